@@ -1 +1 @@
-__version__ = "0.26.5"
+__version__ = "0.26.30"
@@ -1,7 +1,11 @@
+from typing import Union
+
 from azure.cosmos.aio import CosmosClient, DatabaseProxy, ContainerProxy
 
-from core.config import STATE_STORE_ENDPOINT, STATE_STORE_KEY, STATE_STORE_SSL_VERIFY, STATE_STORE_DATABASE
+from core.config import STATE_STORE_ENDPOINT, STATE_STORE_KEY, STATE_STORE_SSL_VERIFY, STATE_STORE_DATABASE, STATE_STORE_BACKEND, STATE_STORE_PARTITION_KEYS
 from core.credentials import get_credential_async
+from db.instrumentation import record_cosmos_response
+from db.memory.container import InMemoryDatabase
 from services.logging import logger
 
 
@@ -17,7 +21,7 @@ class Singleton(type):
 class Database(metaclass=Singleton):
 
     _cosmos_client: CosmosClient = None
-    _database_proxy: DatabaseProxy = None
+    _database_proxy: Union[DatabaseProxy, InMemoryDatabase] = None
 
     def __init__(cls):
         pass
@@ -32,7 +36,8 @@ class Database(metaclass=Singleton):
                 logger.debug("Connecting with SSL verification")
                 cosmos_client = CosmosClient(
                     url=STATE_STORE_ENDPOINT,
-                    credential=STATE_STORE_KEY
+                    credential=STATE_STORE_KEY,
+                    raw_response_hook=record_cosmos_response
                 )
             else:
                 logger.debug("Connecting without SSL verification")
@@ -40,14 +45,16 @@ class Database(metaclass=Singleton):
                 cosmos_client = CosmosClient(
                     url=STATE_STORE_ENDPOINT,
                     credential=STATE_STORE_KEY,
-                    connection_verify=False
+                    connection_verify=False,
+                    raw_response_hook=record_cosmos_response
                 )
         else:
             logger.debug("Connecting with managed identity")
             credential = await get_credential_async()
             cosmos_client = CosmosClient(
                 url=STATE_STORE_ENDPOINT,
-                credential=credential
+                credential=credential,
+                raw_response_hook=record_cosmos_response
             )
 
         logger.debug("Connection established")
@@ -55,6 +62,11 @@ class Database(metaclass=Singleton):
 
     @classmethod
     async def get_container_proxy(cls, container_name) -> ContainerProxy:
+        if STATE_STORE_BACKEND == "memory":
+            if cls._database_proxy is None:
+                cls._database_proxy = InMemoryDatabase(STATE_STORE_PARTITION_KEYS)
+            return cls._database_proxy.get_container_client(container_name)
+
         if cls._cosmos_client is None:
             cls._cosmos_client = await cls._connect_to_db()
 
@@ -0,0 +1,22 @@
+from typing import Optional
+
+from fastapi import Query
+
+from resources import strings
+
+MAX_PAGE_SIZE = 1000
+# Used by list endpoints whose response body is a bare array, so has nowhere to carry the token
+CONTINUATION_TOKEN_HEADER = "x-continuation-token"
+
+
+class PageParameters:
+    def __init__(
+            self,
+            page_size: Optional[int] = Query(default=None, alias="pageSize", ge=1, le=MAX_PAGE_SIZE, description=strings.PAGE_SIZE_DESCRIPTION),
+            continuation_token: Optional[str] = Query(default=None, alias="continuationToken", description=strings.CONTINUATION_TOKEN_DESCRIPTION)):
+        self.page_size = page_size
+        self.continuation_token = continuation_token
+
+    @property
+    def is_paged(self) -> bool:
+        return self.page_size is not None or self.continuation_token is not None
@@ -0,0 +1,21 @@
+from typing import List, Optional
+
+from fastapi import Query
+
+from resources import strings
+
+
+class ResourceHistoryParameters:
+    def __init__(
+            self,
+            from_when: Optional[float] = Query(default=None, alias="from", description=strings.HISTORY_FROM_DESCRIPTION),
+            to_when: Optional[float] = Query(default=None, alias="to", description=strings.HISTORY_TO_DESCRIPTION),
+            order_ascending: bool = Query(default=True, description=strings.HISTORY_ORDER_ASCENDING_DESCRIPTION),
+            fields: Optional[str] = Query(default=None, description=strings.HISTORY_FIELDS_DESCRIPTION)):
+        self.from_when = from_when
+        self.to_when = to_when
+        self.order_ascending = order_ascending
+        self.fields: Optional[List[str]] = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+    def query_options(self) -> dict:
+        return {"from_when": self.from_when, "to_when": self.to_when, "order_ascending": self.order_ascending, "fields": self.fields}
@@ -1,8 +1,9 @@
-from fastapi import Depends, HTTPException, Path, status
+from fastapi import Depends, HTTPException, Path, Query, status
 from pydantic import UUID4
 
 from api.helpers import get_repository
 from db.errors import EntityDoesNotExist
+from db.partitioning import SHARED_PARTITION
 from resources import strings
 from models.domain.shared_service import SharedService
 from models.domain.operation import Operation
@@ -21,8 +22,8 @@ async def get_shared_service_by_id_from_path(shared_service_id: UUID4 = Path(...
     return await get_shared_service_by_id(shared_service_id, shared_service_repo)
 
 
-async def get_operation_by_id_from_path(operation_id: UUID4 = Path(...), operations_repo=Depends(get_repository(OperationRepository))) -> Operation:
+async def get_operation_by_id_from_path(shared_service_id: UUID4 = Path(...), operation_id: UUID4 = Path(...), operations_repo=Depends(get_repository(OperationRepository)), include_archived: bool = Query(default=False, alias="includeArchived", description=strings.INCLUDE_ARCHIVED_DESCRIPTION)) -> Operation:
     try:
-        return await operations_repo.get_operation_by_id(operation_id=operation_id)
+        return await operations_repo.get_operation_by_id(operation_id=operation_id, workspace_id=SHARED_PARTITION, resource_id=str(shared_service_id), include_archived=include_archived)
     except EntityDoesNotExist:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=strings.OPERATION_DOES_NOT_EXIST)
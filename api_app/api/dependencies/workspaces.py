@@ -1,4 +1,4 @@
-from fastapi import Depends, HTTPException, Path, status
+from fastapi import Depends, HTTPException, Path, Query, status
 from pydantic import UUID4
 
 from api.helpers import get_repository
@@ -58,8 +58,8 @@ async def get_user_resource_by_id_from_path(workspace_id: UUID4 = Path(...), ser
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=strings.USER_RESOURCE_DOES_NOT_EXIST)
 
 
-async def get_operation_by_id_from_path(operation_id: UUID4 = Path(...), operations_repo=Depends(get_repository(OperationRepository))) -> Operation:
+async def get_operation_by_id_from_path(workspace_id: UUID4 = Path(...), operation_id: UUID4 = Path(...), operations_repo=Depends(get_repository(OperationRepository)), include_archived: bool = Query(default=False, alias="includeArchived", description=strings.INCLUDE_ARCHIVED_DESCRIPTION)) -> Operation:
     try:
-        return await operations_repo.get_operation_by_id(operation_id=operation_id)
+        return await operations_repo.get_operation_by_id(operation_id=operation_id, workspace_id=str(workspace_id), include_archived=include_archived)
     except EntityDoesNotExist:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=strings.OPERATION_DOES_NOT_EXIST)
@@ -4,6 +4,7 @@ from fastapi import HTTPException, status
 
 from db.errors import UnableToAccessDatabase
 from db.repositories.base import BaseRepository
+from db.repositories.registry import repository_registry
 from resources.strings import UNABLE_TO_GET_STATE_STORE_CLIENT
 from services.logging import logger
 
@@ -11,7 +12,7 @@ from services.logging import logger
 def get_repository(repo_type: Type[BaseRepository],) -> Callable:
     async def _get_repo() -> BaseRepository:
         try:
-            return await repo_type.create()
+            return await repository_registry.get(repo_type)
         except UnableToAccessDatabase:
             logger.exception(UNABLE_TO_GET_STATE_STORE_CLIENT)
             raise HTTPException(
@@ -4,19 +4,20 @@ from fastapi import APIRouter, Depends, HTTPException, status as status_code, Re
 
 from jsonschema.exceptions import ValidationError
 from api.helpers import get_repository
+from api.dependencies.pagination import PageParameters
 from db.repositories.resources_history import ResourceHistoryRepository
 from db.repositories.user_resources import UserResourceRepository
 from db.repositories.workspace_services import WorkspaceServiceRepository
 from db.repositories.operations import OperationRepository
 from db.repositories.resource_templates import ResourceTemplateRepository
 from db.repositories.airlock_requests import AirlockRequestRepository
-from db.errors import EntityDoesNotExist, UserNotAuthorizedToUseTemplate
+from db.errors import EntityDoesNotExist, InvalidInput, UserNotAuthorizedToUseTemplate
 
 from api.dependencies.workspaces import get_workspace_by_id_from_path, get_deployed_workspace_by_id_from_path
 from api.dependencies.airlock import get_airlock_request_by_id_from_path
 from models.domain.airlock_request import AirlockRequestStatus, AirlockRequestType
 from models.schemas.airlock_request_url import AirlockRequestTokenInResponse
-from models.schemas.airlock_request import AirlockRequestAndOperationInResponse, AirlockRequestInCreate, AirlockRequestWithAllowedUserActions, \
+from models.schemas.airlock_request import AirlockRequestAndOperationInResponse, AirlockRequestHistoryInList, AirlockRequestInCreate, AirlockRequestWithAllowedUserActions, \
     AirlockRequestWithAllowedUserActionsInList, AirlockReviewInCreate, AirlockRevokeInCreate
 from resources import strings
 from auth.rbac import require_workspace_owner_or_researcher_or_airlock_manager, \
@@ -61,14 +62,21 @@ async def get_all_airlock_requests_by_workspace(
         workspace=Depends(get_deployed_workspace_by_id_from_path),
         user=Depends(require_workspace_owner_or_researcher_or_airlock_manager),
         creator_user_id: Optional[str] = None, type: Optional[AirlockRequestType] = None, status: Optional[AirlockRequestStatus] = None,
-        order_by: Optional[str] = None, order_ascending: bool = True) -> AirlockRequestWithAllowedUserActionsInList:
+        order_by: Optional[str] = None, order_ascending: bool = True,
+        page: PageParameters = Depends()) -> AirlockRequestWithAllowedUserActionsInList:
     try:
-        airlock_requests = await get_airlock_requests_by_user_and_workspace(user=user, workspace=workspace, airlock_request_repo=airlock_request_repo,
-                                                                            creator_user_id=creator_user_id, type=type, status=status,
-                                                                            order_by=order_by, order_ascending=order_ascending)
+        continuation_token = None
+        if page.is_paged:
+            airlock_requests, continuation_token = await airlock_request_repo.get_airlock_requests_page(workspace_id=workspace.id, creator_user_id=creator_user_id, type=type, status=status,
+                                                                                                        order_by=order_by, order_ascending=order_ascending,
+                                                                                                        page_size=page.page_size, continuation_token=page.continuation_token)
+        else:
+            airlock_requests = await get_airlock_requests_by_user_and_workspace(user=user, workspace=workspace, airlock_request_repo=airlock_request_repo,
+                                                                                creator_user_id=creator_user_id, type=type, status=status,
+                                                                                order_by=order_by, order_ascending=order_ascending)
         airlock_requests_with_allowed_user_actions = enrich_requests_with_allowed_actions(airlock_requests, user, airlock_request_repo)
-        return AirlockRequestWithAllowedUserActionsInList(airlockRequests=airlock_requests_with_allowed_user_actions)
-    except (ValidationError, ValueError) as e:
+        return AirlockRequestWithAllowedUserActionsInList(airlockRequests=airlock_requests_with_allowed_user_actions, continuationToken=continuation_token)
+    except (ValidationError, ValueError, InvalidInput) as e:
         logger.exception("Failed retrieving all the airlock requests for a workspace")
         raise HTTPException(status_code=status_code.HTTP_400_BAD_REQUEST, detail=str(e))
 
@@ -83,6 +91,22 @@ async def retrieve_airlock_request_by_id(airlock_request=Depends(get_airlock_req
     return AirlockRequestWithAllowedUserActions(airlockRequest=airlock_request, allowedUserActions=allowed_actions)
 
 
+@airlock_workspace_router.get("/workspaces/{workspace_id}/requests/{airlock_request_id}/history", status_code=status_code.HTTP_200_OK,
+                              response_model=AirlockRequestHistoryInList, name=strings.API_GET_AIRLOCK_REQUEST_HISTORY,
+                              dependencies=[Depends(require_workspace_owner_or_researcher_or_airlock_manager), Depends(get_workspace_by_id_from_path)])
+async def retrieve_airlock_request_history(airlock_request=Depends(get_airlock_request_by_id_from_path),
+                                           airlock_request_repo=Depends(get_repository(AirlockRequestRepository)),
+                                           page: PageParameters = Depends()) -> AirlockRequestHistoryInList:
+    if not page.is_paged:
+        return AirlockRequestHistoryInList(history=await airlock_request_repo.get_airlock_request_history(airlock_request))
+
+    try:
+        history, continuation_token = await airlock_request_repo.get_airlock_request_history_page(airlock_request, page_size=page.page_size, continuation_token=page.continuation_token)
+    except InvalidInput as e:
+        raise HTTPException(status_code=status_code.HTTP_400_BAD_REQUEST, detail=str(e))
+    return AirlockRequestHistoryInList(history=history, continuationToken=continuation_token)
+
+
 @airlock_workspace_router.post("/workspaces/{workspace_id}/requests/{airlock_request_id}/submit", status_code=status_code.HTTP_200_OK,
                                response_model=AirlockRequestWithAllowedUserActions, name=strings.API_SUBMIT_AIRLOCK_REQUEST,
                                dependencies=[Depends(require_workspace_owner_or_researcher), Depends(get_workspace_by_id_from_path)])
@@ -1,7 +1,17 @@
+import time
+
 from fastapi import APIRouter, Depends, HTTPException, status
+from api.helpers import get_repository
 from auth.rbac import require_tre_admin
+from core import config
+from db.migrations.runner import BulkMigrationRunner, describe_progress
+from db.repositories.airlock_requests import AirlockRequestRepository
+from db.repositories.migrations import MigrationRepository
+from db.repositories.operations import OperationRepository
+from db.repositories.resources import ResourceRepository
 from resources import strings
-from models.schemas.migrations import MigrationOutList
+from models.domain.migration import MigrationStatus
+from models.schemas.migrations import Migration, MigrationOutList
 from services.logging import logger
 
 migrations_core_router = APIRouter(dependencies=[Depends(require_tre_admin)])
@@ -12,16 +22,34 @@ migrations_core_router = APIRouter(dependencies=[Depends(require_tre_admin)])
                              name=strings.API_MIGRATE_DATABASE,
                              response_model=MigrationOutList,
                              dependencies=[Depends(require_tre_admin)])
-async def migrate_database():
+async def migrate_database(resource_repo=Depends(get_repository(ResourceRepository)), operations_repo=Depends(get_repository(OperationRepository)), airlock_request_repo=Depends(get_repository(AirlockRequestRepository)), migration_repo=Depends(get_repository(MigrationRepository))):
     try:
         migrations = list()
 
         # ADD MIGRATIONS HERE
-        # Examples of migrations can be found in this file:
-        # https://github.com/microsoft/AzureTRE/blob/v0.22.0/api_app/api/routes/migrations.py#L32-L84
-        # and this folder:
-        # https://github.com/microsoft/AzureTRE/tree/v0.22.0/api_app/db/migrations
-        logger.info("No migrations exist.")
+        # Bulk migrations stream their container a page at a time and checkpoint their progress, so a call that
+        # reaches MIGRATION_TIME_LIMIT returns and the next call resumes where it stopped. They run in order, and
+        # their transforms must be idempotent, as the page a migration was stopped on can be processed again.
+        # copying into the workspace partitioned containers comes first, as the migrations after it read them
+        bulk_migrations = await resource_repo.repartitioning_migrations()
+        bulk_migrations += await operations_repo.repartitioning_migrations()
+        bulk_migrations += await airlock_request_repo.repartitioning_migrations()
+        bulk_migrations += resource_repo.resource_hierarchy_migrations()
+        bulk_migrations += airlock_request_repo.airlock_review_inbox_migrations()
+        bulk_migrations += operations_repo.resource_deployed_migrations(resource_repo)
+
+        logger.info("Running bulk migrations")
+        deadline = time.monotonic() + config.MIGRATION_TIME_LIMIT
+        runner = BulkMigrationRunner(migration_repo, config.MIGRATION_WRITE_CONCURRENCY, config.MIGRATION_TIME_LIMIT)
+        checkpoints = await runner.run(bulk_migrations)
+        for checkpoint in checkpoints:
+            migrations.append(Migration(issueNumber=checkpoint.id, status=describe_progress(checkpoint)))
+
+        # resources deleted before the deleted resources container existed are moved to it in the time that's left
+        if all(checkpoint.status == MigrationStatus.Completed for checkpoint in checkpoints):
+            moved, completed = await resource_repo.move_deleted_resources(deadline)
+            progress = f"Completed: {moved} deleted resources moved" if completed else f"In progress: {moved} deleted resources moved so far. Call again to resume"
+            migrations.append(Migration(issueNumber="move-deleted-resources", status=progress))
 
         return MigrationOutList(migrations=migrations)
     except Exception as e:
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 
+from api.dependencies.pagination import PageParameters
 from api.helpers import get_repository
+from db.errors import InvalidInput
 from db.repositories.operations import OperationRepository
 from models.schemas.operation import OperationInList
 from resources import strings
@@ -11,6 +13,13 @@ operations_router = APIRouter(dependencies=[Depends(require_tre_user_or_admin)])
 
 
 @operations_router.get("/operations", response_model=OperationInList, name=strings.API_GET_MY_OPERATIONS)
-async def get_my_operations(user=Depends(require_tre_user_or_admin), operations_repo=Depends(get_repository(OperationRepository))) -> OperationInList:
-    operations = await operations_repo.get_my_operations(user_id=user.id)
-    return OperationInList(operations=operations)
+async def get_my_operations(user=Depends(require_tre_user_or_admin), operations_repo=Depends(get_repository(OperationRepository)), page: PageParameters = Depends()) -> OperationInList:
+    if not page.is_paged:
+        operations = await operations_repo.get_my_operations(user_id=user.id)
+        return OperationInList(operations=operations)
+
+    try:
+        operations, continuation_token = await operations_repo.get_my_operations_page(user_id=user.id, page_size=page.page_size, continuation_token=page.continuation_token)
+    except InvalidInput as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return OperationInList(operations=operations, continuationToken=continuation_token)
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status as status_code
+from fastapi import APIRouter, Depends, HTTPException, Response, status as status_code
 from typing import List, Optional
 
+from api.dependencies.pagination import CONTINUATION_TOKEN_HEADER, PageParameters
 from api.helpers import get_repository
+from db.errors import InvalidInput
 from resources import strings
 from db.repositories.airlock_requests import AirlockRequestRepository
 from models.domain.airlock_request import AirlockRequest, AirlockRequestStatus, AirlockRequestType
@@ -12,14 +14,39 @@ router = APIRouter(dependencies=[Depends(require_tre_user_or_admin)])
 
 @router.get("/requests", response_model=List[AirlockRequest], name=strings.API_LIST_REQUESTS)
 async def get_requests(
+    response: Response,
     user=Depends(require_tre_user_or_admin),
     airlock_request_repo: AirlockRequestRepository = Depends(get_repository(AirlockRequestRepository)),
     airlock_manager: bool = False,
     type: Optional[AirlockRequestType] = None, status: Optional[AirlockRequestStatus] = None,
-    order_by: Optional[str] = None, order_ascending: bool = True
+    order_by: Optional[str] = None, order_ascending: bool = True,
+    page: PageParameters = Depends()
 ) -> List[AirlockRequest]:
     try:
-        if not airlock_manager:
+        if page.is_paged:
+            if not airlock_manager:
+                requests, continuation_token = await airlock_request_repo.get_airlock_requests_page(
+                    creator_user_id=user.id,
+                    type=type,
+                    status=status,
+                    order_by=order_by,
+                    order_ascending=order_ascending,
+                    page_size=page.page_size,
+                    continuation_token=page.continuation_token
+                )
+            else:
+                requests, continuation_token = await airlock_request_repo.get_airlock_requests_for_airlock_manager_page(
+                    user_id=user.id,
+                    type=type,
+                    status=status,
+                    order_by=order_by,
+                    order_ascending=order_ascending,
+                    page_size=page.page_size,
+                    continuation_token=page.continuation_token
+                )
+            if continuation_token:
+                response.headers[CONTINUATION_TOKEN_HEADER] = continuation_token
+        elif not airlock_manager:
             requests = await airlock_request_repo.get_airlock_requests(
                 creator_user_id=user.id,
                 type=type,
@@ -38,7 +65,7 @@ async def get_requests(
 
         return requests
 
-    except ValueError as ve:
+    except (InvalidInput, ValueError) as ve:
         raise HTTPException(status_code=status_code.HTTP_400_BAD_REQUEST, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=status_code.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
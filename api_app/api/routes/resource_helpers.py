@@ -1,20 +1,26 @@
+import asyncio
 from datetime import datetime, UTC
 import semantic_version
 from copy import deepcopy
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union
 
 from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from core import config
 from db.repositories.user_resources import UserResourceRepository
 from models.domain.user_resource import UserResource
 from models.domain.workspace_service import WorkspaceService
-from models.schemas.resource import ResourcePatch
+from models.schemas.resource import ResourceHistoryInList, ResourcePatch
 from db.repositories.resources import ResourceRepository
 from db.repositories.resources_history import ResourceHistoryRepository
 from models.domain.resource_template import ResourceTemplate
 from models.domain.authentication import User
 from pydantic import TypeAdapter
 
-from db.errors import DuplicateEntity, EntityDoesNotExist
+from api.dependencies.pagination import PageParameters
+from api.dependencies.resource_history import ResourceHistoryParameters
+from db.errors import DuplicateEntity, EntityDoesNotExist, InvalidInput
 from db.repositories.operations import OperationRepository
 from db.repositories.resource_templates import ResourceTemplateRepository
 from models.domain.resource import AvailableUpgrade, ResourceType, Resource
@@ -37,22 +43,69 @@ async def delete_validation(resource: Resource, resource_repo: ResourceRepositor
     return True
 
 
+def _to_child_resource(resource: dict) -> Resource:
+    if resource["resourceType"] == ResourceType.WorkspaceService:
+        return TypeAdapter(WorkspaceService).validate_python(resource)
+    if resource["resourceType"] == ResourceType.UserResource:
+        return TypeAdapter(UserResource).validate_python(resource)
+    return TypeAdapter(Resource).validate_python(resource)
+
+
+async def _get_parent_service_template_names(children: List[Resource], parent_resource: Resource, resource_repo: ResourceRepository) -> Dict[str, str]:
+    # the parent services of the user resources are usually being updated too, so only look up the ones that aren't
+    template_names = {r.id: r.templateName for r in children + [parent_resource] if r.resourceType == ResourceType.WorkspaceService}
+    missing_ids = {r.parentWorkspaceServiceId for r in children if r.resourceType == ResourceType.UserResource} - template_names.keys()
+    # they're in the parent's workspace
+    workspace_partition = resource_repo.workspace_partition(parent_resource.model_dump())
+    parent_services = await asyncio.gather(*[resource_repo.get_resource_by_id(service_id, workspace_partition=workspace_partition) for service_id in missing_ids])
+    template_names.update({service.id: service.templateName for service in parent_services})
+    return template_names
+
+
 async def cascaded_update_resource(resource_patch: ResourcePatch, parent_resource: Resource, user: User, force_version_update: bool, resource_template_repo: ResourceTemplateRepository, resource_history_repo: ResourceHistoryRepository, resource_repo: ResourceRepository):
-    # Get dependecy list
+    """
+    Patches every resource under parent_resource, CASCADE_UPDATE_CONCURRENCY at a time, re-reading and retrying a
+    resource that was modified concurrently. The parent services and templates of all of them are fetched up front.
+    Every resource is attempted; if any fail, the failures are logged and the first is raised.
+    """
+    # Get dependecy list, the last item of which is parent_resource itself
     dependency_list = await resource_repo.get_resource_dependency_list(parent_resource)
-    # Patch all resources
-    for child_resource in dependency_list[:-1]:
-        child_etag = child_resource["_etag"]
-        primary_parent_service_name = ""
-        if child_resource["resourceType"] == ResourceType.WorkspaceService:
-            child_resource = TypeAdapter(WorkspaceService).validate_python(child_resource)
-        elif child_resource["resourceType"] == ResourceType.UserResource:
-            child_resource = TypeAdapter(UserResource).validate_python(child_resource)
-            primary_parent_workspace_service = await resource_repo.get_resource_by_id(child_resource.parentWorkspaceServiceId)
-            primary_parent_service_name = primary_parent_workspace_service.templateName
+    children = [(_to_child_resource(child), child["_etag"]) for child in dependency_list[:-1]]
+    if not children:
+        return
+
+    parent_service_template_names = await _get_parent_service_template_names([child for child, _ in children], parent_resource, resource_repo)
+
+    def template_key(child: Resource) -> Tuple[str, str, ResourceType, str]:
+        parent_service_name = parent_service_template_names[child.parentWorkspaceServiceId] if child.resourceType == ResourceType.UserResource else ""
+        return (child.templateName, child.templateVersion, child.resourceType, parent_service_name)
+
+    template_keys = list({template_key(child) for child, _ in children})
+    templates = await asyncio.gather(*[resource_template_repo.get_template_by_name_and_version(name, version, resource_type, parent_service_name=parent_service_name) for name, version, resource_type, parent_service_name in template_keys])
+    templates_by_key = dict(zip(template_keys, templates))
+
+    semaphore = asyncio.Semaphore(config.CASCADE_UPDATE_CONCURRENCY)
 
-        child_resource_template = await resource_template_repo.get_template_by_name_and_version(child_resource.templateName, child_resource.templateVersion, child_resource.resourceType, parent_service_name=primary_parent_service_name)
-        await resource_repo.patch_resource(child_resource, resource_patch, child_resource_template, child_etag, resource_template_repo, resource_history_repo, user, strings.RESOURCE_ACTION_UPDATE, force_version_update)
+    # the children are all in the parent's workspace
+    workspace_partition = resource_repo.workspace_partition(parent_resource.model_dump())
+
+    async def read_child(child_id: str) -> Tuple[Resource, str]:
+        latest = await resource_repo.get_resource_dict_by_id(child_id, workspace_partition=workspace_partition)
+        return _to_child_resource(latest), latest["_etag"]
+
+    async def patch_child(child: Tuple[Resource, str]):
+        resource, etag = child
+        await resource_repo.patch_resource(resource, resource_patch, templates_by_key[template_key(resource)], etag, resource_template_repo, resource_history_repo, user, strings.RESOURCE_ACTION_UPDATE, force_version_update)
+
+    async def update_child(child: Tuple[Resource, str]):
+        async with semaphore:
+            await resource_repo.update_with_retries(operation="cascaded update", update=patch_child, read=lambda: read_child(child[0].id), item=child)
+
+    results = await asyncio.gather(*[update_child(child) for child in children], return_exceptions=True)
+    failures = [(child.id, result) for (child, _), result in zip(children, results) if isinstance(result, Exception)]
+    if failures:
+        logger.error(f"Cascaded update of {parent_resource.id} failed for {len(failures)} of {len(children)} resources: " + "; ".join(f"{resource_id}: {error!r}" for resource_id, error in failures))
+        raise failures[0][1]
 
 
 async def save_and_deploy_resource(
@@ -93,7 +146,7 @@ async def save_and_deploy_resource(
         )
         return operation
     except Exception:
-        await resource_repo.delete_item(resource.id)
+        await resource_repo.delete_resource(resource)
         logger.exception("Failed send resource request message")
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -325,3 +378,19 @@ async def enrich_resource_with_available_upgrades(resource: Resource, resource_t
         available_upgrades.append(AvailableUpgrade(version=version, forceUpdateRequired=True))
 
     resource.availableUpgrades = available_upgrades
+
+
+async def get_resource_history(resource_id: str, resource_history_repo: ResourceHistoryRepository, page: PageParameters, history: ResourceHistoryParameters) -> Union[ResourceHistoryInList, JSONResponse]:
+    try:
+        if not page.is_paged:
+            resource_history_list = ResourceHistoryInList(resource_history=await resource_history_repo.get_resource_history_by_resource_id(resource_id=resource_id, **history.query_options()))
+        else:
+            resource_history, continuation_token = await resource_history_repo.get_resource_history_page(resource_id=resource_id, page_size=page.page_size, continuation_token=page.continuation_token, **history.query_options())
+            resource_history_list = ResourceHistoryInList(resource_history=resource_history, continuationToken=continuation_token)
+    except InvalidInput as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if history.fields:
+        # only the fields asked for are returned, rather than the defaults of those that weren't read
+        return JSONResponse(content=jsonable_encoder(resource_history_list, exclude_unset=True))
+    return resource_history_list
@@ -1,11 +1,13 @@
 import asyncio
 
-from fastapi import APIRouter, Depends, HTTPException, Header, status, Response
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, status, Response
 from jsonschema.exceptions import ValidationError
 
 from db.repositories.operations import OperationRepository
 from db.errors import DuplicateEntity, MajorVersionUpdateDenied, UserNotAuthorizedToUseTemplate, TargetTemplateVersionDoesNotExist, VersionDowngradeDenied
 from api.helpers import get_repository
+from api.dependencies.pagination import PageParameters
+from api.dependencies.resource_history import ResourceHistoryParameters
 from api.dependencies.shared_services import get_shared_service_by_id_from_path, get_operation_by_id_from_path
 from db.repositories.resource_templates import ResourceTemplateRepository
 from db.repositories.resources_history import ResourceHistoryRepository
@@ -17,7 +19,7 @@ from models.schemas.resource import ResourceHistoryInList, ResourcePatch
 from resources import strings
 from .workspaces import save_and_deploy_resource, construct_location_header
 from azure.cosmos.exceptions import CosmosAccessConditionFailedError
-from .resource_helpers import enrich_resource_with_available_upgrades, send_custom_action_message, send_uninstall_message, send_resource_request_message
+from .resource_helpers import enrich_resource_with_available_upgrades, get_resource_history, send_custom_action_message, send_uninstall_message, send_resource_request_message
 from auth.rbac import require_tre_admin, require_tre_user_or_admin
 from models.domain.request_action import RequestAction
 from services.logging import logger
@@ -143,8 +145,8 @@ async def invoke_action_on_shared_service(response: Response, action: str, user=
 
 # Shared service operations
 @shared_services_router.get("/shared-services/{shared_service_id}/operations", response_model=OperationInList, name=strings.API_GET_RESOURCE_OPERATIONS, dependencies=[Depends(require_tre_admin), Depends(get_shared_service_by_id_from_path)])
-async def retrieve_shared_service_operations_by_shared_service_id(shared_service=Depends(get_shared_service_by_id_from_path), operations_repo=Depends(get_repository(OperationRepository))) -> OperationInList:
-    return OperationInList(operations=await operations_repo.get_operations_by_resource_id(resource_id=shared_service.id))
+async def retrieve_shared_service_operations_by_shared_service_id(shared_service=Depends(get_shared_service_by_id_from_path), operations_repo=Depends(get_repository(OperationRepository)), include_archived: bool = Query(default=False, alias="includeArchived", description=strings.INCLUDE_ARCHIVED_DESCRIPTION)) -> OperationInList:
+    return OperationInList(operations=await operations_repo.get_operations_by_resource_id(resource_id=shared_service.id, include_archived=include_archived))
 
 
 @shared_services_router.get("/shared-services/{shared_service_id}/operations/{operation_id}", response_model=OperationInResponse, name=strings.API_GET_RESOURCE_OPERATION_BY_ID, dependencies=[Depends(require_tre_admin), Depends(get_shared_service_by_id_from_path)])
@@ -154,5 +156,5 @@ async def retrieve_shared_service_operation_by_shared_service_id_and_operation_i
 
 # Shared service history
 @shared_services_router.get("/shared-services/{shared_service_id}/history", response_model=ResourceHistoryInList, name=strings.API_GET_RESOURCE_HISTORY, dependencies=[Depends(require_tre_admin)])
-async def retrieve_shared_service_history_by_shared_service_id(shared_service=Depends(get_shared_service_by_id_from_path), resource_history_repo=Depends(get_repository(ResourceHistoryRepository))) -> ResourceHistoryInList:
-    return ResourceHistoryInList(resource_history=await resource_history_repo.get_resource_history_by_resource_id(resource_id=shared_service.id))
+async def retrieve_shared_service_history_by_shared_service_id(shared_service=Depends(get_shared_service_by_id_from_path), resource_history_repo=Depends(get_repository(ResourceHistoryRepository)), page: PageParameters = Depends(), history: ResourceHistoryParameters = Depends()) -> ResourceHistoryInList:
+    return await get_resource_history(shared_service.id, resource_history_repo, page, history)
@@ -1,11 +1,13 @@
 import asyncio
 
-from fastapi import APIRouter, Depends, HTTPException, Header, Path, status, Response
+from fastapi import APIRouter, Depends, HTTPException, Header, Path, Query, status, Response
 from pydantic import UUID4
 
 from jsonschema.exceptions import ValidationError
 
 from api.helpers import get_repository
+from api.dependencies.pagination import PageParameters
+from api.dependencies.resource_history import ResourceHistoryParameters
 from api.dependencies.workspaces import get_operation_by_id_from_path, get_workspace_by_id_from_path, get_deployed_workspace_by_id_from_path, get_deployed_workspace_service_by_id_from_path, get_workspace_service_by_id_from_path, get_user_resource_by_id_from_path
 from db.errors import InvalidInput, MajorVersionUpdateDenied, TargetTemplateVersionDoesNotExist, UserNotAuthorizedToUseTemplate, VersionDowngradeDenied, StorageAccountNameGenerationTimeout, StorageAccountNameCheckFailed
 from db.repositories.operations import OperationRepository
@@ -33,7 +35,7 @@ from services.azure_resource_status import get_azure_resource_status
 from azure.cosmos.exceptions import CosmosAccessConditionFailedError
 
 from .resource_helpers import cascaded_update_resource, delete_validation, enrich_resource_with_available_upgrades, get_identity_role_assignments, save_and_deploy_resource, construct_location_header, send_uninstall_message, \
-    send_custom_action_message, send_resource_request_message, update_user_resource
+    send_custom_action_message, send_resource_request_message, update_user_resource, get_resource_history
 from models.domain.request_action import RequestAction
 from services.logging import logger
 
@@ -55,14 +57,20 @@ def validate_user_has_valid_role_for_user_resource(user, user_resource):
 
 # WORKSPACE ROUTES
 @workspaces_core_router.get("/workspaces", response_model=WorkspacesInList, name=strings.API_GET_ALL_WORKSPACES)
-async def retrieve_users_active_workspaces(user=Depends(require_tre_user_or_admin), workspace_repo=Depends(get_repository(WorkspaceRepository)), resource_template_repo=Depends(get_repository(ResourceTemplateRepository))) -> WorkspacesInList:
+async def retrieve_users_active_workspaces(user=Depends(require_tre_user_or_admin), workspace_repo=Depends(get_repository(WorkspaceRepository)), resource_template_repo=Depends(get_repository(ResourceTemplateRepository)), page: PageParameters = Depends()) -> WorkspacesInList:
+    continuation_token = None
+    if page.is_paged:
+        # Pages are filtered to the workspaces the user has a role in, so may hold fewer than pageSize items
+        try:
+            workspaces, continuation_token = await workspace_repo.get_active_workspaces_page(page_size=page.page_size, continuation_token=page.continuation_token)
+        except InvalidInput as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    else:
+        workspaces = await workspace_repo.get_active_workspaces()
 
     if "TREAdmin" in user.roles:
-        workspaces = await workspace_repo.get_active_workspaces()
         await asyncio.gather(*[enrich_resource_with_available_upgrades(workspace, resource_template_repo) for workspace in workspaces])
-        return WorkspacesInList(workspaces=workspaces)
-
-    workspaces = await workspace_repo.get_active_workspaces()
+        return WorkspacesInList(workspaces=workspaces, continuationToken=continuation_token)
 
     access_service = get_aad_service()
     user_role_assignments = get_identity_role_assignments(user)
@@ -76,7 +84,7 @@ async def retrieve_users_active_workspaces(user=Depends(require_tre_user_or_admi
             return WorkspaceRole.NoRole
     user_workspaces = [workspace for workspace in workspaces if _safe_get_workspace_role(user, workspace, user_role_assignments) != WorkspaceRole.NoRole]
     await asyncio.gather(*[enrich_resource_with_available_upgrades(workspace, resource_template_repo) for workspace in user_workspaces])
-    return WorkspacesInList(workspaces=user_workspaces)
+    return WorkspacesInList(workspaces=user_workspaces, continuationToken=continuation_token)
 
 
 @workspaces_shared_router.get("/workspaces/{workspace_id}", response_model=WorkspaceInResponse, name=strings.API_GET_WORKSPACE_BY_ID)
@@ -213,8 +221,8 @@ async def get_user_resource_templates(
 
 
 @workspaces_shared_router.get("/workspaces/{workspace_id}/operations", response_model=OperationInList, name=strings.API_GET_RESOURCE_OPERATIONS, dependencies=[Depends(require_workspace_owner_or_tre_admin)])
-async def retrieve_workspace_operations_by_workspace_id(workspace=Depends(get_workspace_by_id_from_path), operations_repo=Depends(get_repository(OperationRepository))) -> OperationInList:
-    return OperationInList(operations=await operations_repo.get_operations_by_resource_id(resource_id=workspace.id))
+async def retrieve_workspace_operations_by_workspace_id(workspace=Depends(get_workspace_by_id_from_path), operations_repo=Depends(get_repository(OperationRepository)), include_archived: bool = Query(default=False, alias="includeArchived", description=strings.INCLUDE_ARCHIVED_DESCRIPTION)) -> OperationInList:
+    return OperationInList(operations=await operations_repo.get_operations_by_resource_id(resource_id=workspace.id, workspace_id=workspace.id, include_archived=include_archived))
 
 
 @workspaces_shared_router.get("/workspaces/{workspace_id}/operations/{operation_id}", response_model=OperationInResponse, name=strings.API_GET_RESOURCE_OPERATION_BY_ID, dependencies=[Depends(require_workspace_owner_or_tre_admin)])
@@ -223,8 +231,8 @@ async def retrieve_workspace_operation_by_workspace_id_and_operation_id(workspac
 
 
 @workspaces_shared_router.get("/workspaces/{workspace_id}/history", response_model=ResourceHistoryInList, name=strings.API_GET_RESOURCE_HISTORY, dependencies=[Depends(require_workspace_owner_or_tre_admin)])
-async def retrieve_workspace_history_by_workspace_id(workspace=Depends(get_workspace_by_id_from_path), resource_history_repo=Depends(get_repository(ResourceHistoryRepository))) -> ResourceHistoryInList:
-    return ResourceHistoryInList(resource_history=await resource_history_repo.get_resource_history_by_resource_id(resource_id=workspace.id))
+async def retrieve_workspace_history_by_workspace_id(workspace=Depends(get_workspace_by_id_from_path), resource_history_repo=Depends(get_repository(ResourceHistoryRepository)), page: PageParameters = Depends(), history: ResourceHistoryParameters = Depends()) -> ResourceHistoryInList:
+    return await get_resource_history(workspace.id, resource_history_repo, page, history)
 
 
 # WORKSPACE SERVICES ROUTES
@@ -262,7 +270,7 @@ async def create_workspace_service(response: Response, workspace_service_input:
         # check workspace has address_spaces property
         if not workspace.properties.get("address_spaces"):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=strings.WORKSPACE_DOES_NOT_HAVE_ADDRESS_SPACES_PROPERTY)
-        workspace_service.properties["address_space"] = await workspace_repo.get_address_space_based_on_size(workspace_service_input.properties)
+        workspace_service.properties["address_space"] = await workspace_repo.get_address_space_based_on_size(workspace_service_input.properties, workspace.id)
         workspace_patch = ResourcePatch()
         workspace_patch.properties = {"address_spaces": workspace.properties["address_spaces"] + [workspace_service.properties["address_space"]]}
         # IP address allocation is managed by the API. Ideally this request would happen as a result of the workspace
@@ -349,8 +357,8 @@ async def invoke_action_on_workspace_service(response: Response, action: str, us
 
 # workspace service operations
 @workspace_services_workspace_router.get("/workspaces/{workspace_id}/workspace-services/{service_id}/operations", response_model=OperationInList, name=strings.API_GET_RESOURCE_OPERATIONS, dependencies=[Depends(require_workspace_owner_or_airlock_manager), Depends(get_workspace_by_id_from_path)])
-async def retrieve_workspace_service_operations_by_workspace_service_id(workspace_service=Depends(get_workspace_service_by_id_from_path), operations_repo=Depends(get_repository(OperationRepository))) -> OperationInList:
-    return OperationInList(operations=await operations_repo.get_operations_by_resource_id(resource_id=workspace_service.id))
+async def retrieve_workspace_service_operations_by_workspace_service_id(workspace_service=Depends(get_workspace_service_by_id_from_path), operations_repo=Depends(get_repository(OperationRepository)), include_archived: bool = Query(default=False, alias="includeArchived", description=strings.INCLUDE_ARCHIVED_DESCRIPTION)) -> OperationInList:
+    return OperationInList(operations=await operations_repo.get_operations_by_resource_id(resource_id=workspace_service.id, workspace_id=workspace_service.workspaceId, include_archived=include_archived))
 
 
 @workspace_services_workspace_router.get("/workspaces/{workspace_id}/workspace-services/{service_id}/operations/{operation_id}", response_model=OperationInResponse, name=strings.API_GET_RESOURCE_OPERATION_BY_ID, dependencies=[Depends(require_workspace_owner_or_airlock_manager), Depends(get_workspace_by_id_from_path)])
@@ -359,8 +367,8 @@ async def retrieve_workspace_service_operation_by_workspace_service_id_and_opera
 
 
 @workspace_services_workspace_router.get("/workspaces/{workspace_id}/workspace-services/{service_id}/history", response_model=ResourceHistoryInList, name=strings.API_GET_RESOURCE_HISTORY, dependencies=[Depends(require_workspace_owner_or_airlock_manager), Depends(get_workspace_by_id_from_path)])
-async def retrieve_workspace_service_history_by_workspace_service_id(workspace_service=Depends(get_workspace_service_by_id_from_path), resource_history_repo=Depends(get_repository(ResourceHistoryRepository))) -> ResourceHistoryInList:
-    return ResourceHistoryInList(resource_history=await resource_history_repo.get_resource_history_by_resource_id(resource_id=workspace_service.id))
+async def retrieve_workspace_service_history_by_workspace_service_id(workspace_service=Depends(get_workspace_service_by_id_from_path), resource_history_repo=Depends(get_repository(ResourceHistoryRepository)), page: PageParameters = Depends(), history: ResourceHistoryParameters = Depends()) -> ResourceHistoryInList:
+    return await get_resource_history(workspace_service.id, resource_history_repo, page, history)
 
 
 # USER RESOURCE ROUTES
@@ -547,9 +555,10 @@ async def invoke_action_on_user_resource(
 async def retrieve_user_resource_operations_by_user_resource_id(
         user_resource=Depends(get_user_resource_by_id_from_path),
         user=Depends(require_workspace_owner_or_researcher_or_airlock_manager),
-        operations_repo=Depends(get_repository(OperationRepository))) -> OperationInList:
+        operations_repo=Depends(get_repository(OperationRepository)),
+        include_archived: bool = Query(default=False, alias="includeArchived", description=strings.INCLUDE_ARCHIVED_DESCRIPTION)) -> OperationInList:
     validate_user_has_valid_role_for_user_resource(user, user_resource)
-    return OperationInList(operations=await operations_repo.get_operations_by_resource_id(resource_id=user_resource.id))
+    return OperationInList(operations=await operations_repo.get_operations_by_resource_id(resource_id=user_resource.id, workspace_id=user_resource.workspaceId, include_archived=include_archived))
 
 
 @user_resources_workspace_router.get("/workspaces/{workspace_id}/workspace-services/{service_id}/user-resources/{resource_id}/operations/{operation_id}", response_model=OperationInResponse, name=strings.API_GET_RESOURCE_OPERATION_BY_ID, dependencies=[Depends(get_workspace_by_id_from_path)])
@@ -562,6 +571,6 @@ async def retrieve_user_resource_operations_by_user_resource_id_and_operation_id
 
 
 @user_resources_workspace_router.get("/workspaces/{workspace_id}/workspace-services/{service_id}/user-resources/{resource_id}/history", response_model=ResourceHistoryInList, name=strings.API_GET_RESOURCE_HISTORY, dependencies=[Depends(get_workspace_by_id_from_path)])
-async def retrieve_user_resource_history_by_user_resource_id(user_resource=Depends(get_user_resource_by_id_from_path), user=Depends(require_workspace_owner_or_researcher_or_airlock_manager), resource_history_repo=Depends(get_repository(ResourceHistoryRepository))) -> ResourceHistoryInList:
+async def retrieve_user_resource_history_by_user_resource_id(user_resource=Depends(get_user_resource_by_id_from_path), user=Depends(require_workspace_owner_or_researcher_or_airlock_manager), resource_history_repo=Depends(get_repository(ResourceHistoryRepository)), page: PageParameters = Depends(), history: ResourceHistoryParameters = Depends()) -> ResourceHistoryInList:
     validate_user_has_valid_role_for_user_resource(user, user_resource)
-    return ResourceHistoryInList(resource_history=await resource_history_repo.get_resource_history_by_resource_id(resource_id=user_resource.id))
+    return await get_resource_history(user_resource.id, resource_history_repo, page, history)
@@ -28,11 +28,79 @@ STATE_STORE_SSL_VERIFY: bool = config("STATE_STORE_SSL_VERIFY", cast=bool, defau
 STATE_STORE_KEY: str = config("STATE_STORE_KEY", default="")                # Cosmos DB access key
 COSMOSDB_ACCOUNT_NAME: str = config("COSMOSDB_ACCOUNT_NAME", default="")                # Cosmos DB account name
 STATE_STORE_DATABASE = "AzureTRE"
-STATE_STORE_RESOURCES_CONTAINER = "Resources"
+# Opt-in: keep resources, operations and airlock requests in containers partitioned on their workspace, then id,
+# rather than on id, so listing a workspace's contents is a single partition query. POST /migrations copies the
+# existing items into them.
+STATE_STORE_PARTITION_BY_WORKSPACE: bool = config("STATE_STORE_PARTITION_BY_WORKSPACE", cast=bool, default=False)
+# Opt-in: keep operations in the resources container, in the partition of the resource they change, so a deployment
+# status update writes the operation and the resource in a single transactional batch. POST /migrations copies the
+# existing resources and operations into it. Can't be combined with STATE_STORE_PARTITION_BY_WORKSPACE.
+STATE_STORE_COLOCATE_OPERATIONS: bool = config("STATE_STORE_COLOCATE_OPERATIONS", cast=bool, default=False)
+if STATE_STORE_PARTITION_BY_WORKSPACE and STATE_STORE_COLOCATE_OPERATIONS:
+    raise ValueError("STATE_STORE_PARTITION_BY_WORKSPACE and STATE_STORE_COLOCATE_OPERATIONS can't both be set")
+STATE_STORE_RESOURCES_CONTAINER = "ResourcesByWorkspace" if STATE_STORE_PARTITION_BY_WORKSPACE else "ResourcesWithOperations" if STATE_STORE_COLOCATE_OPERATIONS else "Resources"
+STATE_STORE_DELETED_RESOURCES_CONTAINER = "ResourcesDeleted"
 STATE_STORE_RESOURCE_TEMPLATES_CONTAINER = "ResourceTemplates"
 STATE_STORE_RESOURCES_HISTORY_CONTAINER = "ResourceHistory"
-STATE_STORE_OPERATIONS_CONTAINER = "Operations"
-STATE_STORE_AIRLOCK_REQUESTS_CONTAINER = "Requests"
+STATE_STORE_OPERATIONS_CONTAINER = "OperationsByWorkspace" if STATE_STORE_PARTITION_BY_WORKSPACE else "ResourcesWithOperations" if STATE_STORE_COLOCATE_OPERATIONS else "Operations"
+STATE_STORE_OPERATIONS_ARCHIVE_CONTAINER = "OperationsArchive"
+STATE_STORE_AIRLOCK_REQUESTS_CONTAINER = "RequestsByWorkspace" if STATE_STORE_PARTITION_BY_WORKSPACE else "Requests"
+STATE_STORE_AIRLOCK_REQUEST_HISTORY_CONTAINER = "RequestHistory"
+STATE_STORE_AIRLOCK_REVIEW_INBOX_CONTAINER = "AirlockReviewInbox"
+STATE_STORE_ADDRESS_SPACES_CONTAINER = "AddressSpaces"
+STATE_STORE_RESOURCE_HIERARCHY_CONTAINER = "ResourceHierarchy"
+STATE_STORE_MIGRATIONS_CONTAINER = "Migrations"
+# The containers partitioned on id that the workspace partitioned containers, or the container of resources and their
+# operations, replace, and which they are copied from
+STATE_STORE_ID_PARTITIONED_CONTAINERS = {
+    "ResourcesByWorkspace": "Resources",
+    "OperationsByWorkspace": "Operations",
+    "RequestsByWorkspace": "Requests",
+    "ResourcesWithOperations": "Resources"
+}
+# Hierarchical partition key of the workspace partitioned containers; partitionKey is set by the repositories
+WORKSPACE_PARTITION_KEY = ["/partitionKey", "/id"]
+# Partition key of the container of resources and their operations: a resource's id, or the resource an operation changes
+RESOURCE_PARTITION_KEY = "/partitionKey"
+# Partition key path (or paths, for a hierarchical key) of each container
+STATE_STORE_PARTITION_KEYS = {
+    STATE_STORE_RESOURCES_CONTAINER: WORKSPACE_PARTITION_KEY if STATE_STORE_PARTITION_BY_WORKSPACE else RESOURCE_PARTITION_KEY if STATE_STORE_COLOCATE_OPERATIONS else "/id",
+    STATE_STORE_DELETED_RESOURCES_CONTAINER: "/id",
+    STATE_STORE_RESOURCE_TEMPLATES_CONTAINER: "/id",
+    STATE_STORE_RESOURCES_HISTORY_CONTAINER: "/resourceId",
+    STATE_STORE_OPERATIONS_CONTAINER: WORKSPACE_PARTITION_KEY if STATE_STORE_PARTITION_BY_WORKSPACE else RESOURCE_PARTITION_KEY if STATE_STORE_COLOCATE_OPERATIONS else "/id",
+    STATE_STORE_OPERATIONS_ARCHIVE_CONTAINER: "/resourceId",
+    STATE_STORE_AIRLOCK_REQUESTS_CONTAINER: WORKSPACE_PARTITION_KEY if STATE_STORE_PARTITION_BY_WORKSPACE else "/id",
+    STATE_STORE_AIRLOCK_REQUEST_HISTORY_CONTAINER: "/airlockRequestId",
+    STATE_STORE_AIRLOCK_REVIEW_INBOX_CONTAINER: "/workspaceId",
+    STATE_STORE_ADDRESS_SPACES_CONTAINER: "/id",
+    STATE_STORE_RESOURCE_HIERARCHY_CONTAINER: "/workspaceId",
+    STATE_STORE_MIGRATIONS_CONTAINER: "/id"
+}
+# "cosmos", or "memory" to keep the state store in memory, e.g. to benchmark the API without a Cosmos DB account
+STATE_STORE_BACKEND: str = config("STATE_STORE_BACKEND", default="cosmos")
+# How long (in seconds) the API trusts its cached "current" version of a template before re-reading it
+RESOURCE_TEMPLATE_CACHE_CURRENT_TTL: int = config("RESOURCE_TEMPLATE_CACHE_CURRENT_TTL", cast=int, default=60)
+# How many child resources a cascaded update (e.g. disabling a workspace) patches at once
+CASCADE_UPDATE_CONCURRENCY: int = config("CASCADE_UPDATE_CONCURRENCY", cast=int, default=10)
+# How long (in seconds) an airlock manager's role assignments are cached for when listing the requests they can review
+AIRLOCK_MANAGER_ROLE_ASSIGNMENT_CACHE_TTL: int = config("AIRLOCK_MANAGER_ROLE_ASSIGNMENT_CACHE_TTL", cast=int, default=300)
+# How many resource history items a patch chain holds: a snapshot of the full properties and patches against it
+RESOURCE_HISTORY_SNAPSHOT_INTERVAL: int = config("RESOURCE_HISTORY_SNAPSHOT_INTERVAL", cast=int, default=10)
+# How many times a read-modify-write is retried when the item was modified concurrently, and the base of the
+# exponential (jittered) backoff between attempts in milliseconds
+ETAG_CONFLICT_MAX_RETRIES: int = config("ETAG_CONFLICT_MAX_RETRIES", cast=int, default=5)
+ETAG_CONFLICT_BACKOFF_BASE_MS: float = config("ETAG_CONFLICT_BACKOFF_BASE_MS", cast=float, default=50)
+# Operations that finished more than this many days ago are moved to the operations archive container, every
+# OPERATIONS_ARCHIVE_INTERVAL seconds; 0 keeps every operation in the operations container
+OPERATIONS_RETENTION_DAYS: float = config("OPERATIONS_RETENTION_DAYS", cast=float, default=0)
+OPERATIONS_ARCHIVE_INTERVAL: int = config("OPERATIONS_ARCHIVE_INTERVAL", cast=int, default=3600)
+# How often (in seconds) the airlock review inbox is reconciled with the requests awaiting review; 0 never does
+AIRLOCK_REVIEW_INBOX_RECONCILE_INTERVAL: int = config("AIRLOCK_REVIEW_INBOX_RECONCILE_INTERVAL", cast=int, default=3600)
+MIGRATION_WRITE_CONCURRENCY: int = config("MIGRATION_WRITE_CONCURRENCY", cast=int, default=20)
+MIGRATION_TIME_LIMIT: int = config("MIGRATION_TIME_LIMIT", cast=int, default=60)
+COSMOS_REQUEST_CHARGE_LOG_THRESHOLD: float = config("COSMOS_REQUEST_CHARGE_LOG_THRESHOLD", cast=float, default=100)
+COSMOS_DURATION_LOG_THRESHOLD_MS: float = config("COSMOS_DURATION_LOG_THRESHOLD_MS", cast=float, default=1000)
 SUBSCRIPTION_ID: str = config("SUBSCRIPTION_ID", default="")
 RESOURCE_GROUP_NAME: str = config("RESOURCE_GROUP_NAME", default="")
 
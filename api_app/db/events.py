@@ -1,23 +1,26 @@
 import asyncio
+from azure.core.exceptions import ResourceNotFoundError
 from azure.mgmt.cosmosdb import CosmosDBManagementClient
 
-from core.config import SUBSCRIPTION_ID, RESOURCE_GROUP_NAME, RESOURCE_LOCATION, COSMOSDB_ACCOUNT_NAME, STATE_STORE_DATABASE, STATE_STORE_RESOURCES_CONTAINER, STATE_STORE_RESOURCE_TEMPLATES_CONTAINER, STATE_STORE_RESOURCES_HISTORY_CONTAINER, STATE_STORE_OPERATIONS_CONTAINER, STATE_STORE_AIRLOCK_REQUESTS_CONTAINER
+from core.config import SUBSCRIPTION_ID, RESOURCE_GROUP_NAME, RESOURCE_LOCATION, COSMOSDB_ACCOUNT_NAME, STATE_STORE_DATABASE, STATE_STORE_PARTITION_KEYS, STATE_STORE_BACKEND
 from core.credentials import get_credential
+from db.indexing import get_indexing_policy, indexing_policy_changes
 from services.logging import logger
 
 
 async def bootstrap_database() -> bool:
+    if STATE_STORE_BACKEND == "memory":
+        logger.warning("Using the in-memory state store; state will be lost when the API stops")
+        return True
+
     try:
         credential = get_credential()
         db_mgmt_client = CosmosDBManagementClient(credential=credential, subscription_id=SUBSCRIPTION_ID)
 
-        await asyncio.gather(
-            create_container_if_not_exists(db_mgmt_client, STATE_STORE_RESOURCES_CONTAINER, "/id"),
-            create_container_if_not_exists(db_mgmt_client, STATE_STORE_RESOURCE_TEMPLATES_CONTAINER, "/id"),
-            create_container_if_not_exists(db_mgmt_client, STATE_STORE_RESOURCES_HISTORY_CONTAINER, "/resourceId"),
-            create_container_if_not_exists(db_mgmt_client, STATE_STORE_OPERATIONS_CONTAINER, "/id"),
-            create_container_if_not_exists(db_mgmt_client, STATE_STORE_AIRLOCK_REQUESTS_CONTAINER, "/id")
-        )
+        await asyncio.gather(*[
+            create_container_if_not_exists(db_mgmt_client, container, partition_key)
+            for container, partition_key in STATE_STORE_PARTITION_KEYS.items()
+        ])
 
         return True
 
@@ -27,8 +30,35 @@ async def bootstrap_database() -> bool:
         return False
 
 
+def partition_key_definition(partition_key):
+    if isinstance(partition_key, list):
+        # a hierarchical partition key
+        return {"paths": partition_key, "kind": "MultiHash", "version": 2}
+    return {"paths": [partition_key], "kind": "Hash"}
+
+
+def get_current_indexing_policy(db_mgmt_client, container):
+    try:
+        current = db_mgmt_client.sql_resources.get_sql_container(
+            resource_group_name=RESOURCE_GROUP_NAME,
+            account_name=COSMOSDB_ACCOUNT_NAME,
+            database_name=STATE_STORE_DATABASE,
+            container_name=container
+        )
+    except ResourceNotFoundError:
+        return None
+    return current.resource.indexing_policy.as_dict() if current.resource.indexing_policy else {}
+
+
 async def create_container_if_not_exists(db_mgmt_client, container, partition_key):
+    # Creates the container, or updates its indexing policy if it differs from the one declared in db.indexing.
+    # Cosmos DB re-indexes the container in the background after a policy change, while it stays available.
+    indexing_policy = get_indexing_policy(container)
+    changes = indexing_policy_changes(get_current_indexing_policy(db_mgmt_client, container), indexing_policy)
+    if not changes:
+        return
 
+    logger.info(f"Updating container {container}: {'; '.join(changes)}")
     db_mgmt_client.sql_resources.begin_create_update_sql_container(
         resource_group_name=RESOURCE_GROUP_NAME,
         account_name=COSMOSDB_ACCOUNT_NAME,
@@ -38,12 +68,8 @@ async def create_container_if_not_exists(db_mgmt_client, container, partition_ke
             "location": RESOURCE_LOCATION,
             "resource": {
                 "id": container,
-                "partition_key": {
-                    "paths": [
-                        partition_key
-                    ],
-                    "kind": "Hash"
-                }
+                "partition_key": partition_key_definition(partition_key),
+                "indexing_policy": indexing_policy
             }
         }
     )
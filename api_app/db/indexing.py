@@ -0,0 +1,100 @@
+from typing import Dict, List, Optional
+
+from core import config
+
+# Cosmos DB always excludes the etag, and adds it to the policy it returns
+SYSTEM_EXCLUDED_PATHS = {'/"_etag"/?'}
+
+
+def composite_index(*paths: str) -> List[dict]:
+    return [{"path": path, "order": "ascending"} for path in paths]
+
+
+def indexing_policy(excluded_paths: Optional[List[str]] = None, composite_indexes: Optional[List[List[dict]]] = None) -> dict:
+    """
+    Returns an indexing policy that indexes everything but excluded_paths. A composite index serves an ORDER BY on
+    its paths in the order given, or all reversed, and a query with equality filters on its leading paths ordered
+    by the last.
+    """
+    return {
+        "indexing_mode": "consistent",
+        "automatic": True,
+        "included_paths": [{"path": "/*"}],
+        "excluded_paths": [{"path": path} for path in excluded_paths or []],
+        "composite_indexes": composite_indexes or []
+    }
+
+
+def merge_indexing_policies(*policies: dict) -> dict:
+    """
+    Returns the indexing policy of a container holding the items of several, such as resources and their operations.
+    Each policy's excluded paths are ones its items aren't queried on, and none of them are queried on by the others,
+    so all are excluded, and every composite index is kept.
+    """
+    excluded_paths = set().union(*[{path["path"] for path in policy["excluded_paths"]} for policy in policies])
+    composite_indexes = []
+    for policy in policies:
+        composite_indexes += [index for index in policy["composite_indexes"] if index not in composite_indexes]
+    return indexing_policy(excluded_paths=sorted(excluded_paths), composite_indexes=composite_indexes)
+
+
+RESOURCES_INDEXING_POLICY = indexing_policy(excluded_paths=["/properties/*"])
+OPERATIONS_INDEXING_POLICY = indexing_policy(composite_indexes=[
+    composite_index("/user/id", "/status", "/createdWhen")
+])
+
+# The indexing policy of each container, applied by bootstrap_database whenever it differs from the container's.
+# Nothing is queried on properties (or history), which hold most of each document, so indexing them only adds to
+# the charge of every write.
+STATE_STORE_INDEXING_POLICIES: Dict[str, dict] = {
+    config.STATE_STORE_RESOURCES_CONTAINER: RESOURCES_INDEXING_POLICY,
+    config.STATE_STORE_DELETED_RESOURCES_CONTAINER: indexing_policy(excluded_paths=["/properties/*"]),
+    config.STATE_STORE_RESOURCE_TEMPLATES_CONTAINER: indexing_policy(excluded_paths=["/properties/*"]),
+    config.STATE_STORE_RESOURCES_HISTORY_CONTAINER: indexing_policy(excluded_paths=["/properties/*", "/propertiesPatch/*"]),
+    config.STATE_STORE_OPERATIONS_CONTAINER: OPERATIONS_INDEXING_POLICY,
+    # archived operations are only read by resource, or by id
+    config.STATE_STORE_OPERATIONS_ARCHIVE_CONTAINER: indexing_policy(excluded_paths=["/steps/*", "/user/*"]),
+    config.STATE_STORE_AIRLOCK_REQUESTS_CONTAINER: indexing_policy(excluded_paths=["/properties/*", "/history/*"], composite_indexes=[
+        composite_index("/workspaceId", "/status", "/createdWhen"),
+        composite_index("/workspaceId", "/status", "/updatedWhen"),
+        composite_index("/createdBy/id", "/status", "/createdWhen"),
+        composite_index("/createdBy/id", "/status", "/updatedWhen")
+    ]),
+    config.STATE_STORE_AIRLOCK_REQUEST_HISTORY_CONTAINER: indexing_policy(excluded_paths=["/properties/*"]),
+    config.STATE_STORE_AIRLOCK_REVIEW_INBOX_CONTAINER: indexing_policy(excluded_paths=["/properties/*"]),
+}
+if config.STATE_STORE_COLOCATE_OPERATIONS:
+    STATE_STORE_INDEXING_POLICIES[config.STATE_STORE_RESOURCES_CONTAINER] = merge_indexing_policies(RESOURCES_INDEXING_POLICY, OPERATIONS_INDEXING_POLICY)
+
+
+def get_indexing_policy(container: str) -> dict:
+    return STATE_STORE_INDEXING_POLICIES.get(container, indexing_policy())
+
+
+def describe_composite_index(paths: List[dict]) -> str:
+    return "(" + ", ".join(f"{path['path']} {(path.get('order') or 'ascending').lower()}" for path in paths) + ")"
+
+
+def indexing_policy_changes(current: Optional[dict], desired: dict) -> List[str]:
+    """
+    Describes the changes that turn the current indexing policy (as returned by Cosmos DB, with snake_case keys)
+    into the desired one. No changes means the policies are equivalent.
+    """
+    if current is None:
+        return ["create the container"]
+
+    changes = []
+    if (current.get("indexing_mode") or "consistent").lower() != desired["indexing_mode"]:
+        changes.append(f"set the indexing mode to {desired['indexing_mode']}")
+
+    for kind in ("included_paths", "excluded_paths"):
+        current_paths = {path["path"] for path in current.get(kind) or []} - SYSTEM_EXCLUDED_PATHS
+        desired_paths = {path["path"] for path in desired[kind]}
+        changes += [f"{kind.replace('_', ' ')}: add {path}" for path in sorted(desired_paths - current_paths)]
+        changes += [f"{kind.replace('_', ' ')}: remove {path}" for path in sorted(current_paths - desired_paths)]
+
+    current_indexes = {describe_composite_index(paths) for paths in current.get("composite_indexes") or []}
+    desired_indexes = {describe_composite_index(paths) for paths in desired["composite_indexes"]}
+    changes += [f"composite indexes: add {index}" for index in sorted(desired_indexes - current_indexes)]
+    changes += [f"composite indexes: remove {index}" for index in sorted(current_indexes - desired_indexes)]
+    return changes
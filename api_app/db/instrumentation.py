@@ -0,0 +1,174 @@
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from azure.core.pipeline import PipelineResponse
+from azure.cosmos import http_constants
+from opentelemetry import metrics
+
+from core import config
+from services.logging import logger, tracer
+
+meter = metrics.get_meter("azuretre_api")
+request_charge_histogram = meter.create_histogram("cosmosdb.request_charge", unit="RU", description="Request units consumed by a repository call")
+duration_histogram = meter.create_histogram("cosmosdb.duration", unit="ms", description="Duration of a repository call")
+etag_conflict_retries_histogram = meter.create_histogram("cosmosdb.etag_conflict_retries", unit="{retry}", description="Retries of a read-modify-write after etag conflicts")
+optimistic_update_duration_histogram = meter.create_histogram("cosmosdb.optimistic_update.duration", unit="ms", description="Duration of a read-modify-write, including its retries")
+deployment_status_update_duration_histogram = meter.create_histogram("cosmosdb.deployment_status_update.duration", unit="ms", description="Duration of the state store writes for a deployment status update")
+
+
+class CosmosCall:
+    """
+    Totals the Cosmos DB responses received during a single call to a repository method.
+    """
+
+    def __init__(self, repository: str, method: str):
+        self.repository = repository
+        self.method = method
+        self.request_charge = 0.0
+        self.request_count = 0
+        self.item_count = 0
+        self.page_count = 0
+        self.throttled_count = 0
+        self.duration_ms = 0.0
+        self.started_when = time.time_ns()
+
+    def record_response(self, headers, status_code: int):
+        self.request_count += 1
+        self.request_charge += float(headers.get(http_constants.HttpHeaders.RequestCharge) or 0)
+        item_count = headers.get(http_constants.HttpHeaders.ItemCount)
+        if item_count is not None:
+            self.page_count += 1
+            self.item_count += int(item_count)
+        if status_code == http_constants.StatusCodes.TOO_MANY_REQUESTS:
+            self.throttled_count += 1
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.request_count == 0:
+            return
+
+        attributes = {"repository": self.repository, "method": self.method}
+        request_charge_histogram.record(self.request_charge, attributes)
+        duration_histogram.record(self.duration_ms, attributes)
+
+        # started retrospectively, so a call that never reaches Cosmos DB doesn't produce a span
+        span = tracer.start_span(f"{self.repository}.{self.method}", start_time=self.started_when, attributes={
+            "db.system": "cosmosdb",
+            "cosmosdb.request_charge": self.request_charge,
+            "cosmosdb.request_count": self.request_count,
+            "cosmosdb.item_count": self.item_count,
+            "cosmosdb.page_count": self.page_count,
+            "cosmosdb.throttled_count": self.throttled_count,
+            **attributes
+        })
+        if error is not None:
+            span.record_exception(error)
+        span.end()
+
+        if self.request_charge >= config.COSMOS_REQUEST_CHARGE_LOG_THRESHOLD or self.duration_ms >= config.COSMOS_DURATION_LOG_THRESHOLD_MS:
+            logger.warning(f"{self.repository}.{self.method} used {self.request_charge:.1f} RU in {self.duration_ms:.0f}ms over {self.request_count} requests, "
+                           f"reading {self.item_count} items in {self.page_count} pages ({self.throttled_count} requests throttled)")
+
+
+def record_optimistic_update(repository: str, operation: str, retries: int, duration_ms: float, succeeded: bool):
+    attributes = {"repository": repository, "operation": operation, "succeeded": succeeded}
+    etag_conflict_retries_histogram.record(retries, attributes)
+    optimistic_update_duration_histogram.record(duration_ms, attributes)
+    if retries:
+        logger.info(f"{repository} {operation} took {retries} retries and {duration_ms:.0f}ms after etag conflicts")
+
+
+def record_deployment_status_update(duration_ms: float, transactional_batch: bool):
+    """
+    Records how long the state store writes for a deployment status update took, and whether the operation and its
+    resource were written in a transactional batch, so the two can be compared.
+    """
+    deployment_status_update_duration_histogram.record(duration_ms, {"transactional_batch": transactional_batch})
+
+
+current_call: ContextVar[Optional[CosmosCall]] = ContextVar("current_cosmos_call", default=None)
+
+
+def record_cosmos_response(response: PipelineResponse):
+    """
+    Cosmos DB client response hook, called for every response (including throttled attempts that are retried).
+    Responses received outside an instrumented repository method aren't recorded.
+    """
+    call = current_call.get()
+    if call is not None:
+        call.record_response(response.http_response.headers, response.http_response.status_code)
+
+
+def instrument_repository_method(method: Callable) -> Callable:
+    """
+    Records the Cosmos DB responses of each call to method against the repository class and method name. Only the
+    outermost instrumented method is recorded, so a method's charge includes the repository methods it calls.
+    """
+    if inspect.isasyncgenfunction(method):
+        @functools.wraps(method)
+        async def instrumented_generator(self, *args, **kwargs):
+            if current_call.get() is not None:
+                async for item in method(self, *args, **kwargs):
+                    yield item
+                return
+
+            call = CosmosCall(type(self).__name__, method.__name__)
+            generator = method(self, *args, **kwargs)
+            error = None
+            try:
+                while True:
+                    # only recorded while the generator is running, not while the caller consumes what it yields
+                    token = current_call.set(call)
+                    started = time.monotonic()
+                    try:
+                        item = await generator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    except Exception as e:
+                        error = e
+                        raise
+                    finally:
+                        call.duration_ms += (time.monotonic() - started) * 1000
+                        current_call.reset(token)
+                    yield item
+            finally:
+                await generator.aclose()
+                call.finish(error)
+
+        instrumented_generator.__instrumented__ = True
+        return instrumented_generator
+
+    @functools.wraps(method)
+    async def instrumented(self, *args, **kwargs):
+        if current_call.get() is not None:
+            return await method(self, *args, **kwargs)
+
+        call = CosmosCall(type(self).__name__, method.__name__)
+        token = current_call.set(call)
+        started = time.monotonic()
+        error = None
+        try:
+            return await method(self, *args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            call.duration_ms = (time.monotonic() - started) * 1000
+            current_call.reset(token)
+            call.finish(error)
+
+    instrumented.__instrumented__ = True
+    return instrumented
+
+
+def instrument_repository(repository_type: type):
+    """
+    Instruments the public async methods defined on repository_type.
+    """
+    for name, attribute in list(vars(repository_type).items()):
+        if name.startswith("_") or getattr(attribute, "__instrumented__", False):
+            continue
+        if inspect.iscoroutinefunction(attribute) or inspect.isasyncgenfunction(attribute):
+            setattr(repository_type, name, instrument_repository_method(attribute))
@@ -0,0 +1,53 @@
+import copy
+import json
+from typing import List
+
+
+def escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def differs(source, target) -> bool:
+    # 1, 1.0 and True are equal in Python, but not in JSON
+    return source != target or json.dumps(source, sort_keys=True) != json.dumps(target, sort_keys=True)
+
+
+def make_patch(source: dict, target: dict, path: str = "") -> List[dict]:
+    """
+    Returns the JSON patch (RFC 6902) operations that turn source into target. Objects are compared key by key;
+    any other value that differs, including a list, is replaced whole.
+    """
+    operations = [{"op": "remove", "path": f"{path}/{escape(key)}"} for key in source if key not in target]
+    for key, value in target.items():
+        key_path = f"{path}/{escape(key)}"
+        if key not in source:
+            operations.append({"op": "add", "path": key_path, "value": value})
+        elif isinstance(source[key], dict) and isinstance(value, dict):
+            operations += make_patch(source[key], value, key_path)
+        elif differs(source[key], value):
+            operations.append({"op": "replace", "path": key_path, "value": value})
+    return operations
+
+
+def apply_patch(document: dict, operations: List[dict]) -> dict:
+    """
+    Returns a copy of document with the add, remove and replace operations of a patch made by make_patch applied.
+    """
+    patched = copy.deepcopy(document)
+    for operation in operations:
+        *parent_tokens, key = [unescape(token) for token in operation["path"].split("/")[1:]]
+        parent = patched
+        for token in parent_tokens:
+            parent = parent[token]
+
+        if operation["op"] == "remove":
+            del parent[key]
+        elif operation["op"] in ("add", "replace"):
+            parent[key] = copy.deepcopy(operation["value"])
+        else:
+            raise ValueError(f"Unsupported JSON patch operation {operation['op']}")
+    return patched
@@ -0,0 +1,334 @@
+import copy
+import json
+from bisect import bisect_right
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+from azure.core import MatchConditions
+from azure.cosmos import http_constants
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosBatchOperationError, CosmosHttpResponseError, CosmosResourceExistsError, CosmosResourceNotFoundError
+
+from db.json_patch import unescape
+from db.memory.query import QuerySyntaxError, parse_query
+
+DEFAULT_PAGE_SIZE = 100
+
+ResponseHook = Callable[[Mapping[str, str], Any], None]
+
+
+class InMemoryPage:
+    def __init__(self, items: List[Any]):
+        self._items = items
+
+    async def _iterate(self):
+        for item in self._items:
+            yield item
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class InMemoryPages:
+    """
+    Pages of query results, with the continuation token of the next page set as each page is returned, like the
+    page iterator of a Cosmos DB query. As in Cosmos DB, a query without an ORDER BY resumes after the last item
+    read, so removing items already read doesn't skip the ones after them; an ordered one resumes at an offset.
+    """
+
+    def __init__(self, run_query: Callable[[], Tuple[List[Tuple[Any, Any]], bool]], page_size: int, continuation_token: Optional[str]):
+        self._run_query = run_query
+        self._page_size = page_size
+        self._results: Optional[List[Tuple[Any, Any]]] = None
+        self._offset = 0
+        self._done = False
+        self._positional = False
+        self.continuation_token = continuation_token
+
+    def __aiter__(self):
+        return self
+
+    def _resume_offset(self) -> int:
+        token = decode_continuation_token(self.continuation_token)
+        if self._positional and "after" in token:
+            return bisect_right([position for position, _ in self._results], token["after"])
+        return token.get("offset", 0)
+
+    async def __anext__(self) -> InMemoryPage:
+        if self._results is None:
+            self._results, self._positional = self._run_query()
+            self._offset = self._resume_offset()
+        if self._done or (self._offset >= len(self._results) and self.continuation_token is not None):
+            raise StopAsyncIteration
+
+        page = self._results[self._offset:self._offset + self._page_size]
+        self._offset += len(page)
+        self._done = self._offset >= len(self._results)
+        if self._done:
+            self.continuation_token = None
+        elif self._positional:
+            self.continuation_token = json.dumps({"after": page[-1][0]})
+        else:
+            self.continuation_token = json.dumps({"offset": self._offset})
+        return InMemoryPage([result for _, result in page])
+
+
+class InMemoryQueryIterable:
+    def __init__(self, run_query: Callable[[], Tuple[List[Tuple[Any, Any]], bool]], page_size: int):
+        self._run_query = run_query
+        self._page_size = page_size
+
+    async def _iterate(self):
+        results, _ = self._run_query()
+        for _, item in results:
+            yield item
+
+    def __aiter__(self):
+        return self._iterate()
+
+    def by_page(self, continuation_token: Optional[str] = None) -> InMemoryPages:
+        return InMemoryPages(self._run_query, self._page_size, continuation_token)
+
+
+def decode_continuation_token(continuation_token: Optional[str]) -> dict:
+    if continuation_token is None:
+        return {}
+    try:
+        token = json.loads(continuation_token)
+        if not isinstance(token, dict) or not all(isinstance(token[key], int) for key in token) or not token.keys() & {"offset", "after"}:
+            raise ValueError
+        return token
+    except (ValueError, TypeError, KeyError):
+        raise CosmosHttpResponseError(status_code=http_constants.StatusCodes.BAD_REQUEST, message="Invalid continuation token")
+
+
+def apply_patch_operation(document: dict, operation: dict):
+    """
+    Applies a Cosmos DB partial document update operation to document, in place: set adds or replaces a property (or
+    replaces an array element), add does the same but inserts into an array, replace and remove need the path to exist
+    and incr adds to a number.
+    """
+    *parent_tokens, key = [unescape(token) for token in operation["path"].split("/")[1:]]
+    parent = document
+    try:
+        for token in parent_tokens:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        op = operation["op"]
+        if isinstance(parent, list):
+            index = len(parent) if key == "-" else int(key)
+            if op == "add":
+                parent.insert(index, operation["value"])
+            elif op in ("set", "replace"):
+                parent[index] = operation["value"]
+            elif op == "remove":
+                del parent[index]
+            elif op == "incr":
+                parent[index] += operation["value"]
+            else:
+                raise ValueError(op)
+        else:
+            if op in ("set", "add"):
+                parent[key] = operation["value"]
+            elif op == "replace":
+                if key not in parent:
+                    raise KeyError(key)
+                parent[key] = operation["value"]
+            elif op == "remove":
+                del parent[key]
+            elif op == "incr":
+                parent[key] = parent.get(key, 0) + operation["value"]
+            else:
+                raise ValueError(op)
+    except (KeyError, IndexError, TypeError, ValueError):
+        raise CosmosHttpResponseError(status_code=http_constants.StatusCodes.BAD_REQUEST, message=f"Can't apply the patch operation {operation['op']} to {operation['path']}")
+
+
+class InMemoryContainer:
+    """
+    A container held in memory, implementing the subset of azure.cosmos.aio.ContainerProxy the repositories use,
+    so the API can run without a Cosmos DB account. Items are stored as JSON, keyed on partition key and id, and are
+    given an _etag on every write, which the match conditions are checked against. Queries support the subset of
+    the SQL dialect in db.memory.query.
+
+    A hierarchical partition key is given as a list of paths, and its values as a list, of which a query's
+    partition key can be a prefix.
+    """
+
+    def __init__(self, container_id: str, partition_key_path: Union[str, List[str]] = "/id"):
+        self.id = container_id
+        self._hierarchical = isinstance(partition_key_path, list)
+        paths = partition_key_path if self._hierarchical else [partition_key_path]
+        self._partition_key_paths = [path.strip("/").split("/") for path in paths]
+        self._items: Dict[Tuple[Any, str], dict] = {}
+        # the order items were created in, like the _rid Cosmos DB gives them, which queries resume after
+        self._positions: Dict[Tuple[Any, str], int] = {}
+        self._next_position = 0
+
+    @staticmethod
+    def _value_at(body: dict, path: List[str]):
+        value = body
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                return None
+            value = value[key]
+        return value
+
+    def _partition_key(self, body: dict):
+        values = [self._value_at(body, path) for path in self._partition_key_paths]
+        return tuple(values) if self._hierarchical else values[0]
+
+    def _partition_key_value(self, partition_key: Any):
+        return tuple(partition_key) if self._hierarchical and isinstance(partition_key, list) else partition_key
+
+    def _in_partition(self, item_partition_key: Any, partition_key: Any) -> bool:
+        if partition_key is None:
+            return True
+        if self._hierarchical:
+            prefix = self._partition_key_value(partition_key)
+            return item_partition_key[:len(prefix)] == prefix
+        return item_partition_key == partition_key
+
+    def _key(self, body: dict) -> Tuple[Any, str]:
+        if not isinstance(body.get("id"), str):
+            raise CosmosHttpResponseError(status_code=http_constants.StatusCodes.BAD_REQUEST, message="The item must have a string id")
+        return self._partition_key(body), body["id"]
+
+    @staticmethod
+    def _check_match_condition(existing: Optional[dict], etag: Optional[str], match_condition: Optional[MatchConditions]):
+        if match_condition == MatchConditions.IfNotModified and (existing is None or existing["_etag"] != etag):
+            raise CosmosAccessConditionFailedError(status_code=http_constants.StatusCodes.PRECONDITION_FAILED, message="The etag doesn't match")
+
+    @staticmethod
+    def _respond(result: Any, response_hook: Optional[ResponseHook]):
+        if response_hook is not None:
+            headers = {http_constants.HttpHeaders.RequestCharge: "0"}
+            if isinstance(result, dict) and "_etag" in result:
+                headers[http_constants.HttpHeaders.ETag] = result["_etag"]
+            response_hook(headers, result)
+        return result
+
+    def _store(self, key: Tuple[Any, str], body: dict) -> dict:
+        # stored as JSON, as Cosmos DB would, so the caller can't change a stored item through a reference to it
+        item = json.loads(json.dumps(body))
+        item["_etag"] = f'"{uuid.uuid4()}"'
+        item["_ts"] = int(time.time())
+        if key not in self._positions:
+            self._positions[key] = self._next_position
+            self._next_position += 1
+        self._items[key] = item
+        return copy.deepcopy(item)
+
+    async def read_item(self, item: str, partition_key: Any, response_hook: Optional[ResponseHook] = None, **kwargs) -> dict:
+        stored = self._items.get((self._partition_key_value(partition_key), item))
+        if stored is None:
+            raise CosmosResourceNotFoundError(status_code=http_constants.StatusCodes.NOT_FOUND, message=f"Item {item} not found")
+        return self._respond(copy.deepcopy(stored), response_hook)
+
+    async def create_item(self, body: dict, response_hook: Optional[ResponseHook] = None, **kwargs) -> dict:
+        key = self._key(body)
+        if key in self._items:
+            raise CosmosResourceExistsError(status_code=http_constants.StatusCodes.CONFLICT, message=f"Item {body['id']} already exists")
+        return self._respond(self._store(key, body), response_hook)
+
+    async def upsert_item(self, body: dict, etag: Optional[str] = None, match_condition: Optional[MatchConditions] = None, response_hook: Optional[ResponseHook] = None, **kwargs) -> dict:
+        key = self._key(body)
+        self._check_match_condition(self._items.get(key), etag, match_condition)
+        return self._respond(self._store(key, body), response_hook)
+
+    async def replace_item(self, item: str, body: dict, etag: Optional[str] = None, match_condition: Optional[MatchConditions] = None, response_hook: Optional[ResponseHook] = None, **kwargs) -> dict:
+        key = self._key(body)
+        existing = self._items.get(key)
+        if existing is None or body["id"] != item:
+            raise CosmosResourceNotFoundError(status_code=http_constants.StatusCodes.NOT_FOUND, message=f"Item {item} not found")
+        self._check_match_condition(existing, etag, match_condition)
+        return self._respond(self._store(key, body), response_hook)
+
+    async def patch_item(self, item: str, partition_key: Any, patch_operations: List[dict], etag: Optional[str] = None, match_condition: Optional[MatchConditions] = None, response_hook: Optional[ResponseHook] = None, **kwargs) -> dict:
+        key = (self._partition_key_value(partition_key), item)
+        existing = self._items.get(key)
+        if existing is None:
+            raise CosmosResourceNotFoundError(status_code=http_constants.StatusCodes.NOT_FOUND, message=f"Item {item} not found")
+        self._check_match_condition(existing, etag, match_condition)
+        # the operations are applied together or not at all
+        patched = copy.deepcopy(existing)
+        for operation in patch_operations:
+            apply_patch_operation(patched, operation)
+        return self._respond(self._store(key, patched), response_hook)
+
+    async def delete_item(self, item: str, partition_key: Any, etag: Optional[str] = None, match_condition: Optional[MatchConditions] = None, response_hook: Optional[ResponseHook] = None, **kwargs) -> None:
+        key = (self._partition_key_value(partition_key), item)
+        existing = self._items.get(key)
+        if existing is None:
+            raise CosmosResourceNotFoundError(status_code=http_constants.StatusCodes.NOT_FOUND, message=f"Item {item} not found")
+        self._check_match_condition(existing, etag, match_condition)
+        del self._items[key]
+        del self._positions[key]
+        self._respond(None, response_hook)
+
+    async def execute_item_batch(self, batch_operations: List[tuple], partition_key: Any, response_hook: Optional[ResponseHook] = None, **kwargs) -> List[dict]:
+        """
+        Runs the operations of a transactional batch against a copy of the items, keeping the copy only if they all
+        succeed, and raises CosmosBatchOperationError with the index and status of the first that fails if not.
+        """
+        items, positions = self._items, self._positions
+        self._items, self._positions = copy.deepcopy(items), dict(positions)
+        results = []
+        try:
+            for operation_type, args, *options in batch_operations:
+                etag = options[0].get("if_match_etag") if options else None
+                match_condition = MatchConditions.IfNotModified if etag is not None else None
+                try:
+                    if operation_type in ("create", "upsert", "replace"):
+                        body = args[-1]
+                        if self._partition_key(body) != self._partition_key_value(partition_key):
+                            raise CosmosHttpResponseError(status_code=http_constants.StatusCodes.BAD_REQUEST, message="The item isn't in the batch's partition")
+                        if operation_type == "create":
+                            result = await self.create_item(body)
+                        elif operation_type == "upsert":
+                            result = await self.upsert_item(body, etag=etag, match_condition=match_condition)
+                        else:
+                            result = await self.replace_item(args[0], body, etag=etag, match_condition=match_condition)
+                    elif operation_type == "patch":
+                        result = await self.patch_item(args[0], partition_key, args[1], etag=etag, match_condition=match_condition)
+                    elif operation_type == "read":
+                        result = await self.read_item(args[0], partition_key)
+                    elif operation_type == "delete":
+                        result = await self.delete_item(args[0], partition_key, etag=etag, match_condition=match_condition)
+                    else:
+                        raise CosmosHttpResponseError(status_code=http_constants.StatusCodes.BAD_REQUEST, message=f"Unsupported batch operation {operation_type}")
+                except CosmosHttpResponseError as e:
+                    raise CosmosBatchOperationError(error_index=len(results), headers={}, status_code=e.status_code, message=e.message,
+                                                    operation_responses=results + [{"statusCode": e.status_code}])
+                results.append({"statusCode": 200, "resourceBody": result, "eTag": result["_etag"] if result else None})
+        except Exception:
+            self._items, self._positions = items, positions
+            raise
+        return self._respond(results, response_hook)
+
+    def query_items(self, query: str, parameters: Optional[List[dict]] = None, partition_key: Optional[Any] = None, max_item_count: Optional[int] = None, **kwargs) -> InMemoryQueryIterable:
+        def run_query() -> Tuple[List[Tuple[Any, Any]], bool]:
+            try:
+                compiled = parse_query(query)
+            except QuerySyntaxError as e:
+                raise CosmosHttpResponseError(status_code=http_constants.StatusCodes.BAD_REQUEST, message=f"Unsupported query: {e}")
+            keys = [key for key in self._items if self._in_partition(key[0], partition_key)]
+            rows = compiled.execute_with_positions([self._items[key] for key in keys], [self._positions[key] for key in keys], parameters)
+            return copy.deepcopy(rows), not compiled.order_by
+
+        page_size = max_item_count if max_item_count and max_item_count > 0 else DEFAULT_PAGE_SIZE
+        return InMemoryQueryIterable(run_query, page_size)
+
+
+class InMemoryDatabase:
+    """
+    Holds the in-memory containers, creating each one with its partition key the first time it's requested.
+    """
+
+    def __init__(self, partition_key_paths: Dict[str, Union[str, List[str]]]):
+        self._partition_key_paths = partition_key_paths
+        self._containers: Dict[str, InMemoryContainer] = {}
+
+    def get_container_client(self, container_name: str) -> InMemoryContainer:
+        if container_name not in self._containers:
+            self._containers[container_name] = InMemoryContainer(container_name, self._partition_key_paths.get(container_name, "/id"))
+        return self._containers[container_name]
@@ -0,0 +1,381 @@
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class QuerySyntaxError(Exception):
+    pass
+
+
+class Undefined:
+    """
+    The value of a property that doesn't exist. Unlike null, it never matches a comparison and is left out of results.
+    """
+
+    def __repr__(self):
+        return "undefined"
+
+
+UNDEFINED = Undefined()
+
+Expression = Callable[[dict, Dict[str, Any]], Any]
+
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<parameter>@\w+)
+      | (?P<identifier>[A-Za-z_]\w*)
+      | (?P<operator>!=|<>|<=|>=|=|<|>|,|\(|\)|\[|\]|\.|\*)
+    )""", re.VERBOSE)
+
+KEYWORDS = {"SELECT", "TOP", "VALUE", "FROM", "WHERE", "ORDER", "BY", "ASC", "DESC", "AND", "OR", "NOT", "AS", "TRUE", "FALSE", "NULL"}
+
+
+def tokenize(query: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = TOKEN_PATTERN.match(query, position)
+        if match is None:
+            raise QuerySyntaxError(f"Unexpected character at position {position}: {query[position:position + 10]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "identifier" and value.upper() in KEYWORDS:
+            kind = "keyword"
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def same_type(a, b) -> bool:
+    if is_number(a) and is_number(b):
+        return True
+    return type(a) is type(b) or (isinstance(a, str) and isinstance(b, str))
+
+
+def equals(a, b):
+    if a is UNDEFINED or b is UNDEFINED:
+        return UNDEFINED
+    return same_type(a, b) and a == b
+
+
+def compare(operator: str, a, b):
+    if operator == "=":
+        return equals(a, b)
+    if operator in ("!=", "<>"):
+        result = equals(a, b)
+        return result if result is UNDEFINED else not result
+    if not ((is_number(a) and is_number(b)) or (isinstance(a, str) and isinstance(b, str))):
+        return UNDEFINED
+    if operator == "<":
+        return a < b
+    if operator == "<=":
+        return a <= b
+    if operator == ">":
+        return a > b
+    return a >= b
+
+
+def logical_and(values):
+    if any(v is False for v in values):
+        return False
+    return True if all(v is True for v in values) else UNDEFINED
+
+
+def logical_or(values):
+    if any(v is True for v in values):
+        return True
+    return False if all(v is False for v in values) else UNDEFINED
+
+
+def strings_function(function: Callable[[str, str], bool]):
+    def evaluate(value, argument, ignore_case=False):
+        if not isinstance(value, str) or not isinstance(argument, str):
+            return UNDEFINED
+        if ignore_case is True:
+            value, argument = value.lower(), argument.lower()
+        return function(value, argument)
+    return evaluate
+
+
+def array_contains(array, value, partial=False):
+    if not isinstance(array, list) or value is UNDEFINED:
+        return UNDEFINED
+    if partial is True and isinstance(value, dict):
+        return any(isinstance(a, dict) and all(k in a and equals(a[k], v) is True for k, v in value.items()) for a in array)
+    return any(equals(a, value) is True for a in array)
+
+
+FUNCTIONS: Dict[str, Callable] = {
+    "CONTAINS": strings_function(lambda value, argument: argument in value),
+    "STARTSWITH": strings_function(lambda value, argument: value.startswith(argument)),
+    "ENDSWITH": strings_function(lambda value, argument: value.endswith(argument)),
+    "ARRAY_CONTAINS": array_contains,
+    "ARRAY_LENGTH": lambda array: len(array) if isinstance(array, list) else UNDEFINED,
+    "IS_DEFINED": lambda value: value is not UNDEFINED,
+    "IS_NULL": lambda value: value is None,
+    "LOWER": lambda value: value.lower() if isinstance(value, str) else UNDEFINED,
+    "UPPER": lambda value: value.upper() if isinstance(value, str) else UNDEFINED,
+}
+
+# undefined sorts first, then values of each type in the order Cosmos DB uses
+TYPE_ORDER = [(type(None), 1), (bool, 2), (int, 3), (float, 3), (str, 4)]
+
+
+def sort_key(value):
+    if value is UNDEFINED:
+        return (0, 0)
+    for value_type, rank in TYPE_ORDER:
+        if isinstance(value, value_type):
+            return (rank, 0 if value is None else value)
+    return (5, 0)
+
+
+class Query:
+    """
+    A compiled query in the subset of the Cosmos DB SQL dialect the repositories use:
+    SELECT [TOP n] [VALUE] (* | expressions) FROM c [WHERE condition] [ORDER BY c.path [ASC|DESC], ...]
+    """
+
+    def __init__(self, top: Optional[int], select_value: bool, projections: Optional[List[Tuple[str, Expression]]], condition: Optional[Expression], order_by: List[Tuple[Expression, bool]]):
+        self.top = top
+        self.select_value = select_value
+        self.projections = projections
+        self.condition = condition
+        self.order_by = order_by
+
+    def execute(self, items: List[dict], parameters: Optional[List[dict]] = None) -> List[Any]:
+        return [result for _, result in self.execute_with_positions(items, list(range(len(items))), parameters)]
+
+    def execute_with_positions(self, items: List[dict], positions: List[Any], parameters: Optional[List[dict]] = None) -> List[Tuple[Any, Any]]:
+        """
+        Returns the results, each with the position of the item it came from, so a page can resume after the last
+        item of the one before rather than at an offset.
+        """
+        values = {p["name"]: p["value"] for p in parameters or []}
+        rows = list(zip(positions, items))
+        if self.condition is not None:
+            rows = [(position, item) for position, item in rows if self.condition(item, values) is True]
+        for expression, descending in reversed(self.order_by):
+            rows = sorted(rows, key=lambda row: sort_key(expression(row[1], values)), reverse=descending)
+        if self.top is not None:
+            rows = rows[:self.top]
+        if self.projections is None:
+            return rows
+        if self.select_value:
+            _, expression = self.projections[0]
+            return [(position, value) for position, value in ((position, expression(item, values)) for position, item in rows) if value is not UNDEFINED]
+        results = []
+        for position, item in rows:
+            result = {}
+            for name, expression in self.projections:
+                value = expression(item, values)
+                if value is not UNDEFINED:
+                    result[name] = value
+            results.append((position, result))
+        return results
+
+
+class Parser:
+    def __init__(self, query: str):
+        self.tokens = tokenize(query)
+        self.position = 0
+        self.alias = None
+
+    def peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def at(self, kind: str, value: Optional[str] = None, offset: int = 0) -> bool:
+        token_kind, token_value = self.peek(offset)
+        # keywords are case insensitive, and are only matched by kind when used as property names
+        return token_kind == kind and (value is None or (token_value.upper() if kind == "keyword" else token_value) == value)
+
+    def accept(self, kind: str, value: Optional[str] = None) -> Optional[str]:
+        token_value = self.peek()[1]
+        if self.at(kind, value):
+            self.position += 1
+            return token_value
+        return None
+
+    def expect(self, kind: str, value: Optional[str] = None) -> str:
+        token = self.accept(kind, value)
+        if token is None:
+            raise QuerySyntaxError(f"Expected {value or kind} but found {self.peek()[1]!r}")
+        return token
+
+    def parse(self) -> Query:
+        self.expect("keyword", "SELECT")
+        top = int(self.expect("number")) if self.accept("keyword", "TOP") else None
+        select_value = self.accept("keyword", "VALUE") is not None
+        # projections reference the alias, which is only known once FROM is parsed
+        projection_start = self.position
+        self.skip_to_keyword("FROM")
+        self.expect("keyword", "FROM")
+        self.alias = self.expect("identifier")
+        condition = self.parse_expression() if self.accept("keyword", "WHERE") else None
+        order_by = self.parse_order_by() if self.accept("keyword", "ORDER") else []
+        if self.position != len(self.tokens):
+            raise QuerySyntaxError(f"Unexpected {self.peek()[1]!r}")
+
+        end = self.position
+        self.position = projection_start
+        projections = self.parse_projections(select_value)
+        self.position = end
+        return Query(top, select_value, projections, condition, order_by)
+
+    def skip_to_keyword(self, keyword: str):
+        while not self.at("keyword", keyword):
+            if self.peek()[0] is None:
+                raise QuerySyntaxError(f"Expected {keyword}")
+            self.position += 1
+
+    def parse_projections(self, select_value: bool) -> Optional[List[Tuple[str, Expression]]]:
+        if self.accept("operator", "*"):
+            return None
+        projections = []
+        while True:
+            start = self.position
+            expression = self.parse_expression()
+            name = self.accept("keyword", "AS") and self.expect("identifier")
+            if not name:
+                # a property path is named after its last property
+                is_path = self.position - start > 1 and self.tokens[self.position - 2] == ("operator", ".")
+                name = self.tokens[self.position - 1][1] if is_path else f"${len(projections) + 1}"
+            projections.append((name, expression))
+            if not self.accept("operator", ","):
+                break
+        if select_value and len(projections) != 1:
+            raise QuerySyntaxError("SELECT VALUE takes a single expression")
+        return projections
+
+    def parse_order_by(self) -> List[Tuple[Expression, bool]]:
+        self.expect("keyword", "BY")
+        order_by = []
+        while True:
+            expression = self.parse_primary()
+            descending = self.accept("keyword", "DESC") is not None
+            if not descending:
+                self.accept("keyword", "ASC")
+            order_by.append((expression, descending))
+            if not self.accept("operator", ","):
+                return order_by
+
+    def parse_expression(self) -> Expression:
+        operands = [self.parse_and()]
+        while self.accept("keyword", "OR"):
+            operands.append(self.parse_and())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda item, values: logical_or([operand(item, values) for operand in operands])
+
+    def parse_and(self) -> Expression:
+        operands = [self.parse_not()]
+        while self.accept("keyword", "AND"):
+            operands.append(self.parse_not())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda item, values: logical_and([operand(item, values) for operand in operands])
+
+    def parse_not(self) -> Expression:
+        if self.accept("keyword", "NOT"):
+            operand = self.parse_not()
+
+            def negate(item, values):
+                value = operand(item, values)
+                return not value if isinstance(value, bool) else UNDEFINED
+            return negate
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> Expression:
+        left = self.parse_primary()
+        kind, operator = self.peek()
+        if kind == "operator" and operator in ("=", "!=", "<>", "<", "<=", ">", ">="):
+            self.position += 1
+            right = self.parse_primary()
+            return lambda item, values: compare(operator, left(item, values), right(item, values))
+        return left
+
+    def parse_primary(self) -> Expression:
+        kind, value = self.peek()
+        if kind == "number":
+            self.position += 1
+            number = float(value) if "." in value else int(value)
+            return lambda item, values: number
+        if kind == "string":
+            self.position += 1
+            string = re.sub(r"\\(.)", r"\1", value[1:-1])
+            return lambda item, values: string
+        if kind == "parameter":
+            self.position += 1
+            return lambda item, values: values.get(value, UNDEFINED)
+        if kind == "keyword" and value.upper() in ("TRUE", "FALSE", "NULL"):
+            self.position += 1
+            constant = {"TRUE": True, "FALSE": False, "NULL": None}[value.upper()]
+            return lambda item, values: constant
+        if self.accept("operator", "("):
+            expression = self.parse_expression()
+            self.expect("operator", ")")
+            return expression
+        if kind == "identifier":
+            if self.at("operator", "(", offset=1):
+                return self.parse_function()
+            return self.parse_path()
+        raise QuerySyntaxError(f"Unexpected {value!r}")
+
+    def parse_function(self) -> Expression:
+        name = self.expect("identifier").upper()
+        function = FUNCTIONS.get(name)
+        if function is None:
+            raise QuerySyntaxError(f"Unsupported function {name}")
+        self.expect("operator", "(")
+        arguments = []
+        if not self.accept("operator", ")"):
+            while True:
+                arguments.append(self.parse_expression())
+                if self.accept("operator", ")"):
+                    break
+                self.expect("operator", ",")
+        return lambda item, values: function(*[argument(item, values) for argument in arguments])
+
+    def parse_path(self) -> Expression:
+        root = self.expect("identifier")
+        if self.alias is not None and root != self.alias:
+            raise QuerySyntaxError(f"Unknown identifier {root}")
+        steps: List[Expression] = []
+        while True:
+            if self.accept("operator", "."):
+                name = self.accept("identifier") or self.expect("keyword")
+                steps.append(lambda item, values, name=name: name)
+            elif self.accept("operator", "["):
+                steps.append(self.parse_expression())
+                self.expect("operator", "]")
+            else:
+                break
+
+        def resolve(item, values):
+            value = item
+            for step in steps:
+                key = step(item, values)
+                if isinstance(value, dict) and isinstance(key, str):
+                    value = value.get(key, UNDEFINED)
+                elif isinstance(value, list) and is_number(key) and 0 <= key < len(value):
+                    value = value[int(key)]
+                else:
+                    return UNDEFINED
+            return value
+        return resolve
+
+
+@lru_cache(maxsize=512)
+def parse_query(query: str) -> Query:
+    """
+    Compiles a query, raising QuerySyntaxError for anything outside the supported subset.
+    """
+    return Parser(query).parse()
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Mapping, Optional, Union
+
+from azure.cosmos import http_constants
+from azure.cosmos.aio import ContainerProxy
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceExistsError, CosmosResourceNotFoundError
+
+MAX_THROTTLED_RETRIES = 10
+DEFAULT_RETRY_AFTER_MS = 1000
+
+
+@dataclass
+class BulkPatch:
+    """
+    Fields a transform sets on the document with id and partition_key, in place of the whole document, so that writes
+    made to its other fields while the migration runs are kept.
+    """
+    id: str
+    partition_key: Any
+    fields: dict
+
+    def patch_operations(self) -> List[dict]:
+        return [{"op": "set", "path": f"/{field}", "value": value} for field, value in self.fields.items()]
+
+
+class BulkWriter:
+    """
+    Upserts documents with at most max_concurrency requests in flight. When Cosmos DB throttles a write (429), every
+    write waits out the retry-after it was given before sending again, so a migration slows to the throughput the
+    container has rather than failing. The request charges of the writes are totalled for reporting.
+
+    Unless overwrite is set, documents are created rather than upserted, and a document that already exists is left
+    as it is. A BulkPatch is applied as a partial update, and skipped if its document has been deleted since.
+    """
+
+    def __init__(self, container: ContainerProxy, max_concurrency: int, overwrite: bool = True):
+        self.container = container
+        self.overwrite = overwrite
+        self.request_charge = 0.0
+        self.throttled_count = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._resume_at = 0.0
+
+    def _record_request_charge(self, headers: Mapping[str, str], _):
+        self.request_charge += float(headers.get(http_constants.HttpHeaders.RequestCharge, 0))
+
+    async def upsert(self, item: Union[dict, BulkPatch]):
+        async with self._semaphore:
+            for attempt in range(MAX_THROTTLED_RETRIES + 1):
+                delay = self._resume_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    if isinstance(item, BulkPatch):
+                        await self.container.patch_item(item=item.id, partition_key=item.partition_key, patch_operations=item.patch_operations(), response_hook=self._record_request_charge)
+                    elif self.overwrite:
+                        await self.container.upsert_item(body=item, response_hook=self._record_request_charge)
+                    else:
+                        await self.container.create_item(body=item, response_hook=self._record_request_charge)
+                    return
+                except CosmosResourceExistsError:
+                    # only raised when creating; the document target has is kept
+                    return
+                except CosmosResourceNotFoundError:
+                    # only raised when patching; a document deleted since it was read has nothing to migrate
+                    return
+                except CosmosHttpResponseError as e:
+                    if e.status_code != http_constants.StatusCodes.TOO_MANY_REQUESTS or attempt == MAX_THROTTLED_RETRIES:
+                        raise
+                    self.throttled_count += 1
+                    retry_after = int(e.headers.get(http_constants.HttpHeaders.RetryAfterInMilliseconds, DEFAULT_RETRY_AFTER_MS)) / 1000
+                    self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+
+    async def upsert_all(self, items: List[Union[dict, BulkPatch]]):
+        """
+        Upserts every item, raising the first failure once all of them have been attempted.
+        """
+        results = await asyncio.gather(*[self.upsert(item) for item in items], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+
+@dataclass
+class BulkMigration:
+    """
+    Streams the documents query returns from container, a page at a time, and upserts whatever transform returns
+    for each of them (None leaves the document alone) into target, which defaults to container. A migration that
+    doesn't overwrite only creates the documents target doesn't have yet. A transform that only sets some fields
+    returns a BulkPatch of them rather than the document, so it doesn't revert concurrent writes to the others.
+
+    A transform that has to read other documents can be async; those of a page are run concurrently. Transforms
+    must be idempotent, as a page that was interrupted is processed again when the migration resumes.
+    """
+    name: str
+    container: ContainerProxy
+    query: str
+    transform: Callable[[dict], Union[Optional[dict], Optional[BulkPatch], Awaitable[Optional[Union[dict, BulkPatch]]]]]
+    parameters: Optional[list] = None
+    target: Optional[ContainerProxy] = None
+    overwrite: bool = True
+
+
+def rename_field(old_field_name: str, new_field_name: str) -> Callable[[dict], Optional[dict]]:
+    def transform(item: dict) -> Optional[dict]:
+        if old_field_name not in item:
+            return None
+        item[new_field_name] = item.pop(old_field_name)
+        return item
+    return transform
@@ -0,0 +1,97 @@
+import asyncio
+import inspect
+import time
+from typing import List, Optional, Union
+
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceExistsError
+
+from db.migrations.bulk import BulkMigration, BulkPatch, BulkWriter
+from db.repositories.migrations import MigrationRepository
+from models.domain.migration import MigrationCheckpoint, MigrationStatus
+from services.logging import logger
+
+PAGE_SIZE = 100
+
+
+def describe_progress(checkpoint: MigrationCheckpoint) -> str:
+    elapsed = max(checkpoint.elapsedSeconds, 0.001)
+    throughput = f"{checkpoint.documentsRead / elapsed:.0f} documents/s, {checkpoint.requestCharge / elapsed:.0f} RU/s written"
+    if checkpoint.status == MigrationStatus.Completed:
+        return f"Completed: {checkpoint.documentsWritten} of {checkpoint.documentsRead} documents updated in {checkpoint.elapsedSeconds:.1f}s ({throughput})"
+    if checkpoint.documentsRead == 0:
+        return "Pending"
+    return f"In progress: {checkpoint.documentsWritten} of {checkpoint.documentsRead} documents updated so far ({throughput}). Call again to resume"
+
+
+class BulkMigrationRunner:
+    """
+    Runs bulk migrations in order, streaming each one a page at a time and checkpointing after every page, until
+    they have all completed or time_limit seconds have passed. A migration that is stopped resumes from its
+    checkpoint the next time the runner is called, and the migrations after it wait until it has completed.
+    """
+
+    def __init__(self, migration_repo: MigrationRepository, max_concurrency: int, time_limit: float):
+        self.migration_repo = migration_repo
+        self.max_concurrency = max_concurrency
+        self.time_limit = time_limit
+
+    async def run(self, migrations: List[BulkMigration]) -> List[MigrationCheckpoint]:
+        deadline = time.monotonic() + self.time_limit
+        checkpoints = []
+        for migration in migrations:
+            if checkpoints and checkpoints[-1].status != MigrationStatus.Completed:
+                checkpoint, _ = await self.migration_repo.get_checkpoint(migration.name)
+            else:
+                checkpoint = await self.run_migration(migration, deadline)
+            checkpoints.append(checkpoint)
+        return checkpoints
+
+    async def run_migration(self, migration: BulkMigration, deadline: float) -> MigrationCheckpoint:
+        checkpoint, etag = await self.migration_repo.get_checkpoint(migration.name)
+        if checkpoint.status == MigrationStatus.Completed:
+            return checkpoint
+
+        writer = BulkWriter(migration.target or migration.container, self.max_concurrency, migration.overwrite)
+        pages = migration.container.query_items(query=migration.query, parameters=migration.parameters, max_item_count=PAGE_SIZE).by_page(checkpoint.continuationToken)
+        started = time.monotonic()
+        try:
+            async for page in pages:
+                items = [i async for i in page]
+                transformed = [t for t in await self.transform_all(migration, items) if t is not None]
+                await writer.upsert_all(transformed)
+
+                checkpoint.continuationToken = pages.continuation_token
+                checkpoint.documentsRead += len(items)
+                checkpoint.documentsWritten += len(transformed)
+                if checkpoint.continuationToken is None:
+                    checkpoint.status = MigrationStatus.Completed
+                etag = await self.save_progress(checkpoint, etag, writer, started)
+                started = time.monotonic()
+
+                if checkpoint.status == MigrationStatus.Completed or started >= deadline:
+                    break
+            else:
+                checkpoint.status = MigrationStatus.Completed
+                etag = await self.save_progress(checkpoint, etag, writer, started)
+        except (CosmosAccessConditionFailedError, CosmosResourceExistsError):
+            logger.warning(f"Migration {migration.name} is being run by another instance")
+            checkpoint, _ = await self.migration_repo.get_checkpoint(migration.name)
+            return checkpoint
+
+        logger.info(f"Migration {migration.name}: {describe_progress(checkpoint)}. {writer.throttled_count} writes were throttled")
+        return checkpoint
+
+    @staticmethod
+    async def transform_all(migration: BulkMigration, items: List[dict]) -> List[Optional[Union[dict, BulkPatch]]]:
+        async def transform(item: dict) -> Optional[Union[dict, BulkPatch]]:
+            result = migration.transform(item)
+            return await result if inspect.isawaitable(result) else result
+
+        # an async transform reads other documents, so those of a page are run concurrently
+        return await asyncio.gather(*[transform(item) for item in items])
+
+    async def save_progress(self, checkpoint: MigrationCheckpoint, etag: Optional[str], writer: BulkWriter, started: float) -> str:
+        checkpoint.elapsedSeconds += time.monotonic() - started
+        checkpoint.requestCharge += writer.request_charge
+        writer.request_charge = 0.0
+        return await self.migration_repo.save_checkpoint(checkpoint, etag)
@@ -0,0 +1,17 @@
+from typing import Optional
+
+# The property holding the first level of a workspace partitioned container's partition key (see
+# STATE_STORE_PARTITION_BY_WORKSPACE); the second level is the item id
+PARTITION_KEY_FIELD = "partitionKey"
+# The partition of the items that don't belong to a workspace, i.e. shared services and their operations
+SHARED_PARTITION = "shared"
+
+
+def workspace_partition(workspace_id: Optional[str]) -> str:
+    return workspace_id or SHARED_PARTITION
+
+
+def workspace_partition_of_path(resource_path: str) -> str:
+    # everything in a workspace has a resource path under /workspaces/{workspace_id}
+    parts = resource_path.strip("/").split("/")
+    return workspace_partition(parts[1] if len(parts) > 1 and parts[0] == "workspaces" else None)
@@ -0,0 +1,209 @@
+from datetime import datetime, UTC
+from ipaddress import IPv4Network
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceExistsError, CosmosResourceNotFoundError
+
+from core import config
+from db.repositories.base import BaseRepository
+from models.domain.workspace import WorkspaceAddressSpaces
+from services.cidr_service import CidrAllocationIndex, get_allocation_index, validate_netmask
+from services.logging import logger
+
+ADDRESS_SPACES_DOCUMENT_ID = "workspace-address-spaces"
+MAX_RESERVATION_ATTEMPTS = 10
+# Reservations younger than this survive reconciliation, as their workspace may not have been saved yet
+RESERVATION_GRACE_PERIOD_SECONDS = 3600
+
+ActiveWorkspaceAddressSpacesLoader = Callable[[], Awaitable[List[WorkspaceAddressSpaces]]]
+
+
+class AddressSpaceIndexCache:
+    """
+    Holds the allocation index built from the last version of the allocation document this process read or wrote,
+    keyed by the document's etag, so consecutive allocations don't rebuild it. An index is only valid for the exact
+    document version it was built from; take() hands it over to be mutated, and it is only put back once the write
+    that recorded the mutation has succeeded.
+    """
+
+    def __init__(self):
+        self._etag: Optional[str] = None
+        self._index: Optional[CidrAllocationIndex] = None
+
+    def take(self, etag: str) -> Optional[CidrAllocationIndex]:
+        index = self._index if etag == self._etag else None
+        self.clear()
+        return index
+
+    def set(self, etag: str, index: CidrAllocationIndex):
+        self._etag = etag
+        self._index = index
+
+    def clear(self):
+        self._etag = None
+        self._index = None
+
+
+address_space_index_cache = AddressSpaceIndexCache()
+
+
+class AddressSpaceRepository(BaseRepository):
+    """
+    Records the address spaces allocated to workspaces in a single document, which is updated with an etag
+    condition so that concurrent allocations made by any API instance can never hand out the same range.
+    """
+
+    @classmethod
+    async def create(cls):
+        cls = AddressSpaceRepository()
+        await cls._init_container(config.STATE_STORE_ADDRESS_SPACES_CONTAINER)
+        return cls
+
+    @staticmethod
+    def get_timestamp() -> float:
+        return datetime.now(UTC).timestamp()
+
+    @staticmethod
+    def allocation(address_space: str, workspace_id: str, reserved_when: float) -> dict:
+        return {"addressSpace": address_space, "workspaceId": workspace_id, "reservedWhen": reserved_when}
+
+    @staticmethod
+    def allocations_from_workspaces(workspaces: List[WorkspaceAddressSpaces], reserved_when: float) -> List[dict]:
+        allocations = {}
+        for workspace in workspaces:
+            for address_space in [workspace.address_space] + list(workspace.address_spaces):
+                if address_space is not None:
+                    allocations.setdefault(address_space, AddressSpaceRepository.allocation(address_space, workspace.id, reserved_when))
+        return list(allocations.values())
+
+    async def get_allocations(self, load_active_workspaces: ActiveWorkspaceAddressSpacesLoader) -> Tuple[List[dict], Optional[str]]:
+        """
+        Returns the recorded allocations and the etag of the document holding them. The etag is None when the
+        document doesn't exist yet, in which case the allocations are seeded from the active workspaces.
+        """
+        try:
+            document = await self.read_item_by_id(ADDRESS_SPACES_DOCUMENT_ID)
+            return document["allocations"], document["_etag"]
+        except CosmosResourceNotFoundError:
+            return self.allocations_from_workspaces(await load_active_workspaces(), self.get_timestamp()), None
+
+    async def save_allocations(self, allocations: List[dict], etag: Optional[str]) -> str:
+        document = {"id": ADDRESS_SPACES_DOCUMENT_ID, "allocations": allocations}
+        if etag is None:
+            saved = await self.container.create_item(body=document)
+        else:
+            saved = await self.container.replace_item(item=ADDRESS_SPACES_DOCUMENT_ID, body=document, etag=etag, match_condition=MatchConditions.IfNotModified)
+        return saved["_etag"]
+
+    async def reconcile_allocations(self, allocations: List[dict], load_active_workspaces: ActiveWorkspaceAddressSpacesLoader) -> List[dict]:
+        """
+        Drops the allocations of workspaces that have since been deleted (e.g. before the release was recorded, or
+        whose creation failed after reserving) and records the address spaces of active workspaces that are missing.
+        """
+        workspaces = await load_active_workspaces()
+        active_ids = {workspace.id for workspace in workspaces}
+        cutoff = self.get_timestamp() - RESERVATION_GRACE_PERIOD_SECONDS
+        reconciled = [a for a in allocations if a["workspaceId"] in active_ids or a["reservedWhen"] > cutoff]
+        recorded = {a["addressSpace"] for a in reconciled}
+        reconciled += [a for a in self.allocations_from_workspaces(workspaces, self.get_timestamp()) if a["addressSpace"] not in recorded]
+        return reconciled
+
+    async def update_allocations(self, reserve: Callable[[CidrAllocationIndex, List[dict]], Optional[List[str]]], load_active_workspaces: ActiveWorkspaceAddressSpacesLoader) -> Optional[List[str]]:
+        """
+        Applies reserve to the current allocations and their index and saves the result, re-reading and reapplying it
+        if another allocation got there first. reserve returns the address spaces it reserved, or None when they
+        aren't available, in which case the allocations are reconciled against the active workspaces once before
+        giving up.
+        """
+        for attempt in range(MAX_RESERVATION_ATTEMPTS):
+            allocations, etag = await self.get_allocations(load_active_workspaces)
+            index = address_space_index_cache.take(etag) if etag is not None else None
+            if index is None:
+                index = get_allocation_index(a["addressSpace"] for a in allocations)
+
+            reserved = reserve(index, allocations)
+            if reserved is None:
+                allocations = await self.reconcile_allocations(allocations, load_active_workspaces)
+                index = get_allocation_index(a["addressSpace"] for a in allocations)
+                reserved = reserve(index, allocations)
+                if reserved is None:
+                    return None
+
+            if not reserved and etag is not None:
+                address_space_index_cache.set(etag, index)
+                return reserved
+
+            try:
+                new_etag = await self.save_allocations(allocations, etag)
+            except (CosmosAccessConditionFailedError, CosmosResourceExistsError):
+                if attempt == MAX_RESERVATION_ATTEMPTS - 1:
+                    raise
+                logger.warning("Address space allocations were updated concurrently. Retrying.")
+                continue
+
+            address_space_index_cache.set(new_etag, index)
+            return reserved
+
+    async def allocate_address_space(self, workspace_id: str, cidr_netmask: int, load_active_workspaces: ActiveWorkspaceAddressSpacesLoader) -> str:
+        validate_netmask(cidr_netmask)
+
+        def reserve(index: CidrAllocationIndex, allocations: List[dict]) -> Optional[List[str]]:
+            if not index.can_allocate(cidr_netmask):
+                return None
+            address_space = str(index.allocate(cidr_netmask))
+            allocations.append(self.allocation(address_space, workspace_id, self.get_timestamp()))
+            return [address_space]
+
+        reserved = await self.update_allocations(reserve, load_active_workspaces)
+        if reserved is None:
+            raise Exception("Not enough space in network.")
+        return reserved[0]
+
+    async def reserve_address_space(self, workspace_id: str, address_space: str, load_active_workspaces: ActiveWorkspaceAddressSpacesLoader) -> bool:
+        """
+        Reserves a specific address space, returning False if any of it is already allocated.
+        """
+        network = IPv4Network(address_space)
+
+        def reserve(index: CidrAllocationIndex, allocations: List[dict]) -> Optional[List[str]]:
+            if not index.is_available(network):
+                return None
+            index.reserve(network)
+            allocations.append(self.allocation(address_space, workspace_id, self.get_timestamp()))
+            return [address_space]
+
+        return await self.update_allocations(reserve, load_active_workspaces) is not None
+
+    async def claim_address_spaces(self, workspace_id: str, address_spaces: List[str], load_active_workspaces: ActiveWorkspaceAddressSpacesLoader):
+        """
+        Records address spaces set on a workspace directly (e.g. by a patch), without checking they are free, so that
+        they aren't handed out again.
+        """
+        def reserve(index: CidrAllocationIndex, allocations: List[dict]) -> Optional[List[str]]:
+            recorded = {a["addressSpace"] for a in allocations}
+            claimed = [a for a in dict.fromkeys(address_spaces) if a not in recorded]
+            for address_space in claimed:
+                index.reserve(IPv4Network(address_space))
+                allocations.append(self.allocation(address_space, workspace_id, self.get_timestamp()))
+            return claimed
+
+        if address_spaces:
+            await self.update_allocations(reserve, load_active_workspaces)
+
+    async def release_address_spaces(self, workspace_id: str, load_active_workspaces: ActiveWorkspaceAddressSpacesLoader):
+        for attempt in range(MAX_RESERVATION_ATTEMPTS):
+            allocations, etag = await self.get_allocations(load_active_workspaces)
+            remaining = [a for a in allocations if a["workspaceId"] != workspace_id]
+            if etag is not None and len(remaining) == len(allocations):
+                return
+            address_space_index_cache.clear()
+            try:
+                new_etag = await self.save_allocations(remaining, etag)
+            except (CosmosAccessConditionFailedError, CosmosResourceExistsError):
+                if attempt == MAX_RESERVATION_ATTEMPTS - 1:
+                    raise
+                logger.warning("Address space allocations were updated concurrently. Retrying.")
+                continue
+            address_space_index_cache.set(new_etag, get_allocation_index(a["addressSpace"] for a in remaining))
+            return
@@ -0,0 +1,60 @@
+from typing import List, Optional, Set, Tuple
+
+from pydantic import TypeAdapter
+
+from core import config
+from db.repositories.base import BaseRepository
+from models.domain.airlock_request import AirlockRequestHistoryItem
+
+
+class AirlockRequestHistoryRepository(BaseRepository):
+    """
+    History of the changes made to each airlock request, partitioned on the request id. Each item records a
+    version of the request as it was before a change was made to it.
+
+    Requests created before history was stored separately hold their earlier history in the request document,
+    which is moved here the next time the request changes.
+    """
+
+    @classmethod
+    async def create(cls):
+        cls = AirlockRequestHistoryRepository()
+        await cls._init_container(config.STATE_STORE_AIRLOCK_REQUEST_HISTORY_CONTAINER)
+        return cls
+
+    @staticmethod
+    def history_item_id(airlock_request_id: str, resource_version: int) -> str:
+        # one item per version, so saving the history of a version again (e.g. when retrying a change) replaces it
+        return f"{airlock_request_id}-{resource_version}"
+
+    async def save_history_items(self, airlock_request_id: str, history_items: List[AirlockRequestHistoryItem]):
+        for history_item in history_items:
+            history_item.id = self.history_item_id(airlock_request_id, history_item.resourceVersion)
+            history_item.airlockRequestId = airlock_request_id
+            await self.update_item(history_item)
+
+    @staticmethod
+    def history_query(airlock_request_id: str):
+        query = 'SELECT * FROM c WHERE c.airlockRequestId = @airlockRequestId ORDER BY c.resourceVersion ASC'
+        parameters = [
+            {'name': '@airlockRequestId', 'value': airlock_request_id}
+        ]
+        return query, parameters
+
+    async def get_history(self, airlock_request_id: str) -> List[AirlockRequestHistoryItem]:
+        query, parameters = self.history_query(airlock_request_id)
+        history_items = await self.query(query=query, parameters=parameters, partition_key=airlock_request_id)
+        return TypeAdapter(List[AirlockRequestHistoryItem]).validate_python(history_items)
+
+    async def get_history_page(self, airlock_request_id: str, page_size: Optional[int] = None, continuation_token: Optional[str] = None) -> Tuple[List[AirlockRequestHistoryItem], Optional[str]]:
+        query, parameters = self.history_query(airlock_request_id)
+        history_items, continuation_token = await self.query_page(query=query, parameters=parameters, page_size=page_size, continuation_token=continuation_token, partition_key=airlock_request_id)
+        return TypeAdapter(List[AirlockRequestHistoryItem]).validate_python(history_items), continuation_token
+
+    async def get_stored_ids(self, airlock_request_id: str, history_item_ids: List[str]) -> Set[str]:
+        query = 'SELECT VALUE c.id FROM c WHERE c.airlockRequestId = @airlockRequestId AND ARRAY_CONTAINS(@ids, c.id)'
+        parameters = [
+            {'name': '@airlockRequestId', 'value': airlock_request_id},
+            {'name': '@ids', 'value': history_item_ids}
+        ]
+        return set(await self.query(query=query, parameters=parameters, partition_key=airlock_request_id))
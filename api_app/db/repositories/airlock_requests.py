@@ -1,32 +1,71 @@
 import copy
+import time
 import uuid
 
 from datetime import datetime, timezone, UTC
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 from pydantic import UUID4
-from azure.cosmos.exceptions import CosmosResourceNotFoundError, CosmosAccessConditionFailedError
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
 from fastapi import HTTPException, status
 from pydantic import TypeAdapter
 from db.repositories.workspaces import WorkspaceRepository
 from services.authentication import get_aad_service
 from models.domain.authentication import User
-from db.errors import EntityDoesNotExist
+from db.errors import EntityDoesNotExist, InvalidInput
 from models.domain.airlock_request import AirlockFile, AirlockRequest, AirlockRequestStatus, \
     AirlockReview, AirlockReviewDecision, AirlockRequestHistoryItem, AirlockRequestType, AirlockReviewUserResource
 from models.schemas.airlock_request import AirlockRequestInCreate, AirlockReviewInCreate
 from core import config
 from resources import strings
+from db.repositories.airlock_request_history import AirlockRequestHistoryRepository
+from db.repositories.airlock_review_inbox import REVIEWABLE_STATUSES, AirlockReviewInboxRepository
 from db.repositories.base import BaseRepository
-from services.logging import logger
+from db.repositories.registry import repository_registry
+
+# Marks a history page continuation token that resumes the history held in the request document
+EMBEDDED_HISTORY_TOKEN_PREFIX = "embedded:"
+
+
+class RoleAssignmentCache:
+    """
+    Holds the ids of the roles assigned to each user, as read from Microsoft Graph, for
+    AIRLOCK_MANAGER_ROLE_ASSIGNMENT_CACHE_TTL seconds, so listing an airlock manager's requests doesn't call Graph
+    every time. A role assigned or removed is picked up once the user's entry expires.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[float, set]] = {}
+
+    def get(self, user_id: str) -> Optional[set]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, user_id: str, role_ids: set):
+        self._entries[user_id] = (time.monotonic() + config.AIRLOCK_MANAGER_ROLE_ASSIGNMENT_CACHE_TTL, role_ids)
+
+    def clear(self):
+        self._entries.clear()
+
+
+role_assignment_cache = RoleAssignmentCache()
 
 
 class AirlockRequestRepository(BaseRepository):
+    partitioned_by_workspace = config.STATE_STORE_PARTITION_BY_WORKSPACE
+
     @classmethod
     async def create(cls):
         cls = AirlockRequestRepository()
-        await super().create(config.STATE_STORE_AIRLOCK_REQUESTS_CONTAINER)
+        await cls._init_container(config.STATE_STORE_AIRLOCK_REQUESTS_CONTAINER)
+        cls.history_repo = await repository_registry.get(AirlockRequestHistoryRepository)
+        cls.review_inbox_repo = await repository_registry.get(AirlockReviewInboxRepository)
         return cls
 
+    def workspace_partition(self, item: dict) -> str:
+        return item["workspaceId"]
+
     @staticmethod
     def get_resource_base_spec_params():
         return {"tre_id": config.TRE_ID}
@@ -41,7 +80,10 @@ class AirlockRequestRepository(BaseRepository):
             updatedBy=original_request.updatedBy,
             properties=request_properties
         )
-        new_request.history.append(history_item)
+        # the history item records the original version, which exists whether or not this update succeeds, so it is
+        # saved first; any history still held in the request document is moved out with it
+        await self.history_repo.save_history_items(new_request.id, new_request.history + [history_item])
+        new_request.history = []
 
         # now update the request props
         new_request.resourceVersion = new_request.resourceVersion + 1
@@ -54,11 +96,14 @@ class AirlockRequestRepository(BaseRepository):
         new_request.updatedWhen = self.get_timestamp()
 
         await self.upsert_item_with_etag(new_request, new_request.etag)
+        await self.review_inbox_repo.update_request(original_request.status, new_request)
         return new_request
 
     @staticmethod
     def airlock_requests_query():
-        return 'SELECT * FROM c'
+        # every field but history, which requests created before it was stored separately still hold
+        fields = [field.alias or name for name, field in AirlockRequest.model_fields.items() if name != "history"]
+        return 'SELECT ' + ', '.join(f'c.{field}' for field in fields) + ' FROM c'
 
     def validate_status_update(self, current_status: AirlockRequestStatus, new_status: AirlockRequestStatus) -> bool:
 
@@ -128,7 +173,7 @@ class AirlockRequestRepository(BaseRepository):
 
         return airlock_request
 
-    async def get_airlock_requests(self, workspace_id: Optional[str] = None, creator_user_id: Optional[str] = None, type: Optional[AirlockRequestType] = None, status: Optional[AirlockRequestStatus] = None, order_by: Optional[str] = None, order_ascending=True) -> List[AirlockRequest]:
+    def airlock_requests_query_with_filters(self, workspace_id: Optional[str] = None, creator_user_id: Optional[str] = None, type: Optional[AirlockRequestType] = None, status: Optional[AirlockRequestStatus] = None, order_by: Optional[str] = None, order_ascending=True, workspace_ids: Optional[List[str]] = None):
         query = self.airlock_requests_query()
 
         # optional filters
@@ -137,6 +182,9 @@ class AirlockRequestRepository(BaseRepository):
         if workspace_id:
             conditions.append('c.workspaceId=@workspace_id')
             parameters.append({"name": "@workspace_id", "value": workspace_id})
+        if workspace_ids is not None:
+            conditions.append('ARRAY_CONTAINS(@workspace_ids, c.workspaceId)')
+            parameters.append({"name": "@workspace_ids", "value": workspace_ids})
         if creator_user_id:
             conditions.append('c.createdBy.id=@user_id')
             parameters.append({"name": "@user_id", "value": creator_user_id})
@@ -155,36 +203,108 @@ class AirlockRequestRepository(BaseRepository):
             query += ' ORDER BY c.' + order_by
             query += ' ASC' if order_ascending else ' DESC'
 
-        airlock_requests = await self.query(query=query, parameters=parameters)
+        return query, parameters
+
+    async def get_airlock_requests(self, workspace_id: Optional[str] = None, creator_user_id: Optional[str] = None, type: Optional[AirlockRequestType] = None, status: Optional[AirlockRequestStatus] = None, order_by: Optional[str] = None, order_ascending=True, workspace_ids: Optional[List[str]] = None) -> List[AirlockRequest]:
+        query, parameters = self.airlock_requests_query_with_filters(workspace_id=workspace_id, creator_user_id=creator_user_id, type=type, status=status, order_by=order_by, order_ascending=order_ascending, workspace_ids=workspace_ids)
+        airlock_requests = await self.query(query=query, parameters=parameters, **self.workspace_query_options(workspace_id))
         return TypeAdapter(List[AirlockRequest]).validate_python(airlock_requests)
 
-    async def get_airlock_request_by_id(self, airlock_request_id: UUID4) -> AirlockRequest:
+    async def get_airlock_requests_page(self, workspace_id: Optional[str] = None, creator_user_id: Optional[str] = None, type: Optional[AirlockRequestType] = None, status: Optional[AirlockRequestStatus] = None, order_by: Optional[str] = None, order_ascending=True, workspace_ids: Optional[List[str]] = None, page_size: Optional[int] = None, continuation_token: Optional[str] = None) -> Tuple[List[AirlockRequest], Optional[str]]:
+        query, parameters = self.airlock_requests_query_with_filters(workspace_id=workspace_id, creator_user_id=creator_user_id, type=type, status=status, order_by=order_by, order_ascending=order_ascending, workspace_ids=workspace_ids)
+        airlock_requests, continuation_token = await self.query_page(query=query, parameters=parameters, page_size=page_size, continuation_token=continuation_token, **self.workspace_query_options(workspace_id))
+        return TypeAdapter(List[AirlockRequest]).validate_python(airlock_requests), continuation_token
+
+    async def get_airlock_request_by_id(self, airlock_request_id: UUID4, workspace_id: Optional[str] = None) -> AirlockRequest:
         try:
-            airlock_requests = await self.read_item_by_id(str(airlock_request_id))
+            airlock_requests = await self.read_item_by_id(str(airlock_request_id), self.partition_key(str(airlock_request_id), workspace_id))
         except CosmosResourceNotFoundError:
             raise EntityDoesNotExist
         return TypeAdapter(AirlockRequest).validate_python(airlock_requests)
 
-    async def get_airlock_requests_for_airlock_manager(self, user_id: str, type: Optional[AirlockRequestType] = None, status: Optional[AirlockRequestStatus] = None, order_by: Optional[str] = None, order_ascending=True) -> List[AirlockRequest]:
-        workspace_repo = await WorkspaceRepository.create()
-        access_service = get_aad_service()
-
-        workspaces = await workspace_repo.get_active_workspaces()
-        user_role_assignments = access_service.get_identity_role_assignments(user_id)
-
-        valid_roles = {ra.role_id for ra in user_role_assignments}
-
-        workspace_ids = [
+    async def get_airlock_request_history(self, airlock_request: AirlockRequest) -> List[AirlockRequestHistoryItem]:
+        history = await self.history_repo.get_history(airlock_request.id)
+        stored_ids = {history_item.id for history_item in history}
+        return [history_item for history_item in airlock_request.history if self.history_repo.history_item_id(airlock_request.id, history_item.resourceVersion) not in stored_ids] + history
+
+    async def get_embedded_history(self, airlock_request: AirlockRequest) -> List[AirlockRequestHistoryItem]:
+        """
+        Returns the history still held in the request document, less any that is also stored separately, as an
+        update whose request write failed after its history was saved leaves it in both.
+        """
+        if not airlock_request.history:
+            return []
+        history_item_ids = [self.history_repo.history_item_id(airlock_request.id, history_item.resourceVersion) for history_item in airlock_request.history]
+        stored_ids = await self.history_repo.get_stored_ids(airlock_request.id, history_item_ids)
+        return [history_item for history_item, history_item_id in zip(airlock_request.history, history_item_ids) if history_item_id not in stored_ids]
+
+    async def get_airlock_request_history_page(self, airlock_request: AirlockRequest, page_size: Optional[int] = None, continuation_token: Optional[str] = None) -> Tuple[List[AirlockRequestHistoryItem], Optional[str]]:
+        """
+        Returns a page of the request's history, oldest first. History still held in the request document is older
+        than any stored separately, so fills the first pages; while it does, the continuation token is how much of
+        it has been returned, prefixed with EMBEDDED_HISTORY_TOKEN_PREFIX, rather than a Cosmos continuation token.
+        """
+        if continuation_token is not None and not continuation_token.startswith(EMBEDDED_HISTORY_TOKEN_PREFIX):
+            return await self.history_repo.get_history_page(airlock_request.id, page_size=page_size, continuation_token=continuation_token)
+
+        offset = 0
+        if continuation_token is not None:
+            try:
+                offset = int(continuation_token[len(EMBEDDED_HISTORY_TOKEN_PREFIX):])
+            except ValueError:
+                raise InvalidInput(strings.INVALID_CONTINUATION_TOKEN)
+
+        embedded_history = await self.get_embedded_history(airlock_request)
+        history = embedded_history[offset:] if page_size is None else embedded_history[offset:offset + page_size]
+        if page_size is not None and len(history) == page_size:
+            # a page of the embedded history only; the next page resumes after it
+            return history, f"{EMBEDDED_HISTORY_TOKEN_PREFIX}{offset + len(history)}"
+
+        stored_history, next_continuation_token = await self.history_repo.get_history_page(airlock_request.id, page_size=None if page_size is None else page_size - len(history))
+        return history + stored_history, next_continuation_token
+
+    async def get_airlock_manager_workspace_ids(self, user_id: str) -> List[str]:
+        workspace_repo = await repository_registry.get(WorkspaceRepository)
+        workspaces = await workspace_repo.get_active_workspace_airlock_manager_roles()
+
+        valid_roles = role_assignment_cache.get(user_id)
+        if valid_roles is None:
+            user_role_assignments = get_aad_service().get_identity_role_assignments(user_id)
+            valid_roles = {ra.role_id for ra in user_role_assignments}
+            role_assignment_cache.set(user_id, valid_roles)
+
+        return [
             workspace.id
             for workspace in workspaces
-            if workspace.properties["app_role_id_workspace_airlock_manager"] in valid_roles
+            if workspace.app_role_id_workspace_airlock_manager in valid_roles
         ]
-        requests = []
-
-        for workspace_id in workspace_ids:
-            requests += await self.get_airlock_requests(workspace_id=workspace_id, type=type, status=status, order_by=order_by, order_ascending=order_ascending)
 
-        return requests
+    async def get_airlock_requests_for_airlock_manager(self, user_id: str, type: Optional[AirlockRequestType] = None, status: Optional[AirlockRequestStatus] = None, order_by: Optional[str] = None, order_ascending=True) -> List[AirlockRequest]:
+        # A single query across the manager's workspaces; requests awaiting review are read from the review inbox
+        workspace_ids = await self.get_airlock_manager_workspace_ids(user_id)
+        if not workspace_ids:
+            return []
+        if status in REVIEWABLE_STATUSES:
+            return await self.review_inbox_repo.get_inbox(workspace_ids, type=type, order_by=order_by, order_ascending=order_ascending)
+        return await self.get_airlock_requests(workspace_ids=workspace_ids, type=type, status=status, order_by=order_by, order_ascending=order_ascending)
+
+    async def get_airlock_requests_for_airlock_manager_page(self, user_id: str, type: Optional[AirlockRequestType] = None, status: Optional[AirlockRequestStatus] = None, order_by: Optional[str] = None, order_ascending=True, page_size: Optional[int] = None, continuation_token: Optional[str] = None) -> Tuple[List[AirlockRequest], Optional[str]]:
+        # A single query across the manager's workspaces, as a continuation token can only resume one query
+        workspace_ids = await self.get_airlock_manager_workspace_ids(user_id)
+        if not workspace_ids:
+            return [], None
+        if status in REVIEWABLE_STATUSES:
+            return await self.review_inbox_repo.get_inbox_page(workspace_ids, type=type, order_by=order_by, order_ascending=order_ascending, page_size=page_size, continuation_token=continuation_token)
+        return await self.get_airlock_requests_page(workspace_ids=workspace_ids, type=type, status=status, order_by=order_by, order_ascending=order_ascending, page_size=page_size, continuation_token=continuation_token)
+
+    def airlock_review_inbox_migrations(self):
+        return [self.review_inbox_repo.backfill_migration(self.container)]
+
+    async def reconcile_review_inbox(self) -> int:
+        # the inbox is read first; see AirlockReviewInboxRepository.reconcile
+        copies = await self.review_inbox_repo.get_copies()
+        reviewable_requests = await self.query(query='SELECT * FROM c WHERE ARRAY_CONTAINS(@statuses, c.status)', parameters=[{"name": "@statuses", "value": REVIEWABLE_STATUSES}])
+        return await self.review_inbox_repo.reconcile(copies, reviewable_requests)
 
     async def update_airlock_request(
             self,
@@ -195,23 +315,23 @@ class AirlockRequestRepository(BaseRepository):
             status_message: Optional[str] = None,
             airlock_review: Optional[AirlockReview] = None,
             review_user_resource: Optional[AirlockReviewUserResource] = None) -> AirlockRequest:
-        updated_request = self._build_updated_request(
-            original_request=original_request,
-            new_status=new_status,
-            request_files=request_files,
-            status_message=status_message,
-            airlock_review=airlock_review,
-            review_user_resource=review_user_resource,
-            updated_by=updated_by)
-        try:
-            db_response = await self.update_airlock_request_item(original_request, updated_request, updated_by, {"previousStatus": original_request.status})
-        except CosmosAccessConditionFailedError:
-            logger.warning(f"ETag mismatch for request ID: '{original_request.id}'. Retrying.")
-            original_request = await self.get_airlock_request_by_id(original_request.id)
-            updated_request = self._build_updated_request(original_request=original_request, new_status=new_status, request_files=request_files, status_message=status_message, airlock_review=airlock_review)
-            db_response = await self.update_airlock_request_item(original_request, updated_request, updated_by, {"previousStatus": original_request.status})
-
-        return db_response
+        async def update(current_request: AirlockRequest) -> AirlockRequest:
+            updated_request = self._build_updated_request(
+                original_request=current_request,
+                new_status=new_status,
+                request_files=request_files,
+                status_message=status_message,
+                airlock_review=airlock_review,
+                review_user_resource=review_user_resource,
+                updated_by=updated_by)
+            return await self.update_airlock_request_item(current_request, updated_request, updated_by, {"previousStatus": current_request.status})
+
+        # the status may be changed by the airlock processor at the same time, so is re-read and applied again on a conflict
+        return await self.update_with_retries(
+            operation="airlock request update",
+            update=update,
+            read=lambda: self.get_airlock_request_by_id(original_request.id, original_request.workspaceId),
+            item=original_request)
 
     def get_airlock_request_spec_params(self):
         return self.get_resource_base_spec_params()
@@ -0,0 +1,129 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceNotFoundError
+from pydantic import TypeAdapter
+
+from core import config
+from db.migrations.bulk import BulkMigration
+from db.repositories.base import BaseRepository, etag_conflict_backoff
+from models.domain.airlock_request import AirlockRequest, AirlockRequestStatus, AirlockRequestType
+from services.logging import logger
+
+# Statuses in which a request is waiting for an airlock manager to review it
+REVIEWABLE_STATUSES = [AirlockRequestStatus.InReview]
+# How many times writing (or removing) a request's copy is attempted before the request's update fails
+INBOX_WRITE_ATTEMPTS = 3
+
+
+class AirlockReviewInboxRepository(BaseRepository):
+    """
+    Copies of the airlock requests awaiting review, partitioned on the workspace id, so an airlock manager's inbox
+    across their workspaces is a single query over a container holding only those requests, rather than a query
+    over every request ever made.
+
+    A request's copy is written or removed each time the request is updated, by AirlockRequestRepository. That is
+    a separate write from the request's own, so copies an update failed to correct (or that two updates wrote out of
+    order) are corrected by reconcile, which AirlockReviewInboxReconciler runs periodically.
+    """
+
+    @classmethod
+    async def create(cls):
+        cls = AirlockReviewInboxRepository()
+        await cls._init_container(config.STATE_STORE_AIRLOCK_REVIEW_INBOX_CONTAINER)
+        return cls
+
+    @staticmethod
+    def inbox_item(airlock_request: dict) -> dict:
+        # the copy gets an _etag (and other system properties) of its own, so the request's etag is kept alongside it
+        item = {key: value for key, value in airlock_request.items() if key not in ("history", "etag") and not key.startswith("_")}
+        item["requestEtag"] = airlock_request.get("etag") or airlock_request.get("_etag")
+        return item
+
+    @staticmethod
+    def to_airlock_request(item: dict) -> dict:
+        airlock_request = {key: value for key, value in item.items() if key != "requestEtag" and not key.startswith("_")}
+        airlock_request["_etag"] = item.get("requestEtag")
+        return airlock_request
+
+    async def update_request(self, previous_status: AirlockRequestStatus, airlock_request: AirlockRequest):
+        """
+        Writes or removes the request's copy, once the request has been written. Both are idempotent, as the copy's
+        id is the request's, so a failed attempt is retried; when every attempt fails the error is raised.
+        """
+        for attempt in range(1, INBOX_WRITE_ATTEMPTS + 1):
+            try:
+                if airlock_request.status in REVIEWABLE_STATUSES:
+                    await self.update_item_dict(self.inbox_item(airlock_request.model_dump()))
+                elif previous_status in REVIEWABLE_STATUSES:
+                    await self.remove_copy(airlock_request.id, airlock_request.workspaceId)
+                return
+            except CosmosHttpResponseError as e:
+                if attempt == INBOX_WRITE_ATTEMPTS:
+                    logger.exception(f"Failed to update the review inbox copy of airlock request {airlock_request.id}")
+                    raise
+                logger.warning(f"Updating the review inbox copy of airlock request {airlock_request.id} failed. Retrying ({attempt}/{INBOX_WRITE_ATTEMPTS - 1}) - {e}")
+                await asyncio.sleep(etag_conflict_backoff(attempt))
+
+    async def remove_copy(self, request_id: str, workspace_id: str):
+        try:
+            await self.container.delete_item(item=request_id, partition_key=workspace_id)
+        except CosmosResourceNotFoundError:
+            pass
+
+    async def get_copies(self) -> Dict[str, dict]:
+        items = await self.query(query='SELECT c.id, c.workspaceId, c.requestEtag FROM c')
+        return {item["id"]: item for item in items}
+
+    async def reconcile(self, copies: Dict[str, dict], reviewable_requests: List[dict]) -> int:
+        """
+        Writes the copies of the reviewable requests that are missing or stale, and removes those of the requests no
+        longer reviewable, returning how many were corrected. copies must be read (with get_copies) before the
+        requests, so that a copy written in between, of a request that has since entered review, is kept.
+        """
+        copies = dict(copies)
+        corrected = 0
+        for airlock_request in reviewable_requests:
+            item = self.inbox_item(airlock_request)
+            copy = copies.pop(item["id"], None)
+            if copy is None or copy.get("requestEtag") != item["requestEtag"]:
+                await self.update_item_dict(item)
+                corrected += 1
+        for copy in copies.values():
+            await self.remove_copy(copy["id"], copy["workspaceId"])
+            corrected += 1
+        return corrected
+
+    @staticmethod
+    def inbox_query(workspace_ids: List[str], type: Optional[AirlockRequestType] = None, order_by: Optional[str] = None, order_ascending=True):
+        query = 'SELECT * FROM c WHERE ARRAY_CONTAINS(@workspace_ids, c.workspaceId)'
+        parameters = [{"name": "@workspace_ids", "value": workspace_ids}]
+        if type:
+            query += ' AND c.type=@type'
+            parameters.append({"name": "@type", "value": type})
+        if order_by:
+            query += ' ORDER BY c.' + order_by
+            query += ' ASC' if order_ascending else ' DESC'
+        return query, parameters
+
+    async def get_inbox(self, workspace_ids: List[str], type: Optional[AirlockRequestType] = None, order_by: Optional[str] = None, order_ascending=True) -> List[AirlockRequest]:
+        query, parameters = self.inbox_query(workspace_ids, type, order_by, order_ascending)
+        items = await self.query(query=query, parameters=parameters)
+        return TypeAdapter(List[AirlockRequest]).validate_python([self.to_airlock_request(item) for item in items])
+
+    async def get_inbox_page(self, workspace_ids: List[str], type: Optional[AirlockRequestType] = None, order_by: Optional[str] = None, order_ascending=True, page_size: Optional[int] = None, continuation_token: Optional[str] = None) -> Tuple[List[AirlockRequest], Optional[str]]:
+        query, parameters = self.inbox_query(workspace_ids, type, order_by, order_ascending)
+        items, continuation_token = await self.query_page(query=query, parameters=parameters, page_size=page_size, continuation_token=continuation_token)
+        return TypeAdapter(List[AirlockRequest]).validate_python([self.to_airlock_request(item) for item in items]), continuation_token
+
+    def backfill_migration(self, airlock_requests_container) -> BulkMigration:
+        """
+        Returns the bulk migration that copies the requests already awaiting review into the inbox.
+        """
+        return BulkMigration(
+            name="airlock-review-inbox",
+            container=airlock_requests_container,
+            query='SELECT * FROM c WHERE ARRAY_CONTAINS(@statuses, c.status)',
+            parameters=[{"name": "@statuses", "value": REVIEWABLE_STATUSES}],
+            transform=self.inbox_item,
+            target=self.container)
@@ -1,55 +1,273 @@
-from typing import Optional
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple, Type, TypeVar
 from azure.cosmos.aio import ContainerProxy
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosHttpResponseError, CosmosResourceNotFoundError
 from azure.core import MatchConditions
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
 from api.dependencies.database import Database
-from db.errors import UnableToAccessDatabase
+from core import config
+from db.errors import EntityDoesNotExist, InvalidInput, UnableToAccessDatabase
+from db.instrumentation import instrument_repository, record_optimistic_update
+from db.migrations.bulk import BulkMigration, rename_field
+from db.partitioning import PARTITION_KEY_FIELD, workspace_partition_of_path
+from resources import strings
+from services.logging import logger
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# The most operations Cosmos DB applies in a single partial document update
+MAX_PATCH_OPERATIONS = 10
+# The longest backoff between the attempts of a read-modify-write, however many times it has conflicted
+ETAG_CONFLICT_BACKOFF_MAX_MS = 2000
+
+
+def etag_conflict_backoff(attempt: int) -> float:
+    """
+    Returns how long (in seconds) to wait before retrying a read-modify-write that conflicted attempt times: a random
+    time up to an exponentially growing limit, so writers contending for the same item spread out rather than
+    conflicting again in lockstep.
+    """
+    limit_ms = min(ETAG_CONFLICT_BACKOFF_MAX_MS, config.ETAG_CONFLICT_BACKOFF_BASE_MS * 2 ** (attempt - 1))
+    return random.uniform(0, limit_ms) / 1000
 
 
 class BaseRepository:
+    # Whether the container is partitioned on the workspace its items belong to, then their id, rather than on id;
+    # repositories that support it set this from STATE_STORE_PARTITION_BY_WORKSPACE, and override workspace_partition
+    # if their items don't have a workspaceId or resourcePath to take it from
+    partitioned_by_workspace = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        instrument_repository(cls)
+
     @classmethod
     async def create(cls, container_name: Optional[str] = None):
+        repository = cls()
+        await repository._init_container(container_name)
+        return repository
+
+    async def _init_container(self, container_name: Optional[str] = None):
+        # set on the instance, so repositories sharing a base class don't share a container
         try:
-            cls._container: ContainerProxy = await Database().get_container_proxy(container_name)
+            self._container: ContainerProxy = await Database().get_container_proxy(container_name)
         except Exception:
             raise UnableToAccessDatabase
 
-        return cls
-
     @property
     def container(self) -> ContainerProxy:
         return self._container
 
-    async def query(self, query: str, parameters: Optional[dict] = None):
-        items = self.container.query_items(query=query, parameters=parameters)
+    @property
+    def partitioned_on_id(self) -> bool:
+        """
+        Whether each item's partition key is its id, so it can be point read knowing only that.
+        """
+        return not self.partitioned_by_workspace
+
+    def workspace_partition(self, item: dict) -> str:
+        """
+        Returns the first level of item's partition key in a workspace partitioned container: the workspace it has
+        the id of, or else that its resource path is under. Repositories whose items say so differently override it.
+        """
+        if item.get("workspaceId"):
+            return item["workspaceId"]
+        return workspace_partition_of_path(item.get("resourcePath", ""))
+
+    def item_partition_key(self, item: dict) -> Any:
+        if self.partitioned_by_workspace:
+            return [self.workspace_partition(item), item["id"]]
+        return item["id"]
+
+    def partition_key(self, item_id: str, workspace_partition: Optional[str] = None) -> Optional[Any]:
+        """
+        Returns the partition key of the item with item_id, or None if the container is partitioned on the workspace
+        and workspace_partition isn't known, in which case read_item_by_id finds the item with a query.
+        """
+        if not self.partitioned_by_workspace:
+            return item_id
+        return [workspace_partition, item_id] if workspace_partition is not None else None
+
+    def workspace_query_options(self, workspace_partition: Optional[str]) -> dict:
+        """
+        Returns the query_items options that scope a query to a single workspace's partition, if the container is
+        partitioned on the workspace and workspace_partition is known.
+        """
+        return {"partition_key": [workspace_partition]} if self.partitioned_by_workspace and workspace_partition is not None else {}
+
+    def to_document(self, item: dict) -> dict:
+        if self.partitioned_by_workspace:
+            item[PARTITION_KEY_FIELD] = self.workspace_partition(item)
+        return item
+
+    async def query(self, query: str, parameters: Optional[dict] = None, **options):
+        items = self.container.query_items(query=query, parameters=parameters, **options)
         return [i async for i in items]
 
-    async def read_item_by_id(self, item_id: str) -> dict:
-        return await self.container.read_item(item=item_id, partition_key=item_id)
+    async def query_pages(self, query: str, parameters: Optional[list] = None, page_size: Optional[int] = None) -> AsyncIterator[List[dict]]:
+        """
+        Yields the query results a page at a time, so callers that walk a whole container hold one page in memory
+        rather than every item.
+        """
+        pages = self.container.query_items(query=query, parameters=parameters, max_item_count=page_size).by_page()
+        async for page in pages:
+            yield [i async for i in page]
+
+    async def query_page(self, query: str, parameters: Optional[list] = None, page_size: Optional[int] = None, continuation_token: Optional[str] = None, **options) -> Tuple[List[dict], Optional[str]]:
+        """
+        Returns a single page of query results and the continuation token for the next page, which is None once the
+        results are exhausted.
+
+        :raises InvalidInput: When Cosmos rejects the continuation token.
+        """
+        pages = self.container.query_items(query=query, parameters=parameters, max_item_count=page_size, **options).by_page(continuation_token)
+        try:
+            page = await pages.__anext__()
+            items = [i async for i in page]
+        except StopAsyncIteration:
+            return [], None
+        except CosmosHttpResponseError as e:
+            if continuation_token and e.status_code == 400:
+                raise InvalidInput(strings.INVALID_CONTINUATION_TOKEN)
+            raise
+        return items, pages.continuation_token
+
+    async def read_item_by_id(self, item_id: str, partition_key: Optional[Any] = None) -> dict:
+        if partition_key is None and not self.partitioned_on_id:
+            # the item's partition isn't known, so it can't be point read
+            items = await self.query(query='SELECT * FROM c WHERE c.id = @id', parameters=[{'name': '@id', 'value': item_id}])
+            if not items:
+                raise CosmosResourceNotFoundError(status_code=404, message=f"Item {item_id} not found")
+            return items[0]
+        return await self.container.read_item(item=item_id, partition_key=item_id if partition_key is None else partition_key)
+
+    async def read_item(self, item_id: str, item_type: Type[T], partition_key: Optional[Any] = None, item_filter: Optional[Callable[[dict], bool]] = None) -> T:
+        """
+        Point-reads a single item and validates it as item_type. This costs a single round trip and 1 RU for a small
+        item, rather than a query. The partition key defaults to the item id, which is how most containers are partitioned.
+
+        :param item_filter: Predicate applied after the read, for conditions a query would have had in its WHERE clause.
+        :raises EntityDoesNotExist: When the item does not exist or does not satisfy item_filter.
+        """
+        try:
+            item = await self.read_item_by_id(item_id, partition_key)
+        except CosmosResourceNotFoundError:
+            raise EntityDoesNotExist
+        if item_filter is not None and not item_filter(item):
+            raise EntityDoesNotExist
+        return TypeAdapter(item_type).validate_python(item)
 
     async def save_item(self, item: BaseModel):
-        await self.container.create_item(body=item.model_dump())
+        await self.container.create_item(body=self.to_document(item.model_dump()))
 
     async def update_item(self, item: BaseModel):
-        await self.container.upsert_item(body=item.model_dump())
+        await self.container.upsert_item(body=self.to_document(item.model_dump()))
 
     async def update_item_with_etag(self, item: BaseModel, etag: str) -> BaseModel:
-        await self.container.replace_item(item=item.id, body=item.model_dump(), etag=etag, match_condition=MatchConditions.IfNotModified)
-        return await self.read_item_by_id(item.id)
+        body = self.to_document(item.model_dump())
+        await self.container.replace_item(item=item.id, body=body, etag=etag, match_condition=MatchConditions.IfNotModified)
+        return await self.read_item_by_id(item.id, self.item_partition_key(body))
 
     async def upsert_item_with_etag(self, item: BaseModel, etag: str) -> BaseModel:
-        return await self.container.upsert_item(body=item.model_dump(), etag=etag, match_condition=MatchConditions.IfNotModified)
+        return await self.container.upsert_item(body=self.to_document(item.model_dump()), etag=etag, match_condition=MatchConditions.IfNotModified)
 
     async def update_item_dict(self, item_dict: dict):
-        await self.container.upsert_item(body=item_dict)
+        await self.container.upsert_item(body=self.to_document(item_dict))
+
+    async def patch_item_by_id(self, item_id: str, patch_operations: List[dict], partition_key: Optional[Any] = None, etag: Optional[str] = None) -> dict:
+        """
+        Applies Cosmos DB partial document update operations (set, add, replace, remove, incr) to an item and returns
+        the updated item. Only the operations are sent, rather than the whole document, and paths they don't touch
+        can't be overwritten by a stale copy. With an etag, the patch is only applied if the item hasn't been modified
+        since. Cosmos DB applies at most MAX_PATCH_OPERATIONS operations atomically, so more are sent in several
+        patches, each conditional on the etag the one before returned.
+
+        :raises CosmosAccessConditionFailedError: When the item was modified since it was read with etag.
+        """
+        if not patch_operations:
+            return await self.read_item_by_id(item_id, partition_key)
+        if partition_key is None:
+            partition_key = item_id if self.partitioned_on_id else self.item_partition_key(await self.read_item_by_id(item_id))
+
+        for start in range(0, len(patch_operations), MAX_PATCH_OPERATIONS):
+            match_condition = {"etag": etag, "match_condition": MatchConditions.IfNotModified} if etag is not None else {}
+            item = await self.container.patch_item(item=item_id, partition_key=partition_key, patch_operations=patch_operations[start:start + MAX_PATCH_OPERATIONS], **match_condition)
+            if etag is not None:
+                etag = item["_etag"]
+        return item
+
+    async def update_with_retries(self, operation: str, update: Callable[[T], Awaitable[R]], read: Callable[[], Awaitable[T]], item: Optional[T] = None, max_retries: Optional[int] = None) -> R:
+        """
+        Runs an optimistic read-modify-write: update is given the item, read with read unless it's passed in, and
+        must write it conditionally on the etag it was read with. When the write fails because the item has been
+        modified since, the item is read again and update retried, after a jittered exponential backoff, up to
+        max_retries (default ETAG_CONFLICT_MAX_RETRIES) times. The number of retries and the time taken are recorded
+        against operation.
+
+        :raises CosmosAccessConditionFailedError: When the last attempt conflicts too.
+        """
+        max_retries = config.ETAG_CONFLICT_MAX_RETRIES if max_retries is None else max_retries
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                if item is None:
+                    item = await read()
+                result = await update(item)
+            except CosmosAccessConditionFailedError:
+                if attempt == max_retries:
+                    record_optimistic_update(type(self).__name__, operation, attempt, (time.monotonic() - started) * 1000, succeeded=False)
+                    raise
+                attempt += 1
+                logger.warning(f"Etag mismatch in {operation}. Retrying ({attempt}/{max_retries}).")
+                item = None
+                await asyncio.sleep(etag_conflict_backoff(attempt))
+                continue
+            record_optimistic_update(type(self).__name__, operation, attempt, (time.monotonic() - started) * 1000, succeeded=True)
+            return result
+
+    async def delete_item(self, item_id: str, partition_key: Optional[Any] = None):
+        await self.container.delete_item(item=item_id, partition_key=item_id if partition_key is None else partition_key)
+
+    def rename_field_migration(self, migration_name: str, old_field_name: str, new_field_name: str) -> BulkMigration:
+        """
+        Returns a bulk migration renaming old_field_name to new_field_name on every item in the container that has it.
+        """
+        return BulkMigration(
+            name=migration_name,
+            container=self.container,
+            query='SELECT * FROM c WHERE IS_DEFINED(c[@oldFieldName])',
+            parameters=[{'name': '@oldFieldName', 'value': old_field_name}],
+            transform=rename_field(old_field_name, new_field_name))
+
+    def replaced_container_name(self) -> Optional[str]:
+        """
+        Returns the name of the container partitioned on id that this repository's container replaced, if it's a
+        workspace partitioned container or the container of resources and their operations.
+        """
+        return config.STATE_STORE_ID_PARTITIONED_CONTAINERS.get(self.container.id)
+
+    async def repartitioning_migrations(self) -> List[BulkMigration]:
+        """
+        Returns the bulk migration that copies the items of the container partitioned on id, which this repository's
+        container replaced, into it. The API stays up while it runs: items it has written to this container since
+        are newer, so are kept rather than overwritten.
+        """
+        source_container_name = self.replaced_container_name()
+        if source_container_name is None:
+            return []
+
+        return [BulkMigration(
+            name=f"{'partition-by-workspace' if self.partitioned_by_workspace else 'colocate-operations'}-{source_container_name}",
+            container=await Database().get_container_proxy(source_container_name),
+            query='SELECT * FROM c',
+            transform=lambda item: self.to_document({key: value for key, value in item.items() if not key.startswith("_")}),
+            target=self.container,
+            overwrite=False)]
 
-    async def delete_item(self, item_id: str):
-        await self.container.delete_item(item=item_id, partition_key=item_id)
 
-    async def rename_field_name(self, old_field_name: str, new_field_name: str):
-        for item in await self.query('SELECT * FROM c'):
-            if old_field_name in item:
-                item[new_field_name] = item[old_field_name]
-                del item[old_field_name]
-                await self.update_item_dict(item)
+instrument_repository(BaseRepository)
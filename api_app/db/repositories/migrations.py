@@ -0,0 +1,44 @@
+from datetime import datetime, UTC
+from typing import Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+from core import config
+from db.repositories.base import BaseRepository
+from models.domain.migration import MigrationCheckpoint
+
+
+class MigrationRepository(BaseRepository):
+    """
+    Stores a checkpoint per migration, so a migration that was stopped part way through resumes from the page it had
+    reached. Checkpoints are written with an etag condition, so two API instances can't run the same migration.
+    """
+
+    @classmethod
+    async def create(cls):
+        cls = MigrationRepository()
+        await cls._init_container(config.STATE_STORE_MIGRATIONS_CONTAINER)
+        return cls
+
+    @staticmethod
+    def get_timestamp() -> float:
+        return datetime.now(UTC).timestamp()
+
+    async def get_checkpoint(self, migration_name: str) -> Tuple[MigrationCheckpoint, Optional[str]]:
+        """
+        Returns the checkpoint of the migration and its etag, or a new checkpoint and None if it has never run.
+        """
+        try:
+            item = await self.read_item_by_id(migration_name)
+        except CosmosResourceNotFoundError:
+            return MigrationCheckpoint(id=migration_name, startedWhen=self.get_timestamp()), None
+        return MigrationCheckpoint.model_validate(item), item["_etag"]
+
+    async def save_checkpoint(self, checkpoint: MigrationCheckpoint, etag: Optional[str]) -> str:
+        checkpoint.updatedWhen = self.get_timestamp()
+        if etag is None:
+            saved = await self.container.create_item(body=checkpoint.model_dump())
+        else:
+            saved = await self.container.replace_item(item=checkpoint.id, body=checkpoint.model_dump(), etag=etag, match_condition=MatchConditions.IfNotModified)
+        return saved["_etag"]
@@ -1,8 +1,13 @@
+import asyncio
 from datetime import datetime, UTC
 import uuid
-from typing import List
+from typing import List, Optional, Tuple
 
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosBatchOperationError, CosmosResourceNotFoundError
 from pydantic import TypeAdapter
+from db.errors import EntityDoesNotExist
+from db.migrations.bulk import BulkMigration, BulkPatch
 from db.repositories.resource_templates import ResourceTemplateRepository
 from resources import strings
 from models.domain.request_action import RequestAction
@@ -10,19 +15,66 @@ from models.domain.resource import ResourceType
 from db.repositories.resources import ResourceRepository
 from models.domain.authentication import User
 from core import config
-from db.repositories.base import BaseRepository
+from db.repositories.base import MAX_PATCH_OPERATIONS, BaseRepository
+from db.repositories.operations_archive import OperationArchiveRepository
+from db.repositories.registry import repository_registry
+from db.partitioning import PARTITION_KEY_FIELD, workspace_partition_of_path
+
 
-from db.errors import EntityDoesNotExist
 from models.domain.operation import Operation, OperationStep, Status
 
+# Statuses an operation finishes in, after which it's no longer updated
+FINISHED_STATUSES = [Status.Deployed, Status.DeploymentFailed, Status.Updated, Status.UpdatingFailed, Status.Deleted, Status.DeletingFailed, Status.ActionSucceeded, Status.ActionFailed]
+# How many operations archive_operations moves at a time
+ARCHIVE_PAGE_SIZE = 100
+
 
 class OperationRepository(BaseRepository):
+    partitioned_by_workspace = config.STATE_STORE_PARTITION_BY_WORKSPACE
+    # Whether operations are kept in the resources container, each in the partition of the resource it acts on, so
+    # an operation and its resource can be updated together in a transactional batch
+    colocated_with_resources = config.STATE_STORE_COLOCATE_OPERATIONS
+
     @classmethod
     async def create(cls):
         cls = OperationRepository()
-        await super().create(config.STATE_STORE_OPERATIONS_CONTAINER)
+        await cls._init_container(config.STATE_STORE_OPERATIONS_CONTAINER)
+        cls.archive_repo = await repository_registry.get(OperationArchiveRepository)
         return cls
 
+    @property
+    def partitioned_on_id(self) -> bool:
+        return super().partitioned_on_id and not self.colocated_with_resources
+
+    def workspace_partition(self, item: dict) -> str:
+        return workspace_partition_of_path(item["resourcePath"])
+
+    def item_partition_key(self, item: dict):
+        if self.colocated_with_resources:
+            return item["resourceId"]
+        return super().item_partition_key(item)
+
+    def partition_key(self, item_id: str, workspace_partition: Optional[str] = None, resource_id: Optional[str] = None):
+        """
+        Returns the partition key of the operation with item_id, or None if it isn't known: when operations are kept
+        with their resources, that's the id of the resource the operation acts on.
+        """
+        if self.colocated_with_resources:
+            return str(resource_id) if resource_id is not None else None
+        return super().partition_key(item_id, workspace_partition)
+
+    def to_document(self, item: dict) -> dict:
+        if self.colocated_with_resources:
+            item[PARTITION_KEY_FIELD] = item["resourceId"]
+        return super().to_document(item)
+
+    def replaced_container_name(self) -> Optional[str]:
+        # the resources container replaced the resources container partitioned on id, which the operations didn't
+        # come from
+        if self.colocated_with_resources:
+            return "Operations"
+        return super().replaced_container_name()
+
     @staticmethod
     def operations_query():
         return 'SELECT * FROM c WHERE'
@@ -61,7 +113,7 @@ class OperationRepository(BaseRepository):
             resource_type = ResourceType(resource["resourceType"])
             primary_parent_service_name = None
             if resource_type == ResourceType.UserResource:
-                primary_parent_workspace_service = await resource_repo.get_resource_by_id(resource["parentWorkspaceServiceId"])
+                primary_parent_workspace_service = await resource_repo.get_resource_by_id(resource["parentWorkspaceServiceId"], workspace_partition=resource["workspaceId"])
                 primary_parent_service_name = primary_parent_workspace_service.templateName
             resource_template = await resource_template_repo.get_template_by_name_and_version(name, version, resource_type, primary_parent_service_name)
             resource_template_dict = resource_template.model_dump(exclude_none=True)
@@ -118,14 +170,14 @@ class OperationRepository(BaseRepository):
                             primary_resource = await resource_repo.get_resource_by_id(uuid.UUID(resource_id))
                             if primary_resource.resourceType == ResourceType.SharedService or primary_resource.resourceType == ResourceType.Workspace:
                                 raise Exception("You can only reference a workspace from a workspace service or user resource")
-                            resource_for_step = await resource_repo.get_resource_by_id(uuid.UUID(primary_resource.workspaceId))
+                            resource_for_step = await resource_repo.get_resource_by_id(uuid.UUID(primary_resource.workspaceId), workspace_partition=primary_resource.workspaceId)
 
                         # if it's a workspace service, we must be a user-resource - find the parent
                         if step["resourceType"] == ResourceType.WorkspaceService:
                             primary_resource = await resource_repo.get_resource_by_id(uuid.UUID(resource_id))
                             if primary_resource.resourceType != ResourceType.UserResource:
                                 raise Exception("Only user resources can update their parent workspace services")
-                            resource_for_step = await resource_repo.get_resource_by_id(uuid.UUID(primary_resource.parentWorkspaceServiceId))
+                            resource_for_step = await resource_repo.get_resource_by_id(uuid.UUID(primary_resource.parentWorkspaceServiceId), workspace_partition=primary_resource.workspaceId)
 
                         if resource_for_step is None:
                             raise Exception(f"Error finding resource to update, triggered by resource ID {resource_id}")
@@ -173,24 +225,180 @@ class OperationRepository(BaseRepository):
         await self.update_item(operation)
         return operation
 
-    async def get_operation_by_id(self, operation_id: str) -> Operation:
-        query = self.operations_query() + f' c.id = "{operation_id}"'
-        operation = await self.query(query=query)
-        if not operation:
+    async def get_operation_by_id(self, operation_id: str, workspace_id: Optional[str] = None, resource_id: Optional[str] = None, include_archived: bool = False) -> Operation:
+        try:
+            return await self.read_item(str(operation_id), Operation, partition_key=self.partition_key(str(operation_id), workspace_id, resource_id))
+        except EntityDoesNotExist:
+            if not include_archived:
+                raise
+            return await self.archive_repo.get_operation_by_id(str(operation_id))
+
+    async def get_operation_and_etag_by_id(self, operation_id: str, workspace_id: Optional[str] = None, resource_id: Optional[str] = None) -> Tuple[Operation, str]:
+        partition_key = self.partition_key(str(operation_id), workspace_id, resource_id)
+        try:
+            try:
+                operation = await self.read_item_by_id(str(operation_id), partition_key)
+            except CosmosResourceNotFoundError:
+                if partition_key is None or not self.colocated_with_resources:
+                    raise
+                # resource_id is the resource the caller expects the operation to act on, which for a step of its
+                # pipeline may be another; the operation is found with a query instead
+                operation = await self.read_item_by_id(str(operation_id))
+        except CosmosResourceNotFoundError:
             raise EntityDoesNotExist
-        return TypeAdapter(Operation).validate_python(operation[0])
+        return TypeAdapter(Operation).validate_python(operation), operation["_etag"]
+
+    async def update_operation_step_status(self, operation: Operation, step_index: int, etag: str) -> str:
+        """
+        Writes the status, message and update time of the operation and of its step at step_index with a partial
+        document update, conditional on the operation not having been modified since it was read with etag. Returns
+        the operation's new etag.
+
+        :raises CosmosAccessConditionFailedError: When the operation was modified since.
+        """
+        operation_dict = operation.model_dump()
+        updated = await self.patch_item_by_id(operation.id, self.step_status_patch(operation_dict, step_index), partition_key=self.item_partition_key(operation_dict), etag=etag)
+        return updated["_etag"]
+
+    async def update_operation_step_and_resource_status(self, operation: Operation, step_index: int, etag: str, resource_patch_operations: List[dict]) -> Tuple[str, dict]:
+        """
+        Writes the status of the operation and its step at step_index, as update_operation_step_status does, and
+        applies resource_patch_operations to the resource the operation acts on, in a single transactional batch:
+        one round trip, and either both are written or neither is. Operations must be kept with their resources.
+        Returns the operation's new etag and the updated resource.
+
+        :raises CosmosAccessConditionFailedError: When the operation was modified since it was read with etag.
+        :raises EntityDoesNotExist: When the operation or the resource doesn't exist.
+        """
+        operation_dict = operation.model_dump()
+        batch_operations = [("patch", (operation.id, self.step_status_patch(operation_dict, step_index)), {"if_match_etag": etag})]
+        # a batch can hold up to 100 operations, so the resource's can be split into as many patches as needed
+        batch_operations += [("patch", (operation.resourceId, resource_patch_operations[i:i + MAX_PATCH_OPERATIONS])) for i in range(0, len(resource_patch_operations), MAX_PATCH_OPERATIONS)]
+        if len(batch_operations) == 1:
+            batch_operations.append(("read", (operation.resourceId,)))
+        try:
+            results = await self.container.execute_item_batch(batch_operations=batch_operations, partition_key=operation.resourceId)
+        except CosmosBatchOperationError as e:
+            if e.status_code == 412:
+                raise CosmosAccessConditionFailedError(status_code=412, message=f"Operation {operation.id} was modified since it was read")
+            if e.status_code == 404:
+                raise EntityDoesNotExist
+            raise
+        return results[0]["resourceBody"]["_etag"], results[-1]["resourceBody"]
+
+    @staticmethod
+    def step_status_patch(operation_dict: dict, step_index: int) -> List[dict]:
+        step = operation_dict["steps"][step_index]
+        patch_operations = [{"op": "set", "path": f"/{field}", "value": operation_dict[field]} for field in ("status", "message", "updatedWhen")]
+        patch_operations += [{"op": "set", "path": f"/steps/{step_index}/{field}", "value": step[field]} for field in ("status", "message", "updatedWhen")]
+        return patch_operations
+
+    @staticmethod
+    def my_operations_query(user_id: str):
+        query = OperationRepository.operations_query() + ' c.user.id = @userId AND ARRAY_CONTAINS(@inProgressStatuses, c.status) ORDER BY c.createdWhen ASC'
+        parameters = [
+            {'name': '@userId', 'value': user_id},
+            {'name': '@inProgressStatuses', 'value': [Status.AwaitingAction, Status.InvokingAction, Status.AwaitingDeployment, Status.Deploying, Status.AwaitingDeletion, Status.Deleting, Status.AwaitingUpdate, Status.Updating, Status.PipelineRunning]}
+        ]
+        return query, parameters
 
     async def get_my_operations(self, user_id: str) -> List[Operation]:
-        query = self.operations_query() + f' c.user.id = "{user_id}" AND c.status IN ("{Status.AwaitingAction}", "{Status.InvokingAction}", "{Status.AwaitingDeployment}", "{Status.Deploying}", "{Status.AwaitingDeletion}", "{Status.Deleting}", "{Status.AwaitingUpdate}", "{Status.Updating}", "{Status.PipelineRunning}") ORDER BY c.createdWhen ASC'
-        operations = await self.query(query=query)
+        query, parameters = self.my_operations_query(user_id)
+        operations = await self.query(query=query, parameters=parameters)
         return TypeAdapter(List[Operation]).validate_python(operations)
 
-    async def get_operations_by_resource_id(self, resource_id: str) -> List[Operation]:
+    async def get_my_operations_page(self, user_id: str, page_size: Optional[int] = None, continuation_token: Optional[str] = None) -> Tuple[List[Operation], Optional[str]]:
+        query, parameters = self.my_operations_query(user_id)
+        operations, continuation_token = await self.query_page(query=query, parameters=parameters, page_size=page_size, continuation_token=continuation_token)
+        return TypeAdapter(List[Operation]).validate_python(operations), continuation_token
+
+    def resource_query_options(self, resource_id: str, workspace_id: Optional[str]) -> dict:
+        if self.colocated_with_resources:
+            return {"partition_key": str(resource_id)}
+        return self.workspace_query_options(workspace_id)
+
+    async def get_operations_by_resource_id(self, resource_id: str, workspace_id: Optional[str] = None, include_archived: bool = False) -> List[Operation]:
         query = self.operations_query() + f' c.resourceId = "{resource_id}"'
-        operations = await self.query(query=query)
-        return TypeAdapter(List[Operation]).validate_python(operations)
+        operations = TypeAdapter(List[Operation]).validate_python(await self.query(query=query, **self.resource_query_options(resource_id, workspace_id)))
+        if include_archived:
+            # archived operations are older than any still in the operations container. One that's being archived is
+            # in both until its original is deleted, and it's the original that's kept, as it may still be updated
+            hot_ids = {operation.id for operation in operations}
+            archived = [operation for operation in await self.archive_repo.get_operations_by_resource_id(resource_id) if operation.id not in hot_ids]
+            operations = archived + operations
+        return operations
+
+    @staticmethod
+    def deployed_operations_condition(resource_id: str) -> str:
+        return f' c.resourceId = "{resource_id}" AND ((c.action = "{RequestAction.Install}" AND c.status = "{Status.Deployed}") OR (c.action = "{RequestAction.Upgrade}" AND c.status = "{Status.Updated}"))'
 
-    async def resource_has_deployed_operation(self, resource_id: str) -> bool:
-        query = self.operations_query() + f' c.resourceId = "{resource_id}" AND ((c.action = "{RequestAction.Install}" AND c.status = "{Status.Deployed}") OR (c.action = "{RequestAction.Upgrade}" AND c.status = "{Status.Updated}"))'
-        operations = await self.query(query=query)
+    async def resource_has_deployed_operation(self, resource_id: str, workspace_id: Optional[str] = None) -> bool:
+        query = self.operations_query() + self.deployed_operations_condition(resource_id)
+        operations = await self.query(query=query, **self.resource_query_options(resource_id, workspace_id))
+        if not operations:
+            # the operation that deployed a long-lived resource will have been archived
+            operations = await self.archive_repo.query(query=query, partition_key=str(resource_id))
         return len(operations) > 0
+
+    async def get_first_deployed_when(self, resource_id: str, workspace_id: Optional[str] = None) -> Optional[float]:
+        """
+        Returns when the first of the operations that deployed a resource finished, or None if none have.
+        """
+        query = 'SELECT VALUE c.updatedWhen FROM c WHERE' + self.deployed_operations_condition(resource_id)
+        deployed_when = await self.query(query=query, **self.resource_query_options(resource_id, workspace_id))
+        deployed_when += await self.archive_repo.query(query=query, partition_key=str(resource_id))
+        return min(deployed_when, default=None)
+
+    def resource_deployed_migrations(self, resource_repo: ResourceRepository) -> List[BulkMigration]:
+        """
+        Returns the bulk migration that records on the active resources deployed before isDeployed was, that they
+        have been, and when they first were, from the operations that deployed them.
+        """
+        async def mark_deployed(resource: dict) -> Optional[BulkPatch]:
+            deployed_when = await self.get_first_deployed_when(resource["id"], resource_repo.workspace_partition(resource))
+            if deployed_when is None:
+                return None
+            # only the two fields are set, as the resource may be updated while its operations are read
+            return BulkPatch(id=resource["id"], partition_key=resource_repo.item_partition_key(resource), fields=ResourceRepository.deployed_fields(deployed_when))
+
+        return [
+            BulkMigration(
+                name="resource-deployed-flag",
+                container=resource_repo.container,
+                query='SELECT * FROM c WHERE c.deploymentStatus != @deletedStatus AND IS_DEFINED(c.resourceType) AND (NOT IS_DEFINED(c.isDeployed) OR c.isDeployed = false)',
+                parameters=[{'name': '@deletedStatus', 'value': Status.Deleted}],
+                transform=mark_deployed)
+        ]
+
+    async def archive_operations(self, finished_before: float, page_size: int = ARCHIVE_PAGE_SIZE) -> int:
+        """
+        Moves the operations that finished before the finished_before timestamp to the archive, a page at a time: each
+        page is written to the archive, then deleted from the operations container, so a run that's interrupted leaves
+        operations in both, and the next run archives them again. Returns how many operations were moved.
+
+        An operation updated after it was read isn't deleted, so is moved by a later run if it's still finished.
+        """
+        query = self.operations_query() + ' ARRAY_CONTAINS(@finishedStatuses, c.status) AND c.updatedWhen < @finishedBefore'
+        parameters = [
+            {'name': '@finishedStatuses', 'value': FINISHED_STATUSES},
+            {'name': '@finishedBefore', 'value': finished_before}
+        ]
+        archived = 0
+        while True:
+            operations, _ = await self.query_page(query=query, parameters=parameters, page_size=page_size)
+            if not operations:
+                return archived
+
+            await self.archive_repo.archive(operations)
+            deleted = await asyncio.gather(*[self._delete_archived_operation(operation) for operation in operations])
+            if not any(deleted):
+                # every operation on the page was updated or removed since it was read; left for the next run
+                return archived
+            archived += sum(deleted)
+
+    async def _delete_archived_operation(self, operation: dict) -> bool:
+        try:
+            await self.container.delete_item(item=operation["id"], partition_key=self.item_partition_key(operation), etag=operation["_etag"], match_condition=MatchConditions.IfNotModified)
+        except (CosmosAccessConditionFailedError, CosmosResourceNotFoundError):
+            return False
+        return True
@@ -0,0 +1,45 @@
+from typing import List
+
+from pydantic import TypeAdapter
+
+from core import config
+from db.errors import EntityDoesNotExist
+from db.migrations.bulk import BulkWriter
+from db.repositories.base import BaseRepository
+from models.domain.operation import Operation
+
+# How many archived operations are written at once
+ARCHIVE_WRITE_CONCURRENCY = 10
+
+
+class OperationArchiveRepository(BaseRepository):
+    """
+    Operations that finished more than OPERATIONS_RETENTION_DAYS ago, moved out of the operations container by
+    OperationRepository.archive_operations, so the queries behind each refresh of the UI only read the operations
+    of recent interest. Partitioned on the resource id, as archived operations are listed by resource.
+    """
+
+    @classmethod
+    async def create(cls):
+        cls = OperationArchiveRepository()
+        await cls._init_container(config.STATE_STORE_OPERATIONS_ARCHIVE_CONTAINER)
+        return cls
+
+    async def archive(self, operations: List[dict]):
+        """
+        Writes the operations to the archive, backing off if Cosmos DB throttles the writes. Writing an operation
+        that's already archived replaces it, so an interrupted archival can be run again.
+        """
+        writer = BulkWriter(self.container, ARCHIVE_WRITE_CONCURRENCY)
+        await writer.upsert_all([{key: value for key, value in operation.items() if not key.startswith("_")} for operation in operations])
+
+    async def get_operations_by_resource_id(self, resource_id: str) -> List[Operation]:
+        operations = await self.query(query='SELECT * FROM c WHERE c.resourceId = @resourceId', parameters=[{'name': '@resourceId', 'value': str(resource_id)}], partition_key=str(resource_id))
+        return TypeAdapter(List[Operation]).validate_python(operations)
+
+    async def get_operation_by_id(self, operation_id: str) -> Operation:
+        # the resource isn't known, so the operation is found with a query across partitions
+        operations = await self.query(query='SELECT * FROM c WHERE c.id = @id', parameters=[{'name': '@id', 'value': str(operation_id)}])
+        if not operations:
+            raise EntityDoesNotExist
+        return TypeAdapter(Operation).validate_python(operations[0])
@@ -0,0 +1,37 @@
+import time
+from typing import Dict, List, Type, TypeVar
+
+from db.repositories.base import BaseRepository
+from services.logging import logger
+
+TRepository = TypeVar("TRepository", bound=BaseRepository)
+
+
+class RepositoryRegistry:
+    """
+    Holds one instance of each repository, and so one container proxy per container, for the lifetime of the
+    application. The repositories are created when the application starts, rather than on every request; any
+    repository that wasn't is created on first use and kept.
+    """
+
+    def __init__(self):
+        self._repositories: Dict[type, BaseRepository] = {}
+
+    async def initialize(self, repo_types: List[Type[BaseRepository]]):
+        # created one at a time, as the first repository connects the Cosmos DB client the rest share
+        started = time.monotonic()
+        for repo_type in repo_types:
+            await self.get(repo_type)
+        logger.info(f"Created {len(repo_types)} repositories in {time.monotonic() - started:.3f}s")
+
+    async def get(self, repo_type: Type[TRepository]) -> TRepository:
+        repo = self._repositories.get(repo_type)
+        if repo is None:
+            repo = self._repositories.setdefault(repo_type, await repo_type.create())
+        return repo
+
+    def clear(self):
+        self._repositories.clear()
+
+
+repository_registry = RepositoryRegistry()
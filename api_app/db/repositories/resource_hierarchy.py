@@ -0,0 +1,82 @@
+from typing import List, Optional
+
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+from core import config
+from db.repositories.base import BaseRepository
+from models.domain.resource import Resource, ResourceType
+
+
+class ResourceHierarchyRepository(BaseRepository):
+    """
+    Index of the resources under each workspace, partitioned on the workspace id, so the dependents of a workspace
+    or workspace service are found with a single partition query rather than a scan of the resources container.
+
+    The workspace's own entry marks the workspace as indexed; workspaces created before the index existed have no
+    entry until the index is backfilled, and their dependents have to be found by querying the resources.
+    """
+
+    @classmethod
+    async def create(cls):
+        cls = ResourceHierarchyRepository()
+        await cls._init_container(config.STATE_STORE_RESOURCE_HIERARCHY_CONTAINER)
+        return cls
+
+    @staticmethod
+    def get_workspace_id(resource: Resource) -> Optional[str]:
+        if resource.resourceType == ResourceType.Workspace:
+            return resource.id
+        if resource.resourceType in (ResourceType.WorkspaceService, ResourceType.UserResource):
+            return resource.workspaceId
+        # shared services don't belong to a workspace and have no dependents
+        return None
+
+    @staticmethod
+    def hierarchy_item(resource_id: str, workspace_id: str, resource_type: ResourceType, resource_path: str) -> dict:
+        return {
+            "id": resource_id,
+            "workspaceId": workspace_id,
+            "resourceType": resource_type,
+            "resourcePath": resource_path,
+            "depth": resource_path.count("/")
+        }
+
+    async def add_resource(self, resource: Resource):
+        workspace_id = self.get_workspace_id(resource)
+        if workspace_id is not None:
+            await self.update_item_dict(self.hierarchy_item(resource.id, workspace_id, resource.resourceType, resource.resourcePath))
+
+    async def remove_resource(self, resource: Resource):
+        workspace_id = self.get_workspace_id(resource)
+        if workspace_id is None:
+            return
+        try:
+            await self.container.delete_item(item=resource.id, partition_key=workspace_id)
+        except CosmosResourceNotFoundError:
+            pass
+
+    async def is_workspace_indexed(self, workspace_id: str) -> bool:
+        try:
+            await self.read_item_by_id(workspace_id, workspace_id)
+        except CosmosResourceNotFoundError:
+            return False
+        return True
+
+    async def get_dependency_ids(self, resource: Resource) -> Optional[List[str]]:
+        """
+        Returns the ids of resource and the resources under it, deepest first, or None if resource's workspace
+        isn't indexed.
+        """
+        workspace_id = self.get_workspace_id(resource)
+        if workspace_id is None:
+            return [resource.id]
+        if not await self.is_workspace_indexed(workspace_id):
+            return None
+
+        query = 'SELECT c.id FROM c WHERE c.resourcePath = @resourcePath OR STARTSWITH(c.resourcePath, @childResourcePath) ORDER BY c.depth DESC'
+        parameters = [
+            {'name': '@resourcePath', 'value': resource.resourcePath},
+            {'name': '@childResourcePath', 'value': resource.resourcePath + "/"}
+        ]
+        items = self.container.query_items(query=query, parameters=parameters, partition_key=workspace_id)
+        return [item["id"] async for item in items]
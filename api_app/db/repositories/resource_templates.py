@@ -1,5 +1,6 @@
+import time
 import uuid
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from pydantic import TypeAdapter
 
@@ -10,14 +11,95 @@ from models.domain.resource import ResourceType
 from models.domain.resource_template import ResourceTemplate
 from models.domain.user_resource_template import UserResourceTemplate
 from models.schemas.resource_template import ResourceTemplateInCreate, ResourceTemplateInformation
-from services.schema_service import enrich_shared_service_template, enrich_workspace_template, enrich_workspace_service_template, enrich_user_resource_template
+from services.schema_service import enrich_shared_service_template, enrich_workspace_template, enrich_workspace_service_template, enrich_user_resource_template, enriched_templates
+from services.logging import logger
+
+
+class ResourceTemplateCache:
+    """
+    In-process, read-through cache of resource templates.
+
+    A registered (name, version, resourceType, parentWorkspaceService) template never changes, so versioned
+    lookups are kept for the lifetime of the process. Its 'current' flag does, and the "current" pointer for a
+    template name moves when a new version is registered; the pointer is invalidated by registrations made through
+    this process and otherwise expires after `current_ttl` seconds so that registrations made through another API
+    instance are picked up. A cached version's 'current' flag is set from the pointer, and one cached without it
+    is only served for `current_ttl` seconds, so it's never staler than the pointer would be.
+    """
+
+    def __init__(self, current_ttl: float):
+        self.current_ttl = current_ttl
+        self.hits = 0
+        self.misses = 0
+        self._templates: Dict[Tuple[str, str, str, str], Tuple[ResourceTemplate, float]] = {}
+        self._current_versions: Dict[Tuple[str, str, str], Tuple[str, float]] = {}
+
+    @staticmethod
+    def _key(name: str, resource_type: ResourceType, parent_service_name: Optional[str]) -> Tuple[str, str, str]:
+        return (name, str(resource_type), parent_service_name or "")
+
+    def _expired(self, cached_at: float) -> bool:
+        return time.monotonic() - cached_at > self.current_ttl
+
+    def _current_version(self, key: Tuple[str, str, str]) -> Optional[str]:
+        current = self._current_versions.get(key)
+        if current is None or self._expired(current[1]):
+            return None
+        return current[0]
+
+    def get(self, name: str, version: str, resource_type: ResourceType, parent_service_name: Optional[str] = None) -> Optional[ResourceTemplate]:
+        key = self._key(name, resource_type, parent_service_name)
+        cached = self._templates.get(key + (version,))
+        current_version = self._current_version(key)
+        if cached is None or (current_version is None and self._expired(cached[1])):
+            self.misses += 1
+            return None
+        self.hits += 1
+        # hand out a copy so callers that mutate the template (e.g. flipping 'current') can't corrupt the cache
+        template = cached[0].model_copy(deep=True)
+        if current_version is not None:
+            template.current = version == current_version
+        return template
+
+    def get_current(self, name: str, resource_type: ResourceType, parent_service_name: Optional[str] = None) -> Optional[ResourceTemplate]:
+        current_version = self._current_version(self._key(name, resource_type, parent_service_name))
+        if current_version is None:
+            self.misses += 1
+            return None
+        return self.get(name, current_version, resource_type, parent_service_name)
+
+    def set(self, template: ResourceTemplate, parent_service_name: Optional[str] = None):
+        key = self._key(template.name, template.resourceType, parent_service_name)
+        cached_at = time.monotonic()
+        self._templates[key + (template.version,)] = (template.model_copy(deep=True), cached_at)
+        if template.current:
+            self._current_versions[key] = (template.version, cached_at)
+
+    def invalidate(self, name: str, resource_type: ResourceType, parent_service_name: Optional[str] = None):
+        """
+        Drops every cached version of a template, as registering a version changes the 'current' flag of the others
+        """
+        key = self._key(name, resource_type, parent_service_name)
+        self._current_versions.pop(key, None)
+        for template_key in [k for k in self._templates if k[:3] == key]:
+            del self._templates[template_key]
+        logger.debug(f"Invalidated cached templates for {name} ({resource_type})")
+
+    def clear(self):
+        self._templates.clear()
+        self._current_versions.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+template_cache = ResourceTemplateCache(current_ttl=config.RESOURCE_TEMPLATE_CACHE_CURRENT_TTL)
 
 
 class ResourceTemplateRepository(BaseRepository):
     @classmethod
     async def create(cls):
         cls = ResourceTemplateRepository()
-        await super().create(config.STATE_STORE_RESOURCE_TEMPLATES_CONTAINER)
+        await cls._init_container(config.STATE_STORE_RESOURCE_TEMPLATES_CONTAINER)
         return cls
 
     @staticmethod
@@ -31,6 +113,13 @@ class ResourceTemplateRepository(BaseRepository):
 
     @staticmethod
     def enrich_template(template: ResourceTemplate, is_update: bool = False) -> dict:
+        """
+        Returns the enriched template. The dict is shared with other callers, so copy it before making changes.
+        """
+        return enriched_templates.get(template, is_update, ResourceTemplateRepository._enrich_template)
+
+    @staticmethod
+    def _enrich_template(template: ResourceTemplate, is_update: bool = False) -> dict:
         if template.resourceType == ResourceType.Workspace:
             return enrich_workspace_template(template, is_update=is_update)
         elif template.resourceType == ResourceType.WorkspaceService:
@@ -66,6 +155,12 @@ class ResourceTemplateRepository(BaseRepository):
         """
         Returns full template for the current version of the 'template_name' template
         """
+        if resource_type != ResourceType.UserResource:
+            parent_service_name = ""
+        cached_template = template_cache.get_current(template_name, resource_type, parent_service_name)
+        if cached_template is not None:
+            return cached_template
+
         query, parameters = self._template_by_name_query(template_name, resource_type)
         query += ' AND c.current = true'
         if resource_type == ResourceType.UserResource:
@@ -76,10 +171,9 @@ class ResourceTemplateRepository(BaseRepository):
             raise EntityDoesNotExist
         if len(templates) > 1:
             raise DuplicateEntity
-        if resource_type == ResourceType.UserResource:
-            return TypeAdapter(UserResourceTemplate).validate_python(templates[0])
-        else:
-            return TypeAdapter(ResourceTemplate).validate_python(templates[0])
+        template = self._parse_template(templates[0], resource_type)
+        template_cache.set(template, parent_service_name)
+        return template
 
     async def get_template_by_name_and_version(self, name: str, version: str, resource_type: ResourceType, parent_service_name: Optional[str] = None) -> Union[ResourceTemplate, UserResourceTemplate]:
         """
@@ -87,6 +181,12 @@ class ResourceTemplateRepository(BaseRepository):
 
         For UserResource templates, you also need to pass in 'parent_service_name' as a parameter
         """
+        if resource_type != ResourceType.UserResource:
+            parent_service_name = None
+        cached_template = template_cache.get(name, version, resource_type, parent_service_name)
+        if cached_template is not None:
+            return cached_template
+
         query, parameters = self._template_by_name_query(name, resource_type)
         query += ' AND c.version = @version'
         parameters.append({'name': '@version', 'value': version})
@@ -103,10 +203,16 @@ class ResourceTemplateRepository(BaseRepository):
         templates = await self.query(query=query, parameters=parameters)
         if len(templates) != 1:
             raise EntityDoesNotExist
+        template = self._parse_template(templates[0], resource_type)
+        template_cache.set(template, parent_service_name)
+        return template
+
+    @staticmethod
+    def _parse_template(template: dict, resource_type: ResourceType) -> Union[ResourceTemplate, UserResourceTemplate]:
         if resource_type == ResourceType.UserResource:
-            return TypeAdapter(UserResourceTemplate).validate_python(templates[0])
+            return TypeAdapter(UserResourceTemplate).validate_python(template)
         else:
-            return TypeAdapter(ResourceTemplate).validate_python(templates[0])
+            return TypeAdapter(ResourceTemplate).validate_python(template)
 
     async def get_all_template_versions(self, template_name: str) -> List[str]:
         query = 'SELECT VALUE c.version FROM c where c.name = @template_name'
@@ -158,6 +264,8 @@ class ResourceTemplateRepository(BaseRepository):
         Updates the current version for the template
         Saves to the database and returns the enriched template
         """
+        # registration must see the stored versions, not what this process has cached
+        template_cache.invalidate(template_input.name, resource_type, workspace_service_template_name)
         try:
             template = await self.get_template_by_name_and_version(template_input.name, template_input.version, resource_type, workspace_service_template_name)
             if template:
@@ -172,6 +280,7 @@ class ResourceTemplateRepository(BaseRepository):
                 # first registration
                 template_input.current = True  # For first time registration, template is always marked current
             created_template = await self.create_template(template_input, resource_type, workspace_service_template_name)
+            template_cache.invalidate(template_input.name, resource_type, workspace_service_template_name)
             return self.enrich_template(created_template)
 
     def _validate_pipeline_has_unique_step_ids(self, pipeline):
@@ -1,16 +1,29 @@
+import asyncio
 import copy
+import time
 import semantic_version
+from collections import OrderedDict
 from datetime import datetime, UTC
-from typing import Optional, Tuple, List
+from typing import Callable, Optional, Tuple, List
 
-from azure.cosmos.exceptions import CosmosResourceNotFoundError
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceNotFoundError
 from resources.strings import RESOURCE_ACTION_INSTALL
 from core import config
 from db.errors import VersionDowngradeDenied, EntityDoesNotExist, MajorVersionUpdateDenied, TargetTemplateVersionDoesNotExist, UserNotAuthorizedToUseTemplate
+from db.json_patch import escape
+from db.migrations.bulk import BulkMigration
+from db.partitioning import PARTITION_KEY_FIELD, SHARED_PARTITION
 from db.repositories.resources_history import ResourceHistoryRepository
 from db.repositories.base import BaseRepository
+from db.repositories.registry import repository_registry
+from db.repositories.resource_hierarchy import ResourceHierarchyRepository
 from db.repositories.resource_templates import ResourceTemplateRepository
-from jsonschema import ValidationError, validate
+from db.repositories.resources_deleted import DeletedResourceRepository
+from jsonschema import ValidationError
+from jsonschema.exceptions import best_match
+from jsonschema.protocols import Validator
+from jsonschema.validators import validator_for
 from models.domain.authentication import User
 from models.domain.resource import Resource, ResourceType
 from models.domain.resource_template import ResourceTemplate
@@ -23,13 +36,83 @@ from models.schemas.resource import ResourcePatch
 from pydantic import UUID4, TypeAdapter
 
 
+class TemplateValidatorRegistry:
+    """
+    Bounded LRU of compiled JSON schema validators, keyed on (template id, is_update, action).
+
+    Registered templates are immutable, so the normalized (and, for patches, cut down) schema of a template only
+    needs to be checked against its metaschema and compiled once, rather than on every create and patch.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._validators: OrderedDict[Tuple[str, bool, str], Validator] = OrderedDict()
+
+    def get_validator(self, key: Optional[Tuple[str, bool, str]], build_schema: Callable[[], dict]) -> Validator:
+        """
+        Returns the compiled validator for key, building the schema and compiling it on a miss.
+        Schemas without a key (i.e. ad hoc templates without an id) are compiled but not kept.
+        """
+        if key is not None and key in self._validators:
+            self._validators.move_to_end(key)
+            return self._validators[key]
+
+        schema = ResourceRepository._normalize_template_schema(build_schema())
+        validator_class = validator_for(schema)
+        validator_class.check_schema(schema)
+        validator = validator_class(schema)
+
+        if key is not None:
+            self._validators[key] = validator
+            if len(self._validators) > self.max_size:
+                self._validators.popitem(last=False)
+        return validator
+
+    def clear(self):
+        self._validators.clear()
+
+
+template_validators = TemplateValidatorRegistry()
+
+
 class ResourceRepository(BaseRepository):
+    partitioned_by_workspace = config.STATE_STORE_PARTITION_BY_WORKSPACE
+    # Whether the container also holds each resource's operations, in the resource's partition (see
+    # OperationRepository), so a resource and its operation can be updated in a single transactional batch
+    colocated_with_operations = config.STATE_STORE_COLOCATE_OPERATIONS
+
     @classmethod
     async def create(cls):
         cls = ResourceRepository()
-        await super().create(config.STATE_STORE_RESOURCES_CONTAINER)
+        await cls._init_resource_repository()
         return cls
 
+    async def _init_resource_repository(self):
+        # called by the create of each subclass on the instance it returns
+        await self._init_container(config.STATE_STORE_RESOURCES_CONTAINER)
+        self.hierarchy_repo = await repository_registry.get(ResourceHierarchyRepository)
+        self.deleted_repo = await repository_registry.get(DeletedResourceRepository)
+
+    async def save_item(self, resource: Resource):
+        # index the resource first, so a failed save leaves an index entry for a missing resource rather than a
+        # resource missing from its parent's dependencies
+        await self.hierarchy_repo.add_resource(resource)
+        await super().save_item(resource)
+
+    def workspace_partition(self, item: dict) -> str:
+        if item.get("resourceType") == ResourceType.Workspace:
+            return item["id"]
+        return item.get("workspaceId") or SHARED_PARTITION
+
+    def to_document(self, item: dict) -> dict:
+        if self.colocated_with_operations:
+            item[PARTITION_KEY_FIELD] = item["id"]
+        return super().to_document(item)
+
+    async def delete_resource(self, resource: Resource):
+        await self.delete_item(resource.id, self.item_partition_key(resource.model_dump()))
+        await self.hierarchy_repo.remove_resource(resource)
+
     def _active_resources_by_type_query(self, resource_type: ResourceType):
         query = 'SELECT * FROM c WHERE c.deploymentStatus != @deletedStatus AND c.resourceType = @resourceType'
         parameters = [
@@ -96,12 +179,20 @@ class ResourceRepository(BaseRepository):
         return normalized_template
 
     @staticmethod
-    def _validate_resource_parameters(resource_input, resource_template):
-        normalized_template = ResourceRepository._normalize_template_schema(resource_template)
-        validate(instance=resource_input["properties"], schema=normalized_template)
+    def _validate_resource_parameters(resource_input, resource_template, is_update: bool = False, action: str = RESOURCE_ACTION_INSTALL):
+        key = (resource_template["id"], is_update, action) if resource_template.get("id") else None
+        validator = template_validators.get_validator(key, lambda: resource_template)
+        ResourceRepository._raise_first_validation_error(validator, resource_input["properties"])
+
+    @staticmethod
+    def _raise_first_validation_error(validator: Validator, instance: dict):
+        # same error selection as jsonschema.validate
+        error = best_match(validator.iter_errors(instance))
+        if error is not None:
+            raise error
 
     async def _get_enriched_template(self, template_name: str, resource_type: ResourceType, parent_template_name: str = "") -> dict:
-        template_repo = await ResourceTemplateRepository.create()
+        template_repo = await repository_registry.get(ResourceTemplateRepository)
         template = await template_repo.get_current_template(template_name, resource_type, parent_template_name)
         return template_repo.enrich_template(template)
 
@@ -109,16 +200,62 @@ class ResourceRepository(BaseRepository):
     def get_resource_base_spec_params():
         return {"tre_id": config.TRE_ID}
 
-    async def get_resource_dict_by_id(self, resource_id: UUID4) -> dict:
+    async def get_resource_dict_by_id(self, resource_id: UUID4, include_deleted: bool = False, workspace_partition: Optional[str] = None) -> dict:
+        """
+        Reads a resource by id, including one whose uninstall has completed and been moved to the deleted resources
+        container if include_deleted is set. workspace_partition is the resource's workspace (see workspace_partition)
+        when the caller knows it, so the read is a point read when resources are partitioned by workspace.
+        """
         try:
-            resource = await self.read_item_by_id(str(resource_id))
+            return await self.read_item_by_id(str(resource_id), self.partition_key(str(resource_id), workspace_partition))
+        except CosmosResourceNotFoundError:
+            if not include_deleted:
+                raise EntityDoesNotExist
+        try:
+            return await self.deleted_repo.read_item_by_id(str(resource_id))
         except CosmosResourceNotFoundError:
             raise EntityDoesNotExist
-        return resource
 
-    async def get_resource_by_id(self, resource_id: UUID4) -> Resource:
-        resource = await self.get_resource_dict_by_id(resource_id)
+    async def get_resource_by_id(self, resource_id: UUID4, include_deleted: bool = False, workspace_partition: Optional[str] = None) -> Resource:
+        return self.to_resource(await self.get_resource_dict_by_id(resource_id, include_deleted, workspace_partition))
 
+    async def move_to_deleted(self, resource: dict) -> bool:
+        """
+        Moves a deleted resource, as read from the resources container, to the deleted resources container. It's
+        written there first, then removed here if it hasn't been modified since it was read, so it's never in neither.
+        Returns whether it was moved.
+        """
+        if resource.get("deploymentStatus") != Status.Deleted:
+            return False
+        await self.deleted_repo.add_resource(resource)
+        try:
+            await self.container.delete_item(item=resource["id"], partition_key=self.item_partition_key(resource), etag=resource["_etag"], match_condition=MatchConditions.IfNotModified)
+        except (CosmosAccessConditionFailedError, CosmosResourceNotFoundError):
+            return False
+        return True
+
+    async def move_deleted_resources(self, deadline: float, page_size: int = 100) -> Tuple[int, bool]:
+        """
+        Moves the resources already deleted to the deleted resources container, a page at a time, until the query is
+        exhausted or the deadline (a time.monotonic() time) has passed. Returns how many were moved, and whether all
+        were: a resource modified since it was read isn't, and is left for the next call.
+        """
+        query = 'SELECT * FROM c WHERE c.deploymentStatus = @deletedStatus'
+        parameters = [{'name': '@deletedStatus', 'value': Status.Deleted}]
+        moved = 0
+        all_moved = True
+        continuation_token = None
+        while time.monotonic() < deadline:
+            resources, continuation_token = await self.query_page(query=query, parameters=parameters, page_size=page_size, continuation_token=continuation_token)
+            results = await asyncio.gather(*[self.move_to_deleted(resource) for resource in resources])
+            moved += sum(results)
+            all_moved = all_moved and all(results)
+            if continuation_token is None:
+                return moved, all_moved
+        return moved, False
+
+    @staticmethod
+    def to_resource(resource: dict) -> Resource:
         if resource["resourceType"] == ResourceType.SharedService:
             return TypeAdapter(SharedService).validate_python(resource)
         if resource["resourceType"] == ResourceType.Workspace:
@@ -129,6 +266,55 @@ class ResourceRepository(BaseRepository):
             return TypeAdapter(UserResource).validate_python(resource)
         return TypeAdapter(Resource).validate_python(resource)
 
+    @staticmethod
+    def deployment_status_patch(deployment_status: Status) -> List[dict]:
+        return [{"op": "set", "path": "/deploymentStatus", "value": deployment_status}]
+
+    @staticmethod
+    def outputs_patch(outputs: dict) -> List[dict]:
+        return [{"op": "set", "path": f"/properties/{escape(name)}", "value": value} for name, value in outputs.items()]
+
+    @staticmethod
+    def deployed_fields(deployed_when: float) -> dict:
+        return {"isDeployed": True, "firstDeployedAt": deployed_when}
+
+    async def mark_deployed(self, resource: Resource, deployed_when: float, workspace_partition: Optional[str] = None):
+        """
+        Records on a resource that it has been deployed, so that's a field read rather than a query of its operations.
+        Only the first deployment is written, so firstDeployedAt is when that was.
+        """
+        if resource.isDeployed:
+            return
+        patch_operations = [{"op": "set", "path": f"/{name}", "value": value} for name, value in self.deployed_fields(deployed_when).items()]
+        try:
+            await self.patch_item_by_id(str(resource.id), patch_operations, partition_key=self.partition_key(str(resource.id), workspace_partition))
+        except CosmosResourceNotFoundError:
+            raise EntityDoesNotExist
+
+    async def update_deployment_status(self, resource_id: str, deployment_status: Status, workspace_partition: Optional[str] = None) -> Resource:
+        """
+        Sets the deployment status of a resource with a partial document update, leaving the rest of it as it is, and
+        returns the updated resource.
+        """
+        try:
+            resource = await self.patch_item_by_id(str(resource_id), self.deployment_status_patch(deployment_status), partition_key=self.partition_key(str(resource_id), workspace_partition))
+        except CosmosResourceNotFoundError:
+            raise EntityDoesNotExist
+        return self.to_resource(resource)
+
+    async def update_outputs(self, resource_id: str, outputs: dict, workspace_partition: Optional[str] = None):
+        """
+        Sets each of a deployment's outputs as a property of the resource with a partial document update, so the
+        properties written since it was read aren't overwritten.
+        """
+        if not outputs:
+            return
+        operations = self.outputs_patch(outputs)
+        try:
+            await self.patch_item_by_id(str(resource_id), operations, partition_key=self.partition_key(str(resource_id), workspace_partition))
+        except CosmosResourceNotFoundError:
+            raise EntityDoesNotExist
+
     async def get_active_resource_by_template_name(self, template_name: str) -> Resource:
         query = "SELECT TOP 1 * FROM c WHERE c.templateName = @templateName AND c.deploymentStatus != @deletedStatus AND c.deploymentStatus != @failedStatus"
         parameters = [
@@ -160,7 +346,8 @@ class ResourceRepository(BaseRepository):
         return TypeAdapter(ResourceTemplate).validate_python(template)
 
     async def patch_resource(self, resource: Resource, resource_patch: ResourcePatch, resource_template: ResourceTemplate, etag: str, resource_template_repo: ResourceTemplateRepository, resource_history_repo: ResourceHistoryRepository, user: User, resource_action: str, force_version_update: bool = False) -> Tuple[Resource, ResourceTemplate]:
-        await resource_history_repo.create_resource_history_item(resource)
+        snapshot_id = resource_history_repo.advance_history_chain(resource)
+        resource_before_patch = resource.model_copy(deep=True)
         # now update the resource props
         resource.resourceVersion = resource.resourceVersion + 1
         resource.user = user.model_dump() if hasattr(user, "model_dump") else user
@@ -180,9 +367,31 @@ class ResourceRepository(BaseRepository):
             resource.properties.update(resource_patch.properties)
 
         await self.update_item_with_etag(resource, etag)
+        # history is only written once the patch is, so a patch that loses the etag check (and is retried) leaves none
+        await resource_history_repo.create_resource_history_item(resource_before_patch, snapshot_id)
         return resource, resource_template
 
     async def get_resource_dependency_list(self, resource: Resource) -> List:
+        """
+        Returns resource and the active resources under it, deepest first.
+        """
+        dependency_ids = await self.hierarchy_repo.get_dependency_ids(resource)
+        if dependency_ids is None:
+            return await self.query_resource_dependency_list(resource)
+
+        # a resource's dependencies are all in its workspace
+        workspace_partition = self.workspace_partition(resource.model_dump())
+        dependencies = await asyncio.gather(*[self._read_active_resource_dict(resource_id, workspace_partition) for resource_id in dependency_ids])
+        return [dependency for dependency in dependencies if dependency is not None]
+
+    async def _read_active_resource_dict(self, resource_id: str, workspace_partition: str) -> Optional[dict]:
+        try:
+            resource = await self.read_item_by_id(resource_id, self.partition_key(resource_id, workspace_partition))
+        except CosmosResourceNotFoundError:
+            return None
+        return resource if resource["deploymentStatus"] != Status.Deleted else None
+
+    async def query_resource_dependency_list(self, resource: Resource) -> List:
         # Get the parent resource path and id
         parent_resource_path = resource.resourcePath
         dependent_resources_list = []
@@ -193,7 +402,7 @@ class ResourceRepository(BaseRepository):
             {'name': '@resourcePath', 'value': parent_resource_path},
             {'name': '@deletedStatus', 'value': Status.Deleted}
         ]
-        related_resources = await self.query(query=related_resources_query, parameters=parameters)
+        related_resources = await self.query(query=related_resources_query, parameters=parameters, **self.workspace_query_options(self.workspace_partition(resource.model_dump())))
         for resource in related_resources:
             resource_path = resource["resourcePath"]
             resource_level = resource_path.count("/")
@@ -202,12 +411,46 @@ class ResourceRepository(BaseRepository):
         sorted_list = sorted(dependent_resources_list, key=lambda x: x[1], reverse=True)
         return [resource[0] for resource in sorted_list]
 
+    def resource_hierarchy_migrations(self) -> List[BulkMigration]:
+        """
+        Returns the bulk migrations that backfill the hierarchy index with the active resources. Workspaces are
+        indexed by the second migration, once everything under them is, as their entry marks the workspace as indexed.
+        """
+        query = 'SELECT c.id, c.resourceType, c.resourcePath, c.workspaceId FROM c WHERE c.deploymentStatus != @deletedStatus AND ARRAY_CONTAINS(@resourceTypes, c.resourceType)'
+
+        def parameters(*resource_types: ResourceType) -> list:
+            return [
+                {'name': '@deletedStatus', 'value': Status.Deleted},
+                {'name': '@resourceTypes', 'value': list(resource_types)}
+            ]
+
+        def to_hierarchy_item(item: dict) -> dict:
+            workspace_id = item["id"] if item["resourceType"] == ResourceType.Workspace else item["workspaceId"]
+            return ResourceHierarchyRepository.hierarchy_item(item["id"], workspace_id, item["resourceType"], item["resourcePath"])
+
+        return [
+            BulkMigration(
+                name="resource-hierarchy-workspace-children",
+                container=self.container,
+                query=query,
+                parameters=parameters(ResourceType.WorkspaceService, ResourceType.UserResource),
+                transform=to_hierarchy_item,
+                target=self.hierarchy_repo.container),
+            BulkMigration(
+                name="resource-hierarchy-workspaces",
+                container=self.container,
+                query=query,
+                parameters=parameters(ResourceType.Workspace),
+                transform=to_hierarchy_item,
+                target=self.hierarchy_repo.container)
+        ]
+
     async def validate_template_version_patch(self, resource: Resource, resource_patch: ResourcePatch, resource_template_repo: ResourceTemplateRepository, resource_template: ResourceTemplate, force_version_update: bool = False):
         parent_service_template_name = None
         if resource.resourceType == ResourceType.UserResource:
             try:
-                resource_repo = await ResourceRepository.create()
-                parent_service = await resource_repo.get_resource_by_id(resource.parentWorkspaceServiceId)
+                resource_repo = await repository_registry.get(ResourceRepository)
+                parent_service = await resource_repo.get_resource_by_id(resource.parentWorkspaceServiceId, workspace_partition=resource.workspaceId)
                 parent_service_template_name = parent_service.templateName
             except EntityDoesNotExist:
                 raise ValueError(f'Parent workspace service {resource.parentWorkspaceServiceId} not found')
@@ -232,18 +475,23 @@ class ResourceRepository(BaseRepository):
             raise TargetTemplateVersionDoesNotExist(f"Template '{resource_template.name}' not found for resource type '{resource_template.resourceType}' with target template version '{resource_patch.templateVersion}'")
 
     def validate_patch(self, resource_patch: ResourcePatch, resource_template_repo: ResourceTemplateRepository, resource_template: ResourceTemplate, resource_action: str):
-        # get the enriched (combined) template
-        enriched_template = resource_template_repo.enrich_template(resource_template, is_update=True)
-
-        # validate the PATCH data against a cut down version of the full template.
-        update_template = copy.deepcopy(enriched_template)
-        update_template["required"] = []
-        update_template["properties"] = {}
-        for prop_name, prop in enriched_template["properties"].items():
-            if (resource_action == RESOURCE_ACTION_INSTALL or prop.get("updateable", False) is True):
-                update_template["properties"][prop_name] = prop
-
-        self._validate_resource_parameters(resource_patch.model_dump(), update_template)
+        def build_update_schema() -> dict:
+            # get the enriched (combined) template
+            enriched_template = resource_template_repo.enrich_template(resource_template, is_update=True)
+
+            # validate the PATCH data against a cut down version of the full template.
+            update_template = copy.deepcopy(enriched_template)
+            update_template["required"] = []
+            update_template["properties"] = {}
+            for prop_name, prop in enriched_template["properties"].items():
+                if (resource_action == RESOURCE_ACTION_INSTALL or prop.get("updateable", False) is True):
+                    update_template["properties"][prop_name] = prop
+            return update_template
+
+        template_id = resource_template.get("id") if isinstance(resource_template, dict) else resource_template.id
+        key = (template_id, True, resource_action) if template_id else None
+        validator = template_validators.get_validator(key, build_update_schema)
+        self._raise_first_validation_error(validator, resource_patch.model_dump()["properties"])
 
     def get_timestamp(self) -> float:
         return datetime.now(UTC).timestamp()
@@ -0,0 +1,29 @@
+from typing import List
+
+from pydantic import TypeAdapter
+
+from core import config
+from db.repositories.base import BaseRepository
+from models.domain.resource import ResourceType
+from models.domain.workspace import Workspace
+
+
+class DeletedResourceRepository(BaseRepository):
+    """
+    Resources whose uninstall has completed, moved out of the resources container by ResourceRepository, so the
+    queries for active resources don't read (and pay for) every resource the TRE has ever deleted. They are only read
+    when a caller asks for deleted resources; their history stays in the resource history container.
+    """
+
+    @classmethod
+    async def create(cls):
+        cls = DeletedResourceRepository()
+        await cls._init_container(config.STATE_STORE_DELETED_RESOURCES_CONTAINER)
+        return cls
+
+    async def add_resource(self, resource: dict):
+        await self.update_item_dict({key: value for key, value in resource.items() if not key.startswith("_")})
+
+    async def get_workspaces(self) -> List[Workspace]:
+        workspaces = await self.query(query='SELECT * FROM c WHERE c.resourceType = @resourceType', parameters=[{'name': '@resourceType', 'value': ResourceType.Workspace}])
+        return TypeAdapter(List[Workspace]).validate_python(workspaces)
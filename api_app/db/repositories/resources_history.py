@@ -1,19 +1,62 @@
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import uuid
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
 from pydantic import TypeAdapter
 
-from db.errors import EntityDoesNotExist
+from db.errors import EntityDoesNotExist, InvalidInput
+from db.json_patch import make_patch, apply_patch
 from db.repositories.base import BaseRepository
 from core import config
 from models.domain.resource import Resource, ResourceHistoryItem
+from resources import strings
 from services.logging import logger
 
+# Fields of a stored history item that hold its properties as a patch against an earlier item
+PATCH_FIELDS = ("propertiesPatch", "baseId", "snapshotId")
+
+
+def is_snapshot(item: dict) -> bool:
+    # items written before history was delta encoded hold their full properties, so are snapshots too
+    return "propertiesPatch" not in item
+
+
+def reconstruct_properties(items_by_id: Dict[str, dict], item_id: str, reconstructed: Dict[str, dict]) -> Optional[dict]:
+    """
+    Returns the properties of the item, applying the patches of its chain to the snapshot the chain starts at, or
+    None if part of the chain isn't in items_by_id. reconstructed holds the properties of items already rebuilt, so
+    each patch is applied once however many items share it.
+    """
+    chain = []
+    current_id = item_id
+    while current_id not in reconstructed:
+        item = items_by_id.get(current_id)
+        if item is None:
+            return None
+        if is_snapshot(item):
+            reconstructed[current_id] = item.get("properties", {})
+            break
+        chain.append(item)
+        current_id = item["baseId"]
+
+    properties = reconstructed[current_id]
+    for item in reversed(chain):
+        properties = apply_patch(properties, item["propertiesPatch"])
+        reconstructed[item["id"]] = properties
+    return properties
+
 
 class ResourceHistoryRepository(BaseRepository):
+    """
+    Stores the properties of a history item as a JSON patch against the snapshot that starts its chain, as most
+    patches change few of a resource's properties, with full properties stored every
+    RESOURCE_HISTORY_SNAPSHOT_INTERVAL items. The chain a resource's next item goes in is kept on the resource, so
+    writing an item reads no more than that snapshot.
+    """
+
     @classmethod
     async def create(cls):
         cls = ResourceHistoryRepository()
-        await super().create(config.STATE_STORE_RESOURCES_HISTORY_CONTAINER)
+        await cls._init_container(config.STATE_STORE_RESOURCES_HISTORY_CONTAINER)
         return cls
 
     @staticmethod
@@ -23,30 +66,142 @@ class ResourceHistoryRepository(BaseRepository):
         except ValueError:
             raise ValueError("Resource Id should be a valid GUID")
 
-    def resource_history_query(self, resourceId: str):
+    @staticmethod
+    def history_projection(fields: Optional[List[str]]) -> str:
+        """
+        Returns what to SELECT of the history items for the fields asked for, all of them by default. Properties are
+        stored as patch chains, so items are only read whole when their properties are asked for.
+        """
+        if not fields:
+            return '*'
+        unknown_fields = [field for field in fields if field not in ResourceHistoryItem.model_fields]
+        if unknown_fields:
+            raise InvalidInput(strings.INVALID_RESOURCE_HISTORY_FIELDS.format(", ".join(unknown_fields)))
+        if "properties" in fields:
+            return '*'
+        return ", ".join(f"c.{field}" for field in dict.fromkeys(["id", "resourceId", *fields]))
+
+    def resource_history_query(self, resourceId: str, from_when: Optional[float] = None, to_when: Optional[float] = None, order_ascending: bool = True, fields: Optional[List[str]] = None):
         logger.debug("Validate sanity of resourceId")
         self.is_valid_uuid(resourceId)
-        query = 'SELECT * FROM c WHERE c.resourceId = @resourceId'
+        query = f'SELECT {self.history_projection(fields)} FROM c WHERE c.resourceId = @resourceId'
         parameters = [
             {'name': '@resourceId', 'value': resourceId}
         ]
+        if from_when is not None:
+            query += ' AND c.updatedWhen >= @fromWhen'
+            parameters.append({'name': '@fromWhen', 'value': from_when})
+        if to_when is not None:
+            query += ' AND c.updatedWhen <= @toWhen'
+            parameters.append({'name': '@toWhen', 'value': to_when})
+        query += ' ORDER BY c.updatedWhen ' + ('ASC' if order_ascending else 'DESC')
         return query, parameters
 
-    async def get_resource_history_by_resource_id(self, resource_id: str) -> List[ResourceHistoryItem]:
-        query, parameters = self.resource_history_query(resource_id)
+    async def get_resource_history_by_resource_id(self, resource_id: str, from_when: Optional[float] = None, to_when: Optional[float] = None, order_ascending: bool = True, fields: Optional[List[str]] = None) -> List[ResourceHistoryItem]:
+        query, parameters = self.resource_history_query(resource_id, from_when, to_when, order_ascending, fields)
         try:
             logger.info(f"Fetching history for resource {resource_id}")
-            resource_history_items = await self.query(query=query, parameters=parameters)
+            resource_history_items = await self.query(query=query, parameters=parameters, partition_key=resource_id)
             logger.debug(f"Got {len(resource_history_items)} history items for resource {resource_id}")
         except EntityDoesNotExist:
             logger.info(f"No history for resource {resource_id}")
             resource_history_items = []
-        return TypeAdapter(List[ResourceHistoryItem]).validate_python(resource_history_items)
+        return await self.to_history_items(resource_id, resource_history_items, fields)
+
+    async def get_resource_history_page(self, resource_id: str, page_size: Optional[int] = None, continuation_token: Optional[str] = None, from_when: Optional[float] = None, to_when: Optional[float] = None, order_ascending: bool = True, fields: Optional[List[str]] = None) -> Tuple[List[ResourceHistoryItem], Optional[str]]:
+        query, parameters = self.resource_history_query(resource_id, from_when, to_when, order_ascending, fields)
+        resource_history_items, continuation_token = await self.query_page(query=query, parameters=parameters, page_size=page_size, continuation_token=continuation_token, partition_key=resource_id)
+        return await self.to_history_items(resource_id, resource_history_items, fields), continuation_token
+
+    async def to_history_items(self, resource_id: str, items: List[dict], fields: Optional[List[str]] = None) -> List[ResourceHistoryItem]:
+        """
+        Returns the history items read, with only the fields asked for (and their ids) set, if any were.
+        """
+        if not fields:
+            return await self.reconstruct_history_items(resource_id, items)
+        if "properties" in fields:
+            items = [item.model_dump() for item in await self.reconstruct_history_items(resource_id, items)]
+        included = {"id", "resourceId", *fields}
+        return TypeAdapter(List[ResourceHistoryItem]).validate_python([{key: value for key, value in item.items() if key in included} for item in items])
+
+    async def get_patch_chains(self, resource_id: str, snapshot_ids: List[str]) -> List[dict]:
+        query = 'SELECT * FROM c WHERE c.resourceId = @resourceId AND (ARRAY_CONTAINS(@snapshotIds, c.id) OR ARRAY_CONTAINS(@snapshotIds, c.snapshotId))'
+        parameters = [
+            {'name': '@resourceId', 'value': resource_id},
+            {'name': '@snapshotIds', 'value': snapshot_ids}
+        ]
+        return await self.query(query=query, parameters=parameters, partition_key=resource_id)
+
+    async def reconstruct_history_items(self, resource_id: str, items: List[dict]) -> List[ResourceHistoryItem]:
+        """
+        Returns the stored items with their full properties. Items whose patch chain starts outside those read (e.g.
+        on an earlier page) have their chains read in a single query.
+        """
+        items_by_id = {item["id"]: item for item in items}
+        reconstructed: Dict[str, dict] = {}
+        incomplete = [item for item in items if reconstruct_properties(items_by_id, item["id"], reconstructed) is None]
+        if incomplete:
+            for item in await self.get_patch_chains(resource_id, list({item["snapshotId"] for item in incomplete})):
+                items_by_id.setdefault(item["id"], item)
+
+        history_items = []
+        for item in items:
+            properties = reconstruct_properties(items_by_id, item["id"], reconstructed)
+            if properties is None:
+                logger.error(f"History item {item['id']} of resource {resource_id} can't be reconstructed, as part of its patch chain is missing")
+            stored = {key: value for key, value in item.items() if key not in PATCH_FIELDS}
+            history_items.append({**stored, "properties": properties or {}})
+        return TypeAdapter(List[ResourceHistoryItem]).validate_python(history_items)
+
+    async def get_snapshot_properties(self, resource_id: str, snapshot_id: str) -> Optional[dict]:
+        # a point read within the resource's partition, None if the snapshot was never written
+        try:
+            snapshot = await self.read_item_by_id(snapshot_id, partition_key=resource_id)
+        except CosmosResourceNotFoundError:
+            return None
+        return snapshot.get("properties", {}) if is_snapshot(snapshot) else None
+
+    async def encode_resource_history_item(self, resource_history_item: ResourceHistoryItem, snapshot_id: Optional[str] = None) -> dict:
+        """
+        Returns the item to store: a patch against the snapshot of the chain it goes in, or a snapshot with the full
+        properties when it starts a chain (or the chain's snapshot can't be read).
+        """
+        item = resource_history_item.model_dump()
+        if snapshot_id is None:
+            return item
+
+        snapshot_properties = await self.get_snapshot_properties(resource_history_item.resourceId, snapshot_id)
+        if snapshot_properties is None:
+            return item
+
+        del item["properties"]
+        return {**item, "propertiesPatch": make_patch(snapshot_properties, resource_history_item.properties), "baseId": snapshot_id, "snapshotId": snapshot_id}
+
+    @staticmethod
+    def history_item_id(resource: Resource) -> str:
+        # one item per version of a resource, so saving an item again replaces it rather than duplicating it
+        return f"{resource.id}-{resource.resourceVersion}"
+
+    @classmethod
+    def advance_history_chain(cls, resource: Resource) -> Optional[str]:
+        """
+        Records on the resource the chain the history item of its current version goes in, returning the snapshot
+        that item is a patch against, or None if the item is to start a new chain as a snapshot.
+        """
+        if resource.historySnapshotId is None or resource.historyChainLength >= config.RESOURCE_HISTORY_SNAPSHOT_INTERVAL:
+            resource.historySnapshotId = cls.history_item_id(resource)
+            resource.historyChainLength = 1
+            return None
+        resource.historyChainLength += 1
+        return resource.historySnapshotId
+
+    async def save_item(self, resource_history_item: ResourceHistoryItem, snapshot_id: Optional[str] = None):
+        await self.container.upsert_item(body=await self.encode_resource_history_item(resource_history_item, snapshot_id))
 
-    async def create_resource_history_item(self, resource: Resource) -> ResourceHistoryItem:
+    async def create_resource_history_item(self, resource: Resource, snapshot_id: Optional[str] = None) -> ResourceHistoryItem:
         logger.info(f"Creating a new history item for resource {resource.id}")
         resource_history_item = ResourceHistoryItem(
-            id=str(uuid.uuid4()),
+            id=self.history_item_id(resource),
             resourceId=resource.id,
             isEnabled=resource.isEnabled,
             properties=resource.properties,
@@ -57,7 +212,7 @@ class ResourceHistoryRepository(BaseRepository):
         )
         logger.info(f"Saving history item for {resource.id}")
         try:
-            await self.save_item(resource_history_item)
+            await self.save_item(resource_history_item, snapshot_id)
         except Exception:
             logger.exception(f"Failed saving history item for {resource.id}")
             raise
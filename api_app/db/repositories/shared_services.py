@@ -9,7 +9,8 @@ from models.domain.authentication import User
 from db.repositories.resource_templates import ResourceTemplateRepository
 from db.repositories.resources_history import ResourceHistoryRepository
 from db.repositories.resources import ResourceRepository
-from db.errors import DuplicateEntity, EntityDoesNotExist
+from db.errors import DuplicateEntity
+from db.partitioning import SHARED_PARTITION
 from models.domain.shared_service import SharedService
 from models.schemas.resource import ResourcePatch
 from models.schemas.shared_service_template import SharedServiceTemplateInCreate
@@ -21,18 +22,9 @@ class SharedServiceRepository(ResourceRepository):
     @classmethod
     async def create(cls):
         cls = SharedServiceRepository()
-        await super().create()
+        await cls._init_resource_repository()
         return cls
 
-    @staticmethod
-    def shared_service_query(shared_service_id: str):
-        query = 'SELECT * FROM c WHERE c.resourceType = @resourceType AND c.id = @sharedServiceId'
-        parameters = [
-            {'name': '@resourceType', 'value': ResourceType.SharedService},
-            {'name': '@sharedServiceId', 'value': shared_service_id}
-        ]
-        return query, parameters
-
     @staticmethod
     def active_shared_services_query():
         query = 'SELECT * FROM c WHERE c.deploymentStatus != @deletedStatus AND c.resourceType = @resourceType'
@@ -54,20 +46,14 @@ class SharedServiceRepository(ResourceRepository):
         return query, parameters
 
     async def get_shared_service_by_id(self, shared_service_id: str):
-        query, parameters = self.shared_service_query(str(shared_service_id))
-        query += ' AND c.deploymentStatus != @deletedStatus'
-        parameters.append({'name': '@deletedStatus', 'value': Status.Deleted})
-        shared_services = await self.query(query=query, parameters=parameters)
-        if not shared_services:
-            raise EntityDoesNotExist
-        return TypeAdapter(SharedService).validate_python(shared_services[0])
+        return await self.read_item(str(shared_service_id), SharedService, partition_key=self.partition_key(str(shared_service_id), SHARED_PARTITION), item_filter=lambda item: item.get("resourceType") == ResourceType.SharedService and item.get("deploymentStatus") != Status.Deleted)
 
     async def get_active_shared_services(self) -> List[SharedService]:
         """
         returns list of "non-deleted" shared services linked to this shared
         """
         query, parameters = SharedServiceRepository.active_shared_services_query()
-        shared_services = await self.query(query=query, parameters=parameters)
+        shared_services = await self.query(query=query, parameters=parameters, **self.workspace_query_options(SHARED_PARTITION))
         return TypeAdapter(List[SharedService]).validate_python(shared_services)
 
     def get_shared_service_spec_params(self):
@@ -77,7 +63,7 @@ class SharedServiceRepository(ResourceRepository):
         shared_service_id = str(uuid.uuid4())
 
         query, parameters = self.active_shared_service_with_template_name_query(shared_service_input.templateName)
-        existing_shared_services = await self.query(query=query, parameters=parameters)
+        existing_shared_services = await self.query(query=query, parameters=parameters, **self.workspace_query_options(SHARED_PARTITION))
 
         # Duplicate is same template (=id), same version and deployed
         if existing_shared_services:
@@ -7,7 +7,6 @@ from models.domain.resource_template import ResourceTemplate
 from models.domain.authentication import User
 
 import resources.strings as strings
-from db.errors import EntityDoesNotExist
 from db.repositories.resource_templates import ResourceTemplateRepository
 from db.repositories.resources import ResourceRepository
 from models.domain.operation import Status
@@ -21,19 +20,9 @@ class UserResourceRepository(ResourceRepository):
     @classmethod
     async def create(cls):
         cls = UserResourceRepository()
-        await super().create()
+        await cls._init_resource_repository()
         return cls
 
-    @staticmethod
-    def user_resources_query(workspace_id: str, service_id: str):
-        query = 'SELECT * FROM c WHERE c.resourceType = @resourceType AND c.parentWorkspaceServiceId = @serviceId AND c.workspaceId = @workspaceId'
-        parameters = [
-            {'name': '@resourceType', 'value': ResourceType.UserResource},
-            {'name': '@serviceId', 'value': service_id},
-            {'name': '@workspaceId', 'value': workspace_id}
-        ]
-        return query, parameters
-
     @staticmethod
     def active_user_resources_query(workspace_id: str, service_id: str):
         query = 'SELECT * FROM c WHERE c.deploymentStatus != @deletedStatus AND c.resourceType = @resourceType AND c.parentWorkspaceServiceId = @serviceId AND c.workspaceId = @workspaceId'
@@ -72,18 +61,17 @@ class UserResourceRepository(ResourceRepository):
         returns a list of "non-deleted" user resources linked to this workspace service
         """
         query, parameters = self.active_user_resources_query(str(workspace_id), str(service_id))
-        user_resources = await self.query(query=query, parameters=parameters)
+        user_resources = await self.query(query=query, parameters=parameters, **self.workspace_query_options(str(workspace_id)))
         return TypeAdapter(List[UserResource]).validate_python(user_resources)
 
     async def get_user_resource_by_id(self, workspace_id: str, service_id: str, resource_id: str) -> UserResource:
-        query, parameters = self.user_resources_query(str(workspace_id), str(service_id))
-        query += ' AND c.id = @resourceId AND c.deploymentStatus != @deletedStatus'
-        parameters.append({'name': '@resourceId', 'value': str(resource_id)})
-        parameters.append({'name': '@deletedStatus', 'value': Status.Deleted})
-        user_resources = await self.query(query=query, parameters=parameters)
-        if not user_resources:
-            raise EntityDoesNotExist
-        return TypeAdapter(UserResource).validate_python(user_resources[0])
+        def is_active_user_resource_of_service(item: dict) -> bool:
+            return (item.get("resourceType") == ResourceType.UserResource
+                    and item.get("workspaceId") == str(workspace_id)
+                    and item.get("parentWorkspaceServiceId") == str(service_id)
+                    and item.get("deploymentStatus") != Status.Deleted)
+
+        return await self.read_item(str(resource_id), UserResource, partition_key=self.partition_key(str(resource_id), str(workspace_id)), item_filter=is_active_user_resource_of_service)
 
     def get_user_resource_spec_params(self):
         return self.get_resource_base_spec_params()
@@ -14,7 +14,7 @@ from db.repositories.operations import OperationRepository
 from models.domain.workspace_service import WorkspaceService
 from models.schemas.resource import ResourcePatch
 from models.schemas.workspace_service import WorkspaceServiceInCreate
-from db.errors import ResourceIsNotDeployed, EntityDoesNotExist
+from db.errors import ResourceIsNotDeployed
 from models.domain.resource import ResourceType
 
 
@@ -22,18 +22,9 @@ class WorkspaceServiceRepository(ResourceRepository):
     @classmethod
     async def create(cls):
         cls = WorkspaceServiceRepository()
-        await super().create()
+        await cls._init_resource_repository()
         return cls
 
-    @staticmethod
-    def workspace_services_query(workspace_id: str):
-        query = 'SELECT * FROM c WHERE c.resourceType = @resourceType AND c.workspaceId = @workspaceId'
-        parameters = [
-            {'name': '@resourceType', 'value': ResourceType.WorkspaceService},
-            {'name': '@workspaceId', 'value': workspace_id}
-        ]
-        return query, parameters
-
     @staticmethod
     def active_workspace_services_query(workspace_id: str):
         query = 'SELECT * FROM c WHERE c.deploymentStatus != @deletedStatus AND c.resourceType = @resourceType AND c.workspaceId = @workspaceId'
@@ -49,26 +40,24 @@ class WorkspaceServiceRepository(ResourceRepository):
         returns list of "non-deleted" workspace services linked to this workspace
         """
         query, parameters = WorkspaceServiceRepository.active_workspace_services_query(str(workspace_id))
-        workspace_services = await self.query(query=query, parameters=parameters)
+        workspace_services = await self.query(query=query, parameters=parameters, **self.workspace_query_options(str(workspace_id)))
         return TypeAdapter(List[WorkspaceService]).validate_python(workspace_services)
 
     async def get_deployed_workspace_service_by_id(self, workspace_id: str, service_id: str, operations_repo: OperationRepository) -> WorkspaceService:
         workspace_service = await self.get_workspace_service_by_id(workspace_id, service_id)
 
-        if (not await operations_repo.resource_has_deployed_operation(resource_id=service_id)):
+        if not workspace_service.isDeployed and not await operations_repo.resource_has_deployed_operation(resource_id=service_id, workspace_id=str(workspace_id)):
             raise ResourceIsNotDeployed
 
         return workspace_service
 
     async def get_workspace_service_by_id(self, workspace_id: str, service_id: str) -> WorkspaceService:
-        query, parameters = self.workspace_services_query(str(workspace_id))
-        query += ' AND c.id = @serviceId AND c.deploymentStatus != @deletedStatus'
-        parameters.append({'name': '@serviceId', 'value': str(service_id)})
-        parameters.append({'name': '@deletedStatus', 'value': Status.Deleted})
-        workspace_services = await self.query(query=query, parameters=parameters)
-        if not workspace_services:
-            raise EntityDoesNotExist
-        return TypeAdapter(WorkspaceService).validate_python(workspace_services[0])
+        def is_active_service_of_workspace(item: dict) -> bool:
+            return (item.get("resourceType") == ResourceType.WorkspaceService
+                    and item.get("workspaceId") == str(workspace_id)
+                    and item.get("deploymentStatus") != Status.Deleted)
+
+        return await self.read_item(str(service_id), WorkspaceService, partition_key=self.partition_key(str(service_id), str(workspace_id)), item_filter=is_active_service_of_workspace)
 
     def get_workspace_service_spec_params(self):
         return self.get_resource_base_spec_params()
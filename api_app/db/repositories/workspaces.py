@@ -1,9 +1,10 @@
 import uuid
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import asyncio
 from azure.mgmt.storage.aio import StorageManagementClient
 
 from pydantic import TypeAdapter
+from db.repositories.address_spaces import AddressSpaceRepository
 from db.repositories.resources_history import ResourceHistoryRepository
 from models.domain.resource_template import ResourceTemplate
 from models.domain.authentication import User
@@ -11,16 +12,16 @@ from models.domain.authentication import User
 import resources.strings as strings
 from core import config, credentials
 from azure.core.exceptions import HttpResponseError
-from db.errors import EntityDoesNotExist, InvalidInput, ResourceIsNotDeployed, StorageAccountNameGenerationTimeout, StorageAccountNameCheckFailed
+from db.errors import InvalidInput, ResourceIsNotDeployed, StorageAccountNameGenerationTimeout, StorageAccountNameCheckFailed
 from db.repositories.resource_templates import ResourceTemplateRepository
 from db.repositories.resources import ResourceRepository
+from db.repositories.registry import repository_registry
 from models.domain.operation import Status
 from db.repositories.operations import OperationRepository
 from models.domain.resource import ResourceType
-from models.domain.workspace import Workspace
+from models.domain.workspace import Workspace, WorkspaceAddressSpaces, WorkspaceAirlockManagerRole
 from models.schemas.resource import ResourcePatch
 from models.schemas.workspace import WorkspaceInCreate
-from services.cidr_service import generate_new_cidr, is_network_available
 from services.logging import logger
 
 
@@ -35,7 +36,8 @@ class WorkspaceRepository(ResourceRepository):
     @classmethod
     async def create(cls):
         cls = WorkspaceRepository()
-        await super().create()
+        await cls._init_resource_repository()
+        cls.address_space_repo = await repository_registry.get(AddressSpaceRepository)
         return cls
 
     @staticmethod
@@ -55,33 +57,59 @@ class WorkspaceRepository(ResourceRepository):
         ]
         return query, parameters
 
+    @staticmethod
+    def active_workspaces_projection_query_string(fields: List[str]):
+        query, parameters = WorkspaceRepository.active_workspaces_query_string()
+        return query.replace('SELECT *', 'SELECT ' + ', '.join(['c.id'] + [f'c.properties.{f}' for f in fields]), 1), parameters
+
     async def get_workspaces(self) -> List[Workspace]:
+        # every workspace, including the deleted ones that have been moved out of the resources container
         query, parameters = WorkspaceRepository.workspaces_query_string()
-        workspaces = await self.query(query=query, parameters=parameters)
-        return TypeAdapter(List[Workspace]).validate_python(workspaces)
+        workspaces = TypeAdapter(List[Workspace]).validate_python(await self.query(query=query, parameters=parameters))
+        # one that was modified while it was being moved is in both, and the resources container's copy is current
+        workspace_ids = {workspace.id for workspace in workspaces}
+        return workspaces + [workspace for workspace in await self.deleted_repo.get_workspaces() if workspace.id not in workspace_ids]
 
     async def get_active_workspaces(self) -> List[Workspace]:
         query, parameters = WorkspaceRepository.active_workspaces_query_string()
         workspaces = await self.query(query=query, parameters=parameters)
         return TypeAdapter(List[Workspace]).validate_python(workspaces)
 
+    async def get_active_workspaces_page(self, page_size: Optional[int] = None, continuation_token: Optional[str] = None) -> Tuple[List[Workspace], Optional[str]]:
+        query, parameters = WorkspaceRepository.active_workspaces_query_string()
+        workspaces, continuation_token = await self.query_page(query=query, parameters=parameters, page_size=page_size, continuation_token=continuation_token)
+        return TypeAdapter(List[Workspace]).validate_python(workspaces), continuation_token
+
+    async def get_active_workspace_address_spaces(self) -> List[WorkspaceAddressSpaces]:
+        query, parameters = WorkspaceRepository.active_workspaces_projection_query_string(["address_space", "address_spaces"])
+        return [WorkspaceAddressSpaces(id=item["id"], address_space=item.get("address_space"), address_spaces=item.get("address_spaces") or [])
+                for item in await self.query(query=query, parameters=parameters)]
+
+    async def get_active_workspace_airlock_manager_roles(self) -> List[WorkspaceAirlockManagerRole]:
+        query, parameters = WorkspaceRepository.active_workspaces_projection_query_string(["app_role_id_workspace_airlock_manager"])
+        return [WorkspaceAirlockManagerRole(id=item["id"], app_role_id_workspace_airlock_manager=item.get("app_role_id_workspace_airlock_manager"))
+                for item in await self.query(query=query, parameters=parameters)]
+
+    async def get_active_workspace_subscription_ids(self) -> List[str]:
+        query, parameters = WorkspaceRepository.active_workspaces_projection_query_string(["workspace_subscription_id"])
+        subscription_ids = []
+        for item in await self.query(query=query, parameters=parameters):
+            subscription_id = item.get("workspace_subscription_id")
+            if subscription_id and subscription_id not in subscription_ids:
+                subscription_ids.append(subscription_id)
+        return subscription_ids
+
     async def get_deployed_workspace_by_id(self, workspace_id: str, operations_repo: OperationRepository) -> Workspace:
         workspace = await self.get_workspace_by_id(workspace_id)
 
-        if (not await operations_repo.resource_has_deployed_operation(resource_id=workspace_id)):
+        # workspaces deployed before isDeployed was recorded, and not yet migrated, only have their operations to go on
+        if not workspace.isDeployed and not await operations_repo.resource_has_deployed_operation(resource_id=workspace_id, workspace_id=str(workspace_id)):
             raise ResourceIsNotDeployed
 
         return workspace
 
     async def get_workspace_by_id(self, workspace_id: str) -> Workspace:
-        query, parameters = self.workspaces_query_string()
-        query += ' AND c.id = @workspaceId AND c.deploymentStatus != @deletedStatus'
-        parameters.append({'name': '@workspaceId', 'value': str(workspace_id)})
-        parameters.append({'name': '@deletedStatus', 'value': Status.Deleted})
-        workspaces = await self.query(query=query, parameters=parameters)
-        if not workspaces:
-            raise EntityDoesNotExist
-        return TypeAdapter(Workspace).validate_python(workspaces[0])
+        return await self.read_item(str(workspace_id), Workspace, partition_key=self.partition_key(str(workspace_id), str(workspace_id)), item_filter=lambda item: item.get("resourceType") == ResourceType.Workspace and item.get("deploymentStatus") != Status.Deleted)
 
     # Remove this method once not using last 4 digits for naming - https://github.com/microsoft/AzureTRE/issues/3666
     async def is_workspace_storage_account_available(self, credential, workspace_id: str) -> bool:
@@ -121,7 +149,7 @@ class WorkspaceRepository(ResourceRepository):
         template = await self.validate_input_against_template(workspace_input.templateName, workspace_input, ResourceType.Workspace, user_roles)
 
         # allow for workspace template taking a single address_space or multiple address_spaces
-        intial_address_space = await self.get_address_space_based_on_size(workspace_input.properties)
+        intial_address_space = await self.get_address_space_based_on_size(workspace_input.properties, full_workspace_id)
         address_space_param = {"address_space": intial_address_space}
         address_spaces_param = {"address_spaces": [intial_address_space]}
 
@@ -158,42 +186,42 @@ class WorkspaceRepository(ResourceRepository):
     def automatically_create_application_registration(self, workspace_properties: dict) -> bool:
         return True if ("auth_type" in workspace_properties and workspace_properties["auth_type"] == "Automatic") else False
 
-    async def get_address_space_based_on_size(self, workspace_properties: dict):
+    async def get_address_space_based_on_size(self, workspace_properties: dict, workspace_id: str):
         # Default the address space to 'small' if not supplied.
         address_space_size = workspace_properties.get("address_space_size", "small").lower()
 
         # 773 allow custom sized networks to be requested
         if (address_space_size == "custom"):
-            if (await self.validate_address_space(workspace_properties.get("address_space"))):
+            if (await self.validate_address_space(workspace_properties.get("address_space"), workspace_id)):
                 return workspace_properties.get("address_space")
             else:
                 raise InvalidInput("The custom 'address_space' you requested does not fit in the current network.")
 
         # Default mask is 24 (small)
         cidr_netmask = WorkspaceRepository.predefined_address_spaces.get(address_space_size, 24)
-        return await self.get_new_address_space(cidr_netmask)
+        return await self.get_new_address_space(workspace_id, cidr_netmask)
 
-    # 772 check that the provided address_space is available in the network.
-    async def validate_address_space(self, address_space):
+    # 772 check that the provided address_space is available in the network, and reserve it if so.
+    async def validate_address_space(self, address_space, workspace_id: str):
         if (address_space is None):
             raise InvalidInput("Missing 'address_space' from properties.")
 
-        allocated_networks = [x.properties["address_space"] for x in await self.get_active_workspaces()]
-        return is_network_available(allocated_networks, address_space)
+        return await self.address_space_repo.reserve_address_space(workspace_id, address_space, self.get_active_workspace_address_spaces)
 
-    async def get_new_address_space(self, cidr_netmask: int = 24):
-        workspaces = await self.get_active_workspaces()
-        networks = [[x.properties.get("address_space")] for x in workspaces]
-        networks = networks + [x.properties.get("address_spaces", []) for x in workspaces]
-        networks = [i for s in networks for i in s if i is not None]
+    async def get_new_address_space(self, workspace_id: str, cidr_netmask: int = 24):
+        return await self.address_space_repo.allocate_address_space(workspace_id, cidr_netmask, self.get_active_workspace_address_spaces)
 
-        new_address_space = generate_new_cidr(networks, cidr_netmask)
-        return new_address_space
+    async def release_address_spaces(self, workspace_id: str):
+        await self.address_space_repo.release_address_spaces(workspace_id, self.get_active_workspace_address_spaces)
 
     async def patch_workspace(self, workspace: Workspace, workspace_patch: ResourcePatch, etag: str, resource_template_repo: ResourceTemplateRepository, resource_history_repo: ResourceHistoryRepository, user: User, force_version_update: bool) -> Tuple[Workspace, ResourceTemplate]:
         # get the workspace template
         workspace_template = await resource_template_repo.get_template_by_name_and_version(workspace.templateName, workspace.templateVersion, ResourceType.Workspace)
-        return await self.patch_resource(workspace, workspace_patch, workspace_template, etag, resource_template_repo, resource_history_repo, user, strings.RESOURCE_ACTION_UPDATE, force_version_update)
+        patched_workspace, template = await self.patch_resource(workspace, workspace_patch, workspace_template, etag, resource_template_repo, resource_history_repo, user, strings.RESOURCE_ACTION_UPDATE, force_version_update)
+        # address spaces set by the patch rather than allocated through this repository still need recording
+        if workspace_patch.properties and workspace_patch.properties.get("address_spaces"):
+            await self.address_space_repo.claim_address_spaces(workspace.id, workspace_patch.properties["address_spaces"], self.get_active_workspace_address_spaces)
+        return patched_workspace, template
 
     def get_workspace_spec_params(self, full_workspace_id: str):
         params = self.get_resource_base_spec_params()
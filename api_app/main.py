@@ -1,4 +1,5 @@
 import asyncio
+import time
 import uvicorn
 
 from fastapi import FastAPI
@@ -17,17 +18,56 @@ from api.errors.validation_error import http422_error_handler
 from api.errors.generic_error import generic_error_handler
 from core import config
 from db.events import bootstrap_database
+from db.repositories.address_spaces import AddressSpaceRepository
+from db.repositories.airlock_request_history import AirlockRequestHistoryRepository
+from db.repositories.airlock_review_inbox import AirlockReviewInboxRepository
+from db.repositories.airlock_requests import AirlockRequestRepository
+from db.repositories.migrations import MigrationRepository
+from db.repositories.operations import OperationRepository
+from db.repositories.operations_archive import OperationArchiveRepository
+from db.repositories.registry import repository_registry
+from db.repositories.resource_hierarchy import ResourceHierarchyRepository
+from db.repositories.resource_templates import ResourceTemplateRepository
+from db.repositories.resources import ResourceRepository
+from db.repositories.resources_deleted import DeletedResourceRepository
+from db.repositories.resources_history import ResourceHistoryRepository
+from db.repositories.shared_services import SharedServiceRepository
+from db.repositories.user_resources import UserResourceRepository
+from db.repositories.workspace_services import WorkspaceServiceRepository
+from db.repositories.workspaces import WorkspaceRepository
+from services.airlock_review_inbox_reconciler import AirlockReviewInboxReconciler
 from services.logging import initialize_logging, logger
+from services.operation_archiver import OperationArchiver
 from service_bus.deployment_status_updater import DeploymentStatusUpdater
 from service_bus.airlock_request_status_update import AirlockStatusUpdater
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    started = time.monotonic()
     while not await bootstrap_database():
         await asyncio.sleep(5)
         logger.warning("Database connection could not be established")
 
+    await repository_registry.initialize([
+        AddressSpaceRepository,
+        AirlockRequestHistoryRepository,
+        AirlockReviewInboxRepository,
+        AirlockRequestRepository,
+        DeletedResourceRepository,
+        MigrationRepository,
+        OperationArchiveRepository,
+        OperationRepository,
+        ResourceHierarchyRepository,
+        ResourceTemplateRepository,
+        ResourceRepository,
+        ResourceHistoryRepository,
+        SharedServiceRepository,
+        UserResourceRepository,
+        WorkspaceServiceRepository,
+        WorkspaceRepository
+    ])
+
     deploymentStatusUpdater = DeploymentStatusUpdater()
     await deploymentStatusUpdater.init_repos()
 
@@ -36,6 +76,17 @@ async def lifespan(app: FastAPI):
 
     asyncio.create_task(deploymentStatusUpdater.receive_messages())
     asyncio.create_task(airlockStatusUpdater.receive_messages())
+
+    if config.OPERATIONS_RETENTION_DAYS > 0:
+        operationArchiver = OperationArchiver()
+        await operationArchiver.init_repos()
+        asyncio.create_task(operationArchiver.archive_periodically())
+
+    if config.AIRLOCK_REVIEW_INBOX_RECONCILE_INTERVAL > 0:
+        airlockReviewInboxReconciler = AirlockReviewInboxReconciler()
+        await airlockReviewInboxReconciler.init_repos()
+        asyncio.create_task(airlockReviewInboxReconciler.reconcile_periodically())
+    logger.info(f"API started in {time.monotonic() - started:.3f}s")
     yield
 
 
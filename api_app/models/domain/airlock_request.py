@@ -71,6 +71,8 @@ class AirlockRequestHistoryItem(AzureTREModel):
     """
     Resource History Item - to preserve history of resource properties
     """
+    id: Optional[str] = Field(None, title="Id", description="Set once the item is stored in the request history container")
+    airlockRequestId: Optional[str] = Field(None, title="Airlock request ID")
     resourceVersion: int
     updatedWhen: float
     updatedBy: dict = Field(default_factory=dict)
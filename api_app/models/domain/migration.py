@@ -0,0 +1,24 @@
+from enum import StrEnum
+from typing import Optional
+
+from models.domain.azuretremodel import AzureTREModel
+
+
+class MigrationStatus(StrEnum):
+    InProgress = "in_progress"
+    Completed = "completed"
+
+
+class MigrationCheckpoint(AzureTREModel):
+    """
+    Progress of a bulk migration, saved after every page it processes
+    """
+    id: str
+    status: MigrationStatus = MigrationStatus.InProgress
+    continuationToken: Optional[str] = None
+    documentsRead: int = 0
+    documentsWritten: int = 0
+    requestCharge: float = 0.0
+    elapsedSeconds: float = 0.0
+    startedWhen: float = 0
+    updatedWhen: float = 0
@@ -55,11 +55,15 @@ class Resource(AzureTREModel):
     isEnabled: bool = True  # Must be set before a resource can be deleted
     resourceType: ResourceType
     deploymentStatus: Optional[str] = Field(None, title="Deployment Status", description="Overall deployment status of the resource")
+    isDeployed: bool = Field(False, title="Is deployed", description="Whether the resource has been deployed")
+    firstDeployedAt: Optional[float] = Field(None, title="First deployed at", description="When the resource was first deployed")
     etag: str = Field(title="_etag", description="eTag of the document", alias="_etag")
     resourcePath: str = ""
     resourceVersion: int = 0
     user: dict = Field(default_factory=dict)
     updatedWhen: float = 0.0
+    historySnapshotId: Optional[str] = Field(None, title="History snapshot id", description="The history item the chain of the resource's next history item starts at")
+    historyChainLength: int = Field(0, title="History chain length", description="How many history items are in that chain")
 
     @field_validator("properties", mode="before")
     @classmethod
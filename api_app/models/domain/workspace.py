@@ -1,4 +1,6 @@
+from dataclasses import dataclass, field
 from enum import Enum
+from typing import List, Optional
 from pydantic import Field
 from models.domain.azuretremodel import AzureTREModel
 from models.domain.resource import Resource, ResourceType
@@ -21,3 +23,19 @@ class Workspace(Resource):
 
 class WorkspaceAuth(AzureTREModel):
     scopeId: str = Field("", title="Scope ID", description="The Workspace App Scope Id to use for auth")
+
+
+# Lightweight records for projection queries over all workspaces, which only need a couple of properties and
+# so skip validating the full Workspace model
+
+@dataclass(frozen=True)
+class WorkspaceAddressSpaces:
+    id: str
+    address_space: Optional[str] = None
+    address_spaces: List[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class WorkspaceAirlockManagerRole:
+    id: str
+    app_role_id_workspace_airlock_manager: Optional[str] = None
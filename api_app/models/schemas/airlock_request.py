@@ -1,10 +1,10 @@
 import uuid
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Optional
 from pydantic import ConfigDict, BaseModel, Field
 from models.domain.operation import Operation
 from models.schemas.operation import get_sample_operation
-from models.domain.airlock_request import AirlockActions, AirlockRequest, AirlockRequestType
+from models.domain.airlock_request import AirlockActions, AirlockRequest, AirlockRequestHistoryItem, AirlockRequestType
 
 
 def get_sample_airlock_review(airlock_review_id: str) -> dict:
@@ -72,6 +72,7 @@ class AirlockRequestWithAllowedUserActions(BaseModel):
 
 class AirlockRequestWithAllowedUserActionsInList(BaseModel):
     airlockRequests: List[AirlockRequestWithAllowedUserActions] = Field(default_factory=list, title="Airlock Requests")
+    continuationToken: Optional[str] = Field(None, title="Continuation token for the next page, if any")
     model_config = ConfigDict(json_schema_extra={
         "example": {
             "airlockRequests": [
@@ -82,6 +83,25 @@ class AirlockRequestWithAllowedUserActionsInList(BaseModel):
     })
 
 
+class AirlockRequestHistoryInList(BaseModel):
+    history: List[AirlockRequestHistoryItem] = Field(default_factory=list, title="Airlock request history")
+    continuationToken: Optional[str] = Field(None, title="Continuation token for the next page, if any")
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "history": [
+                {
+                    "id": "933ad738-7265-4b5f-9eae-a1a62928772e-0",
+                    "airlockRequestId": "933ad738-7265-4b5f-9eae-a1a62928772e",
+                    "resourceVersion": 0,
+                    "updatedWhen": 1725000000.0,
+                    "updatedBy": {},
+                    "properties": {"previousStatus": "draft"}
+                }
+            ]
+        }
+    })
+
+
 class AirlockRequestInCreate(BaseModel):
     type: AirlockRequestType = Field(title="Airlock request type", description="Specifies if this is an import or an export request")
     title: str = Field("Airlock Request", title="Brief title for the request")
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic import ConfigDict, BaseModel, Field
 from models.domain.operation import Operation
 
@@ -41,6 +41,7 @@ class OperationInResponse(BaseModel):
 
 class OperationInList(BaseModel):
     operations: List[Operation] = Field(default_factory=list, title="Operations")
+    continuationToken: Optional[str] = Field(None, title="Continuation token for the next page, if any")
     model_config = ConfigDict(json_schema_extra={
         "example": {
             "operations": [
@@ -39,6 +39,7 @@ def get_sample_resource_history(resource_id: str) -> dict:
 
 class ResourceHistoryInList(BaseModel):
     resource_history: List[ResourceHistoryItem] = Field(default_factory=list, title="Resource history")
+    continuationToken: Optional[str] = Field(None, title="Continuation token for the next page, if any")
     model_config = ConfigDict(json_schema_extra={
         "example": {
             "resource_history": [
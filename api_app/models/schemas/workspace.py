@@ -1,5 +1,5 @@
 from enum import StrEnum
-from typing import List
+from typing import List, Optional
 
 from pydantic import ConfigDict, BaseModel, Field
 
@@ -57,6 +57,7 @@ class WorkspaceAuthInResponse(BaseModel):
 
 class WorkspacesInList(BaseModel):
     workspaces: List[Workspace]
+    continuationToken: Optional[str] = Field(None, title="Continuation token for the next page, if any")
     model_config = ConfigDict(json_schema_extra={
         "example": {
             "workspaces": [
@@ -42,6 +42,7 @@ API_LIST_REQUESTS = "Get requests"
 
 API_CREATE_AIRLOCK_REQUEST = "Create an airlock request"
 API_GET_AIRLOCK_REQUEST = "Get an airlock request"
+API_GET_AIRLOCK_REQUEST_HISTORY = "Get the history of an airlock request"
 API_LIST_AIRLOCK_REQUESTS = "Get all airlock requests for a workspace"
 API_SUBMIT_AIRLOCK_REQUEST = "Submit an airlock request"
 API_CANCEL_AIRLOCK_REQUEST = "Cancel an airlock request"
@@ -106,6 +107,15 @@ RESOURCE_PROCESSOR = "Resource Processor"
 RESOURCE_PROCESSOR_GENERAL_ERROR_MESSAGE = "Resource Processor is not responding"
 RESOURCE_PROCESSOR_HEALTHY_MESSAGE = "HealthState/healthy"
 
+# Pagination
+PAGE_SIZE_DESCRIPTION = "Maximum number of items to return. Omit this and continuationToken to return all items."
+CONTINUATION_TOKEN_DESCRIPTION = "Continuation token from the previous page's response."
+INCLUDE_ARCHIVED_DESCRIPTION = "Include operations that finished long enough ago to have been archived."
+HISTORY_FROM_DESCRIPTION = "Only return history items updated at or after this time (seconds since the epoch)."
+HISTORY_TO_DESCRIPTION = "Only return history items updated at or before this time (seconds since the epoch)."
+HISTORY_ORDER_ASCENDING_DESCRIPTION = "Return the history items oldest first (the default), or newest first."
+HISTORY_FIELDS_DESCRIPTION = "Comma separated fields of the history items to return, e.g. resourceVersion,updatedWhen,user. Leave out properties to return the items without reading their properties."
+
 # Error strings
 ACCESS_APP_IS_MISSING_ROLE = "The App is missing role"
 ACCESS_PLEASE_SUPPLY_CLIENT_ID = "Please supply the client_id for the AAD application"
@@ -129,6 +139,8 @@ INVALID_TOKEN = "Invalid token"
 
 UNABLE_TO_REPLACE_CURRENT_TEMPLATE = "Unable to replace the existing 'current' template with this name"
 UNABLE_TO_PROCESS_REQUEST = "Unable to process request"
+INVALID_CONTINUATION_TOKEN = "The continuation token is invalid or has expired"
+INVALID_RESOURCE_HISTORY_FIELDS = "Unknown resource history fields: {}"
 
 USER_RESOURCE_DOES_NOT_EXIST = "User Resource does not exist"
 USER_RESOURCES_NEED_TO_BE_DELETED_BEFORE_WORKSPACE = "All user resources need to be deleted before you can delete the workspace service"
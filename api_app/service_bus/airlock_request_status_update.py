@@ -7,12 +7,13 @@ from azure.servicebus.exceptions import OperationTimeoutError, ServiceBusConnect
 from fastapi import HTTPException
 from pydantic import ValidationError, TypeAdapter
 
-from api.dependencies.airlock import get_airlock_request_by_id_from_path
+from api.dependencies.airlock import get_airlock_request_by_id
 from services.airlock import update_and_publish_event_airlock_request
 from services.logging import logger, tracer
 from db.repositories.workspaces import WorkspaceRepository
 from models.domain.airlock_request import AirlockRequestStatus
 from db.repositories.airlock_requests import AirlockRequestRepository
+from db.repositories.registry import repository_registry
 from models.domain.airlock_operations import StepResultStatusUpdateMessage
 from core import config, credentials
 from resources import strings
@@ -24,8 +25,8 @@ class AirlockStatusUpdater():
         pass
 
     async def init_repos(self):
-        self.airlock_request_repo = await AirlockRequestRepository.create()
-        self.workspace_repo = await WorkspaceRepository.create()
+        self.airlock_request_repo = await repository_registry.get(AirlockRequestRepository)
+        self.workspace_repo = await repository_registry.get(WorkspaceRepository)
 
     async def receive_messages(self):
         with tracer.start_as_current_span("airlock_receive_messages"):
@@ -108,7 +109,7 @@ class AirlockStatusUpdater():
             status_message = step_result_data.status_message
             request_files = step_result_data.request_files
             # Find the airlock request by id
-            airlock_request = await get_airlock_request_by_id_from_path(airlock_request_id=airlock_request_id, airlock_request_repo=self.airlock_request_repo)
+            airlock_request = await get_airlock_request_by_id(airlock_request_id, self.airlock_request_repo)
             # Validate that the airlock request status is the same as current status
             if airlock_request.status == current_status:
                 workspace = await self.workspace_repo.get_workspace_by_id(airlock_request.workspaceId)
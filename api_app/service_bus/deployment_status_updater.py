@@ -2,11 +2,12 @@ import asyncio
 import json
 import uuid
 import time
+from typing import Optional, Tuple
 
 from pydantic import ValidationError, TypeAdapter
 
 from api.routes.resource_helpers import get_timestamp
-from models.domain.resource import Output
+from models.domain.resource import Output, Resource, ResourceType
 from db.repositories.resources_history import ResourceHistoryRepository
 from models.domain.request_action import RequestAction
 from db.repositories.resource_templates import ResourceTemplateRepository
@@ -17,7 +18,11 @@ from azure.servicebus.aio import ServiceBusClient, AutoLockRenewer
 from db.repositories.operations import OperationRepository
 from core import config, credentials
 from db.errors import EntityDoesNotExist
+from db.instrumentation import record_deployment_status_update
+from db.partitioning import workspace_partition_of_path
 from db.repositories.resources import ResourceRepository
+from db.repositories.registry import repository_registry
+from db.repositories.workspaces import WorkspaceRepository
 from models.domain.operation import DeploymentStatusUpdateMessage, Operation, OperationStep, Status
 from resources import strings
 from services.logging import logger, tracer
@@ -28,10 +33,11 @@ class DeploymentStatusUpdater():
         pass
 
     async def init_repos(self):
-        self.operations_repo = await OperationRepository.create()
-        self.resource_repo = await ResourceRepository.create()
-        self.resource_template_repo = await ResourceTemplateRepository.create()
-        self.resource_history_repo = await ResourceHistoryRepository.create()
+        self.operations_repo = await repository_registry.get(OperationRepository)
+        self.resource_repo = await repository_registry.get(ResourceRepository)
+        self.resource_template_repo = await repository_registry.get(ResourceTemplateRepository)
+        self.resource_history_repo = await repository_registry.get(ResourceHistoryRepository)
+        self.workspace_repo = await repository_registry.get(WorkspaceRepository)
 
     def run(self, *args, **kwargs):
         asyncio.run(self.receive_messages())
@@ -113,49 +119,67 @@ class DeploymentStatusUpdater():
         result = False
 
         try:
-            # update the op
-            operation = await self.operations_repo.get_operation_by_id(str(message.operationId))
-            step_to_update = None
-            is_last_step = False
-
-            current_step_index = 0
-            for i, step in enumerate(operation.steps):
-                # TODO more simple condition
-                if step.id == message.stepId and step.resourceId == str(message.id):
-                    step_to_update = step
-                    current_step_index = i
-                    if i == (len(operation.steps) - 1):
-                        is_last_step = True
-
-            if step_to_update is None:
-                raise f"Error finding step {message.stepId} in operation {message.operationId}"
-
-            # update the step status
-            step_to_update.status = message.status
-            step_to_update.message = message.message
-            step_to_update.updatedWhen = get_timestamp()
-
-            # update the overall headline operation status
-            await self.update_overall_operation_status(operation, step_to_update, is_last_step)
-
-            # save the operation
-            await self.operations_repo.update_item(operation)
+            started = time.perf_counter()
+
+            # update the op, with a partial update of the step and overall status that is retried if the operation
+            # was modified in the meantime
+            async def update_operation(current: Tuple[Operation, str]) -> Tuple[Operation, int, bool, str, Optional[Resource]]:
+                operation, etag = current
+                step_index = next((i for i, step in enumerate(operation.steps) if step.id == message.stepId and step.resourceId == str(message.id)), None)
+                if step_index is None:
+                    raise Exception(f"Error finding step {message.stepId} in operation {message.operationId}")
+                step_to_update = operation.steps[step_index]
+                is_last_step = step_index == len(operation.steps) - 1
+
+                # update the step status
+                step_to_update.status = message.status
+                step_to_update.message = message.message
+                step_to_update.updatedWhen = get_timestamp()
+
+                # update the overall headline operation status
+                await self.update_overall_operation_status(operation, step_to_update, is_last_step)
+
+                if self.operations_repo.colocated_with_resources and step_to_update.resourceId == operation.resourceId:
+                    # the operation is kept in its resource's partition, so the step's status (and outputs) are copied
+                    # to the resource in the same transactional batch as the operation is updated
+                    resource_patch = ResourceRepository.deployment_status_patch(step_to_update.status)
+                    if step_to_update.is_success():
+                        resource_patch += ResourceRepository.outputs_patch(self.convert_outputs_to_dict(message.outputs))
+                    etag, resource = await self.operations_repo.update_operation_step_and_resource_status(operation, step_index, etag, resource_patch)
+                    return operation, step_index, is_last_step, etag, ResourceRepository.to_resource(resource)
+
+                etag = await self.operations_repo.update_operation_step_status(operation, step_index, etag)
+                return operation, step_index, is_last_step, etag, None
+
+            operation, current_step_index, is_last_step, operation_etag, resource = await self.operations_repo.update_with_retries(
+                operation="deployment status update",
+                update=update_operation,
+                read=lambda: self.operations_repo.get_operation_and_etag_by_id(str(message.operationId), resource_id=str(message.id)))
+            step_to_update = operation.steps[current_step_index]
+            transactional_batch = resource is not None
 
             # copy the step status to the resource item, for convenience
             resource_id = uuid.UUID(step_to_update.resourceId)
+            resource_partition = self.get_resource_workspace_partition(operation, step_to_update.resourceId)
 
-            resource = await self.resource_repo.get_resource_by_id(resource_id)
-            resource.deploymentStatus = step_to_update.status
-            await self.resource_repo.update_item(resource)
+            if not transactional_batch:
+                resource = await self.resource_repo.update_deployment_status(resource_id, step_to_update.status, resource_partition)
+
+            if resource.deploymentStatus == Status.Deleted:
+                await self.resource_repo.hierarchy_repo.remove_resource(resource)
+                # a deleted workspace's address spaces can be allocated again
+                if resource.resourceType == ResourceType.Workspace:
+                    await self.workspace_repo.release_address_spaces(resource.id)
 
             # if the step failed, or this queue message is an intermediary ("now deploying..."), return here.
             if not step_to_update.is_success():
+                record_deployment_status_update((time.perf_counter() - started) * 1000, transactional_batch)
                 return True
 
-            # update the resource doc to persist any outputs
-            resource = await self.resource_repo.get_resource_dict_by_id(resource_id)
-            resource_to_persist = self.create_updated_resource_document(resource, message)
-            await self.resource_repo.update_item_dict(resource_to_persist)
+            # persist any outputs into the resource's properties
+            if not transactional_batch:
+                await self.resource_repo.update_outputs(resource_id, self.convert_outputs_to_dict(message.outputs), resource_partition)
+            record_deployment_status_update((time.perf_counter() - started) * 1000, transactional_batch)
 
             # more steps in the op to do?
             if is_last_step is False:
@@ -165,7 +189,7 @@ class DeploymentStatusUpdater():
                 # catch any errors in updating the resource - maybe Cosmos / schema invalid etc, and report them back to the op
                 try:
                     # parent resource is always retrieved via cosmos, hence it is always with redacted sensitive values
-                    parent_resource = await self.resource_repo.get_resource_by_id(next_step.sourceTemplateResourceId)
+                    parent_resource = await self.resource_repo.get_resource_by_id(next_step.sourceTemplateResourceId, include_deleted=True)
                     resource_to_send = await update_resource_for_step(
                         operation_step=next_step,
                         resource_repo=self.resource_repo,
@@ -183,10 +207,12 @@ class DeploymentStatusUpdater():
                     await send_deployment_message(content=content, correlation_id=operation.id, session_id=resource_to_send.id, action=next_step.resourceAction)
                 except Exception as e:
                     logger.exception("Unable to send update for resource in pipeline step")
-                    next_step.message = repr(e)
-                    next_step.status = Status.UpdatingFailed
-                    await self.update_overall_operation_status(operation, next_step, is_last_step)
-                    await self.operations_repo.update_item(operation)
+                    await self.fail_step(operation, operation_etag, current_step_index + 1, repr(e))
+            elif operation.status == Status.Deleted:
+                # the uninstall has completed, so no later step reads the resource
+                await self.move_deleted_resource(operation.resourceId, workspace_partition_of_path(operation.resourcePath))
+            elif self.deploys_resource(operation):
+                await self.mark_resource_deployed(operation, resource)
 
             result = True
 
@@ -199,6 +225,48 @@ class DeploymentStatusUpdater():
 
         return result
 
+    async def fail_step(self, operation: Operation, etag: str, step_index: int, error_message: str):
+        """
+        Marks the step at step_index, and so the operation, as failed. The operation can have been modified since it
+        was read with etag, while the step was being prepared, in which case it's read again and marked failed anew.
+        """
+        async def mark_step_failed(current: Tuple[Operation, str]) -> str:
+            operation, etag = current
+            step = operation.steps[step_index]
+            step.message = error_message
+            step.status = Status.UpdatingFailed
+            await self.update_overall_operation_status(operation, step, is_last_step=False)
+            return await self.operations_repo.update_operation_step_status(operation, step_index, etag)
+
+        await self.operations_repo.update_with_retries(
+            operation="pipeline step failure",
+            update=mark_step_failed,
+            read=lambda: self.operations_repo.get_operation_and_etag_by_id(operation.id, resource_id=operation.resourceId),
+            item=(operation, etag))
+
+    async def move_deleted_resource(self, resource_id: str, workspace_partition: str):
+        try:
+            resource = await self.resource_repo.get_resource_dict_by_id(resource_id, workspace_partition=workspace_partition)
+            await self.resource_repo.move_to_deleted(resource)
+        except Exception:
+            # it stays in the resources container, where it's still filtered out of the active resources, until
+            # POST /migrations moves it
+            logger.exception(f"Unable to move deleted resource {resource_id} to the deleted resources container")
+
+    @staticmethod
+    def deploys_resource(operation: Operation) -> bool:
+        # the operations OperationRepository.resource_has_deployed_operation looks for
+        return (operation.action == RequestAction.Install and operation.status == Status.Deployed) or (operation.action == RequestAction.Upgrade and operation.status == Status.Updated)
+
+    async def mark_resource_deployed(self, operation: Operation, step_resource: Resource):
+        try:
+            workspace_partition = workspace_partition_of_path(operation.resourcePath)
+            resource = step_resource if step_resource.id == operation.resourceId else await self.resource_repo.get_resource_by_id(operation.resourceId, workspace_partition=workspace_partition)
+            await self.resource_repo.mark_deployed(resource, operation.updatedWhen, workspace_partition)
+        except Exception:
+            # whether it's deployed is then read from its operations, until POST /migrations records it
+            logger.exception(f"Unable to record that resource {operation.resourceId} is deployed")
+
     async def update_overall_operation_status(self, operation: Operation, step: OperationStep, is_last_step: bool):
         operation.updatedWhen = get_timestamp()
 
@@ -223,14 +291,18 @@ class DeploymentStatusUpdater():
                     break
 
             if main_step:
-                primary_resource = await self.resource_repo.get_resource_by_id(uuid.UUID(main_step.resourceId))
-                primary_resource.deploymentStatus = operation.status
-                await self.resource_repo.update_item(primary_resource)
+                await self.resource_repo.update_deployment_status(uuid.UUID(main_step.resourceId), operation.status, self.get_resource_workspace_partition(operation, main_step.resourceId))
 
         if step.is_success() and is_last_step:
             operation.status = self.get_success_status_for_action(operation.action)
             operation.message = "Multi step pipeline completed successfully"
 
+    @staticmethod
+    def get_resource_workspace_partition(operation: Operation, resource_id: str) -> Optional[str]:
+        # the workspace of the operation's own resource is known from its path; the other resources its steps update
+        # (such as shared services) are looked up
+        return workspace_partition_of_path(operation.resourcePath) if resource_id == operation.resourceId else None
+
     def get_success_status_for_action(self, action: RequestAction):
         status = Status.ActionSucceeded
 
@@ -255,19 +327,6 @@ class DeploymentStatusUpdater():
 
         return status
 
-    def create_updated_resource_document(self, resource: dict, message: DeploymentStatusUpdateMessage):
-        """
-        Merge the outputs with the resource document to persist
-        """
-
-        # although outputs are likely to be relevant when resources are moving to "deployed" status,
-        # lets not limit when we update them and have the resource process make that decision.
-        # need to convert porter outputs to dict so boolean values are converted to bools, not strings
-        output_dict = self.convert_outputs_to_dict(message.outputs)
-        resource["properties"].update(output_dict)
-
-        return resource
-
     def convert_outputs_to_dict(self, outputs_list: [Output]):
         """
         Convert a list of Porter outputs to a dictionary
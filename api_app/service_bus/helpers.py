@@ -13,7 +13,6 @@ from models.schemas.resource import ResourcePatch
 from db.repositories.resources import ResourceRepository
 from core import config, credentials
 from services.logging import logger
-from azure.cosmos.exceptions import CosmosAccessConditionFailedError
 
 
 async def _send_message(message: ServiceBusMessage, queue: str):
@@ -45,7 +44,8 @@ async def update_resource_for_step(operation_step: OperationStep, resource_repo:
     # step_resource is the resource instance where the step was defined. e.g. 'add firewall rule' step defined in Guacamole template -> the step_resource is the Guacamole ws service.
     # root_resource is theresource on which the user chose to update, i.e. the top most resource in cascaded action or the same resource in a non-cascaded action.
     if step_resource is None:
-        step_resource = await resource_repo.get_resource_by_id(operation_step.sourceTemplateResourceId)
+        # the resources of an uninstall are moved to the deleted resources container once it has completed
+        step_resource = await resource_repo.get_resource_by_id(operation_step.sourceTemplateResourceId, include_deleted=True)
 
     # If we are handling the root resource, we can leverage the given resource which has non redacted properties
     if root_resource is not None and root_resource.id == step_resource.id:
@@ -55,12 +55,12 @@ async def update_resource_for_step(operation_step: OperationStep, resource_repo:
     step_resource_parent_workspace = None
     step_resource_parent_workspace_service = None
     if step_resource.resourceType == ResourceType.UserResource:
-        step_resource_parent_workspace_service = await resource_repo.get_resource_by_id(step_resource.parentWorkspaceServiceId)
+        step_resource_parent_workspace_service = await resource_repo.get_resource_by_id(step_resource.parentWorkspaceServiceId, include_deleted=True, workspace_partition=step_resource.workspaceId)
         step_resource_parent_service_name = step_resource_parent_workspace_service.templateName
-        step_resource_parent_workspace = await resource_repo.get_resource_by_id(step_resource.workspaceId)
+        step_resource_parent_workspace = await resource_repo.get_resource_by_id(step_resource.workspaceId, include_deleted=True, workspace_partition=step_resource.workspaceId)
 
     if step_resource.resourceType == ResourceType.WorkspaceService:
-        step_resource_parent_workspace = await resource_repo.get_resource_by_id(step_resource.workspaceId)
+        step_resource_parent_workspace = await resource_repo.get_resource_by_id(step_resource.workspaceId, include_deleted=True, workspace_partition=step_resource.workspaceId)
 
     parent_template = await resource_template_repo.get_template_by_name_and_version(step_resource.templateName, step_resource.templateVersion, step_resource.resourceType, step_resource_parent_service_name)
 
@@ -98,8 +98,6 @@ async def update_resource_for_step(operation_step: OperationStep, resource_repo:
         raise Exception(f"Cannot find step with id of {operation_step.templateStepId} in template {step_resource.templateName} for action {primary_action}")
 
     resource_to_send = await try_update_with_retries(
-        num_retries=3,
-        attempt_count=0,
         resource_repo=resource_repo,
         resource_template_repo=resource_template_repo,
         resource_history_repo=resource_history_repo,
@@ -114,42 +112,26 @@ async def update_resource_for_step(operation_step: OperationStep, resource_repo:
     return resource_to_send
 
 
-async def try_update_with_retries(num_retries: int, attempt_count: int, resource_repo: ResourceRepository, resource_template_repo: ResourceTemplateRepository, resource_history_repo: ResourceHistoryRepository, user: User, resource_to_update_id: str, template_step: PipelineStep, primary_resource: Resource, primary_parent_workspace: Resource = None, primary_parent_workspace_svc: Resource = None) -> Resource:
-    try:
-        return await try_patch(
+async def try_update_with_retries(resource_repo: ResourceRepository, resource_template_repo: ResourceTemplateRepository, resource_history_repo: ResourceHistoryRepository, user: User, resource_to_update_id: str, template_step: PipelineStep, primary_resource: Resource, primary_parent_workspace: Resource = None, primary_parent_workspace_svc: Resource = None) -> Resource:
+    # the resource may be patched by other pipeline steps at the same time, so is re-read and patched again on a conflict
+    return await resource_repo.update_with_retries(
+        operation="pipeline step update",
+        read=lambda: resource_repo.get_resource_by_id(resource_to_update_id),
+        update=lambda resource_to_update: try_patch(
             resource_repo=resource_repo,
             resource_template_repo=resource_template_repo,
             resource_history_repo=resource_history_repo,
             user=user,
-            resource_to_update_id=resource_to_update_id,
+            resource_to_update=resource_to_update,
             template_step=template_step,
             primary_resource=primary_resource,
             primary_parent_workspace=primary_parent_workspace,
             primary_parent_workspace_svc=primary_parent_workspace_svc
         )
-    except CosmosAccessConditionFailedError as e:
-        logger.warning(f"Etag mismatch for {resource_to_update_id}. Retrying.")
-        if attempt_count < num_retries:
-            await try_update_with_retries(
-                num_retries=num_retries,
-                attempt_count=(attempt_count + 1),
-                resource_repo=resource_repo,
-                resource_template_repo=resource_template_repo,
-                resource_history_repo=resource_history_repo,
-                user=user,
-                resource_to_update_id=resource_to_update_id,
-                template_step=template_step,
-                primary_resource=primary_resource,
-                primary_parent_workspace=primary_parent_workspace,
-                primary_parent_workspace_svc=primary_parent_workspace_svc
-            )
-        else:
-            raise e
-
-
-async def try_patch(resource_repo: ResourceRepository, resource_template_repo: ResourceTemplateRepository, resource_history_repo: ResourceHistoryRepository, user: User, resource_to_update_id: str, template_step: PipelineStep, primary_resource: Resource, primary_parent_workspace: Resource, primary_parent_workspace_svc: Resource) -> Resource:
-    resource_to_update = await resource_repo.get_resource_by_id(resource_to_update_id)
+    )
+
 
+async def try_patch(resource_repo: ResourceRepository, resource_template_repo: ResourceTemplateRepository, resource_history_repo: ResourceHistoryRepository, user: User, resource_to_update: Resource, template_step: PipelineStep, primary_resource: Resource, primary_parent_workspace: Resource, primary_parent_workspace_svc: Resource) -> Resource:
     # substitute values into new property bag for update
     properties = substitute_properties(template_step, primary_resource, primary_parent_workspace, primary_parent_workspace_svc, resource_to_update)
 
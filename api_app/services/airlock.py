@@ -296,7 +296,7 @@ async def save_and_publish_event_airlock_request(airlock_request: AirlockRequest
         await send_status_changed_event(airlock_request=airlock_request, previous_status=None)
         await send_airlock_notification_event(airlock_request, workspace, role_assignment_details)
     except Exception as e:
-        await airlock_request_repo.delete_item(airlock_request.id)
+        await airlock_request_repo.delete_item(airlock_request.id, airlock_request_repo.item_partition_key(airlock_request.model_dump()))
         logger.exception("Failed sending status_changed message")
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=strings.EVENT_GRID_PUBLISH_FAILED.format(e))
 
@@ -0,0 +1,31 @@
+import asyncio
+
+from core import config
+from db.repositories.airlock_requests import AirlockRequestRepository
+from db.repositories.registry import repository_registry
+from services.logging import logger
+
+
+class AirlockReviewInboxReconciler:
+    """
+    Corrects the airlock review inbox against the requests awaiting review every
+    AIRLOCK_REVIEW_INBOX_RECONCILE_INTERVAL seconds, as a request's copy is written after the request rather than
+    atomically with it. Every API instance runs one; reconciling is idempotent, so they can overlap.
+    """
+
+    async def init_repos(self):
+        self.airlock_request_repo = await repository_registry.get(AirlockRequestRepository)
+
+    async def reconcile_periodically(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.exception(f"Failed to reconcile the airlock review inbox. Will retry - {e}")
+            await asyncio.sleep(config.AIRLOCK_REVIEW_INBOX_RECONCILE_INTERVAL)
+
+    async def reconcile(self) -> int:
+        corrected = await self.airlock_request_repo.reconcile_review_inbox()
+        if corrected:
+            logger.warning(f"Corrected {corrected} copies in the airlock review inbox")
+        return corrected
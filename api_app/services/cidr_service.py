@@ -1,48 +1,111 @@
-from typing import List
+from bisect import bisect_left, insort
+from typing import Iterable, List, Optional
 from ipaddress import IPv4Network, NetmaskValueError, collapse_addresses
 
 from core import config
 
 
-def generate_new_cidr(allocated_subnets: List[str], required_cidr_block_type: int) -> str:
-    if required_cidr_block_type >= 32 or required_cidr_block_type < 8:
-        raise NetmaskValueError("Invalid netmask for this operation.")
-
-    free_subnets = get_free_subnets(allocated_subnets)
+class CidrAllocationIndex:
+    """
+    The free address space held as sorted lists of block start addresses, one per prefix length, each block being the
+    largest aligned network that is free. These are the same networks get_free_subnets returns, so allocations match,
+    but reserving or allocating a network only touches the lists for the prefix lengths in between rather than
+    rebuilding the free space for every allocated subnet.
+    """
+    def __init__(self, allocation_network: IPv4Network, reserved_networks: Iterable[IPv4Network] = ()):
+        self._free: List[List[int]] = [[] for _ in range(33)]
+        self._free[allocation_network.prefixlen].append(int(allocation_network.network_address))
+        for network in reserved_networks:
+            self.reserve(network)
+
+    @staticmethod
+    def _block_size(prefixlen: int) -> int:
+        return 1 << (32 - prefixlen)
+
+    def _is_free_block(self, prefixlen: int, start: int) -> bool:
+        blocks = self._free[prefixlen]
+        i = bisect_left(blocks, start)
+        return i < len(blocks) and blocks[i] == start
+
+    def _find_free_block_containing(self, network: IPv4Network) -> Optional[int]:
+        start = int(network.network_address)
+        for prefixlen in range(network.prefixlen, -1, -1):
+            if self._is_free_block(prefixlen, start & ~(self._block_size(prefixlen) - 1)):
+                return prefixlen
+        return None
+
+    def _split(self, prefixlen: int, network: IPv4Network):
+        # Take network out of the free block of size prefixlen containing it, freeing the halves that don't contain it
+        start = int(network.network_address)
+        blocks = self._free[prefixlen]
+        del blocks[bisect_left(blocks, start & ~(self._block_size(prefixlen) - 1))]
+        for child_prefixlen in range(prefixlen + 1, network.prefixlen + 1):
+            child_size = self._block_size(child_prefixlen)
+            insort(self._free[child_prefixlen], (start & ~(child_size - 1)) ^ child_size)
+
+    def is_available(self, network: IPv4Network) -> bool:
+        return self._find_free_block_containing(network) is not None
+
+    def reserve(self, network: IPv4Network) -> bool:
+        """
+        Marks network as allocated, returning whether any of it was free.
+        """
+        prefixlen = self._find_free_block_containing(network)
+        if prefixlen is not None:
+            self._split(prefixlen, network)
+            return True
 
-    # compare to the required subnet size and work with what is large enough
-    free_subnets = [x for x in free_subnets if x.prefixlen <= required_cidr_block_type]
+        # Not wholly free, so drop whatever free blocks lie inside it
+        start = int(network.network_address)
+        end = start + self._block_size(network.prefixlen)
+        reserved = False
+        for blocks in self._free[network.prefixlen + 1:]:
+            lo, hi = bisect_left(blocks, start), bisect_left(blocks, end)
+            if lo < hi:
+                del blocks[lo:hi]
+                reserved = True
+        return reserved
+
+    def can_allocate(self, prefixlen: int) -> bool:
+        return any(self._free[block_prefixlen] for block_prefixlen in range(prefixlen + 1))
+
+    def allocate(self, prefixlen: int) -> IPv4Network:
+        # allocate in smaller free blocks before larger ones, lowest address first
+        for block_prefixlen in range(prefixlen, -1, -1):
+            if self._free[block_prefixlen]:
+                network = IPv4Network((self._free[block_prefixlen][0], prefixlen))
+                self._split(block_prefixlen, network)
+                return network
 
-    if len(free_subnets) == 0:
         raise Exception("Not enough space in network.")
 
-    # allocate in smaller subnets before larger ones
-    free_subnets.sort(key=lambda x: x.prefixlen, reverse=True)
-    allocation_subnet = free_subnets[0]
-    new_subnet = list(allocation_subnet.subnets(new_prefix=required_cidr_block_type))
-    return str(new_subnet[0])
+    def free_subnets(self) -> List[IPv4Network]:
+        return sorted(IPv4Network((start, prefixlen)) for prefixlen, blocks in enumerate(self._free) for start in blocks)
 
 
-def get_free_subnets(allocated_subnets: List[str]) -> List[IPv4Network]:
+def get_allocation_index(allocated_subnets: Iterable[str]) -> CidrAllocationIndex:
     core_network = IPv4Network(config.CORE_ADDRESS_SPACE)
     allocation_network = IPv4Network(config.TRE_ADDRESS_SPACE)
 
-    free_subnets = remove_subnet([allocation_network], core_network)
+    return CidrAllocationIndex(allocation_network, [core_network] + [IPv4Network(subnet_string) for subnet_string in allocated_subnets])
+
+
+def validate_netmask(required_cidr_block_type: int):
+    if required_cidr_block_type >= 32 or required_cidr_block_type < 8:
+        raise NetmaskValueError("Invalid netmask for this operation.")
 
-    for subnet_string in allocated_subnets:
-        free_subnets = remove_subnet(free_subnets, IPv4Network(subnet_string))
 
-    return free_subnets
+def generate_new_cidr(allocated_subnets: List[str], required_cidr_block_type: int) -> str:
+    validate_netmask(required_cidr_block_type)
+    return str(get_allocation_index(allocated_subnets).allocate(required_cidr_block_type))
 
 
-def is_network_available(allocated_subnets: List[str], requested_CIDR) -> bool:
-    requested_network = IPv4Network(requested_CIDR)
-    for subnet in get_free_subnets(allocated_subnets):
-        if requested_network.subnet_of(subnet):
-            return True
+def get_free_subnets(allocated_subnets: List[str]) -> List[IPv4Network]:
+    return get_allocation_index(allocated_subnets).free_subnets()
 
-    # The requested network does not fit in the network
-    return False
+
+def is_network_available(allocated_subnets: List[str], requested_CIDR) -> bool:
+    return get_allocation_index(allocated_subnets).is_available(IPv4Network(requested_CIDR))
 
 
 def remove_subnet(subnets: List[IPv4Network], exclude: IPv4Network) -> List[IPv4Network]:
@@ -0,0 +1,34 @@
+import asyncio
+from datetime import datetime, timedelta, UTC
+
+from core import config
+from db.repositories.operations import OperationRepository
+from db.repositories.registry import repository_registry
+from services.logging import logger
+
+
+class OperationArchiver:
+    """
+    Moves the operations that finished more than OPERATIONS_RETENTION_DAYS ago to the operations archive every
+    OPERATIONS_ARCHIVE_INTERVAL seconds, so the operations container holds the recent ones and its queries stay as
+    cheap as the TRE ages. Every API instance runs one; archiving is idempotent, so they can overlap.
+    """
+
+    async def init_repos(self):
+        self.operations_repo = await repository_registry.get(OperationRepository)
+
+    async def archive_periodically(self):
+        while True:
+            try:
+                await self.archive_operations()
+            except Exception as e:
+                # transient (e.g. throttling that outlasted the retries); the next run picks up where this one stopped
+                logger.exception(f"Failed to archive operations. Will retry - {e}")
+            await asyncio.sleep(config.OPERATIONS_ARCHIVE_INTERVAL)
+
+    async def archive_operations(self) -> int:
+        finished_before = datetime.now(UTC) - timedelta(days=config.OPERATIONS_RETENTION_DAYS)
+        archived = await self.operations_repo.archive_operations(finished_before.timestamp())
+        if archived:
+            logger.info(f"Archived {archived} operations that finished before {finished_before.isoformat()}")
+        return archived
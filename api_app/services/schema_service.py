@@ -1,6 +1,10 @@
+import copy
 import json
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Callable, List, Dict, Tuple
+
+SCHEMAS_DIR = Path(__file__).parent / ".." / "schemas"
 
 
 def get_system_properties(id_field: str = "workspace_id"):
@@ -30,11 +34,23 @@ def merge_properties(all_properties: List[Dict]) -> Dict:
     return properties
 
 
+def load_system_schemas() -> Dict[str, Tuple[List[str], Dict]]:
+    system_schemas = {}
+    for schema_def in SCHEMAS_DIR.glob("*.json"):
+        with open(schema_def) as schema_f:
+            schema = json.load(schema_f)
+            system_schemas[schema_def.name] = (schema["required"], schema["properties"])
+    return system_schemas
+
+
+# the system schemas ship with the API, so they are only read from disk once
+SYSTEM_SCHEMAS = load_system_schemas()
+
+
 def read_schema(schema_file: str) -> Tuple[List[str], Dict]:
-    workspace_schema_def = Path(__file__).parent / ".." / "schemas" / schema_file
-    with open(workspace_schema_def) as schema_f:
-        schema = json.load(schema_f)
-        return schema["required"], schema["properties"]
+    required, properties = SYSTEM_SCHEMAS[schema_file]
+    # enrich_template marks properties as readOnly in place, so callers get their own copy
+    return list(required), copy.deepcopy(properties)
 
 
 def enrich_template(original_template, extra_properties, is_update: bool = False, is_workspace_scope: bool = True) -> dict:
@@ -115,3 +131,34 @@ def enrich_user_resource_template(template, is_update: bool = False):
     """
     user_resource_default_properties = read_schema('user_resource.json')
     return enrich_template(template, [user_resource_default_properties], is_update=is_update)
+
+
+class EnrichedTemplateCache:
+    """
+    Bounded LRU of enriched template dicts, keyed on (template id, current, is_update).
+
+    Template versions are immutable apart from their 'current' flag, which is part of the key. The dicts handed out
+    are shared between callers and must be treated as read-only - take a copy.deepcopy before modifying one.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._templates: OrderedDict[Tuple[str, bool, bool], dict] = OrderedDict()
+
+    def get(self, template, is_update: bool, enrich: Callable[..., dict]) -> dict:
+        key = (template.id, template.current, is_update)
+        if key in self._templates:
+            self._templates.move_to_end(key)
+            return self._templates[key]
+
+        enriched_template = enrich(template, is_update=is_update)
+        self._templates[key] = enriched_template
+        if len(self._templates) > self.max_size:
+            self._templates.popitem(last=False)
+        return enriched_template
+
+    def clear(self):
+        self._templates.clear()
+
+
+enriched_templates = EnrichedTemplateCache()
@@ -4,6 +4,12 @@ from mock import AsyncMock, patch
 from azure.cosmos.aio import CosmosClient, DatabaseProxy
 
 from api.dependencies.database import Database
+from db.repositories.address_spaces import address_space_index_cache
+from db.repositories.airlock_requests import role_assignment_cache
+from db.repositories.registry import repository_registry
+from db.repositories.resource_templates import template_cache
+from db.repositories.resources import template_validators
+from services.schema_service import enriched_templates
 from models.domain.request_action import RequestAction
 from models.domain.resource import Resource
 from models.domain.user_resource import UserResource
@@ -591,3 +597,30 @@ async def no_database():
             patch('api.dependencies.database.CosmosClient', return_value=AsyncMock(spec=CosmosClient)) as cosmos_client_mock:
         cosmos_client_mock.return_value.get_database_client.return_value = AsyncMock(spec=DatabaseProxy)
         yield Database()
+
+
+@pytest.fixture
+def in_memory_database():
+    """
+    Backs the repositories with the in-memory state store, instead of a mocked Cosmos DB client
+    """
+    with patch('api.dependencies.database.STATE_STORE_BACKEND', "memory"), \
+            patch.object(Database, "_database_proxy", None):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_template_cache():
+    template_cache.clear()
+    template_validators.clear()
+    enriched_templates.clear()
+    address_space_index_cache.clear()
+    role_assignment_cache.clear()
+    repository_registry.clear()
+    yield
+    template_cache.clear()
+    template_validators.clear()
+    enriched_templates.clear()
+    address_space_index_cache.clear()
+    role_assignment_cache.clear()
+    repository_registry.clear()
@@ -0,0 +1,20 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from api.dependencies.shared_services import get_operation_by_id_from_path
+from db.partitioning import SHARED_PARTITION
+
+pytestmark = pytest.mark.asyncio
+
+SHARED_SERVICE_ID = "000000d3-82da-4bfc-b6e9-9a7853ef753e"
+OPERATION_ID = "b27e68c4-438f-45d3-bcea-402901bc2e20"
+
+
+async def test_get_operation_by_id_from_path_reads_the_operation_from_the_shared_partition():
+    operations_repo = AsyncMock()
+
+    operation = await get_operation_by_id_from_path(shared_service_id=SHARED_SERVICE_ID, operation_id=OPERATION_ID, operations_repo=operations_repo, include_archived=False)
+
+    assert operation == operations_repo.get_operation_by_id.return_value
+    operations_repo.get_operation_by_id.assert_called_once_with(operation_id=OPERATION_ID, workspace_id=SHARED_PARTITION, resource_id=SHARED_SERVICE_ID, include_archived=False)
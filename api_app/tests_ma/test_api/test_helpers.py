@@ -15,3 +15,9 @@ async def test_get_repository_raises_http_exception_when_unable_to_access_databa
     with pytest.raises(HTTPException):
         get_repo = get_repository(BaseRepository)
         await get_repo()
+
+
+async def test_get_repository_returns_the_same_repository_for_every_request():
+    get_repo = get_repository(BaseRepository)
+
+    assert await get_repo() is await get_repo()
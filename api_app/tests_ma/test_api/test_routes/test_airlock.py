@@ -8,8 +8,8 @@ from azure.cosmos.exceptions import CosmosResourceNotFoundError
 
 from tests_ma.test_api.conftest import create_test_user, get_required_roles
 from api.routes.airlock import create_draft_request
-from db.errors import EntityDoesNotExist, UnableToAccessDatabase
-from models.domain.airlock_request import AirlockRequest, AirlockRequestStatus, AirlockReview, AirlockReviewDecision, AirlockReviewUserResource
+from db.errors import EntityDoesNotExist, InvalidInput, UnableToAccessDatabase
+from models.domain.airlock_request import AirlockRequest, AirlockRequestHistoryItem, AirlockRequestStatus, AirlockReview, AirlockReviewDecision, AirlockReviewUserResource
 from models.domain.user_resource import UserResource
 from models.domain.resource_template import ResourceTemplate
 from models.domain.workspace_service import WorkspaceService
@@ -208,6 +208,28 @@ class TestAirlockRoutesThatRequireOwnerOrResearcherRights():
         response = await client.get(app.url_path_for(strings.API_GET_AIRLOCK_REQUEST, workspace_id=WORKSPACE_ID, airlock_request_id=AIRLOCK_REQUEST_ID))
         assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
 
+    # [GET] /workspaces/{workspace_id}/requests/{airlock_request_id}/history
+    @patch("api.routes.airlock.AirlockRequestRepository.read_item_by_id", return_value=sample_airlock_request_object())
+    @patch("db.repositories.airlock_request_history.AirlockRequestHistoryRepository.get_history", return_value=[AirlockRequestHistoryItem(resourceVersion=0, updatedWhen=1.0, properties={"previousStatus": "draft"})])
+    async def test_get_airlock_request_history_returns_history(self, _, __, app, client):
+        response = await client.get(app.url_path_for(strings.API_GET_AIRLOCK_REQUEST_HISTORY, workspace_id=WORKSPACE_ID, airlock_request_id=AIRLOCK_REQUEST_ID))
+        assert response.status_code == status.HTTP_200_OK
+        assert [item["properties"] for item in response.json()["history"]] == [{"previousStatus": "draft"}]
+
+    @patch("api.routes.airlock.AirlockRequestRepository.read_item_by_id", return_value=sample_airlock_request_object())
+    @patch("db.repositories.airlock_request_history.AirlockRequestHistoryRepository.get_history_page", return_value=([], "next-page"))
+    async def test_get_airlock_request_history_page_returns_continuation_token(self, get_history_page_mock, _, app, client):
+        response = await client.get(app.url_path_for(strings.API_GET_AIRLOCK_REQUEST_HISTORY, workspace_id=WORKSPACE_ID, airlock_request_id=AIRLOCK_REQUEST_ID), params={"pageSize": 5})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["continuationToken"] == "next-page"
+        get_history_page_mock.assert_called_once_with(AIRLOCK_REQUEST_ID, page_size=5)
+
+    @patch("api.routes.airlock.AirlockRequestRepository.read_item_by_id", return_value=sample_airlock_request_object())
+    @patch("db.repositories.airlock_request_history.AirlockRequestHistoryRepository.get_history_page", side_effect=InvalidInput(strings.INVALID_CONTINUATION_TOKEN))
+    async def test_get_airlock_request_history_with_invalid_continuation_token_returns_400(self, _, __, app, client):
+        response = await client.get(app.url_path_for(strings.API_GET_AIRLOCK_REQUEST_HISTORY, workspace_id=WORKSPACE_ID, airlock_request_id=AIRLOCK_REQUEST_ID), params={"continuationToken": "bad"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
     # [POST] /workspaces/{workspace_id}/requests/{airlock_request_id}/submit
     @patch("api.routes.airlock.AirlockRequestRepository.read_item_by_id", return_value=sample_airlock_request_object())
     @patch("api.routes.airlock.update_and_publish_event_airlock_request", return_value=sample_airlock_request_object(status=AirlockRequestStatus.Submitted))
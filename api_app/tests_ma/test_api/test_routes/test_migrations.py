@@ -3,6 +3,7 @@ from mock import patch
 
 from fastapi import status
 from auth.rbac import require_tre_admin, require_tre_user_or_admin
+from models.domain.migration import MigrationCheckpoint, MigrationStatus
 from resources import strings
 
 
@@ -36,10 +37,43 @@ class TestMigrationRoutesThatRequireAdminRights:
         app.dependency_overrides = {}
 
     # [POST] /migrations/
+    @patch("api.routes.migrations.ResourceRepository.resource_hierarchy_migrations", return_value=["resource-hierarchy-workspaces"])
+    @patch("api.routes.migrations.AirlockRequestRepository.airlock_review_inbox_migrations", return_value=["airlock-review-inbox"])
+    @patch("api.routes.migrations.OperationRepository.resource_deployed_migrations", return_value=["resource-deployed-flag"])
+    @patch("api.routes.migrations.BulkMigrationRunner.run", return_value=[MigrationCheckpoint(id="resource-hierarchy-workspaces", status=MigrationStatus.Completed, documentsRead=4, documentsWritten=3, requestCharge=20.0, elapsedSeconds=2.0)])
+    @patch("api.routes.migrations.ResourceRepository.move_deleted_resources", return_value=(5, True))
     @patch("api.routes.migrations.logger.info")
-    async def test_post_migrations_returns_202_on_successful(self, logging, client, app):
+    async def test_post_migrations_returns_202_on_successful(self, logging, move_deleted_resources, run_migrations, _, __, ___, client, app):
         response = await client.post(app.url_path_for(strings.API_MIGRATE_DATABASE))
 
         logging.assert_called()
+        run_migrations.assert_called_once_with(["resource-hierarchy-workspaces", "airlock-review-inbox", "resource-deployed-flag"])
+        move_deleted_resources.assert_called_once()
         if response.status_code != status.HTTP_202_ACCEPTED:
             raise AssertionError(f"Expected status code {status.HTTP_202_ACCEPTED}, but got {response.status_code}")
+        assert response.json()["migrations"] == [
+            {"issueNumber": "resource-hierarchy-workspaces", "status": "Completed: 3 of 4 documents updated in 2.0s (2 documents/s, 10 RU/s written)"},
+            {"issueNumber": "move-deleted-resources", "status": "Completed: 5 deleted resources moved"}
+        ]
+
+    # [POST] /migrations/
+    @patch("api.routes.migrations.ResourceRepository.resource_hierarchy_migrations", return_value=[])
+    @patch("api.routes.migrations.AirlockRequestRepository.airlock_review_inbox_migrations", return_value=[])
+    @patch("api.routes.migrations.OperationRepository.resource_deployed_migrations", return_value=[])
+    @patch("api.routes.migrations.BulkMigrationRunner.run", return_value=[MigrationCheckpoint(id="resource-hierarchy-workspaces", status=MigrationStatus.InProgress, documentsRead=4, documentsWritten=3)])
+    @patch("api.routes.migrations.ResourceRepository.move_deleted_resources")
+    async def test_post_migrations_moves_deleted_resources_after_the_bulk_migrations_complete(self, move_deleted_resources, _, __, ___, ____, client, app):
+        response = await client.post(app.url_path_for(strings.API_MIGRATE_DATABASE))
+
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        move_deleted_resources.assert_not_called()
+
+    # [POST] /migrations/
+    @patch("api.routes.migrations.ResourceRepository.resource_hierarchy_migrations", return_value=[])
+    @patch("api.routes.migrations.AirlockRequestRepository.airlock_review_inbox_migrations", return_value=[])
+    @patch("api.routes.migrations.OperationRepository.resource_deployed_migrations", return_value=[])
+    @patch("api.routes.migrations.BulkMigrationRunner.run", side_effect=Exception("boom"))
+    async def test_post_migrations_returns_400_if_migration_fails(self, _, __, ___, ____, client, app):
+        response = await client.post(app.url_path_for(strings.API_MIGRATE_DATABASE))
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
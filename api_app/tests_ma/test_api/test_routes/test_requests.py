@@ -2,6 +2,7 @@ import pytest
 from fastapi import status
 from mock import patch
 
+from db.errors import InvalidInput
 from models.domain.airlock_request import AirlockRequestStatus, AirlockRequestType
 from resources import strings
 from auth.rbac import require_tre_user_or_admin
@@ -118,3 +119,30 @@ class TestRequestsThatDontRequireAdminRigths:
             order_by="updatedWhen",
             order_ascending=False
         )
+
+    @patch("api.routes.requests.AirlockRequestRepository.get_airlock_requests_page", return_value=([], "next-page-token"))
+    async def test_get_requests_returns_continuation_token_header_when_paged(self, mock_get_airlock_requests_page, app, client):
+        response = await client.get(app.url_path_for(strings.API_LIST_REQUESTS), params={"pageSize": 10})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == []
+        assert response.headers["x-continuation-token"] == "next-page-token"
+        mock_get_airlock_requests_page.assert_called_once_with(
+            creator_user_id='user-guid-here', type=None, status=None, order_by=None, order_ascending=True, page_size=10, continuation_token=None
+        )
+
+    @patch("api.routes.requests.AirlockRequestRepository.get_airlock_requests_for_airlock_manager_page", return_value=([], None))
+    async def test_get_airlock_manager_requests_when_paged_omits_header_on_last_page(self, mock_get_page, app, client):
+        response = await client.get(app.url_path_for(strings.API_LIST_REQUESTS), params={"airlock_manager": True, "continuationToken": "this-page-token"})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert "x-continuation-token" not in response.headers
+        mock_get_page.assert_called_once_with(
+            user_id='user-guid-here', type=None, status=None, order_by=None, order_ascending=True, page_size=None, continuation_token="this-page-token"
+        )
+
+    @patch("api.routes.requests.AirlockRequestRepository.get_airlock_requests_page", side_effect=InvalidInput(strings.INVALID_CONTINUATION_TOKEN))
+    async def test_get_requests_returns_400_if_continuation_token_is_invalid(self, _, app, client):
+        response = await client.get(app.url_path_for(strings.API_LIST_REQUESTS), params={"continuationToken": "bad-token"})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
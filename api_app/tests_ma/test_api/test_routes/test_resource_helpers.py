@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 from unittest.mock import AsyncMock
 import uuid
@@ -6,9 +7,10 @@ import pytest_asyncio
 from mock import patch
 import json
 
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
 from fastapi import HTTPException, status
 
-from api.routes.resource_helpers import save_and_deploy_resource, send_uninstall_message, mask_sensitive_properties, enrich_resource_with_available_upgrades
+from api.routes.resource_helpers import cascaded_update_resource, save_and_deploy_resource, send_uninstall_message, mask_sensitive_properties, enrich_resource_with_available_upgrades
 from db.repositories.resources_history import ResourceHistoryRepository
 from tests_ma.test_api.conftest import create_test_user
 from resources import strings
@@ -17,7 +19,10 @@ from db.repositories.resources import ResourceRepository
 from db.repositories.operations import OperationRepository
 from models.domain.operation import Status, Operation, OperationStep
 from models.domain.resource import AvailableUpgrade, RequestAction, ResourceType
+from models.domain.user_resource import UserResource
 from models.domain.workspace import Workspace
+from models.domain.workspace_service import WorkspaceService
+from models.schemas.resource import ResourcePatch
 
 
 WORKSPACE_ID = '933ad738-7265-4b5f-9eae-a1a62928772e'
@@ -184,7 +189,7 @@ class TestResourceHelpers:
     async def test_save_and_deploy_resource_raises_503_if_send_request_fails(self, _, resource_template_repo, resource_repo, operations_repo, basic_resource_template, resource_history_repo):
         resource = sample_resource()
         resource_repo.save_item = AsyncMock(return_value=None)
-        resource_repo.delete_item = AsyncMock(return_value=None)
+        resource_repo.delete_resource = AsyncMock(return_value=None)
 
         with pytest.raises(HTTPException) as ex:
             await save_and_deploy_resource(
@@ -201,11 +206,11 @@ class TestResourceHelpers:
     @patch("api.routes.workspaces.ResourceTemplateRepository")
     @patch("api.routes.resource_helpers.send_resource_request_message", side_effect=Exception)
     @pytest.mark.asyncio
-    async def test_save_and_deploy_resource_deletes_item_from_db_if_send_request_fails(self, _, resource_template_repo, resource_repo, operations_repo, basic_resource_template, resource_history_repo):
+    async def test_save_and_deploy_resource_deletes_resource_from_db_if_send_request_fails(self, _, resource_template_repo, resource_repo, operations_repo, basic_resource_template, resource_history_repo):
         resource = sample_resource()
 
         resource_repo.save_item = AsyncMock(return_value=None)
-        resource_repo.delete_item = AsyncMock(return_value=None)
+        resource_repo.delete_resource = AsyncMock(return_value=None)
         operations_repo.create_operation_item = AsyncMock(return_value=None)
 
         with pytest.raises(HTTPException):
@@ -218,7 +223,7 @@ class TestResourceHelpers:
                 user=create_test_user(),
                 resource_template=basic_resource_template)
 
-        resource_repo.delete_item.assert_called_once_with(resource.id)
+        resource_repo.delete_resource.assert_called_once_with(resource)
 
     @patch("api.routes.workspaces.ResourceTemplateRepository")
     @patch("api.routes.resource_helpers.send_resource_request_message", return_value=None)
@@ -330,3 +335,120 @@ class TestResourceHelpers:
         assert masked_resource["client_id"] == "12345"
         assert masked_resource["secret"] == strings.REDACTED_SENSITIVE_VALUE
         assert masked_resource["prop_with_nested_secret"]["nested_secret"] == strings.REDACTED_SENSITIVE_VALUE
+
+
+SERVICE_ID = 'abcad738-7265-4b5f-9eae-a1a62928772e'
+OTHER_SERVICE_ID = 'bbbad738-7265-4b5f-9eae-a1a62928772e'
+
+
+def service_dict(service_id=SERVICE_ID, etag="service-etag"):
+    return WorkspaceService(id=service_id, workspaceId=WORKSPACE_ID, templateName="tre-service", templateVersion="0.1.0", etag=etag, properties={},
+                            resourcePath=f'/workspaces/{WORKSPACE_ID}/workspace-services/{service_id}').model_dump() | {"_etag": etag}
+
+
+def user_resource_dict(parent_service_id=SERVICE_ID, etag="user-resource-etag"):
+    user_resource_id = str(uuid.uuid4())
+    return UserResource(id=user_resource_id, workspaceId=WORKSPACE_ID, parentWorkspaceServiceId=parent_service_id, templateName="tre-user-resource", templateVersion="0.1.0", etag=etag, properties={},
+                        resourcePath=f'/workspaces/{WORKSPACE_ID}/workspace-services/{parent_service_id}/user-resources/{user_resource_id}').model_dump() | {"_etag": etag}
+
+
+class TestCascadedUpdateResource:
+    @pytest.fixture
+    def cascade_repos(self, resource_repo):
+        resource_repo.patch_resource = AsyncMock()
+        resource_repo.get_resource_by_id = AsyncMock()
+        resource_template_repo = AsyncMock()
+        resource_template_repo.get_template_by_name_and_version.side_effect = lambda name, version, resource_type, parent_service_name: f"{name}:{parent_service_name}"
+        return resource_repo, resource_template_repo, AsyncMock()
+
+    @pytest.mark.asyncio
+    async def test_cascaded_update_resource_patches_every_child_but_not_the_parent(self, cascade_repos):
+        resource_repo, resource_template_repo, resource_history_repo = cascade_repos
+        workspace = sample_resource()
+        user_resources = [user_resource_dict() for _ in range(3)]
+        resource_repo.get_resource_dependency_list = AsyncMock(return_value=user_resources + [service_dict(), workspace.model_dump()])
+        resource_patch = ResourcePatch(isEnabled=False)
+
+        await cascaded_update_resource(resource_patch, workspace, create_test_user(), False, resource_template_repo, resource_history_repo, resource_repo)
+
+        patched = {c.args[0].id: (c.args[2], c.args[3]) for c in resource_repo.patch_resource.call_args_list}
+        assert patched == {
+            SERVICE_ID: ("tre-service:", "service-etag"),
+            **{r["id"]: ("tre-user-resource:tre-service", "user-resource-etag") for r in user_resources}
+        }
+        # the parent service was updated too, so didn't need looking up, and each template was fetched once
+        resource_repo.get_resource_by_id.assert_not_called()
+        assert resource_template_repo.get_template_by_name_and_version.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_cascaded_update_resource_looks_up_each_missing_parent_service_once(self, cascade_repos):
+        resource_repo, resource_template_repo, resource_history_repo = cascade_repos
+        workspace = sample_resource()
+        resource_repo.get_resource_dependency_list = AsyncMock(return_value=[user_resource_dict(OTHER_SERVICE_ID), user_resource_dict(OTHER_SERVICE_ID), workspace.model_dump()])
+        resource_repo.get_resource_by_id.return_value = WorkspaceService(**{k: v for k, v in service_dict(OTHER_SERVICE_ID).items() if k != "_etag"})
+
+        await cascaded_update_resource(ResourcePatch(isEnabled=False), workspace, create_test_user(), False, resource_template_repo, resource_history_repo, resource_repo)
+
+        resource_repo.get_resource_by_id.assert_called_once_with(OTHER_SERVICE_ID, workspace_partition=WORKSPACE_ID)
+        assert resource_repo.patch_resource.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("api.routes.resource_helpers.config.CASCADE_UPDATE_CONCURRENCY", 2)
+    async def test_cascaded_update_resource_bounds_concurrent_patches(self, cascade_repos):
+        resource_repo, resource_template_repo, resource_history_repo = cascade_repos
+        workspace = sample_resource()
+        resource_repo.get_resource_dependency_list = AsyncMock(return_value=[user_resource_dict() for _ in range(6)] + [service_dict(), workspace.model_dump()])
+        in_flight = 0
+        max_in_flight = 0
+
+        async def patch_resource(*args):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+        resource_repo.patch_resource.side_effect = patch_resource
+
+        await cascaded_update_resource(ResourcePatch(isEnabled=False), workspace, create_test_user(), False, resource_template_repo, resource_history_repo, resource_repo)
+
+        assert resource_repo.patch_resource.call_count == 7
+        assert max_in_flight == 2
+
+    @pytest.mark.asyncio
+    async def test_cascaded_update_resource_retries_child_with_latest_etag(self, cascade_repos):
+        resource_repo, resource_template_repo, resource_history_repo = cascade_repos
+        workspace = sample_resource()
+        resource_repo.get_resource_dependency_list = AsyncMock(return_value=[service_dict(), workspace.model_dump()])
+        resource_repo.patch_resource.side_effect = [CosmosAccessConditionFailedError(), None]
+        resource_repo.get_resource_dict_by_id = AsyncMock(return_value=service_dict(etag="latest-etag"))
+
+        await cascaded_update_resource(ResourcePatch(isEnabled=False), workspace, create_test_user(), False, resource_template_repo, resource_history_repo, resource_repo)
+
+        resource_repo.get_resource_dict_by_id.assert_called_once_with(SERVICE_ID, workspace_partition=WORKSPACE_ID)
+        assert [c.args[3] for c in resource_repo.patch_resource.call_args_list] == ["service-etag", "latest-etag"]
+
+    @pytest.mark.asyncio
+    @patch("api.routes.resource_helpers.logger.error")
+    async def test_cascaded_update_resource_attempts_every_child_and_raises_first_failure(self, logging_mock, cascade_repos):
+        resource_repo, resource_template_repo, resource_history_repo = cascade_repos
+        workspace = sample_resource()
+        user_resources = [user_resource_dict() for _ in range(2)]
+        resource_repo.get_resource_dependency_list = AsyncMock(return_value=user_resources + [service_dict(), workspace.model_dump()])
+        resource_repo.patch_resource.side_effect = [ValueError("first"), None, ValueError("last")]
+
+        with pytest.raises(ValueError, match="first"):
+            await cascaded_update_resource(ResourcePatch(isEnabled=False), workspace, create_test_user(), False, resource_template_repo, resource_history_repo, resource_repo)
+
+        assert resource_repo.patch_resource.call_count == 3
+        assert "failed for 2 of 3 resources" in logging_mock.call_args.args[0]
+
+    @pytest.mark.asyncio
+    async def test_cascaded_update_resource_without_children_does_nothing(self, cascade_repos):
+        resource_repo, resource_template_repo, resource_history_repo = cascade_repos
+        workspace = sample_resource()
+        resource_repo.get_resource_dependency_list = AsyncMock(return_value=[workspace.model_dump()])
+
+        await cascaded_update_resource(ResourcePatch(isEnabled=False), workspace, create_test_user(), False, resource_template_repo, resource_history_repo, resource_repo)
+
+        resource_repo.patch_resource.assert_not_called()
+        resource_template_repo.get_template_by_name_and_version.assert_not_called()
@@ -208,6 +208,8 @@ class TestSharedServiceRoutesThatRequireAdminRights:
         modified_shared_service = sample_shared_service()
         modified_shared_service.isEnabled = False
         modified_shared_service.resourceVersion = 1
+        modified_shared_service.historySnapshotId = f"{modified_shared_service.id}-0"
+        modified_shared_service.historyChainLength = 1
         modified_shared_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_shared_service.user = create_admin_user().model_dump()
 
@@ -229,6 +231,8 @@ class TestSharedServiceRoutesThatRequireAdminRights:
         modified_shared_service = sample_shared_service()
         modified_shared_service.isEnabled = True
         modified_shared_service.resourceVersion = 1
+        modified_shared_service.historySnapshotId = f"{modified_shared_service.id}-0"
+        modified_shared_service.historyChainLength = 1
         modified_shared_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_shared_service.user = create_admin_user().model_dump()
         modified_shared_service.templateVersion = "0.2.0"
@@ -251,6 +255,8 @@ class TestSharedServiceRoutesThatRequireAdminRights:
         modified_shared_service = sample_shared_service()
         modified_shared_service.isEnabled = True
         modified_shared_service.resourceVersion = 1
+        modified_shared_service.historySnapshotId = f"{modified_shared_service.id}-0"
+        modified_shared_service.historyChainLength = 1
         modified_shared_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_shared_service.user = create_admin_user().model_dump()
         modified_shared_service.templateVersion = "2.0.0"
@@ -273,6 +279,8 @@ class TestSharedServiceRoutesThatRequireAdminRights:
         modified_shared_service = sample_shared_service()
         modified_shared_service.isEnabled = True
         modified_shared_service.resourceVersion = 1
+        modified_shared_service.historySnapshotId = f"{modified_shared_service.id}-0"
+        modified_shared_service.historyChainLength = 1
         modified_shared_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_shared_service.user = create_admin_user().model_dump()
 
@@ -294,6 +302,8 @@ class TestSharedServiceRoutesThatRequireAdminRights:
         modified_shared_service = sample_shared_service()
         modified_shared_service.isEnabled = True
         modified_shared_service.resourceVersion = 1
+        modified_shared_service.historySnapshotId = f"{modified_shared_service.id}-0"
+        modified_shared_service.historyChainLength = 1
         modified_shared_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_shared_service.user = create_admin_user().model_dump()
 
@@ -12,7 +12,7 @@ from tests_ma.test_api.conftest import create_admin_user, create_test_user, crea
 from models.domain.resource_template import ResourceTemplate
 from models.schemas.operation import OperationInResponse
 
-from db.errors import EntityDoesNotExist, StorageAccountNameGenerationTimeout, StorageAccountNameCheckFailed
+from db.errors import EntityDoesNotExist, InvalidInput, StorageAccountNameGenerationTimeout, StorageAccountNameCheckFailed
 from db.repositories.workspaces import WorkspaceRepository
 from db.repositories.workspace_services import WorkspaceServiceRepository
 from models.domain.authentication import RoleAssignment
@@ -265,7 +265,7 @@ class TestWorkspaceRoutesThatDontRequireAdminRights:
         access_service_mock.get_workspace_role.return_value = [WorkspaceRole.Owner]
 
         response = await client.get(app.url_path_for(strings.API_GET_ALL_WORKSPACES))
-        assert response.json() == {"workspaces": []}
+        assert response.json() == {"workspaces": [], "continuationToken": None}
 
     # [GET] /workspaces
     @patch("api.routes.workspaces.WorkspaceRepository.get_active_workspaces")
@@ -388,6 +388,33 @@ class TestWorkspaceRoutesThatRequireAdminRights:
         assert workspaces_from_response[1]["id"] == valid_ws_2.id
         assert workspaces_from_response[2]["id"] == valid_ws_3.id
 
+    # [GET] /workspaces?pageSize=
+    @patch("api.routes.workspaces.WorkspaceRepository.get_active_workspaces_page")
+    @patch("api.routes.workspaces.enrich_resource_with_available_upgrades", return_value=None)
+    async def test_get_workspaces_returns_page_and_continuation_token_when_paged(self, _, get_workspaces_page_mock, app, client) -> None:
+        workspace = sample_workspace(workspace_id=str(uuid.uuid4()))
+        get_workspaces_page_mock.return_value = ([workspace], "next-page-token")
+
+        response = await client.get(app.url_path_for(strings.API_GET_ALL_WORKSPACES), params={"pageSize": 1, "continuationToken": "this-page-token"})
+
+        assert response.status_code == status.HTTP_200_OK
+        get_workspaces_page_mock.assert_called_once_with(page_size=1, continuation_token="this-page-token")
+        assert response.json()["workspaces"][0]["id"] == workspace.id
+        assert response.json()["continuationToken"] == "next-page-token"
+
+    # [GET] /workspaces?continuationToken=
+    @patch("api.routes.workspaces.WorkspaceRepository.get_active_workspaces_page", side_effect=InvalidInput(strings.INVALID_CONTINUATION_TOKEN))
+    async def test_get_workspaces_returns_400_if_continuation_token_is_invalid(self, _, app, client) -> None:
+        response = await client.get(app.url_path_for(strings.API_GET_ALL_WORKSPACES), params={"continuationToken": "bad-token"})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    # [GET] /workspaces?pageSize=
+    async def test_get_workspaces_returns_422_if_page_size_is_out_of_range(self, app, client) -> None:
+        response = await client.get(app.url_path_for(strings.API_GET_ALL_WORKSPACES), params={"pageSize": 0})
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
     # [GET] /workspaces/{workspace_id}
     @patch("api.dependencies.workspaces.WorkspaceRepository.get_workspace_by_id")
     @patch("api.routes.workspaces.get_identity_role_assignments")
@@ -449,6 +476,26 @@ class TestWorkspaceRoutesThatRequireAdminRights:
         obj = response.json()["resource_history"]
         assert len(obj) == 0
 
+    # [GET] /workspaces/{workspace_id}/history?pageSize=&from=&to=&fields=
+    @patch("api.routes.shared_services.ResourceHistoryRepository.get_resource_history_page")
+    @patch("api.dependencies.workspaces.WorkspaceRepository.get_workspace_by_id")
+    @patch("api.routes.workspaces.get_identity_role_assignments")
+    async def test_get_workspace_history_returns_only_the_fields_asked_for(self, access_service_mock, get_workspace_mock, get_resource_history_page_mock, app, client):
+        auth_info_user_in_workspace_owner_role = {'sp_id': 'ab123', 'client_id': 'cl123', 'app_role_id_workspace_owner': 'ab124', 'app_role_id_workspace_researcher': 'ab125', 'app_role_id_workspace_airlock_manager': 'ab130'}
+        get_workspace_mock.return_value = sample_workspace(auth_info=auth_info_user_in_workspace_owner_role)
+        access_service_mock.return_value = [RoleAssignment('ab123', 'ab124')]
+        get_resource_history_page_mock.return_value = ([ResourceHistoryItem(id="history-1", resourceId=WORKSPACE_ID, resourceVersion=2, updatedWhen=150.0)], "next-page-token")
+
+        response = await client.get(app.url_path_for(strings.API_GET_RESOURCE_HISTORY, workspace_id=WORKSPACE_ID),
+                                    params={"pageSize": 1, "from": 100, "to": 200, "order_ascending": False, "fields": "resourceVersion,updatedWhen"})
+
+        assert response.status_code == status.HTTP_200_OK
+        get_resource_history_page_mock.assert_called_once_with(resource_id=WORKSPACE_ID, page_size=1, continuation_token=None, from_when=100, to_when=200, order_ascending=False, fields=["resourceVersion", "updatedWhen"])
+        assert response.json() == {
+            "resource_history": [{"id": "history-1", "resourceId": WORKSPACE_ID, "resourceVersion": 2, "updatedWhen": 150.0}],
+            "continuationToken": "next-page-token"
+        }
+
     # [POST] /workspaces/
     @patch("api.routes.workspaces.ResourceTemplateRepository.get_template_by_name_and_version")
     @patch("api.routes.resource_helpers.send_resource_request_message", return_value=sample_resource_operation(resource_id=WORKSPACE_ID, operation_id=OPERATION_ID))
@@ -495,18 +542,19 @@ class TestWorkspaceRoutesThatRequireAdminRights:
 
     # [POST] /workspaces/
     @patch("api.routes.workspaces.ResourceTemplateRepository.get_template_by_name_and_version")
-    @patch("api.routes.workspaces.WorkspaceRepository.delete_item")
+    @patch("api.routes.workspaces.WorkspaceRepository.delete_resource")
     @patch("api.routes.resource_helpers.send_resource_request_message", side_effect=Exception)
     @patch("api.routes.workspaces.WorkspaceRepository.save_item")
     @patch("api.routes.workspaces.WorkspaceRepository.create_workspace_item", return_value=[sample_workspace(), sample_resource_template()])
     @patch("api.routes.workspaces.WorkspaceRepository._validate_resource_parameters")
     @patch("api.routes.workspaces.extract_auth_information")
-    async def test_post_workspaces_returns_503_if_service_bus_call_fails(self, _, __, ___, ____, _____, delete_item_mock, resource_template_repo, app, client, workspace_input, basic_resource_template):
+    async def test_post_workspaces_returns_503_if_service_bus_call_fails(self, _, __, ___, ____, _____, delete_resource_mock, resource_template_repo, app, client, workspace_input, basic_resource_template):
         resource_template_repo.return_value = basic_resource_template
         response = await client.post(app.url_path_for(strings.API_CREATE_WORKSPACE), json=workspace_input)
 
         assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
-        delete_item_mock.assert_called_once_with(WORKSPACE_ID)
+        delete_resource_mock.assert_called_once()
+        assert delete_resource_mock.call_args.args[0].id == WORKSPACE_ID
 
     # [POST] /workspaces/
     @patch("api.routes.workspaces.WorkspaceRepository.validate_input_against_template", side_effect=ValueError)
@@ -560,6 +608,8 @@ class TestWorkspaceRoutesThatRequireAdminRights:
         modified_workspace = sample_workspace()
         modified_workspace.isEnabled = False
         modified_workspace.resourceVersion = 1
+        modified_workspace.historySnapshotId = f"{modified_workspace.id}-0"
+        modified_workspace.historyChainLength = 1
         modified_workspace.user = create_admin_user().model_dump()
         modified_workspace.updatedWhen = FAKE_UPDATE_TIMESTAMP
 
@@ -583,6 +633,8 @@ class TestWorkspaceRoutesThatRequireAdminRights:
         modified_workspace = sample_workspace()
         modified_workspace.isEnabled = True
         modified_workspace.resourceVersion = 1
+        modified_workspace.historySnapshotId = f"{modified_workspace.id}-0"
+        modified_workspace.historyChainLength = 1
         modified_workspace.user = create_admin_user().model_dump()
         modified_workspace.updatedWhen = FAKE_UPDATE_TIMESTAMP
 
@@ -606,6 +658,8 @@ class TestWorkspaceRoutesThatRequireAdminRights:
         modified_workspace = sample_workspace()
         modified_workspace.isEnabled = True
         modified_workspace.resourceVersion = 1
+        modified_workspace.historySnapshotId = f"{modified_workspace.id}-0"
+        modified_workspace.historyChainLength = 1
         modified_workspace.user = create_admin_user().model_dump()
         modified_workspace.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_workspace.templateVersion = "2.0.0"
@@ -630,6 +684,8 @@ class TestWorkspaceRoutesThatRequireAdminRights:
         modified_workspace = sample_workspace()
         modified_workspace.isEnabled = True
         modified_workspace.resourceVersion = 1
+        modified_workspace.historySnapshotId = f"{modified_workspace.id}-0"
+        modified_workspace.historyChainLength = 1
         modified_workspace.user = create_admin_user().model_dump()
         modified_workspace.updatedWhen = FAKE_UPDATE_TIMESTAMP
 
@@ -653,6 +709,8 @@ class TestWorkspaceRoutesThatRequireAdminRights:
         modified_workspace = sample_workspace()
         modified_workspace.isEnabled = True
         modified_workspace.resourceVersion = 1
+        modified_workspace.historySnapshotId = f"{modified_workspace.id}-0"
+        modified_workspace.historyChainLength = 1
         modified_workspace.user = create_admin_user().model_dump()
         modified_workspace.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_workspace.templateVersion = "0.2.0"
@@ -675,6 +733,8 @@ class TestWorkspaceRoutesThatRequireAdminRights:
         modified_workspace = sample_workspace()
         modified_workspace.isEnabled = False
         modified_workspace.resourceVersion = 1
+        modified_workspace.historySnapshotId = f"{modified_workspace.id}-0"
+        modified_workspace.historyChainLength = 1
         modified_workspace.user = create_admin_user().model_dump()
         modified_workspace.updatedWhen = FAKE_UPDATE_TIMESTAMP
 
@@ -768,6 +828,7 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         assert response.json()["operation"]["resourceId"] == SERVICE_ID
 
     # [POST] /workspaces/{workspace_id}/workspace-services
+    @patch("db.repositories.workspaces.AddressSpaceRepository.claim_address_spaces")
     @patch("api.routes.workspaces.ResourceHistoryRepository.save_item", return_value=AsyncMock())
     @patch("api.routes.workspaces.save_and_deploy_resource", return_value=sample_resource_operation(resource_id=SERVICE_ID, operation_id=OPERATION_ID))
     @patch("api.routes.workspaces.WorkspaceRepository.get_timestamp", return_value=FAKE_UPDATE_TIMESTAMP)
@@ -777,7 +838,7 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
     @patch("api.dependencies.workspaces.WorkspaceRepository.get_workspace_by_id")
     @patch("api.routes.workspaces.OperationRepository.resource_has_deployed_operation", return_value=True)
     @patch("api.routes.workspaces.WorkspaceServiceRepository.create_workspace_service_item")
-    async def test_post_workspace_services_creates_workspace_service_with_address_space(self, create_workspace_service_item_mock, __, get_workspace_mock, resource_template_repo, ___, update_item_mock, ____, _____, ______, app, client, workspace_service_input, basic_workspace_service_template, basic_resource_template):
+    async def test_post_workspace_services_creates_workspace_service_with_address_space(self, create_workspace_service_item_mock, __, get_workspace_mock, resource_template_repo, new_address_space_mock, update_item_mock, ____, _____, ______, claim_address_spaces_mock, app, client, workspace_service_input, basic_workspace_service_template, basic_resource_template):
         etag = "some-etag-value"
         workspace = sample_workspace()
         workspace.properties["address_spaces"] = ["192.168.0.1/24"]
@@ -791,6 +852,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_workspace = sample_workspace()
         modified_workspace.isEnabled = True
         modified_workspace.resourceVersion = 1
+        modified_workspace.historySnapshotId = f"{modified_workspace.id}-0"
+        modified_workspace.historyChainLength = 1
         modified_workspace.user = create_workspace_owner_user().model_dump()
         modified_workspace.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_workspace.properties["address_spaces"] = ["192.168.0.1/24", "10.1.4.0/24"]
@@ -800,6 +863,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         response = await client.post(app.url_path_for(strings.API_CREATE_WORKSPACE_SERVICE, workspace_id=WORKSPACE_ID), json=workspace_service_input)
 
         update_item_mock.assert_called_once_with(modified_workspace, etag)
+        new_address_space_mock.assert_called_once_with(WORKSPACE_ID, 24)
+        assert claim_address_spaces_mock.call_args.args[:2] == (WORKSPACE_ID, ["192.168.0.1/24", "10.1.4.0/24"])
         assert response.status_code == status.HTTP_202_ACCEPTED
         assert response.json()["operation"]["resourceId"] == SERVICE_ID
 
@@ -1053,6 +1118,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_user_resource = sample_user_resource_object()
         modified_user_resource.isEnabled = False
         modified_user_resource.resourceVersion = 1
+        modified_user_resource.historySnapshotId = f"{modified_user_resource.id}-0"
+        modified_user_resource.historyChainLength = 1
         modified_user_resource.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_user_resource.user = create_workspace_owner_user().model_dump()
 
@@ -1079,6 +1146,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_user_resource = sample_user_resource_object()
         modified_user_resource.isEnabled = True
         modified_user_resource.resourceVersion = 1
+        modified_user_resource.historySnapshotId = f"{modified_user_resource.id}-0"
+        modified_user_resource.historyChainLength = 1
         modified_user_resource.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_user_resource.user = create_workspace_owner_user().model_dump()
 
@@ -1106,6 +1175,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_user_resource = sample_user_resource_object()
         modified_user_resource.isEnabled = True
         modified_user_resource.resourceVersion = 1
+        modified_user_resource.historySnapshotId = f"{modified_user_resource.id}-0"
+        modified_user_resource.historyChainLength = 1
         modified_user_resource.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_user_resource.user = create_workspace_owner_user().model_dump()
         modified_user_resource.templateVersion = "2.0.0"
@@ -1134,6 +1205,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_user_resource = sample_user_resource_object()
         modified_user_resource.isEnabled = True
         modified_user_resource.resourceVersion = 1
+        modified_user_resource.historySnapshotId = f"{modified_user_resource.id}-0"
+        modified_user_resource.historyChainLength = 1
         modified_user_resource.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_user_resource.user = create_workspace_owner_user().model_dump()
 
@@ -1161,6 +1234,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_user_resource = sample_user_resource_object()
         modified_user_resource.isEnabled = True
         modified_user_resource.resourceVersion = 1
+        modified_user_resource.historySnapshotId = f"{modified_user_resource.id}-0"
+        modified_user_resource.historyChainLength = 1
         modified_user_resource.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_user_resource.user = create_workspace_owner_user().model_dump()
         modified_user_resource.templateVersion = "0.2.0"
@@ -1188,6 +1263,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_resource = sample_user_resource_object()
         modified_resource.isEnabled = False
         modified_resource.resourceVersion = 1
+        modified_resource.historySnapshotId = f"{modified_resource.id}-0"
+        modified_resource.historyChainLength = 1
         modified_resource.properties["vm_size"] = "large"
         modified_resource.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_resource.user = create_workspace_owner_user().model_dump()
@@ -1268,6 +1345,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_workspace_service = sample_workspace_service()
         modified_workspace_service.isEnabled = False
         modified_workspace_service.resourceVersion = 1
+        modified_workspace_service.historySnapshotId = f"{modified_workspace_service.id}-0"
+        modified_workspace_service.historyChainLength = 1
         modified_workspace_service.user = create_workspace_owner_user().model_dump()
         modified_workspace_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
 
@@ -1295,6 +1374,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_workspace_service = sample_workspace_service()
         modified_workspace_service.isEnabled = True
         modified_workspace_service.resourceVersion = 1
+        modified_workspace_service.historySnapshotId = f"{modified_workspace_service.id}-0"
+        modified_workspace_service.historyChainLength = 1
         modified_workspace_service.user = create_workspace_owner_user().model_dump()
         modified_workspace_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
 
@@ -1321,6 +1402,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_workspace_service = sample_workspace_service()
         modified_workspace_service.isEnabled = True
         modified_workspace_service.resourceVersion = 1
+        modified_workspace_service.historySnapshotId = f"{modified_workspace_service.id}-0"
+        modified_workspace_service.historyChainLength = 1
         modified_workspace_service.user = create_workspace_owner_user().model_dump()
         modified_workspace_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_workspace_service.templateVersion = "2.0.0"
@@ -1349,6 +1432,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_workspace_service = sample_workspace_service()
         modified_workspace_service.isEnabled = True
         modified_workspace_service.resourceVersion = 1
+        modified_workspace_service.historySnapshotId = f"{modified_workspace_service.id}-0"
+        modified_workspace_service.historyChainLength = 1
         modified_workspace_service.user = create_workspace_owner_user().model_dump()
         modified_workspace_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
 
@@ -1376,6 +1461,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerRights:
         modified_workspace_service = sample_workspace_service()
         modified_workspace_service.isEnabled = True
         modified_workspace_service.resourceVersion = 1
+        modified_workspace_service.historySnapshotId = f"{modified_workspace_service.id}-0"
+        modified_workspace_service.historyChainLength = 1
         modified_workspace_service.user = create_workspace_owner_user().model_dump()
         modified_workspace_service.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_workspace_service.templateVersion = "0.2.0"
@@ -1594,7 +1681,7 @@ class TestWorkspaceServiceRoutesThatRequireOwnerOrResearcherRights:
     @patch("api.dependencies.workspaces.WorkspaceRepository.get_workspace_by_id")
     @patch("api.routes.workspaces.OperationRepository.resource_has_deployed_operation", return_value=False)
     @patch("api.routes.workspaces.OperationRepository.create_operation_item")
-    async def test_post_user_resources_with_non_deployed_workspace_id_returns_404(self, get_deployed_workspace_by_workspace_id_mock, _, __, app, client, sample_user_resource_input_data):
+    async def test_post_user_resources_with_non_deployed_workspace_id_returns_404(self, _, __, get_deployed_workspace_by_workspace_id_mock, app, client, sample_user_resource_input_data):
         workspace = sample_workspace()
         get_deployed_workspace_by_workspace_id_mock.return_value = workspace
 
@@ -1681,6 +1768,8 @@ class TestWorkspaceServiceRoutesThatRequireOwnerOrResearcherRights:
         modified_user_resource = sample_user_resource_object()
         modified_user_resource.isEnabled = False
         modified_user_resource.resourceVersion = 1
+        modified_user_resource.historySnapshotId = f"{modified_user_resource.id}-0"
+        modified_user_resource.historyChainLength = 1
         modified_user_resource.updatedWhen = FAKE_UPDATE_TIMESTAMP
         modified_user_resource.user = create_workspace_researcher_user().model_dump()
 
@@ -1,7 +1,10 @@
+import copy
 from unittest.mock import AsyncMock, MagicMock, patch
-from azure.core.exceptions import AzureError
+from azure.core.exceptions import AzureError, ResourceNotFoundError
 import pytest
+from core import config
 from db import events
+from db.indexing import get_indexing_policy
 
 pytestmark = pytest.mark.asyncio
 
@@ -26,3 +29,63 @@ async def test_bootstrap_database_failure(cosmos_db_mgmt_client_mock, get_creden
     result = await events.bootstrap_database()
 
     assert result is False
+
+
+@patch("db.events.STATE_STORE_BACKEND", "memory")
+@patch("db.events.CosmosDBManagementClient")
+async def test_bootstrap_database_skips_containers_for_in_memory_state_store(cosmos_db_mgmt_client_mock):
+    result = await events.bootstrap_database()
+
+    assert result is True
+    cosmos_db_mgmt_client_mock.assert_not_called()
+
+
+@patch("db.events.get_credential")
+@patch("db.events.CosmosDBManagementClient")
+async def test_bootstrap_database_creates_missing_containers_with_their_indexing_policy(cosmos_db_mgmt_client_mock, _):
+    sql_resources = cosmos_db_mgmt_client_mock.return_value.sql_resources
+    sql_resources.get_sql_container.side_effect = ResourceNotFoundError("not found")
+
+    await events.bootstrap_database()
+
+    parameters = {call.kwargs["container_name"]: call.kwargs["create_update_sql_container_parameters"] for call in sql_resources.begin_create_update_sql_container.call_args_list}
+    assert set(parameters) == set(config.STATE_STORE_PARTITION_KEYS)
+    assert parameters[config.STATE_STORE_AIRLOCK_REQUESTS_CONTAINER]["resource"]["indexing_policy"] == get_indexing_policy(config.STATE_STORE_AIRLOCK_REQUESTS_CONTAINER)
+
+
+@patch("db.events.get_credential")
+@patch("db.events.CosmosDBManagementClient")
+async def test_bootstrap_database_only_updates_containers_whose_indexing_policy_differs(cosmos_db_mgmt_client_mock, _):
+    def get_sql_container(container_name, **kwargs):
+        current_policy = copy.deepcopy(get_indexing_policy(container_name))
+        current_policy["excluded_paths"].append({"path": '/"_etag"/?'})
+        if container_name == config.STATE_STORE_AIRLOCK_REQUESTS_CONTAINER:
+            current_policy["composite_indexes"] = []
+        container = MagicMock()
+        container.resource.indexing_policy.as_dict.return_value = current_policy
+        return container
+
+    sql_resources = cosmos_db_mgmt_client_mock.return_value.sql_resources
+    sql_resources.get_sql_container.side_effect = get_sql_container
+
+    await events.bootstrap_database()
+
+    sql_resources.begin_create_update_sql_container.assert_called_once()
+    assert sql_resources.begin_create_update_sql_container.call_args.kwargs["container_name"] == config.STATE_STORE_AIRLOCK_REQUESTS_CONTAINER
+
+
+@patch("db.events.get_credential")
+@patch("db.events.CosmosDBManagementClient")
+async def test_bootstrap_database_creates_workspace_partitioned_containers_with_a_hierarchical_partition_key(cosmos_db_mgmt_client_mock, _):
+    sql_resources = cosmos_db_mgmt_client_mock.return_value.sql_resources
+    sql_resources.get_sql_container.side_effect = ResourceNotFoundError()
+    partition_keys = {"ResourcesByWorkspace": config.WORKSPACE_PARTITION_KEY, "Templates": "/id"}
+
+    with patch("db.events.STATE_STORE_PARTITION_KEYS", partition_keys):
+        await events.bootstrap_database()
+
+    created = {call.kwargs["container_name"]: call.kwargs["create_update_sql_container_parameters"]["resource"]["partition_key"] for call in sql_resources.begin_create_update_sql_container.call_args_list}
+    assert created == {
+        "ResourcesByWorkspace": {"paths": ["/partitionKey", "/id"], "kind": "MultiHash", "version": 2},
+        "Templates": {"paths": ["/id"], "kind": "Hash"}
+    }
@@ -0,0 +1,43 @@
+from core import config
+from db.indexing import OPERATIONS_INDEXING_POLICY, RESOURCES_INDEXING_POLICY, composite_index, get_indexing_policy, indexing_policy, indexing_policy_changes, merge_indexing_policies
+
+
+def test_indexing_policy_changes_is_empty_for_an_equivalent_policy():
+    desired = indexing_policy(excluded_paths=["/properties/*"], composite_indexes=[composite_index("/workspaceId", "/createdWhen")])
+    # as returned by Cosmos DB, which adds the etag exclusion
+    current = {
+        "indexing_mode": "Consistent",
+        "automatic": True,
+        "included_paths": [{"path": "/*"}],
+        "excluded_paths": [{"path": '/"_etag"/?'}, {"path": "/properties/*"}],
+        "composite_indexes": [[{"path": "/workspaceId", "order": "Ascending"}, {"path": "/createdWhen", "order": "Ascending"}]]
+    }
+
+    assert indexing_policy_changes(current, desired) == []
+
+
+def test_indexing_policy_changes_describes_the_differences():
+    desired = indexing_policy(excluded_paths=["/properties/*"], composite_indexes=[composite_index("/workspaceId", "/createdWhen")])
+    current = indexing_policy(excluded_paths=["/history/*"])
+
+    assert indexing_policy_changes(current, desired) == [
+        "excluded paths: add /properties/*",
+        "excluded paths: remove /history/*",
+        "composite indexes: add (/workspaceId ascending, /createdWhen ascending)"
+    ]
+    assert indexing_policy_changes(None, desired) == ["create the container"]
+
+
+def test_get_indexing_policy_excludes_request_properties_and_history():
+    policy = get_indexing_policy(config.STATE_STORE_AIRLOCK_REQUESTS_CONTAINER)
+
+    assert {path["path"] for path in policy["excluded_paths"]} == {"/properties/*", "/history/*"}
+    assert composite_index("/workspaceId", "/status", "/createdWhen") in policy["composite_indexes"]
+    assert get_indexing_policy(config.STATE_STORE_MIGRATIONS_CONTAINER) == indexing_policy()
+
+
+def test_merge_indexing_policies_keeps_the_exclusions_and_composite_indexes_of_each():
+    policy = merge_indexing_policies(RESOURCES_INDEXING_POLICY, OPERATIONS_INDEXING_POLICY, RESOURCES_INDEXING_POLICY)
+
+    assert policy["excluded_paths"] == [{"path": "/properties/*"}]
+    assert policy["composite_indexes"] == OPERATIONS_INDEXING_POLICY["composite_indexes"]
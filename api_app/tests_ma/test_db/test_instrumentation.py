@@ -0,0 +1,132 @@
+import pytest
+from mock import MagicMock, patch
+from azure.cosmos import http_constants
+
+from db.instrumentation import record_cosmos_response
+from db.repositories.base import BaseRepository
+
+pytestmark = pytest.mark.asyncio
+
+
+def cosmos_response(request_charge, item_count=None, status_code=200):
+    headers = {http_constants.HttpHeaders.RequestCharge: str(request_charge)}
+    if item_count is not None:
+        headers[http_constants.HttpHeaders.ItemCount] = str(item_count)
+    response = MagicMock()
+    response.http_response.headers = headers
+    response.http_response.status_code = status_code
+    return response
+
+
+class FakeRepository(BaseRepository):
+    async def read_things(self):
+        record_cosmos_response(cosmos_response(5, status_code=429))
+        record_cosmos_response(cosmos_response(10))
+        return await self.query_things()
+
+    async def query_things(self):
+        record_cosmos_response(cosmos_response(2.5, item_count=3))
+        return ["a", "b", "c"]
+
+    async def page_things(self):
+        for items in (["a", "b"], ["c"]):
+            record_cosmos_response(cosmos_response(4, item_count=len(items)))
+            yield items
+
+    async def no_cosmos_requests(self):
+        return None
+
+    async def _private_read(self):
+        record_cosmos_response(cosmos_response(1))
+
+
+@pytest.fixture
+def histograms():
+    with patch("db.instrumentation.request_charge_histogram") as request_charge_histogram, \
+            patch("db.instrumentation.duration_histogram") as duration_histogram:
+        yield request_charge_histogram, duration_histogram
+
+
+@pytest.fixture
+def tracer_mock():
+    with patch("db.instrumentation.tracer") as tracer_mock:
+        yield tracer_mock
+
+
+def span_attributes(tracer_mock, call_index=0):
+    return tracer_mock.start_span.call_args_list[call_index].kwargs["attributes"]
+
+
+async def test_call_records_charge_of_nested_repository_methods_once(histograms, tracer_mock):
+    request_charge_histogram, duration_histogram = histograms
+
+    assert await FakeRepository().read_things() == ["a", "b", "c"]
+
+    request_charge_histogram.record.assert_called_once_with(17.5, {"repository": "FakeRepository", "method": "read_things"})
+    duration_histogram.record.assert_called_once()
+    tracer_mock.start_span.assert_called_once()
+    assert tracer_mock.start_span.call_args.args[0] == "FakeRepository.read_things"
+    attributes = span_attributes(tracer_mock)
+    assert (attributes["cosmosdb.request_count"], attributes["cosmosdb.item_count"], attributes["cosmosdb.page_count"], attributes["cosmosdb.throttled_count"]) == (3, 3, 1, 1)
+    tracer_mock.start_span.return_value.end.assert_called_once()
+
+
+async def test_generator_records_pages_but_not_calls_made_while_consuming_them(histograms, tracer_mock):
+    request_charge_histogram, _ = histograms
+    repo = FakeRepository()
+
+    pages = []
+    async for page in repo.page_things():
+        pages.append(page)
+        await repo.query_things()
+
+    assert pages == [["a", "b"], ["c"]]
+    recorded = [(c.args[1]["method"], c.args[0]) for c in request_charge_histogram.record.call_args_list]
+    assert recorded == [("query_things", 2.5), ("query_things", 2.5), ("page_things", 8.0)]
+    attributes = span_attributes(tracer_mock, 2)
+    assert (attributes["cosmosdb.item_count"], attributes["cosmosdb.page_count"]) == (3, 2)
+
+
+async def test_call_without_cosmos_requests_is_not_recorded(histograms, tracer_mock):
+    request_charge_histogram, _ = histograms
+
+    await FakeRepository().no_cosmos_requests()
+
+    request_charge_histogram.record.assert_not_called()
+    tracer_mock.start_span.assert_not_called()
+
+
+async def test_private_methods_are_not_instrumented(histograms, tracer_mock):
+    request_charge_histogram, _ = histograms
+
+    await FakeRepository()._private_read()
+
+    request_charge_histogram.record.assert_not_called()
+
+
+@patch("db.instrumentation.logger.warning")
+async def test_call_above_request_charge_threshold_is_logged(logging_mock, histograms, tracer_mock):
+    with patch("core.config.COSMOS_REQUEST_CHARGE_LOG_THRESHOLD", 10):
+        await FakeRepository().query_things()
+        logging_mock.assert_not_called()
+
+        await FakeRepository().read_things()
+
+    logging_mock.assert_called_once()
+    assert logging_mock.call_args.args[0].startswith("FakeRepository.read_things used 17.5 RU")
+
+
+async def test_failed_call_records_exception_on_span(histograms, tracer_mock):
+    class FailingRepository(BaseRepository):
+        async def fail(self):
+            record_cosmos_response(cosmos_response(1, status_code=429))
+            raise ValueError("throttled")
+
+    with pytest.raises(ValueError):
+        await FailingRepository().fail()
+
+    tracer_mock.start_span.return_value.record_exception.assert_called_once()
+
+
+async def test_response_outside_repository_call_is_ignored():
+    record_cosmos_response(cosmos_response(1))
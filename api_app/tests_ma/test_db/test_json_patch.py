@@ -0,0 +1,39 @@
+import pytest
+
+from db.json_patch import apply_patch, make_patch
+
+
+def test_make_patch_compares_objects_key_by_key():
+    source = {"a": 1, "b": {"c": "x", "d": [1, 2]}, "removed": True}
+    target = {"a": 1, "b": {"c": "y", "d": [1, 2, 3]}, "added": None}
+
+    assert make_patch(source, target) == [
+        {"op": "remove", "path": "/removed"},
+        {"op": "replace", "path": "/b/c", "value": "y"},
+        {"op": "replace", "path": "/b/d", "value": [1, 2, 3]},
+        {"op": "add", "path": "/added", "value": None}
+    ]
+
+
+def test_make_patch_replaces_values_only_equal_in_python():
+    assert make_patch({"a": 1, "b": [0]}, {"a": True, "b": [0.0]}) == [
+        {"op": "replace", "path": "/a", "value": True},
+        {"op": "replace", "path": "/b", "value": [0.0]}
+    ]
+
+
+@pytest.mark.parametrize("source, target", [
+    ({}, {"a/b": {"~c": 1}}),
+    ({"a": {"b": {"c": 1}}}, {"a": {"b": "c"}}),
+    ({"a": "b", "c": {"d": 1}}, {}),
+])
+def test_apply_patch_reverses_make_patch(source, target):
+    assert apply_patch(source, make_patch(source, target)) == target
+
+
+def test_apply_patch_does_not_change_document():
+    document = {"a": {"b": 1}}
+
+    apply_patch(document, [{"op": "replace", "path": "/a/b", "value": 2}])
+
+    assert document == {"a": {"b": 1}}
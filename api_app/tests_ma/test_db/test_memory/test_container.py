@@ -0,0 +1,208 @@
+import pytest
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosBatchOperationError, CosmosHttpResponseError, CosmosResourceExistsError, CosmosResourceNotFoundError
+
+from db.memory.container import InMemoryContainer, InMemoryDatabase
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def container():
+    return InMemoryContainer("History", "/resourceId")
+
+
+async def test_create_and_read_item(container):
+    created = await container.create_item(body={"id": "1", "resourceId": "r1", "value": 1})
+
+    read = await container.read_item(item="1", partition_key="r1")
+
+    assert read == created
+    assert read["value"] == 1 and "_etag" in read
+
+
+async def test_read_item_in_other_partition_raises_not_found(container):
+    await container.create_item(body={"id": "1", "resourceId": "r1"})
+
+    with pytest.raises(CosmosResourceNotFoundError):
+        await container.read_item(item="1", partition_key="r2")
+
+
+async def test_create_existing_item_raises_conflict(container):
+    await container.create_item(body={"id": "1", "resourceId": "r1"})
+
+    with pytest.raises(CosmosResourceExistsError):
+        await container.create_item(body={"id": "1", "resourceId": "r1"})
+
+
+async def test_stored_item_is_not_changed_through_references(container):
+    body = {"id": "1", "resourceId": "r1", "tags": []}
+    read = await container.create_item(body=body)
+    body["tags"].append("a")
+    read["tags"].append("b")
+
+    assert (await container.read_item(item="1", partition_key="r1"))["tags"] == []
+
+
+async def test_replace_item_checks_etag(container):
+    created = await container.create_item(body={"id": "1", "resourceId": "r1", "value": 1})
+    replaced = await container.replace_item(item="1", body={"id": "1", "resourceId": "r1", "value": 2}, etag=created["_etag"], match_condition=MatchConditions.IfNotModified)
+
+    assert replaced["_etag"] != created["_etag"]
+    with pytest.raises(CosmosAccessConditionFailedError):
+        await container.replace_item(item="1", body={"id": "1", "resourceId": "r1", "value": 3}, etag=created["_etag"], match_condition=MatchConditions.IfNotModified)
+    assert (await container.read_item(item="1", partition_key="r1"))["value"] == 2
+
+
+async def test_patch_item_applies_operations_and_checks_etag(container):
+    created = await container.create_item(body={"id": "1", "resourceId": "r1", "status": "a", "steps": [{"status": "a"}, {"status": "a"}], "count": 1, "old": True})
+    patched = await container.patch_item(item="1", partition_key="r1", patch_operations=[
+        {"op": "set", "path": "/status", "value": "b"},
+        {"op": "set", "path": "/steps/1/status", "value": "b"},
+        {"op": "add", "path": "/properties", "value": {"a/b": 1}},
+        {"op": "incr", "path": "/count", "value": 2},
+        {"op": "remove", "path": "/old"}
+    ], etag=created["_etag"], match_condition=MatchConditions.IfNotModified)
+
+    assert {key: value for key, value in patched.items() if not key.startswith("_")} == {"id": "1", "resourceId": "r1", "status": "b", "steps": [{"status": "a"}, {"status": "b"}], "count": 3, "properties": {"a/b": 1}}
+    await container.patch_item(item="1", partition_key="r1", patch_operations=[{"op": "set", "path": "/properties/a~1b", "value": 2}])
+    assert (await container.read_item(item="1", partition_key="r1"))["properties"] == {"a/b": 2}
+    with pytest.raises(CosmosAccessConditionFailedError):
+        await container.patch_item(item="1", partition_key="r1", patch_operations=[{"op": "set", "path": "/status", "value": "c"}], etag=created["_etag"], match_condition=MatchConditions.IfNotModified)
+
+
+async def test_patch_item_applies_all_operations_or_none(container):
+    await container.create_item(body={"id": "1", "resourceId": "r1", "status": "a"})
+
+    with pytest.raises(CosmosHttpResponseError):
+        await container.patch_item(item="1", partition_key="r1", patch_operations=[{"op": "set", "path": "/status", "value": "b"}, {"op": "replace", "path": "/missing", "value": 1}])
+
+    assert (await container.read_item(item="1", partition_key="r1"))["status"] == "a"
+
+
+async def test_execute_item_batch_applies_operations_in_a_partition(container):
+    created = await container.create_item(body={"id": "1", "resourceId": "r1", "status": "a"})
+
+    results = await container.execute_item_batch(batch_operations=[
+        ("patch", ("1", [{"op": "set", "path": "/status", "value": "b"}]), {"if_match_etag": created["_etag"]}),
+        ("create", ({"id": "2", "resourceId": "r1"},)),
+        ("read", ("1",))
+    ], partition_key="r1")
+
+    assert [result["statusCode"] for result in results] == [200, 200, 200]
+    assert results[2]["resourceBody"]["status"] == "b" and results[2]["eTag"] == results[0]["eTag"] != created["_etag"]
+    assert (await container.read_item(item="2", partition_key="r1"))["id"] == "2"
+
+
+async def test_execute_item_batch_applies_all_operations_or_none(container):
+    created = await container.create_item(body={"id": "1", "resourceId": "r1", "status": "a"})
+    await container.patch_item(item="1", partition_key="r1", patch_operations=[{"op": "set", "path": "/status", "value": "b"}])
+
+    with pytest.raises(CosmosBatchOperationError) as error:
+        await container.execute_item_batch(batch_operations=[
+            ("create", ({"id": "2", "resourceId": "r1"},)),
+            ("patch", ("1", [{"op": "set", "path": "/status", "value": "c"}]), {"if_match_etag": created["_etag"]})
+        ], partition_key="r1")
+
+    assert (error.value.error_index, error.value.status_code) == (1, 412)
+    assert (await container.read_item(item="1", partition_key="r1"))["status"] == "b"
+    with pytest.raises(CosmosResourceNotFoundError):
+        await container.read_item(item="2", partition_key="r1")
+
+
+async def test_upsert_item_creates_and_replaces(container):
+    await container.upsert_item(body={"id": "1", "resourceId": "r1", "value": 1})
+    await container.upsert_item(body={"id": "1", "resourceId": "r1", "value": 2})
+
+    assert (await container.read_item(item="1", partition_key="r1"))["value"] == 2
+
+
+async def test_upsert_item_calls_response_hook(container):
+    responses = []
+
+    await container.upsert_item(body={"id": "1", "resourceId": "r1"}, response_hook=lambda headers, result: responses.append(headers))
+
+    assert responses[0]["x-ms-request-charge"] == "0"
+
+
+async def test_delete_item(container):
+    await container.create_item(body={"id": "1", "resourceId": "r1"})
+
+    await container.delete_item(item="1", partition_key="r1")
+
+    with pytest.raises(CosmosResourceNotFoundError):
+        await container.delete_item(item="1", partition_key="r1")
+
+
+async def test_query_items_within_partition(container):
+    for i, resource_id in enumerate(["r1", "r2", "r1"]):
+        await container.create_item(body={"id": str(i), "resourceId": resource_id})
+
+    items = [i async for i in container.query_items(query="SELECT c.id FROM c", partition_key="r1")]
+
+    assert items == [{"id": "0"}, {"id": "2"}]
+
+
+async def test_query_items_by_page_resumes_from_continuation_token(container):
+    for i in range(5):
+        await container.create_item(body={"id": str(i), "resourceId": "r1"})
+
+    pages = container.query_items(query="SELECT VALUE c.id FROM c", max_item_count=2).by_page()
+    first_page = [i async for i in await pages.__anext__()]
+    resumed = container.query_items(query="SELECT VALUE c.id FROM c", max_item_count=2).by_page(pages.continuation_token)
+    remaining = [[i async for i in page] async for page in resumed]
+
+    assert first_page == ["0", "1"]
+    assert remaining == [["2", "3"], ["4"]]
+    assert resumed.continuation_token is None
+
+
+async def test_query_items_by_page_resumes_after_the_last_item_read_when_items_are_removed(container):
+    for i in range(5):
+        await container.create_item(body={"id": str(i), "resourceId": "r1"})
+
+    pages = container.query_items(query="SELECT VALUE c.id FROM c", max_item_count=2).by_page()
+    first_page = [i async for i in await pages.__anext__()]
+    for item_id in first_page:
+        await container.delete_item(item=item_id, partition_key="r1")
+    resumed = container.query_items(query="SELECT VALUE c.id FROM c", max_item_count=2).by_page(pages.continuation_token)
+
+    assert [[i async for i in page] async for page in resumed] == [["2", "3"], ["4"]]
+
+
+async def test_query_items_with_invalid_continuation_token_raises_bad_request(container):
+    pages = container.query_items(query="SELECT * FROM c").by_page("not-a-token")
+
+    with pytest.raises(CosmosHttpResponseError) as e:
+        await pages.__anext__()
+    assert e.value.status_code == 400
+
+
+async def test_unsupported_query_raises_bad_request(container):
+    with pytest.raises(CosmosHttpResponseError):
+        [i async for i in container.query_items(query="SELECT * FROM c GROUP BY c.id")]
+
+
+async def test_hierarchical_partition_key_reads_items_and_scopes_queries_to_a_prefix():
+    container = InMemoryContainer("Resources", ["/partitionKey", "/id"])
+    await container.create_item(body={"id": "1", "partitionKey": "ws-1"})
+    await container.create_item(body={"id": "2", "partitionKey": "ws-1"})
+    await container.create_item(body={"id": "3", "partitionKey": "ws-2"})
+
+    assert await container.read_item(item="1", partition_key=["ws-1", "1"])
+    with pytest.raises(CosmosResourceNotFoundError):
+        await container.read_item(item="1", partition_key=["ws-2", "1"])
+    items = [i async for i in container.query_items(query="SELECT c.id FROM c", partition_key=["ws-1"])]
+    assert items == [{"id": "1"}, {"id": "2"}]
+    await container.delete_item(item="3", partition_key=["ws-2", "3"])
+    assert [i async for i in container.query_items(query="SELECT c.id FROM c", partition_key=["ws-2"])] == []
+
+
+async def test_database_creates_containers_with_their_partition_key():
+    database = InMemoryDatabase({"History": "/resourceId"})
+
+    history = database.get_container_client("History")
+    await history.create_item(body={"id": "1", "resourceId": "r1"})
+
+    assert database.get_container_client("History") is history
+    assert await history.read_item(item="1", partition_key="r1")
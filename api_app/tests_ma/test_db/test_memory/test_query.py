@@ -0,0 +1,76 @@
+import pytest
+
+from db.memory.query import QuerySyntaxError, parse_query
+
+ITEMS = [
+    {"id": "1", "resourceType": "workspace", "deploymentStatus": "deployed", "resourcePath": "/workspaces/1", "properties": {"address_space": "10.1.4.0/24"}, "depth": 2},
+    {"id": "2", "resourceType": "workspace", "deploymentStatus": "deleted", "resourcePath": "/workspaces/2", "properties": {}, "depth": 2},
+    {"id": "3", "resourceType": "workspace-service", "deploymentStatus": "deployed", "resourcePath": "/workspaces/1/workspace-services/3", "workspaceId": "1", "depth": 4},
+    {"id": "4", "resourceType": "shared-service", "resourcePath": "/shared-services/4", "depth": None},
+]
+
+
+def parameters(**values):
+    return [{"name": f"@{name}", "value": value} for name, value in values.items()]
+
+
+def ids(results):
+    return [r["id"] for r in results]
+
+
+def test_where_with_parameters():
+    query = parse_query('SELECT * FROM c WHERE c.deploymentStatus != @deletedStatus AND c.resourceType = @resourceType')
+
+    assert ids(query.execute(ITEMS, parameters(deletedStatus="deleted", resourceType="workspace"))) == ["1"]
+
+
+def test_comparison_with_missing_property_never_matches():
+    query = parse_query('SELECT * FROM c WHERE c.deploymentStatus != @deletedStatus')
+
+    assert ids(query.execute(ITEMS, parameters(deletedStatus="deleted"))) == ["1", "3"]
+
+
+def test_string_literals_and_lower_case_keywords():
+    query = parse_query("select * from c where c.resourceType = 'workspace' and c.id = \"2\"")
+
+    assert ids(query.execute(ITEMS)) == ["2"]
+
+
+def test_or_and_parentheses():
+    query = parse_query('SELECT * FROM c WHERE c.resourceType = "shared-service" OR (c.resourceType = "workspace" AND NOT (c.deploymentStatus = "deleted"))')
+
+    assert ids(query.execute(ITEMS)) == ["1", "4"]
+
+
+def test_order_by_top_and_projection():
+    query = parse_query('SELECT TOP 2 c.id, c.properties.address_space FROM c WHERE c.resourceType = "workspace" ORDER BY c.id DESC')
+
+    assert query.execute(ITEMS) == [{"id": "2"}, {"id": "1", "address_space": "10.1.4.0/24"}]
+
+
+def test_order_by_sorts_undefined_and_null_first():
+    query = parse_query('SELECT VALUE c.id FROM c ORDER BY c.depth ASC')
+
+    assert query.execute([{"id": "a", "depth": 4}, {"id": "b"}, {"id": "c", "depth": None}, {"id": "d", "depth": 2}]) == ["b", "c", "d", "a"]
+
+
+def test_select_value():
+    query = parse_query('SELECT VALUE c.properties.address_space FROM c')
+
+    assert query.execute(ITEMS) == ["10.1.4.0/24"]
+
+
+@pytest.mark.parametrize("query, expected_ids", [
+    ('SELECT * FROM c WHERE CONTAINS(c.resourcePath, @path)', ["1", "3"]),
+    ('SELECT * FROM c WHERE STARTSWITH(c.resourcePath, @path)', ["1", "3"]),
+    ('SELECT * FROM c WHERE ARRAY_CONTAINS(@ids, c.id)', ["2", "4"]),
+    ('SELECT * FROM c WHERE IS_DEFINED(c[@field])', ["3"]),
+    ('SELECT * FROM c WHERE c.depth >= 4', ["3"]),
+])
+def test_functions_and_operators(query, expected_ids):
+    assert ids(parse_query(query).execute(ITEMS, parameters(path="/workspaces/1", ids=["2", "4"], field="workspaceId"))) == expected_ids
+
+
+def test_unsupported_query_raises_syntax_error():
+    with pytest.raises(QuerySyntaxError):
+        parse_query('SELECT * FROM c JOIN t IN c.tags')
@@ -0,0 +1,354 @@
+import time
+
+import pytest
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+from mock import patch
+
+from api.dependencies.database import Database
+from core import config
+from db.errors import EntityDoesNotExist, InvalidInput
+from db.migrations.runner import BulkMigrationRunner
+from db.repositories.address_spaces import AddressSpaceRepository
+from db.repositories.base import BaseRepository
+from db.repositories.migrations import MigrationRepository
+from db.repositories.operations import OperationRepository
+from db.repositories.resources import ResourceRepository
+from db.repositories.workspace_services import WorkspaceServiceRepository
+from db.repositories.workspaces import WorkspaceRepository
+from models.domain.operation import Operation, OperationStep, Status
+from models.domain.workspace import Workspace
+from models.domain.workspace_service import WorkspaceService
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.usefixtures("in_memory_database")]
+
+
+def workspace(workspace_id: str, **kwargs) -> Workspace:
+    return Workspace(id=workspace_id, templateName="tre-workspace-base", templateVersion="0.1.0", etag="", properties=kwargs.pop("properties", {}), resourcePath=f"/workspaces/{workspace_id}", **kwargs)
+
+
+async def test_workspace_repository_reads_saved_workspaces():
+    workspace_repo = await WorkspaceRepository.create()
+    await workspace_repo.save_item(workspace("ws-1"))
+    await workspace_repo.save_item(workspace("ws-2", deploymentStatus=Status.Deleted))
+
+    assert (await workspace_repo.get_workspace_by_id("ws-1")).id == "ws-1"
+    with pytest.raises(EntityDoesNotExist):
+        await workspace_repo.get_workspace_by_id("ws-2")
+    assert [w.id for w in await workspace_repo.get_active_workspaces()] == ["ws-1"]
+
+
+async def test_workspace_repository_pages_active_workspaces():
+    workspace_repo = await WorkspaceRepository.create()
+    for i in range(5):
+        await workspace_repo.save_item(workspace(f"ws-{i}"))
+
+    first_page, continuation_token = await workspace_repo.get_active_workspaces_page(page_size=3)
+    second_page, last_token = await workspace_repo.get_active_workspaces_page(page_size=3, continuation_token=continuation_token)
+
+    assert [w.id for w in first_page + second_page] == [f"ws-{i}" for i in range(5)]
+    assert last_token is None
+    with pytest.raises(InvalidInput):
+        await workspace_repo.get_active_workspaces_page(continuation_token="not-a-token")
+
+
+async def test_workspace_repository_projects_active_workspace_address_spaces():
+    workspace_repo = await WorkspaceRepository.create()
+    await workspace_repo.save_item(workspace("ws-1", properties={"address_space": "10.1.1.0/24", "address_spaces": ["10.1.1.0/24"]}))
+    await workspace_repo.save_item(workspace("ws-2"))
+
+    address_spaces = await workspace_repo.get_active_workspace_address_spaces()
+
+    assert [(a.id, a.address_space, a.address_spaces) for a in address_spaces] == [("ws-1", "10.1.1.0/24", ["10.1.1.0/24"]), ("ws-2", None, [])]
+
+
+async def test_address_space_repository_allocates_distinct_address_spaces():
+    address_space_repo = await AddressSpaceRepository.create()
+
+    async def no_workspaces():
+        return []
+
+    with patch("core.config.CORE_ADDRESS_SPACE", "10.1.0.0/22"), patch("core.config.TRE_ADDRESS_SPACE", "10.1.0.0/16"):
+        first = await address_space_repo.allocate_address_space("ws-1", 24, no_workspaces)
+        second = await address_space_repo.allocate_address_space("ws-2", 24, no_workspaces)
+
+    assert first != second
+    allocations, etag = await address_space_repo.get_allocations(no_workspaces)
+    assert [a["workspaceId"] for a in allocations] == ["ws-1", "ws-2"]
+    assert etag is not None
+
+
+async def test_operation_step_status_is_patched_conditionally_on_the_etag():
+    operations_repo = await OperationRepository.create()
+    operation = Operation(id="op-1", resourceId="ws-1", resourcePath="/workspaces/ws-1", action="install", steps=[
+        OperationStep(id=f"step-{i}", templateStepId=f"step-{i}", resourceId="ws-1", resourceTemplateName="base", resourceType="workspace", resourceAction="install", sourceTemplateResourceId="ws-1") for i in range(2)
+    ])
+    await operations_repo.save_item(operation)
+    read_operation, etag = await operations_repo.get_operation_and_etag_by_id("op-1")
+
+    read_operation.status = read_operation.steps[1].status = Status.Deployed
+    read_operation.message = read_operation.steps[1].message = "done"
+    new_etag = await operations_repo.update_operation_step_status(read_operation, 1, etag)
+
+    updated, updated_etag = await operations_repo.get_operation_and_etag_by_id("op-1")
+    assert updated_etag == new_etag != etag
+    assert (updated.status, updated.message) == (Status.Deployed, "done")
+    assert [(step.status, step.message) for step in updated.steps] == [(None, ""), (Status.Deployed, "done")]
+    with pytest.raises(CosmosAccessConditionFailedError):
+        await operations_repo.update_operation_step_status(read_operation, 1, etag)
+
+
+async def test_resource_deployment_status_and_outputs_are_patched_without_overwriting_other_properties():
+    resource_repo = await ResourceRepository.create()
+    await resource_repo.save_item(workspace("ws-1", properties={"display_name": "before"}))
+    # written after the deployment status updater read the resource, so must be kept
+    await resource_repo.patch_item_by_id("ws-1", [{"op": "set", "path": "/properties/display_name", "value": "after"}])
+
+    updated = await resource_repo.update_deployment_status("ws-1", Status.Deployed)
+    await resource_repo.update_outputs("ws-1", {"output/1": "a", **{f"output{i}": i for i in range(2, 13)}})
+
+    assert isinstance(updated, Workspace) and updated.deploymentStatus == Status.Deployed
+    properties = (await resource_repo.get_resource_by_id("ws-1")).properties
+    assert properties == {"display_name": "after", "output/1": "a", **{f"output{i}": i for i in range(2, 13)}}
+    with pytest.raises(EntityDoesNotExist):
+        await resource_repo.update_deployment_status("missing", Status.Deployed)
+
+
+@pytest.fixture
+def workspace_partitioned_resources():
+    partition_keys = {**config.STATE_STORE_PARTITION_KEYS, config.STATE_STORE_RESOURCES_CONTAINER: config.WORKSPACE_PARTITION_KEY}
+    with patch("api.dependencies.database.STATE_STORE_PARTITION_KEYS", partition_keys), \
+            patch.object(ResourceRepository, "partitioned_by_workspace", True), \
+            patch.dict(config.STATE_STORE_ID_PARTITIONED_CONTAINERS, {config.STATE_STORE_RESOURCES_CONTAINER: "LegacyResources"}):
+        yield
+
+
+def workspace_service(service_id: str, workspace_id: str) -> WorkspaceService:
+    return WorkspaceService(id=service_id, workspaceId=workspace_id, templateName="tre-service-guacamole", templateVersion="0.1.0", etag="", properties={}, resourcePath=f"/workspaces/{workspace_id}/workspace-services/{service_id}")
+
+
+@pytest.mark.usefixtures("workspace_partitioned_resources")
+async def test_workspace_partitioned_resources_are_read_within_their_workspace():
+    workspace_repo = await WorkspaceRepository.create()
+    service_repo = await WorkspaceServiceRepository.create()
+    await workspace_repo.save_item(workspace("ws-1"))
+    await service_repo.save_item(workspace_service("svc-1", "ws-1"))
+    await service_repo.save_item(workspace_service("svc-2", "ws-2"))
+
+    assert (await workspace_repo.get_workspace_by_id("ws-1")).id == "ws-1"
+    assert (await service_repo.get_workspace_service_by_id("ws-1", "svc-1")).id == "svc-1"
+    with pytest.raises(EntityDoesNotExist):
+        await service_repo.get_workspace_service_by_id("ws-1", "svc-2")
+    # a read without the workspace queries for the id instead
+    assert (await service_repo.get_resource_by_id("svc-2")).workspaceId == "ws-2"
+
+    with patch.object(service_repo.container, "query_items", wraps=service_repo.container.query_items) as query_items:
+        services = await service_repo.get_active_workspace_services_for_workspace("ws-1")
+    assert [s.id for s in services] == ["svc-1"]
+    assert query_items.call_args.kwargs["partition_key"] == ["ws-1"]
+
+
+@pytest.mark.usefixtures("workspace_partitioned_resources")
+async def test_workspace_partitioning_migration_copies_items_without_overwriting_newer_ones():
+    legacy_resources = await Database().get_container_proxy("LegacyResources")
+    await legacy_resources.create_item(body=workspace("ws-1").model_dump())
+    await legacy_resources.create_item(body=workspace_service("svc-1", "ws-1").model_dump())
+    await legacy_resources.create_item(body={**workspace_service("svc-2", "ws-1").model_dump(), "templateVersion": "0.1.0"})
+    service_repo = await WorkspaceServiceRepository.create()
+    # written by the API after it switched to the workspace partitioned container
+    await service_repo.save_item(workspace_service("svc-2", "ws-1").model_copy(update={"templateVersion": "0.2.0"}))
+
+    runner = BulkMigrationRunner(await MigrationRepository.create(), max_concurrency=2, time_limit=60)
+    [checkpoint] = await runner.run(await service_repo.repartitioning_migrations())
+
+    assert checkpoint.id == "partition-by-workspace-LegacyResources" and checkpoint.documentsRead == 3
+    assert (await service_repo.get_workspace_service_by_id("ws-1", "svc-1")).id == "svc-1"
+    assert (await service_repo.get_workspace_service_by_id("ws-1", "svc-2")).templateVersion == "0.2.0"
+    assert (await service_repo.read_item_by_id("ws-1", ["ws-1", "ws-1"]))["partitionKey"] == "ws-1"
+
+
+@pytest.fixture
+def colocated_operations():
+    partition_keys = {**config.STATE_STORE_PARTITION_KEYS, "ResourcesWithOperations": config.RESOURCE_PARTITION_KEY}
+    with patch("api.dependencies.database.STATE_STORE_PARTITION_KEYS", partition_keys), \
+            patch("core.config.STATE_STORE_RESOURCES_CONTAINER", "ResourcesWithOperations"), \
+            patch("core.config.STATE_STORE_OPERATIONS_CONTAINER", "ResourcesWithOperations"), \
+            patch.object(ResourceRepository, "colocated_with_operations", True), \
+            patch.object(OperationRepository, "colocated_with_resources", True), \
+            patch.object(ResourceRepository, "partitioned_by_workspace", False), \
+            patch.object(OperationRepository, "partitioned_by_workspace", False):
+        yield
+
+
+def install_operation(operation_id: str, resource_id: str) -> Operation:
+    return Operation(id=operation_id, resourceId=resource_id, resourcePath=f"/workspaces/{resource_id}", action="install", steps=[
+        OperationStep(id="main", templateStepId="main", resourceId=resource_id, resourceTemplateName="base", resourceType="workspace", resourceAction="install", sourceTemplateResourceId=resource_id)
+    ])
+
+
+@pytest.mark.usefixtures("colocated_operations")
+async def test_colocated_operations_are_kept_in_their_resource_partition_apart_from_resources():
+    workspace_repo = await WorkspaceRepository.create()
+    operations_repo = await OperationRepository.create()
+    await workspace_repo.save_item(workspace("ws-1"))
+    await operations_repo.save_item(install_operation("op-1", "ws-1"))
+
+    assert workspace_repo.container is operations_repo.container
+    assert [w.id for w in await workspace_repo.get_active_workspaces()] == ["ws-1"]
+    assert [o.id for o in await operations_repo.get_operations_by_resource_id("ws-1")] == ["op-1"]
+    assert (await operations_repo.read_item_by_id("op-1", "ws-1"))["partitionKey"] == "ws-1"
+    # without the resource, the operation is found with a query
+    assert (await operations_repo.get_operation_by_id("op-1")).id == "op-1"
+    assert (await operations_repo.get_operation_and_etag_by_id("op-1", resource_id="ws-2"))[0].id == "op-1"
+
+
+@pytest.mark.usefixtures("colocated_operations")
+async def test_colocated_operation_and_resource_are_updated_in_a_transactional_batch():
+    workspace_repo = await WorkspaceRepository.create()
+    operations_repo = await OperationRepository.create()
+    await workspace_repo.save_item(workspace("ws-1", properties={"display_name": "ws"}))
+    await operations_repo.save_item(install_operation("op-1", "ws-1"))
+    operation, etag = await operations_repo.get_operation_and_etag_by_id("op-1", resource_id="ws-1")
+
+    operation.status = operation.steps[0].status = Status.Deployed
+    resource_patch = ResourceRepository.deployment_status_patch(Status.Deployed) + ResourceRepository.outputs_patch({f"output{i}": i for i in range(12)})
+    new_etag, resource = await operations_repo.update_operation_step_and_resource_status(operation, 0, etag, resource_patch)
+
+    assert resource["deploymentStatus"] == Status.Deployed
+    assert resource["properties"] == {"display_name": "ws", **{f"output{i}": i for i in range(12)}}
+    assert (await operations_repo.get_operation_and_etag_by_id("op-1", resource_id="ws-1")) == (operation, new_etag)
+    # a conflicting write leaves both the operation and the resource as they were
+    with pytest.raises(CosmosAccessConditionFailedError):
+        await operations_repo.update_operation_step_and_resource_status(operation, 0, etag, ResourceRepository.deployment_status_patch(Status.DeploymentFailed))
+    assert (await workspace_repo.get_workspace_by_id("ws-1")).deploymentStatus == Status.Deployed
+
+
+def finished_operation(operation_id: str, resource_id: str, status: Status, updated_when: float, action: str = "install") -> Operation:
+    return install_operation(operation_id, resource_id).model_copy(update={"status": status, "action": action, "createdWhen": updated_when, "updatedWhen": updated_when})
+
+
+async def test_finished_operations_are_archived_and_can_still_be_read():
+    operations_repo = await OperationRepository.create()
+    await operations_repo.save_item(finished_operation("installed", "ws-1", Status.Deployed, 100))
+    await operations_repo.save_item(finished_operation("failed", "ws-1", Status.ActionFailed, 200, action="custom"))
+    await operations_repo.save_item(finished_operation("recent", "ws-1", Status.Deployed, 1000))
+    await operations_repo.save_item(finished_operation("running", "ws-1", Status.Deploying, 100))
+
+    assert await operations_repo.archive_operations(finished_before=500, page_size=1) == 2
+    assert await operations_repo.archive_operations(finished_before=500) == 0
+
+    assert sorted(o.id for o in await operations_repo.get_operations_by_resource_id("ws-1")) == ["recent", "running"]
+    assert sorted(o.id for o in await operations_repo.get_operations_by_resource_id("ws-1", include_archived=True)) == ["failed", "installed", "recent", "running"]
+    with pytest.raises(EntityDoesNotExist):
+        await operations_repo.get_operation_by_id("installed")
+    assert (await operations_repo.get_operation_by_id("installed", include_archived=True)).status == Status.Deployed
+    # the operation that deployed the workspace is looked for in the archive too
+    assert await operations_repo.resource_has_deployed_operation("ws-1")
+
+
+async def test_operation_being_archived_is_listed_once_from_the_operations_container():
+    operations_repo = await OperationRepository.create()
+    await operations_repo.save_item(finished_operation("installed", "ws-1", Status.Deployed, 100))
+    # written to the archive, but not yet deleted from the operations container
+    await operations_repo.archive_repo.archive([operations_repo.to_document(finished_operation("installed", "ws-1", Status.Deployed, 100).model_dump())])
+    await operations_repo.patch_item_by_id("installed", [{"op": "set", "path": "/message", "value": "updated"}], partition_key=operations_repo.partition_key("installed", "ws-1"))
+
+    operations = await operations_repo.get_operations_by_resource_id("ws-1", workspace_id="ws-1", include_archived=True)
+
+    assert [(o.id, o.message) for o in operations] == [("installed", "updated")]
+
+
+async def test_deleted_resources_are_moved_out_of_the_resources_container_and_read_when_asked_for():
+    workspace_repo = await WorkspaceRepository.create()
+    await workspace_repo.save_item(workspace("ws-1"))
+    for i in range(3):
+        await workspace_repo.save_item(workspace(f"deleted-{i}", deploymentStatus=Status.Deleted))
+
+    assert await workspace_repo.move_deleted_resources(deadline=time.monotonic() + 60, page_size=2) == (3, True)
+
+    assert [w["id"] for w in await workspace_repo.query('SELECT * FROM c')] == ["ws-1"]
+    with pytest.raises(EntityDoesNotExist):
+        await workspace_repo.get_resource_by_id("deleted-0")
+    assert (await workspace_repo.get_resource_by_id("deleted-0", include_deleted=True)).deploymentStatus == Status.Deleted
+    assert sorted(w.id for w in await workspace_repo.get_workspaces()) == ["deleted-0", "deleted-1", "deleted-2", "ws-1"]
+    # only deleted resources are moved
+    assert not await workspace_repo.move_to_deleted(await workspace_repo.get_resource_dict_by_id("ws-1"))
+
+
+async def test_deleted_resources_modified_while_being_moved_are_left_and_reported_as_not_all_moved():
+    workspace_repo = await WorkspaceRepository.create()
+    for i in range(4):
+        await workspace_repo.save_item(workspace(f"deleted-{i}", deploymentStatus=Status.Deleted))
+    move_to_deleted = workspace_repo.move_to_deleted
+
+    async def modified_while_moved(resource: dict) -> bool:
+        # the first page's resources are updated after they're read, so their conditional deletes fail
+        return False if resource["id"] in ("deleted-0", "deleted-1") else await move_to_deleted(resource)
+
+    with patch.object(workspace_repo, "move_to_deleted", side_effect=modified_while_moved):
+        assert await workspace_repo.move_deleted_resources(deadline=time.monotonic() + 60, page_size=2) == (2, False)
+
+    assert sorted(w["id"] for w in await workspace_repo.query('SELECT * FROM c')) == ["deleted-0", "deleted-1"]
+    # the next call moves them
+    assert await workspace_repo.move_deleted_resources(deadline=time.monotonic() + 60, page_size=2) == (2, True)
+
+
+async def test_resources_deployed_before_they_were_marked_are_backfilled_from_their_operations():
+    workspace_repo = await WorkspaceRepository.create()
+    operations_repo = await OperationRepository.create()
+    for workspace_id in ("ws-1", "ws-2"):
+        # saved before isDeployed was
+        await workspace_repo.container.create_item(body=workspace_repo.to_document({key: value for key, value in workspace(workspace_id).model_dump().items() if key not in ("isDeployed", "firstDeployedAt")}))
+    await operations_repo.save_item(finished_operation("installed", "ws-1", Status.Deployed, 100))
+    await operations_repo.save_item(finished_operation("upgraded", "ws-1", Status.Updated, 300, action="upgrade"))
+    await operations_repo.save_item(finished_operation("failed", "ws-2", Status.DeploymentFailed, 100))
+    await operations_repo.archive_operations(finished_before=200)
+
+    get_first_deployed_when = operations_repo.get_first_deployed_when
+
+    async def updated_while_read(resource_id: str, workspace_id: str):
+        # the workspace is updated while its operations are read, which the backfill mustn't revert
+        await workspace_repo.patch_item_by_id(resource_id, [{"op": "set", "path": "/properties/display_name", "value": "renamed"}], partition_key=workspace_repo.partition_key(resource_id, resource_id))
+        return await get_first_deployed_when(resource_id, workspace_id)
+
+    runner = BulkMigrationRunner(await MigrationRepository.create(), max_concurrency=2, time_limit=60)
+    with patch.object(operations_repo, "get_first_deployed_when", side_effect=updated_while_read):
+        [checkpoint] = await runner.run(operations_repo.resource_deployed_migrations(workspace_repo))
+
+    assert checkpoint.documentsRead == 2 and checkpoint.documentsWritten == 1
+    deployed = await workspace_repo.get_workspace_by_id("ws-1")
+    assert deployed.isDeployed and deployed.firstDeployedAt == 100
+    assert deployed.properties["display_name"] == "renamed"
+    assert not (await workspace_repo.get_workspace_by_id("ws-2")).isDeployed
+
+
+async def test_marked_workspace_is_deployed_without_querying_its_operations():
+    workspace_repo = await WorkspaceRepository.create()
+    operations_repo = await OperationRepository.create()
+    await workspace_repo.save_item(workspace("ws-1"))
+
+    await workspace_repo.mark_deployed(await workspace_repo.get_workspace_by_id("ws-1"), 100)
+    # only the first deployment is recorded
+    await workspace_repo.mark_deployed(await workspace_repo.get_workspace_by_id("ws-1"), 200)
+
+    with patch.object(OperationRepository, "resource_has_deployed_operation") as resource_has_deployed_operation:
+        assert (await workspace_repo.get_deployed_workspace_by_id("ws-1", operations_repo)).firstDeployedAt == 100
+    resource_has_deployed_operation.assert_not_called()
+
+
+async def test_repositories_hold_the_repositories_they_use_on_the_instance():
+    workspace_repo = await WorkspaceRepository.create()
+    operations_repo = await OperationRepository.create()
+
+    assert {"hierarchy_repo", "deleted_repo"} <= vars(workspace_repo).keys()
+    assert "archive_repo" in vars(operations_repo)
+    assert not any(hasattr(repo_type, name) for repo_type in (ResourceRepository, WorkspaceRepository) for name in ("hierarchy_repo", "deleted_repo"))
+    assert not hasattr(OperationRepository, "archive_repo")
+
+
+async def test_repositories_hold_their_container_on_the_instance():
+    workspace_repo = await WorkspaceRepository.create()
+    operations_repo = await OperationRepository.create()
+
+    assert workspace_repo.container is not operations_repo.container
+    assert "_container" in vars(workspace_repo) and "_container" in vars(operations_repo)
+    assert not any(hasattr(repo_type, "_container") for repo_type in (BaseRepository, ResourceRepository, WorkspaceRepository, OperationRepository))
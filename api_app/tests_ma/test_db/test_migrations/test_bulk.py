@@ -0,0 +1,90 @@
+import pytest
+from mock import AsyncMock, MagicMock, patch
+from azure.cosmos import http_constants
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceNotFoundError
+
+from db.migrations.bulk import MAX_THROTTLED_RETRIES, BulkPatch, BulkWriter, rename_field
+
+
+def throttled(retry_after_ms="50"):
+    error = CosmosHttpResponseError(status_code=http_constants.StatusCodes.TOO_MANY_REQUESTS, message="Request rate is large")
+    error.headers = {http_constants.HttpHeaders.RetryAfterInMilliseconds: retry_after_ms}
+    return error
+
+
+def upsert_charging(request_charge):
+    async def upsert_item(body, response_hook):
+        response_hook({http_constants.HttpHeaders.RequestCharge: request_charge}, body)
+        return body
+    return upsert_item
+
+
+@pytest.mark.asyncio
+async def test_upsert_all_upserts_every_item_and_totals_request_charge():
+    container = MagicMock()
+    container.upsert_item = AsyncMock(side_effect=upsert_charging("5.5"))
+    writer = BulkWriter(container, max_concurrency=2)
+
+    await writer.upsert_all([{"id": "1"}, {"id": "2"}, {"id": "3"}])
+
+    assert [c.kwargs["body"] for c in container.upsert_item.call_args_list] == [{"id": "1"}, {"id": "2"}, {"id": "3"}]
+    assert writer.request_charge == 16.5
+
+
+@pytest.mark.asyncio
+@patch("db.migrations.bulk.asyncio.sleep", new_callable=AsyncMock)
+async def test_upsert_backs_off_for_retry_after_when_throttled(sleep_mock):
+    container = MagicMock()
+    container.upsert_item = AsyncMock(side_effect=[throttled("2000"), {"id": "1"}])
+    writer = BulkWriter(container, max_concurrency=2)
+
+    await writer.upsert({"id": "1"})
+
+    assert container.upsert_item.call_count == 2
+    assert writer.throttled_count == 1
+    assert sleep_mock.call_args.args[0] == pytest.approx(2, abs=0.1)
+
+
+@pytest.mark.asyncio
+@patch("db.migrations.bulk.asyncio.sleep", new_callable=AsyncMock)
+async def test_upsert_raises_when_still_throttled_after_max_retries(_):
+    container = MagicMock()
+    container.upsert_item = AsyncMock(side_effect=throttled())
+    writer = BulkWriter(container, max_concurrency=2)
+
+    with pytest.raises(CosmosHttpResponseError):
+        await writer.upsert({"id": "1"})
+
+    assert container.upsert_item.call_count == MAX_THROTTLED_RETRIES + 1
+
+
+@pytest.mark.asyncio
+async def test_upsert_all_raises_first_failure_after_attempting_every_item():
+    container = MagicMock()
+    container.upsert_item = AsyncMock(side_effect=[{"id": "1"}, CosmosHttpResponseError(status_code=400, message="Bad request"), {"id": "3"}])
+    writer = BulkWriter(container, max_concurrency=1)
+
+    with pytest.raises(CosmosHttpResponseError):
+        await writer.upsert_all([{"id": "1"}, {"id": "2"}, {"id": "3"}])
+
+    assert container.upsert_item.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_upsert_patches_only_the_fields_of_a_bulk_patch():
+    container = MagicMock()
+    container.patch_item = AsyncMock(side_effect=[{"id": "1"}, CosmosResourceNotFoundError()])
+    writer = BulkWriter(container, max_concurrency=1)
+
+    await writer.upsert_all([BulkPatch(id="1", partition_key="1", fields={"isDeployed": True}), BulkPatch(id="2", partition_key="2", fields={"isDeployed": True})])
+
+    container.upsert_item.assert_not_called()
+    assert container.patch_item.call_args_list[0].kwargs["patch_operations"] == [{"op": "set", "path": "/isDeployed", "value": True}]
+    assert container.patch_item.call_args_list[0].kwargs["partition_key"] == "1"
+
+
+def test_rename_field_skips_items_without_field():
+    transform = rename_field("old", "new")
+
+    assert transform({"id": "1", "old": 1}) == {"id": "1", "new": 1}
+    assert transform({"id": "1", "new": 1}) is None
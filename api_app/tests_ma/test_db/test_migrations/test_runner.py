@@ -0,0 +1,151 @@
+import pytest
+from mock import AsyncMock, MagicMock
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+
+from db.migrations.bulk import BulkMigration
+from db.migrations.runner import PAGE_SIZE, BulkMigrationRunner, describe_progress
+from models.domain.migration import MigrationCheckpoint, MigrationStatus
+
+
+class FakePages:
+    def __init__(self, pages, continuation_tokens):
+        self._pages = iter(pages)
+        self._continuation_tokens = iter(continuation_tokens)
+        self.continuation_token = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            page = next(self._pages)
+        except StopIteration:
+            raise StopAsyncIteration
+        self.continuation_token = next(self._continuation_tokens)
+        return FakeItems(page)
+
+
+class FakeItems:
+    def __init__(self, items):
+        self._items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def migration(name, pages, continuation_tokens):
+    container = MagicMock()
+    container.query_items.return_value.by_page.return_value = FakePages(pages, continuation_tokens)
+    container.upsert_item = AsyncMock()
+
+    def transform(item):
+        return {**item, "migrated": True} if item["id"] != "skip" else None
+    return BulkMigration(name=name, container=container, query="SELECT * FROM c", transform=transform)
+
+
+@pytest.fixture
+def migration_repo():
+    migration_repo = MagicMock()
+    migration_repo.get_checkpoint = AsyncMock(side_effect=lambda name: (MigrationCheckpoint(id=name), None))
+    migration_repo.save_checkpoint = AsyncMock(return_value="etag")
+    return migration_repo
+
+
+def saved_checkpoints(migration_repo):
+    return [(c.args[0].continuationToken, c.args[0].status) for c in migration_repo.save_checkpoint.call_args_list]
+
+
+@pytest.mark.asyncio
+async def test_run_migrates_every_page_and_checkpoints_after_each(migration_repo):
+    bulk_migration = migration("migration", [[{"id": "1"}, {"id": "skip"}], [{"id": "2"}]], ["token-1", None])
+    # save_checkpoint is given the checkpoint object itself, so record its state as each save happens
+    saves = []
+    migration_repo.save_checkpoint = AsyncMock(side_effect=lambda checkpoint, etag: saves.append((checkpoint.continuationToken, checkpoint.status, etag)) or "etag")
+
+    checkpoint, = await BulkMigrationRunner(migration_repo, max_concurrency=5, time_limit=60).run([bulk_migration])
+
+    bulk_migration.container.query_items.assert_called_once_with(query="SELECT * FROM c", parameters=None, max_item_count=PAGE_SIZE)
+    bulk_migration.container.query_items.return_value.by_page.assert_called_once_with(None)
+    assert [c.kwargs["body"] for c in bulk_migration.container.upsert_item.call_args_list] == [{"id": "1", "migrated": True}, {"id": "2", "migrated": True}]
+    assert saves == [("token-1", MigrationStatus.InProgress, None), (None, MigrationStatus.Completed, "etag")]
+    assert (checkpoint.documentsRead, checkpoint.documentsWritten) == (3, 2)
+
+
+@pytest.mark.asyncio
+async def test_run_writes_to_target_container(migration_repo):
+    bulk_migration = migration("migration", [[{"id": "1"}]], [None])
+    bulk_migration.target = MagicMock()
+    bulk_migration.target.upsert_item = AsyncMock()
+
+    await BulkMigrationRunner(migration_repo, max_concurrency=5, time_limit=60).run([bulk_migration])
+
+    bulk_migration.target.upsert_item.assert_called_once()
+    bulk_migration.container.upsert_item.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_resumes_from_checkpoint(migration_repo):
+    bulk_migration = migration("migration", [[{"id": "2"}]], [None])
+    migration_repo.get_checkpoint = AsyncMock(return_value=(MigrationCheckpoint(id="migration", continuationToken="token-1", documentsRead=1, documentsWritten=1), "etag"))
+
+    checkpoint, = await BulkMigrationRunner(migration_repo, max_concurrency=5, time_limit=60).run([bulk_migration])
+
+    bulk_migration.container.query_items.return_value.by_page.assert_called_once_with("token-1")
+    assert checkpoint.status == MigrationStatus.Completed
+    assert (checkpoint.documentsRead, checkpoint.documentsWritten) == (2, 2)
+
+
+@pytest.mark.asyncio
+async def test_run_completes_migration_without_results(migration_repo):
+    bulk_migration = migration("migration", [], [])
+
+    checkpoint, = await BulkMigrationRunner(migration_repo, max_concurrency=5, time_limit=60).run([bulk_migration])
+
+    assert checkpoint.status == MigrationStatus.Completed
+    migration_repo.save_checkpoint.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_run_skips_completed_migrations(migration_repo):
+    bulk_migration = migration("migration", [[{"id": "1"}]], [None])
+    migration_repo.get_checkpoint = AsyncMock(return_value=(MigrationCheckpoint(id="migration", status=MigrationStatus.Completed), "etag"))
+
+    await BulkMigrationRunner(migration_repo, max_concurrency=5, time_limit=60).run([bulk_migration])
+
+    bulk_migration.container.query_items.assert_not_called()
+    migration_repo.save_checkpoint.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_stops_at_time_limit_and_leaves_later_migrations_pending(migration_repo):
+    first = migration("first", [[{"id": "1"}], [{"id": "2"}]], ["token-1", None])
+    second = migration("second", [[{"id": "3"}]], [None])
+
+    checkpoints = await BulkMigrationRunner(migration_repo, max_concurrency=5, time_limit=0).run([first, second])
+
+    assert [(c.id, c.status, c.continuationToken) for c in checkpoints] == [("first", MigrationStatus.InProgress, "token-1"), ("second", MigrationStatus.InProgress, None)]
+    second.container.query_items.assert_not_called()
+    assert describe_progress(checkpoints[1]) == "Pending"
+
+
+@pytest.mark.asyncio
+async def test_run_stops_if_another_instance_is_running_migration(migration_repo):
+    bulk_migration = migration("migration", [[{"id": "1"}], [{"id": "2"}]], ["token-1", None])
+    migration_repo.save_checkpoint = AsyncMock(side_effect=CosmosAccessConditionFailedError)
+
+    checkpoint, = await BulkMigrationRunner(migration_repo, max_concurrency=5, time_limit=60).run([bulk_migration])
+
+    assert checkpoint.status == MigrationStatus.InProgress
+    assert bulk_migration.container.upsert_item.call_count == 1
+
+
+def test_describe_progress_reports_throughput():
+    checkpoint = MigrationCheckpoint(id="migration", documentsRead=1000, documentsWritten=500, requestCharge=5000.0, elapsedSeconds=10.0)
+
+    assert describe_progress(checkpoint) == "In progress: 500 of 1000 documents updated so far (100 documents/s, 500 RU/s written). Call again to resume"
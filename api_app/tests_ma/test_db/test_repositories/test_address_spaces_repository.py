@@ -0,0 +1,176 @@
+from ipaddress import IPv4Network
+import pytest
+import pytest_asyncio
+from mock import AsyncMock, MagicMock, patch
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceNotFoundError
+
+from db.repositories.address_spaces import ADDRESS_SPACES_DOCUMENT_ID, MAX_RESERVATION_ATTEMPTS, RESERVATION_GRACE_PERIOD_SECONDS, AddressSpaceRepository, address_space_index_cache
+from models.domain.workspace import WorkspaceAddressSpaces
+from services.cidr_service import get_allocation_index
+
+pytestmark = pytest.mark.asyncio
+
+WORKSPACE_ID = "933ad738-7265-4b5f-9eae-a1a62928772e"
+NOW = 1700000000.0
+
+
+def allocation_document(*allocations, etag="etag"):
+    return {"id": ADDRESS_SPACES_DOCUMENT_ID, "allocations": list(allocations), "_etag": etag}
+
+
+def allocation(address_space, workspace_id="ws1", reserved_when=NOW):
+    return {"addressSpace": address_space, "workspaceId": workspace_id, "reservedWhen": reserved_when}
+
+
+def saved_address_spaces(container_call):
+    return [a["addressSpace"] for a in container_call.kwargs["body"]["allocations"]]
+
+
+@pytest_asyncio.fixture
+async def address_space_repo():
+    with patch('api.dependencies.database.Database.get_container_proxy', return_value=MagicMock()), \
+            patch('db.repositories.address_spaces.AddressSpaceRepository.get_timestamp', return_value=NOW), \
+            patch('core.config.CORE_ADDRESS_SPACE', "10.1.0.0/22"), \
+            patch('core.config.TRE_ADDRESS_SPACE', "10.0.0.0/12"):
+        address_space_repo = await AddressSpaceRepository.create()
+        address_space_repo.container.replace_item = AsyncMock(return_value={"_etag": "new-etag"})
+        address_space_repo.container.create_item = AsyncMock(return_value={"_etag": "new-etag"})
+        yield address_space_repo
+
+
+@pytest.fixture
+def load_active_workspaces():
+    return AsyncMock(return_value=[])
+
+
+async def test_allocate_address_space_seeds_document_from_active_workspaces(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(side_effect=CosmosResourceNotFoundError)
+    load_active_workspaces.return_value = [WorkspaceAddressSpaces(id="ws1", address_space="10.1.4.0/24", address_spaces=["10.1.4.0/24", "10.1.5.0/24"])]
+
+    address_space = await address_space_repo.allocate_address_space(WORKSPACE_ID, 24, load_active_workspaces)
+
+    assert address_space == "10.1.6.0/24"
+    address_space_repo.container.create_item.assert_called_once()
+    assert saved_address_spaces(address_space_repo.container.create_item.call_args) == ["10.1.4.0/24", "10.1.5.0/24", "10.1.6.0/24"]
+
+
+async def test_allocate_address_space_replaces_document_if_not_modified(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(return_value=allocation_document(allocation("10.1.4.0/24")))
+
+    address_space = await address_space_repo.allocate_address_space(WORKSPACE_ID, 24, load_active_workspaces)
+
+    assert address_space == "10.1.5.0/24"
+    address_space_repo.container.replace_item.assert_called_once_with(
+        item=ADDRESS_SPACES_DOCUMENT_ID,
+        body={"id": ADDRESS_SPACES_DOCUMENT_ID, "allocations": [allocation("10.1.4.0/24"), allocation("10.1.5.0/24", WORKSPACE_ID)]},
+        etag="etag",
+        match_condition=MatchConditions.IfNotModified)
+    load_active_workspaces.assert_not_called()
+
+
+async def test_allocate_address_space_retries_when_allocated_concurrently(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(side_effect=[
+        allocation_document(allocation("10.1.4.0/24")),
+        allocation_document(allocation("10.1.4.0/24"), allocation("10.1.5.0/24", "ws2"), etag="etag-2")
+    ])
+    address_space_repo.container.replace_item = AsyncMock(side_effect=[CosmosAccessConditionFailedError, {"_etag": "etag-3"}])
+
+    address_space = await address_space_repo.allocate_address_space(WORKSPACE_ID, 24, load_active_workspaces)
+
+    assert address_space == "10.1.6.0/24"
+    assert address_space_repo.container.replace_item.call_args.kwargs["etag"] == "etag-2"
+
+
+async def test_allocate_address_space_raises_after_max_attempts(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(return_value=allocation_document())
+    address_space_repo.container.replace_item = AsyncMock(side_effect=CosmosAccessConditionFailedError)
+
+    with pytest.raises(CosmosAccessConditionFailedError):
+        await address_space_repo.allocate_address_space(WORKSPACE_ID, 24, load_active_workspaces)
+
+    assert address_space_repo.container.replace_item.call_count == MAX_RESERVATION_ATTEMPTS
+
+
+async def test_allocate_address_space_reuses_index_for_unchanged_document(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(side_effect=[
+        allocation_document(),
+        allocation_document(allocation("10.1.4.0/24", WORKSPACE_ID), etag="new-etag")
+    ])
+
+    with patch('db.repositories.address_spaces.get_allocation_index', wraps=get_allocation_index) as get_allocation_index_mock:
+        assert await address_space_repo.allocate_address_space(WORKSPACE_ID, 24, load_active_workspaces) == "10.1.4.0/24"
+        assert await address_space_repo.allocate_address_space(WORKSPACE_ID, 24, load_active_workspaces) == "10.1.5.0/24"
+
+    get_allocation_index_mock.assert_called_once()
+
+
+async def test_allocate_address_space_reconciles_deleted_workspaces_when_full(address_space_repo, load_active_workspaces):
+    with patch('core.config.TRE_ADDRESS_SPACE', "10.1.0.0/23"), patch('core.config.CORE_ADDRESS_SPACE', "10.1.0.0/24"):
+        address_space_repo.container.read_item = AsyncMock(return_value=allocation_document(
+            allocation("10.1.1.0/24", "deleted-ws", NOW - RESERVATION_GRACE_PERIOD_SECONDS - 1)))
+
+        address_space = await address_space_repo.allocate_address_space(WORKSPACE_ID, 24, load_active_workspaces)
+
+    assert address_space == "10.1.1.0/24"
+    assert address_space_repo.container.replace_item.call_args.kwargs["body"]["allocations"] == [allocation("10.1.1.0/24", WORKSPACE_ID)]
+
+
+async def test_allocate_address_space_keeps_recent_reservations_when_full(address_space_repo, load_active_workspaces):
+    with patch('core.config.TRE_ADDRESS_SPACE', "10.1.0.0/23"), patch('core.config.CORE_ADDRESS_SPACE', "10.1.0.0/24"):
+        address_space_repo.container.read_item = AsyncMock(return_value=allocation_document(allocation("10.1.1.0/24", "new-ws")))
+
+        with pytest.raises(Exception, match="Not enough space in network."):
+            await address_space_repo.allocate_address_space(WORKSPACE_ID, 24, load_active_workspaces)
+
+    address_space_repo.container.replace_item.assert_not_called()
+
+
+async def test_reserve_address_space_returns_false_if_allocated(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(return_value=allocation_document(allocation("10.2.0.0/22")))
+    load_active_workspaces.return_value = [WorkspaceAddressSpaces(id="ws1", address_space="10.2.0.0/22")]
+
+    assert not await address_space_repo.reserve_address_space(WORKSPACE_ID, "10.2.1.0/24", load_active_workspaces)
+    address_space_repo.container.replace_item.assert_not_called()
+
+
+async def test_reserve_address_space_records_reservation(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(return_value=allocation_document(allocation("10.2.0.0/22")))
+
+    assert await address_space_repo.reserve_address_space(WORKSPACE_ID, "10.2.4.0/24", load_active_workspaces)
+    assert saved_address_spaces(address_space_repo.container.replace_item.call_args) == ["10.2.0.0/22", "10.2.4.0/24"]
+
+
+async def test_claim_address_spaces_records_only_new_address_spaces(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(return_value=allocation_document(allocation("10.1.4.0/24", WORKSPACE_ID)))
+
+    await address_space_repo.claim_address_spaces(WORKSPACE_ID, ["10.1.4.0/24", "192.168.0.0/24"], load_active_workspaces)
+
+    assert saved_address_spaces(address_space_repo.container.replace_item.call_args) == ["10.1.4.0/24", "192.168.0.0/24"]
+
+
+async def test_claim_address_spaces_already_recorded_does_not_write(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(return_value=allocation_document(allocation("10.1.4.0/24", WORKSPACE_ID)))
+
+    await address_space_repo.claim_address_spaces(WORKSPACE_ID, ["10.1.4.0/24"], load_active_workspaces)
+
+    address_space_repo.container.replace_item.assert_not_called()
+
+
+async def test_release_address_spaces_removes_workspace_allocations(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(return_value=allocation_document(
+        allocation("10.1.4.0/24", WORKSPACE_ID), allocation("10.1.5.0/24"), allocation("10.1.6.0/24", WORKSPACE_ID)))
+
+    await address_space_repo.release_address_spaces(WORKSPACE_ID, load_active_workspaces)
+
+    assert saved_address_spaces(address_space_repo.container.replace_item.call_args) == ["10.1.5.0/24"]
+    index = address_space_index_cache.take("new-etag")
+    assert index.is_available(IPv4Network("10.1.4.0/24"))
+
+
+async def test_release_address_spaces_without_allocations_does_not_write(address_space_repo, load_active_workspaces):
+    address_space_repo.container.read_item = AsyncMock(return_value=allocation_document(allocation("10.1.5.0/24")))
+
+    await address_space_repo.release_address_spaces(WORKSPACE_ID, load_active_workspaces)
+
+    address_space_repo.container.replace_item.assert_not_called()
@@ -0,0 +1,46 @@
+import pytest
+
+from db.repositories.airlock_request_history import AirlockRequestHistoryRepository
+from models.domain.airlock_request import AirlockRequestHistoryItem
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.usefixtures("in_memory_database")]
+
+AIRLOCK_REQUEST_ID = "ce45d43a-e734-469a-88a0-109faf4a611f"
+
+
+def history_item(resource_version: int) -> AirlockRequestHistoryItem:
+    return AirlockRequestHistoryItem(resourceVersion=resource_version, updatedWhen=float(resource_version), properties={"previousStatus": f"status-{resource_version}"})
+
+
+async def test_save_history_items_stores_one_item_per_version():
+    history_repo = await AirlockRequestHistoryRepository.create()
+
+    await history_repo.save_history_items(AIRLOCK_REQUEST_ID, [history_item(1), history_item(0)])
+    await history_repo.save_history_items(AIRLOCK_REQUEST_ID, [history_item(1)])
+    await history_repo.save_history_items("other-request", [history_item(0)])
+
+    history = await history_repo.get_history(AIRLOCK_REQUEST_ID)
+    assert [(item.id, item.airlockRequestId, item.resourceVersion) for item in history] == [
+        (f"{AIRLOCK_REQUEST_ID}-0", AIRLOCK_REQUEST_ID, 0),
+        (f"{AIRLOCK_REQUEST_ID}-1", AIRLOCK_REQUEST_ID, 1)
+    ]
+
+
+async def test_get_history_page_returns_history_oldest_first():
+    history_repo = await AirlockRequestHistoryRepository.create()
+    await history_repo.save_history_items(AIRLOCK_REQUEST_ID, [history_item(version) for version in [2, 0, 1]])
+
+    first_page, continuation_token = await history_repo.get_history_page(AIRLOCK_REQUEST_ID, page_size=2)
+    second_page, last_token = await history_repo.get_history_page(AIRLOCK_REQUEST_ID, page_size=2, continuation_token=continuation_token)
+
+    assert [item.resourceVersion for item in first_page + second_page] == [0, 1, 2]
+    assert last_token is None
+
+
+async def test_get_stored_ids_returns_the_ids_asked_for_that_are_stored():
+    history_repo = await AirlockRequestHistoryRepository.create()
+    await history_repo.save_history_items(AIRLOCK_REQUEST_ID, [history_item(0), history_item(1)])
+
+    stored_ids = await history_repo.get_stored_ids(AIRLOCK_REQUEST_ID, [f"{AIRLOCK_REQUEST_ID}-1", f"{AIRLOCK_REQUEST_ID}-2"])
+
+    assert stored_ids == {f"{AIRLOCK_REQUEST_ID}-1"}
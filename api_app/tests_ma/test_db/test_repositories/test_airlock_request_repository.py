@@ -4,13 +4,13 @@ from mock import patch
 import pytest
 import pytest_asyncio
 from models.domain.authentication import RoleAssignment, User
-from models.domain.workspace import Workspace
+from models.domain.workspace import Workspace, WorkspaceAirlockManagerRole
 from tests_ma.test_api.conftest import create_test_user
 from models.schemas.airlock_request import AirlockRequestInCreate
-from models.domain.airlock_request import AirlockRequest, AirlockRequestStatus, AirlockRequestType
+from models.domain.airlock_request import AirlockRequest, AirlockRequestHistoryItem, AirlockRequestStatus, AirlockRequestType
 from db.repositories.airlock_requests import AirlockRequestRepository
 
-from db.errors import EntityDoesNotExist
+from db.errors import EntityDoesNotExist, InvalidInput
 from azure.cosmos.exceptions import CosmosResourceNotFoundError, CosmosAccessConditionFailedError
 
 pytestmark = pytest.mark.asyncio
@@ -79,6 +79,10 @@ def sample_workspace(workspace_id=WORKSPACE_ID, workspace_properties: dict = {})
     return workspace
 
 
+def airlock_manager_roles(*workspaces: Workspace):
+    return [WorkspaceAirlockManagerRole(id=workspace.id, app_role_id_workspace_airlock_manager=workspace.properties.get("app_role_id_workspace_airlock_manager")) for workspace in workspaces]
+
+
 def airlock_request_mock(status=AirlockRequestStatus.Draft):
     airlock_request = AirlockRequest(
         id=AIRLOCK_REQUEST_ID,
@@ -156,6 +160,91 @@ async def test_update_airlock_request_item_accepts_dict_updated_by(airlock_reque
     airlock_request_repo.upsert_item_with_etag.assert_called_once()
 
 
+async def test_update_airlock_request_item_moves_history_out_of_the_request(airlock_request_repo):
+    original_request = airlock_request_mock(status=SUBMITTED)
+    original_request.resourceVersion = 1
+    original_request.history = [AirlockRequestHistoryItem(resourceVersion=0, updatedWhen=1.0, properties={"previousStatus": DRAFT})]
+    new_request = original_request.model_copy(deep=True, update={"status": IN_REVIEW})
+    airlock_request_repo.upsert_item_with_etag = AsyncMock()
+    airlock_request_repo.history_repo.save_history_items = AsyncMock()
+
+    updated_request = await airlock_request_repo.update_airlock_request_item(original_request, new_request, create_test_user(), {"previousStatus": SUBMITTED})
+
+    request_id, history = airlock_request_repo.history_repo.save_history_items.call_args.args
+    assert request_id == AIRLOCK_REQUEST_ID
+    assert [(item.resourceVersion, item.properties) for item in history] == [(0, {"previousStatus": DRAFT}), (1, {"previousStatus": SUBMITTED})]
+    assert updated_request.history == []
+    assert updated_request.resourceVersion == 2
+
+
+async def test_update_airlock_request_item_updates_the_review_inbox(airlock_request_repo):
+    original_request = airlock_request_mock(status=SUBMITTED)
+    new_request = airlock_request_mock(status=IN_REVIEW)
+    airlock_request_repo.upsert_item_with_etag = AsyncMock()
+    airlock_request_repo.review_inbox_repo.update_request = AsyncMock()
+
+    updated_request = await airlock_request_repo.update_airlock_request_item(original_request, new_request, create_test_user(), {"previousStatus": SUBMITTED})
+
+    airlock_request_repo.review_inbox_repo.update_request.assert_called_once_with(SUBMITTED, updated_request)
+
+
+async def test_reconcile_review_inbox_reads_the_inbox_before_the_requests_in_review(airlock_request_repo):
+    calls = []
+    airlock_request_repo.review_inbox_repo.get_copies = AsyncMock(side_effect=lambda: calls.append("inbox") or {})
+    airlock_request_repo.query = AsyncMock(side_effect=lambda **_: calls.append("requests") or [{"id": AIRLOCK_REQUEST_ID}])
+    airlock_request_repo.review_inbox_repo.reconcile = AsyncMock(return_value=1)
+
+    assert await airlock_request_repo.reconcile_review_inbox() == 1
+
+    assert calls == ["inbox", "requests"]
+    assert airlock_request_repo.query.call_args.kwargs["parameters"] == [{"name": "@statuses", "value": [IN_REVIEW]}]
+    airlock_request_repo.review_inbox_repo.reconcile.assert_called_once_with({}, [{"id": AIRLOCK_REQUEST_ID}])
+
+
+def history_items(*versions: int) -> list:
+    return [AirlockRequestHistoryItem(id=f"{AIRLOCK_REQUEST_ID}-{version}", resourceVersion=version, updatedWhen=float(version), properties={}) for version in versions]
+
+
+async def test_get_airlock_request_history_leaves_out_embedded_history_that_is_also_stored(airlock_request_repo):
+    airlock_request = airlock_request_mock()
+    airlock_request.history = [AirlockRequestHistoryItem(resourceVersion=version, updatedWhen=float(version), properties={}) for version in [0, 1]]
+    airlock_request_repo.history_repo.get_history = AsyncMock(return_value=history_items(1, 2))
+
+    history = await airlock_request_repo.get_airlock_request_history(airlock_request)
+
+    assert [item.resourceVersion for item in history] == [0, 1, 2]
+
+
+async def test_get_airlock_request_history_page_counts_embedded_history_against_the_page_size(airlock_request_repo):
+    airlock_request = airlock_request_mock()
+    airlock_request.history = [AirlockRequestHistoryItem(resourceVersion=version, updatedWhen=float(version), properties={}) for version in [0, 1, 2]]
+    airlock_request_repo.history_repo.get_stored_ids = AsyncMock(return_value={f"{AIRLOCK_REQUEST_ID}-1"})
+    airlock_request_repo.history_repo.get_history_page = AsyncMock(side_effect=[(history_items(1), "stored-page-2"), (history_items(1, 3), None)])
+
+    first_page, first_token = await airlock_request_repo.get_airlock_request_history_page(airlock_request, page_size=1)
+    second_page, second_token = await airlock_request_repo.get_airlock_request_history_page(airlock_request, page_size=1, continuation_token=first_token)
+    third_page, third_token = await airlock_request_repo.get_airlock_request_history_page(airlock_request, page_size=1, continuation_token=second_token)
+    whole_page, _ = await airlock_request_repo.get_airlock_request_history_page(airlock_request, page_size=4)
+
+    assert ([item.resourceVersion for item in first_page], first_token) == ([0], "embedded:1")
+    assert ([item.resourceVersion for item in second_page], second_token) == ([2], "embedded:2")
+    assert ([item.resourceVersion for item in third_page], third_token) == ([1], "stored-page-2")
+    assert [item.resourceVersion for item in whole_page] == [0, 2, 1, 3]
+    assert [call.kwargs["page_size"] for call in airlock_request_repo.history_repo.get_history_page.call_args_list] == [1, 2]
+
+
+async def test_get_airlock_request_history_page_with_invalid_embedded_history_token_raises_invalid_input(airlock_request_repo):
+    with pytest.raises(InvalidInput):
+        await airlock_request_repo.get_airlock_request_history_page(airlock_request_mock(), page_size=1, continuation_token="embedded:bad")
+
+
+async def test_airlock_requests_query_does_not_read_history(airlock_request_repo):
+    query = airlock_request_repo.airlock_requests_query()
+
+    assert "c.history" not in query
+    assert "c.status" in query and "c._etag" in query
+
+
 async def test_create_airlock_request_item_creates_an_airlock_request_with_the_right_values(sample_airlock_request_input, airlock_request_repo):
     airlock_request_item_to_create = sample_airlock_request_input
     created_by_user = create_test_user()  # Use proper User object instead of dict
@@ -191,7 +280,9 @@ async def test_update_airlock_request_should_retry_update_when_etag_is_not_up_to
     assert update_airlock_request_item_mock.call_count == expected_update_attempts
 
 
-async def test_get_airlock_requests_queries_db(airlock_request_repo):
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_airlock_requests_queries_db(airlock_request_repo, partitioned_by_workspace):
+    airlock_request_repo.partitioned_by_workspace = partitioned_by_workspace
     airlock_request_repo.container.query_items = MagicMock()
     expected_query = airlock_request_repo.airlock_requests_query() + ' WHERE c.workspaceId=@workspace_id'
     expected_parameters = [
@@ -199,7 +290,8 @@ async def test_get_airlock_requests_queries_db(airlock_request_repo):
     ]
 
     await airlock_request_repo.get_airlock_requests(WORKSPACE_ID)
-    airlock_request_repo.container.query_items.assert_called_once_with(query=expected_query, parameters=expected_parameters)
+    expected_options = {"partition_key": [WORKSPACE_ID]} if partitioned_by_workspace else {}
+    airlock_request_repo.container.query_items.assert_called_once_with(query=expected_query, parameters=expected_parameters, **expected_options)
 
 
 async def test_get_airlock_requests_with_user_id(airlock_request_repo):
@@ -269,12 +361,12 @@ async def test_get_airlock_requests_for_airlock_manager_no_roles(
 
     # Mock active workspaces
     mock_workspace_instance = MagicMock()
-    mock_workspace_instance.get_active_workspaces = AsyncMock(return_value=[])
+    mock_workspace_instance.get_active_workspace_airlock_manager_roles = AsyncMock(return_value=[])
     mock_workspace_repo.create = AsyncMock(return_value=mock_workspace_instance)
 
     # Call function
     user = User(id="user1", name="TestUser")
-    result = await airlock_request_repo.get_airlock_requests_for_airlock_manager(user)
+    result = await airlock_request_repo.get_airlock_requests_for_airlock_manager(user.id)
 
     # validate
     assert result == []
@@ -294,7 +386,7 @@ async def test_get_airlock_requests_for_airlock_manager_single_workspace(
     # Setup workspace and manager role
     workspace = sample_workspace(workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-1"})
     mock_workspace_instance = MagicMock()
-    mock_workspace_instance.get_active_workspaces = AsyncMock(return_value=[workspace])
+    mock_workspace_instance.get_active_workspace_airlock_manager_roles = AsyncMock(return_value=airlock_manager_roles(workspace))
     mock_workspace_repo.create = AsyncMock(return_value=mock_workspace_instance)
 
     # Setup user roles
@@ -306,11 +398,11 @@ async def test_get_airlock_requests_for_airlock_manager_single_workspace(
     mock_get_requests.return_value = [request_mock]
 
     user = User(id="user1", name="TestUser")
-    result = await airlock_request_repo.get_airlock_requests_for_airlock_manager(user)
+    result = await airlock_request_repo.get_airlock_requests_for_airlock_manager(user.id)
 
     assert len(result) == 1
     assert result[0].id == "request-1"
-    mock_get_requests.assert_called_once_with(workspace_id=WORKSPACE_ID, type=None, status=None, order_by=None, order_ascending=True)
+    mock_get_requests.assert_called_once_with(workspace_ids=[WORKSPACE_ID], type=None, status=None, order_by=None, order_ascending=True)
 
 
 @pytest.mark.asyncio
@@ -327,7 +419,7 @@ async def test_get_airlock_requests_for_airlock_manager_multiple_workspaces(
     workspace1 = sample_workspace(workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-1"})
     workspace2 = sample_workspace(workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-2"})
     mock_workspace_instance = MagicMock()
-    mock_workspace_instance.get_active_workspaces = AsyncMock(return_value=[workspace1, workspace2])
+    mock_workspace_instance.get_active_workspace_airlock_manager_roles = AsyncMock(return_value=airlock_manager_roles(workspace1, workspace2))
     mock_workspace_repo.create = AsyncMock(return_value=mock_workspace_instance)
 
     # Setup user roles
@@ -336,18 +428,19 @@ async def test_get_airlock_requests_for_airlock_manager_multiple_workspaces(
     mock_access_service.return_value.get_identity_role_assignments.return_value = [role_assignment_1, role_assignment_2]
 
     # Setup requests for each workspace
-    first_ws_requests = [AirlockRequest(id="request-1", workspaceId="workspace-1", type=AirlockRequestType.Import, reviews=[])]
-    second_ws_requests = [AirlockRequest(id="request-2", workspaceId="workspace-2", type=AirlockRequestType.Import, reviews=[])]
-    mock_get_requests.side_effect = [first_ws_requests, second_ws_requests]
+    mock_get_requests.return_value = [
+        AirlockRequest(id="request-1", workspaceId="workspace-1", type=AirlockRequestType.Import, reviews=[]),
+        AirlockRequest(id="request-2", workspaceId="workspace-2", type=AirlockRequestType.Import, reviews=[])
+    ]
 
     user = User(id="user1", name="TestUser")
-    result = await airlock_request_repo.get_airlock_requests_for_airlock_manager(user)
+    result = await airlock_request_repo.get_airlock_requests_for_airlock_manager(user.id)
 
-    # combined requests from both
+    # requests from both, read in a single query
     assert len(result) == 2
     assert result[0].id == "request-1"
     assert result[1].id == "request-2"
-    assert mock_get_requests.call_count == 2
+    mock_get_requests.assert_called_once_with(workspace_ids=[workspace1.id, workspace2.id], type=None, status=None, order_by=None, order_ascending=True)
 
 
 @pytest.mark.asyncio
@@ -364,7 +457,7 @@ async def test_get_airlock_requests_for_airlock_manager_active_workspaces_but_no
     workspace1 = sample_workspace(workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-1"})
     workspace2 = sample_workspace(workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-2"})
     mock_workspace_instance = MagicMock()
-    mock_workspace_instance.get_active_workspaces = AsyncMock(return_value=[workspace1, workspace2])
+    mock_workspace_instance.get_active_workspace_airlock_manager_roles = AsyncMock(return_value=airlock_manager_roles(workspace1, workspace2))
     mock_workspace_repo.create = AsyncMock(return_value=mock_workspace_instance)
 
     # No matching roles for these workspaces
@@ -373,7 +466,7 @@ async def test_get_airlock_requests_for_airlock_manager_active_workspaces_but_no
     ]
 
     user = User(id="user1", name="TestUser")
-    result = await airlock_request_repo.get_airlock_requests_for_airlock_manager(user)
+    result = await airlock_request_repo.get_airlock_requests_for_airlock_manager(user.id)
     assert result == []
     mock_get_requests.assert_not_called()
 
@@ -392,7 +485,7 @@ async def test_get_airlock_requests_for_airlock_manager_passes_correct_arguments
     # Setup workspaces
     workspace1 = sample_workspace(workspace_id="workspace-1", workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-1"})
     mock_workspace_instance = MagicMock()
-    mock_workspace_instance.get_active_workspaces = AsyncMock(return_value=[workspace1])
+    mock_workspace_instance.get_active_workspace_airlock_manager_roles = AsyncMock(return_value=airlock_manager_roles(workspace1))
     mock_workspace_repo.create = AsyncMock(return_value=mock_workspace_instance)
 
     # Setup user roles
@@ -404,7 +497,7 @@ async def test_get_airlock_requests_for_airlock_manager_passes_correct_arguments
 
     user_id = "test-user-id"
     test_type = AirlockRequestType.Import
-    test_status = AirlockRequestStatus.InReview
+    test_status = AirlockRequestStatus.Approved
     test_order_by = "updatedWhen"
     test_order_ascending = False
 
@@ -419,7 +512,7 @@ async def test_get_airlock_requests_for_airlock_manager_passes_correct_arguments
 
     # Verify get_airlock_requests was called with all correct arguments
     mock_get_requests.assert_called_once_with(
-        workspace_id="workspace-1",  # This is crucial - workspace_id should be passed
+        workspace_ids=["workspace-1"],  # This is crucial - the manager's workspace ids should be passed
         type=test_type,
         status=test_status,
         order_by=test_order_by,
@@ -441,7 +534,7 @@ async def test_get_airlock_requests_for_airlock_manager_argument_compatibility(
     # Setup minimal required mocks
     workspace1 = sample_workspace(workspace_id="workspace-1", workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-1"})
     mock_workspace_instance = MagicMock()
-    mock_workspace_instance.get_active_workspaces = AsyncMock(return_value=[workspace1])
+    mock_workspace_instance.get_active_workspace_airlock_manager_roles = AsyncMock(return_value=airlock_manager_roles(workspace1))
     mock_workspace_repo.create = AsyncMock(return_value=mock_workspace_instance)
 
     role_assignment = RoleAssignment(resource_id="resource_id", role_id="manager-role-1")
@@ -469,3 +562,84 @@ async def test_get_airlock_requests_for_airlock_manager_argument_compatibility(
             assert isinstance(result, list), f"Test case {i} should return a list"
         except TypeError as e:
             pytest.fail(f"Test case {i} failed with TypeError: {str(e)}. Parameters: {test_kwargs}")
+
+
+@pytest.mark.asyncio
+@patch.object(AirlockRequestRepository, 'query_page', new_callable=AsyncMock)
+@patch('db.repositories.airlock_requests.get_aad_service', autospec=True)
+@patch('db.repositories.airlock_requests.WorkspaceRepository', autospec=True)
+async def test_get_airlock_requests_for_airlock_manager_page_queries_all_managed_workspaces_at_once(
+    mock_workspace_repo,
+    mock_access_service,
+    mock_query_page,
+    airlock_request_repo
+):
+    workspace1 = sample_workspace(workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-1"})
+    workspace2 = sample_workspace(workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-2"})
+    workspace1.id = "workspace-1"
+    workspace2.id = "workspace-2"
+    mock_workspace_instance = MagicMock()
+    mock_workspace_instance.get_active_workspace_airlock_manager_roles = AsyncMock(return_value=airlock_manager_roles(workspace1, workspace2))
+    mock_workspace_repo.create = AsyncMock(return_value=mock_workspace_instance)
+
+    mock_access_service.return_value.get_identity_role_assignments.return_value = [
+        RoleAssignment(resource_id="resource_id", role_id="manager-role-1"),
+        RoleAssignment(resource_id="resource_id", role_id="manager-role-2")
+    ]
+    mock_query_page.return_value = ([], "next-page-token")
+
+    _, continuation_token = await airlock_request_repo.get_airlock_requests_for_airlock_manager_page("user1", order_by="updatedWhen", page_size=10)
+
+    expected_query = airlock_request_repo.airlock_requests_query() + ' WHERE ARRAY_CONTAINS(@workspace_ids, c.workspaceId) ORDER BY c.updatedWhen ASC'
+    expected_parameters = [{"name": "@workspace_ids", "value": ["workspace-1", "workspace-2"]}]
+    mock_query_page.assert_called_once_with(query=expected_query, parameters=expected_parameters, page_size=10, continuation_token=None)
+    assert continuation_token == "next-page-token"
+
+
+@pytest.mark.asyncio
+@patch.object(AirlockRequestRepository, 'query_page', new_callable=AsyncMock)
+@patch.object(AirlockRequestRepository, 'get_airlock_manager_workspace_ids', new_callable=AsyncMock, return_value=[])
+async def test_get_airlock_requests_for_airlock_manager_page_returns_empty_page_without_workspaces(_, mock_query_page, airlock_request_repo):
+    assert await airlock_request_repo.get_airlock_requests_for_airlock_manager_page("user1") == ([], None)
+    mock_query_page.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch.object(AirlockRequestRepository, 'get_airlock_requests', new_callable=AsyncMock)
+@patch('db.repositories.airlock_requests.get_aad_service', autospec=True)
+@patch('db.repositories.airlock_requests.WorkspaceRepository', autospec=True)
+async def test_get_airlock_requests_for_airlock_manager_reads_requests_in_review_from_the_inbox(
+    mock_workspace_repo,
+    mock_access_service,
+    mock_get_requests,
+    airlock_request_repo
+):
+    workspace = sample_workspace(workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-1"})
+    mock_workspace_instance = MagicMock()
+    mock_workspace_instance.get_active_workspace_airlock_manager_roles = AsyncMock(return_value=airlock_manager_roles(workspace))
+    mock_workspace_repo.create = AsyncMock(return_value=mock_workspace_instance)
+    mock_access_service.return_value.get_identity_role_assignments.return_value = [RoleAssignment(resource_id="resource_id", role_id="manager-role-1")]
+    airlock_request_repo.review_inbox_repo.get_inbox = AsyncMock(return_value=[airlock_request_mock(status=IN_REVIEW)])
+
+    result = await airlock_request_repo.get_airlock_requests_for_airlock_manager("user1", type=AirlockRequestType.Export, status=IN_REVIEW, order_by="updatedWhen")
+
+    assert len(result) == 1
+    airlock_request_repo.review_inbox_repo.get_inbox.assert_called_once_with([WORKSPACE_ID], type=AirlockRequestType.Export, order_by="updatedWhen", order_ascending=True)
+    mock_get_requests.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch('db.repositories.airlock_requests.get_aad_service', autospec=True)
+@patch('db.repositories.airlock_requests.WorkspaceRepository', autospec=True)
+async def test_get_airlock_manager_workspace_ids_caches_role_assignments(mock_workspace_repo, mock_access_service, airlock_request_repo):
+    workspace = sample_workspace(workspace_properties={"app_role_id_workspace_airlock_manager": "manager-role-1"})
+    mock_workspace_instance = MagicMock()
+    mock_workspace_instance.get_active_workspace_airlock_manager_roles = AsyncMock(return_value=airlock_manager_roles(workspace))
+    mock_workspace_repo.create = AsyncMock(return_value=mock_workspace_instance)
+    mock_access_service.return_value.get_identity_role_assignments.return_value = [RoleAssignment(resource_id="resource_id", role_id="manager-role-1")]
+
+    assert await airlock_request_repo.get_airlock_manager_workspace_ids("user1") == [WORKSPACE_ID]
+    assert await airlock_request_repo.get_airlock_manager_workspace_ids("user1") == [WORKSPACE_ID]
+    await airlock_request_repo.get_airlock_manager_workspace_ids("user2")
+
+    assert [c.args for c in mock_access_service.return_value.get_identity_role_assignments.call_args_list] == [("user1",), ("user2",)]
@@ -0,0 +1,109 @@
+import pytest
+from azure.cosmos.exceptions import CosmosHttpResponseError
+from mock import patch
+
+from db.migrations.bulk import BulkMigration
+from db.repositories.airlock_review_inbox import INBOX_WRITE_ATTEMPTS, AirlockReviewInboxRepository
+from models.domain.airlock_request import AirlockRequest, AirlockRequestStatus, AirlockRequestType
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.usefixtures("in_memory_database")]
+
+WORKSPACE_ID = "abc000d3-82da-4bfc-b6e9-9a7853ef753e"
+OTHER_WORKSPACE_ID = "def000d3-82da-4bfc-b6e9-9a7853ef753e"
+
+
+def airlock_request(request_id: str, workspace_id: str = WORKSPACE_ID, status=AirlockRequestStatus.InReview, type=AirlockRequestType.Import, updated_when: float = 1.0, etag: str = "request-etag") -> AirlockRequest:
+    return AirlockRequest(id=request_id, workspaceId=workspace_id, type=type, status=status, updatedWhen=updated_when, etag=etag)
+
+
+async def test_update_request_adds_requests_in_review_to_the_inbox():
+    inbox_repo = await AirlockReviewInboxRepository.create()
+
+    await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("request-1"))
+
+    inbox = await inbox_repo.get_inbox([WORKSPACE_ID])
+    assert [(request.id, request.status, request.etag) for request in inbox] == [("request-1", AirlockRequestStatus.InReview, "request-etag")]
+
+
+async def test_update_request_removes_requests_no_longer_in_review():
+    inbox_repo = await AirlockReviewInboxRepository.create()
+    await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("request-1"))
+
+    await inbox_repo.update_request(AirlockRequestStatus.InReview, airlock_request("request-1", status=AirlockRequestStatus.ApprovalInProgress))
+    # removing a request that was never added isn't an error
+    await inbox_repo.update_request(AirlockRequestStatus.InReview, airlock_request("request-2", status=AirlockRequestStatus.Cancelled))
+
+    assert await inbox_repo.get_inbox([WORKSPACE_ID]) == []
+
+
+@patch("db.repositories.airlock_review_inbox.asyncio.sleep")
+async def test_update_request_retries_a_failed_write(sleep_mock):
+    inbox_repo = await AirlockReviewInboxRepository.create()
+
+    with patch.object(inbox_repo, "update_item_dict", side_effect=[CosmosHttpResponseError(status_code=503), None]) as update_mock:
+        await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("request-1"))
+
+    assert update_mock.call_count == 2
+    sleep_mock.assert_called_once()
+
+
+@patch("db.repositories.airlock_review_inbox.asyncio.sleep")
+@patch("db.repositories.airlock_review_inbox.logger.exception")
+async def test_update_request_logs_and_raises_when_every_attempt_fails(logger_mock, _):
+    inbox_repo = await AirlockReviewInboxRepository.create()
+
+    with patch.object(inbox_repo, "remove_copy", side_effect=CosmosHttpResponseError(status_code=503)) as remove_mock:
+        with pytest.raises(CosmosHttpResponseError):
+            await inbox_repo.update_request(AirlockRequestStatus.InReview, airlock_request("request-1", status=AirlockRequestStatus.Cancelled))
+
+    assert remove_mock.call_count == INBOX_WRITE_ATTEMPTS
+    logger_mock.assert_called_once()
+
+
+async def test_reconcile_corrects_missing_stale_and_leftover_copies():
+    inbox_repo = await AirlockReviewInboxRepository.create()
+    await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("up-to-date"))
+    await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("stale"))
+    await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("no-longer-in-review"))
+    copies = await inbox_repo.get_copies()
+    reviewable_requests = [
+        airlock_request("up-to-date").model_dump(),
+        airlock_request("stale", updated_when=2.0, etag="newer-etag").model_dump(),
+        airlock_request("missing", workspace_id=OTHER_WORKSPACE_ID).model_dump()
+    ]
+
+    corrected = await inbox_repo.reconcile(copies, reviewable_requests)
+
+    inbox = await inbox_repo.get_inbox([WORKSPACE_ID, OTHER_WORKSPACE_ID], order_by="id")
+    assert corrected == 3
+    assert [(request.id, request.etag) for request in inbox] == [("missing", "request-etag"), ("stale", "newer-etag"), ("up-to-date", "request-etag")]
+    assert await inbox_repo.reconcile(await inbox_repo.get_copies(), reviewable_requests) == 0
+
+
+async def test_get_inbox_returns_requests_across_workspaces_filtered_and_ordered():
+    inbox_repo = await AirlockReviewInboxRepository.create()
+    await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("request-1", updated_when=3.0))
+    await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("request-2", workspace_id=OTHER_WORKSPACE_ID, updated_when=2.0))
+    await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("request-3", workspace_id=OTHER_WORKSPACE_ID, type=AirlockRequestType.Export))
+    await inbox_repo.update_request(AirlockRequestStatus.Submitted, airlock_request("request-4", workspace_id="unmanaged-workspace"))
+
+    inbox = await inbox_repo.get_inbox([WORKSPACE_ID, OTHER_WORKSPACE_ID], type=AirlockRequestType.Import, order_by="updatedWhen")
+    first_page, continuation_token = await inbox_repo.get_inbox_page([WORKSPACE_ID, OTHER_WORKSPACE_ID], order_by="updatedWhen", order_ascending=False, page_size=2)
+
+    assert [request.id for request in inbox] == ["request-2", "request-1"]
+    assert [request.id for request in first_page] == ["request-1", "request-2"]
+    assert continuation_token is not None
+
+
+async def test_backfill_migration_copies_requests_in_review_to_the_inbox():
+    inbox_repo = await AirlockReviewInboxRepository.create()
+    airlock_requests_container = object()
+
+    migration = inbox_repo.backfill_migration(airlock_requests_container)
+
+    assert isinstance(migration, BulkMigration)
+    assert migration.container is airlock_requests_container
+    assert migration.target is inbox_repo.container
+    assert migration.parameters == [{"name": "@statuses", "value": [AirlockRequestStatus.InReview]}]
+    item = migration.transform({"id": "request-1", "workspaceId": WORKSPACE_ID, "status": "in_review", "history": [{"resourceVersion": 0}], "_etag": "request-etag", "_ts": 1})
+    assert item == {"id": "request-1", "workspaceId": WORKSPACE_ID, "status": "in_review", "requestEtag": "request-etag"}
@@ -1,14 +1,201 @@
+from unittest.mock import AsyncMock, MagicMock
 import pytest
+import pytest_asyncio
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosHttpResponseError, CosmosResourceNotFoundError
 from mock import patch
 
-from db.errors import UnableToAccessDatabase
-from db.repositories.base import BaseRepository
+from db.errors import EntityDoesNotExist, InvalidInput, UnableToAccessDatabase
+from db.repositories.base import BaseRepository, etag_conflict_backoff
+from models.domain.operation import Operation
 
 pytestmark = pytest.mark.asyncio
 
+OPERATION_ID = "0000c8e7-5c42-4fcb-a7fd-294cfc27aa76"
+
+
+@pytest_asyncio.fixture
+async def base_repo():
+    with patch('api.dependencies.database.Database.get_container_proxy', return_value=AsyncMock()):
+        yield await BaseRepository.create()
+
+
+@pytest.fixture
+def operation_dict():
+    return Operation(id=OPERATION_ID, resourceId="resource-id", resourcePath="/workspaces/resource-id", resourceVersion=0, action="install", message="test").model_dump()
+
 
 @patch("api.dependencies.database.Database.get_container_proxy")
 async def test_instantiating_a_repo_raises_unable_to_access_database_if_database_cant_be_accessed(get_container_proxy_mock):
     get_container_proxy_mock.side_effect = Exception()
     with pytest.raises(UnableToAccessDatabase):
         await BaseRepository.create()
+
+
+async def test_read_item_point_reads_with_item_id_as_partition_key_by_default(base_repo, operation_dict):
+    base_repo.container.read_item = AsyncMock(return_value=operation_dict)
+
+    operation = await base_repo.read_item(OPERATION_ID, Operation)
+
+    base_repo.container.read_item.assert_called_once_with(item=OPERATION_ID, partition_key=OPERATION_ID)
+    assert isinstance(operation, Operation)
+    assert operation.id == OPERATION_ID
+
+
+async def test_read_item_uses_given_partition_key(base_repo, operation_dict):
+    base_repo.container.read_item = AsyncMock(return_value=operation_dict)
+
+    await base_repo.read_item(OPERATION_ID, Operation, partition_key="resource-id")
+
+    base_repo.container.read_item.assert_called_once_with(item=OPERATION_ID, partition_key="resource-id")
+
+
+@pytest.mark.parametrize("item, expected_partition", [
+    ({"id": "item-id", "workspaceId": "ws-1", "resourcePath": "/shared-services/ss-1"}, "ws-1"),
+    ({"id": "item-id", "resourcePath": "/workspaces/ws-1/workspace-services/svc-1"}, "ws-1"),
+    ({"id": "item-id", "resourcePath": "/shared-services/ss-1"}, "shared"),
+    ({"id": "item-id"}, "shared"),
+])
+async def test_item_partition_key_takes_the_workspace_from_workspace_id_or_resource_path(base_repo, item, expected_partition):
+    with patch.object(base_repo, "partitioned_by_workspace", True):
+        assert base_repo.item_partition_key(item) == [expected_partition, "item-id"]
+
+
+async def test_read_item_raises_entity_does_not_exist_if_item_not_found(base_repo):
+    base_repo.container.read_item = AsyncMock(side_effect=CosmosResourceNotFoundError)
+
+    with pytest.raises(EntityDoesNotExist):
+        await base_repo.read_item(OPERATION_ID, Operation)
+
+
+async def test_read_item_raises_entity_does_not_exist_if_item_filter_rejects_item(base_repo, operation_dict):
+    base_repo.container.read_item = AsyncMock(return_value=operation_dict)
+
+    with pytest.raises(EntityDoesNotExist):
+        await base_repo.read_item(OPERATION_ID, Operation, item_filter=lambda item: item["resourceId"] == "another-resource")
+
+
+class FakePages:
+    def __init__(self, pages, continuation_tokens):
+        self._pages = iter(pages)
+        self._continuation_tokens = iter(continuation_tokens)
+        self.continuation_token = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            page = next(self._pages)
+        except StopIteration:
+            raise StopAsyncIteration
+        self.continuation_token = next(self._continuation_tokens)
+        return FakePage(page)
+
+
+class FakePage:
+    def __init__(self, items):
+        self._items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def mock_query_pages(base_repo, pages, continuation_tokens):
+    query_items = MagicMock()
+    query_items.by_page.return_value = FakePages(pages, continuation_tokens)
+    base_repo.container.query_items = MagicMock(return_value=query_items)
+    return query_items
+
+
+async def test_query_page_returns_first_page_and_continuation_token(base_repo):
+    query_items = mock_query_pages(base_repo, [[{"id": "1"}, {"id": "2"}], [{"id": "3"}]], ["token-1", None])
+
+    items, continuation_token = await base_repo.query_page("SELECT * FROM c", page_size=2, continuation_token="token-0")
+
+    base_repo.container.query_items.assert_called_once_with(query="SELECT * FROM c", parameters=None, max_item_count=2)
+    query_items.by_page.assert_called_once_with("token-0")
+    assert items == [{"id": "1"}, {"id": "2"}]
+    assert continuation_token == "token-1"
+
+
+async def test_query_page_returns_empty_page_when_there_are_no_results(base_repo):
+    mock_query_pages(base_repo, [], [])
+
+    assert await base_repo.query_page("SELECT * FROM c", page_size=2) == ([], None)
+
+
+async def test_query_page_raises_invalid_input_if_continuation_token_is_rejected(base_repo):
+    query_items = MagicMock()
+    query_items.by_page.return_value.__anext__ = AsyncMock(side_effect=CosmosHttpResponseError(status_code=400, message="Invalid continuation token"))
+    base_repo.container.query_items = MagicMock(return_value=query_items)
+
+    with pytest.raises(InvalidInput):
+        await base_repo.query_page("SELECT * FROM c", continuation_token="bad-token")
+
+
+async def test_query_pages_yields_every_page(base_repo):
+    mock_query_pages(base_repo, [[{"id": "1"}, {"id": "2"}], [{"id": "3"}]], ["token-1", None])
+
+    pages = [page async for page in base_repo.query_pages("SELECT * FROM c", page_size=2)]
+
+    assert pages == [[{"id": "1"}, {"id": "2"}], [{"id": "3"}]]
+
+
+async def test_rename_field_migration_renames_field_on_items_that_have_it(base_repo):
+    migration = base_repo.rename_field_migration("rename-field", "oldName", "newName")
+
+    assert migration.container == base_repo.container
+    assert migration.parameters == [{"name": "@oldFieldName", "value": "oldName"}]
+    assert migration.transform({"id": "1", "oldName": "value"}) == {"id": "1", "newName": "value"}
+    assert migration.transform({"id": "2", "newName": "value"}) is None
+
+
+@patch("db.repositories.base.asyncio.sleep")
+@patch("db.repositories.base.record_optimistic_update")
+async def test_update_with_retries_rereads_and_retries_on_etag_conflict(record_mock, sleep_mock, base_repo):
+    read = AsyncMock(side_effect=[{"_etag": "2"}, {"_etag": "3"}])
+    update = AsyncMock(side_effect=[CosmosAccessConditionFailedError, CosmosAccessConditionFailedError, "updated"])
+
+    result = await base_repo.update_with_retries("test update", update=update, read=read, item={"_etag": "1"})
+
+    assert result == "updated"
+    assert [c.args[0]["_etag"] for c in update.call_args_list] == ["1", "2", "3"]
+    assert sleep_mock.await_count == 2
+    assert record_mock.call_args.args[:3] == ("BaseRepository", "test update", 2)
+    assert record_mock.call_args.kwargs == {"succeeded": True}
+
+
+@patch("db.repositories.base.asyncio.sleep")
+@patch("db.repositories.base.record_optimistic_update")
+async def test_update_with_retries_raises_once_retries_are_exhausted(record_mock, _, base_repo):
+    read = AsyncMock(return_value={"_etag": "latest"})
+    update = AsyncMock(side_effect=CosmosAccessConditionFailedError)
+
+    with pytest.raises(CosmosAccessConditionFailedError):
+        await base_repo.update_with_retries("test update", update=update, read=read, max_retries=3)
+
+    assert read.await_count == 4 and update.await_count == 4
+    assert record_mock.call_args.kwargs == {"succeeded": False}
+
+
+@patch("db.repositories.base.asyncio.sleep")
+async def test_update_with_retries_does_not_retry_other_errors(sleep_mock, base_repo):
+    update = AsyncMock(side_effect=ValueError)
+
+    with pytest.raises(ValueError):
+        await base_repo.update_with_retries("test update", update=update, read=AsyncMock(), item={})
+
+    update.assert_awaited_once()
+    sleep_mock.assert_not_awaited()
+
+
+@patch("db.repositories.base.config.ETAG_CONFLICT_BACKOFF_BASE_MS", 100)
+@patch("db.repositories.base.random.uniform", side_effect=lambda low, high: high)
+async def test_etag_conflict_backoff_grows_exponentially_up_to_a_limit(_):
+    assert [etag_conflict_backoff(attempt) for attempt in (1, 2, 3, 10)] == [0.1, 0.2, 0.4, 2.0]
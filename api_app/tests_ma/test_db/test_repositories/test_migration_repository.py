@@ -0,0 +1,54 @@
+import pytest
+import pytest_asyncio
+from mock import AsyncMock, MagicMock, patch
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+from db.repositories.migrations import MigrationRepository
+from models.domain.migration import MigrationCheckpoint, MigrationStatus
+
+pytestmark = pytest.mark.asyncio
+
+NOW = 1700000000.0
+
+
+@pytest_asyncio.fixture
+async def migration_repo():
+    with patch('api.dependencies.database.Database.get_container_proxy', return_value=MagicMock()), \
+            patch('db.repositories.migrations.MigrationRepository.get_timestamp', return_value=NOW):
+        migration_repo = await MigrationRepository.create()
+        migration_repo.container.create_item = AsyncMock(return_value={"_etag": "new-etag"})
+        migration_repo.container.replace_item = AsyncMock(return_value={"_etag": "new-etag"})
+        yield migration_repo
+
+
+async def test_get_checkpoint_returns_new_checkpoint_if_migration_has_not_run(migration_repo):
+    migration_repo.container.read_item = AsyncMock(side_effect=CosmosResourceNotFoundError)
+
+    checkpoint, etag = await migration_repo.get_checkpoint("migration")
+
+    assert checkpoint == MigrationCheckpoint(id="migration", startedWhen=NOW)
+    assert etag is None
+
+
+async def test_get_checkpoint_returns_saved_checkpoint_and_etag(migration_repo):
+    saved = MigrationCheckpoint(id="migration", status=MigrationStatus.Completed, documentsRead=10)
+    migration_repo.container.read_item = AsyncMock(return_value={**saved.model_dump(), "_etag": "etag"})
+
+    assert await migration_repo.get_checkpoint("migration") == (saved, "etag")
+
+
+async def test_save_checkpoint_creates_new_checkpoint(migration_repo):
+    checkpoint = MigrationCheckpoint(id="migration")
+
+    assert await migration_repo.save_checkpoint(checkpoint, None) == "new-etag"
+
+    migration_repo.container.create_item.assert_called_once_with(body={**checkpoint.model_dump(), "updatedWhen": NOW})
+
+
+async def test_save_checkpoint_replaces_checkpoint_if_not_modified(migration_repo):
+    checkpoint = MigrationCheckpoint(id="migration")
+
+    await migration_repo.save_checkpoint(checkpoint, "etag")
+
+    migration_repo.container.replace_item.assert_called_once_with(item="migration", body={**checkpoint.model_dump(), "updatedWhen": NOW}, etag="etag", match_condition=MatchConditions.IfNotModified)
@@ -65,3 +65,15 @@ async def test_create_operation_steps_from_multi_step_template(_, __, ___, resou
     )
 
     assert operation.model_dump() == expected_op.model_dump()
+
+
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_operation_by_id_point_reads_db(operations_repo, partitioned_by_workspace):
+    operations_repo.partitioned_by_workspace = partitioned_by_workspace
+    operation = {"id": OPERATION_ID, "resourceId": RESOURCE_ID, "resourcePath": f"/workspaces/{RESOURCE_ID}", "resourceVersion": 0, "action": "install", "message": "test"}
+    operations_repo.read_item_by_id = AsyncMock(return_value=operation)
+
+    actual_operation = await operations_repo.get_operation_by_id(OPERATION_ID, workspace_id=RESOURCE_ID)
+
+    operations_repo.read_item_by_id.assert_called_once_with(OPERATION_ID, [RESOURCE_ID, OPERATION_ID] if partitioned_by_workspace else OPERATION_ID)
+    assert actual_operation.id == OPERATION_ID
@@ -0,0 +1,42 @@
+import pytest
+from mock import AsyncMock, patch
+
+from db.repositories.operations import OperationRepository
+from db.repositories.registry import RepositoryRegistry
+from db.repositories.resource_templates import ResourceTemplateRepository
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_get_creates_repository_once_and_reuses_it():
+    registry = RepositoryRegistry()
+
+    with patch.object(OperationRepository, "create", AsyncMock(side_effect=lambda: OperationRepository())) as create_mock:
+        first = await registry.get(OperationRepository)
+        second = await registry.get(OperationRepository)
+
+    assert first is second
+    create_mock.assert_called_once()
+
+
+async def test_initialize_creates_every_repository():
+    registry = RepositoryRegistry()
+
+    await registry.initialize([OperationRepository, ResourceTemplateRepository])
+
+    with patch.object(OperationRepository, "create") as operations_create_mock, \
+            patch.object(ResourceTemplateRepository, "create") as templates_create_mock:
+        assert isinstance(await registry.get(OperationRepository), OperationRepository)
+        assert isinstance(await registry.get(ResourceTemplateRepository), ResourceTemplateRepository)
+
+    operations_create_mock.assert_not_called()
+    templates_create_mock.assert_not_called()
+
+
+async def test_clear_removes_repositories():
+    registry = RepositoryRegistry()
+    repo = await registry.get(OperationRepository)
+
+    registry.clear()
+
+    assert await registry.get(OperationRepository) is not repo
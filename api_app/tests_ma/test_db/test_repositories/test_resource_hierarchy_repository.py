@@ -0,0 +1,106 @@
+import pytest
+import pytest_asyncio
+from mock import AsyncMock, MagicMock, patch
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+from db.repositories.resource_hierarchy import ResourceHierarchyRepository
+from models.domain.resource import ResourceType
+from models.domain.shared_service import SharedService
+from models.domain.user_resource import UserResource
+from models.domain.workspace import Workspace
+from models.domain.workspace_service import WorkspaceService
+
+pytestmark = pytest.mark.asyncio
+
+WORKSPACE_ID = "933ad738-7265-4b5f-9eae-a1a62928772e"
+SERVICE_ID = "abcad738-7265-4b5f-9eae-a1a62928772e"
+USER_RESOURCE_ID = "a33ad738-7265-4b5f-9eae-a1a62928772a"
+
+
+@pytest_asyncio.fixture
+async def hierarchy_repo():
+    with patch('api.dependencies.database.Database.get_container_proxy', return_value=MagicMock()):
+        hierarchy_repo = await ResourceHierarchyRepository.create()
+        yield hierarchy_repo
+
+
+def workspace() -> Workspace:
+    return Workspace(id=WORKSPACE_ID, templateName="tre-workspace-base", templateVersion="0.1.0", etag="", properties={}, resourcePath=f"/workspaces/{WORKSPACE_ID}")
+
+
+def workspace_service() -> WorkspaceService:
+    return WorkspaceService(id=SERVICE_ID, workspaceId=WORKSPACE_ID, templateName="tre-workspace-service", templateVersion="0.1.0", etag="", properties={}, resourcePath=f"/workspaces/{WORKSPACE_ID}/workspace-services/{SERVICE_ID}")
+
+
+def user_resource() -> UserResource:
+    return UserResource(id=USER_RESOURCE_ID, workspaceId=WORKSPACE_ID, parentWorkspaceServiceId=SERVICE_ID, templateName="tre-user-resource", templateVersion="0.1.0", etag="", properties={},
+                        resourcePath=f"/workspaces/{WORKSPACE_ID}/workspace-services/{SERVICE_ID}/user-resources/{USER_RESOURCE_ID}")
+
+
+async def async_items(items):
+    for item in items:
+        yield item
+
+
+async def test_add_resource_indexes_resource_under_its_workspace(hierarchy_repo):
+    hierarchy_repo.container.upsert_item = AsyncMock()
+
+    await hierarchy_repo.add_resource(user_resource())
+
+    hierarchy_repo.container.upsert_item.assert_called_once_with(body={
+        "id": USER_RESOURCE_ID,
+        "workspaceId": WORKSPACE_ID,
+        "resourceType": ResourceType.UserResource,
+        "resourcePath": user_resource().resourcePath,
+        "depth": 6
+    })
+
+
+async def test_add_resource_does_not_index_shared_services(hierarchy_repo):
+    hierarchy_repo.container.upsert_item = AsyncMock()
+
+    await hierarchy_repo.add_resource(SharedService(id="shared", templateName="shared", templateVersion="0.1.0", etag="", properties={}, resourcePath="/shared-services/shared"))
+
+    hierarchy_repo.container.upsert_item.assert_not_called()
+
+
+async def test_remove_resource_deletes_entry_from_workspace_partition(hierarchy_repo):
+    hierarchy_repo.container.delete_item = AsyncMock(side_effect=CosmosResourceNotFoundError)
+
+    await hierarchy_repo.remove_resource(workspace_service())
+
+    hierarchy_repo.container.delete_item.assert_called_once_with(item=SERVICE_ID, partition_key=WORKSPACE_ID)
+
+
+async def test_get_dependency_ids_queries_workspace_partition(hierarchy_repo):
+    hierarchy_repo.container.read_item = AsyncMock(return_value={"id": WORKSPACE_ID})
+    hierarchy_repo.container.query_items = MagicMock(return_value=async_items([{"id": USER_RESOURCE_ID}, {"id": SERVICE_ID}]))
+
+    dependency_ids = await hierarchy_repo.get_dependency_ids(workspace_service())
+
+    assert dependency_ids == [USER_RESOURCE_ID, SERVICE_ID]
+    hierarchy_repo.container.read_item.assert_called_once_with(item=WORKSPACE_ID, partition_key=WORKSPACE_ID)
+    query_kwargs = hierarchy_repo.container.query_items.call_args.kwargs
+    assert query_kwargs["partition_key"] == WORKSPACE_ID
+    assert query_kwargs["query"].endswith("ORDER BY c.depth DESC")
+    assert query_kwargs["parameters"] == [
+        {'name': '@resourcePath', 'value': workspace_service().resourcePath},
+        {'name': '@childResourcePath', 'value': workspace_service().resourcePath + "/"}
+    ]
+
+
+async def test_get_dependency_ids_returns_none_if_workspace_is_not_indexed(hierarchy_repo):
+    hierarchy_repo.container.read_item = AsyncMock(side_effect=CosmosResourceNotFoundError)
+    hierarchy_repo.container.query_items = MagicMock()
+
+    assert await hierarchy_repo.get_dependency_ids(workspace()) is None
+    hierarchy_repo.container.query_items.assert_not_called()
+
+
+async def test_get_dependency_ids_of_shared_service_is_only_itself(hierarchy_repo):
+    hierarchy_repo.container.read_item = AsyncMock()
+
+    shared_service = SharedService(id="shared", templateName="shared", templateVersion="0.1.0", etag="", properties={}, resourcePath="/shared-services/shared")
+
+    assert await hierarchy_repo.get_dependency_ids(shared_service) == ["shared"]
+    hierarchy_repo.container.read_item.assert_not_called()
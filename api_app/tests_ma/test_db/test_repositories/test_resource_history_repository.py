@@ -1,8 +1,10 @@
 from unittest.mock import AsyncMock
-from mock import patch
+from mock import patch, MagicMock
 import pytest
 import pytest_asyncio
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
 
+from db.errors import InvalidInput
 from db.repositories.resources_history import ResourceHistoryRepository
 from models.domain.resource import Resource, ResourceHistoryItem, ResourceType
 from tests_ma.test_api.test_routes.test_resource_helpers import FAKE_CREATE_TIMESTAMP
@@ -16,7 +18,7 @@ RESOURCE_VERSION = 1
 
 @pytest_asyncio.fixture
 async def resource_history_repo():
-    with patch('api.dependencies.database.Database.get_container_proxy', return_value=None):
+    with patch('api.dependencies.database.Database.get_container_proxy', return_value=MagicMock()):
         resource_history_repo = await ResourceHistoryRepository().create()
         yield resource_history_repo
 
@@ -61,13 +63,14 @@ def sample_resource_history() -> ResourceHistoryItem:
 
 
 @pytest.mark.asyncio
-@patch('db.repositories.resources_history.ResourceHistoryRepository.save_item', return_value=AsyncMock())
-async def test_create_resource_history_item(mock_save, resource_history_repo, sample_resource):
+async def test_create_resource_history_item(resource_history_repo, sample_resource):
+    resource_history_repo.container.upsert_item = AsyncMock()
+
     resource_history = await resource_history_repo.create_resource_history_item(sample_resource)
     # Assertions
     assert isinstance(resource_history, ResourceHistoryItem)
-    mock_save.assert_called_once_with(resource_history)
-    assert resource_history.id is not None
+    resource_history_repo.container.upsert_item.assert_called_once_with(body=resource_history.model_dump())
+    assert resource_history.id == f"{RESOURCE_ID}-{RESOURCE_VERSION}"
     assert resource_history.resourceId == sample_resource.id
     assert resource_history.isEnabled is True
     assert resource_history.properties == sample_resource.properties
@@ -77,6 +80,68 @@ async def test_create_resource_history_item(mock_save, resource_history_repo, sa
     assert resource_history.templateVersion == sample_resource.templateVersion
 
 
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("in_memory_database")
+async def test_create_resource_history_item_again_for_a_version_replaces_it(sample_resource):
+    resource_history_repo = await ResourceHistoryRepository.create()
+    sample_resource.resourceVersion = 0
+    await resource_history_repo.create_resource_history_item(sample_resource)
+    sample_resource.resourceVersion = 1
+    await resource_history_repo.create_resource_history_item(sample_resource)
+    sample_resource.properties = {**sample_resource.properties, 'display_name': 'retried'}
+    retried = await resource_history_repo.create_resource_history_item(sample_resource)
+
+    history = await resource_history_repo.get_resource_history_by_resource_id(RESOURCE_ID)
+
+    assert [item.resourceVersion for item in history] == [0, 1]
+    assert history[1] == retried
+
+
+@pytest.mark.asyncio
+@patch('db.repositories.resources_history.ResourceHistoryRepository.query')
+async def test_create_resource_history_item_stores_patch_against_chain_snapshot_read_from_its_partition(mock_query, resource_history_repo, sample_resource, sample_resource_history):
+    resource_history_repo.container.read_item = AsyncMock(return_value=sample_resource_history.model_dump())
+    resource_history_repo.container.upsert_item = AsyncMock()
+    sample_resource.properties = {**sample_resource.properties, 'display_name': 'new display name', 'new_prop': 'new_val'}
+    del sample_resource.properties['computed_prop']
+
+    await resource_history_repo.create_resource_history_item(sample_resource, HISTORY_ID)
+
+    resource_history_repo.container.read_item.assert_called_once_with(item=HISTORY_ID, partition_key=RESOURCE_ID)
+    mock_query.assert_not_called()
+    stored = resource_history_repo.container.upsert_item.call_args.kwargs["body"]
+    assert "properties" not in stored
+    assert stored["baseId"] == HISTORY_ID
+    assert stored["snapshotId"] == HISTORY_ID
+    assert stored["propertiesPatch"] == [
+        {"op": "remove", "path": "/computed_prop"},
+        {"op": "replace", "path": "/display_name", "value": "new display name"},
+        {"op": "add", "path": "/new_prop", "value": "new_val"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_create_resource_history_item_stores_snapshot_when_chain_snapshot_is_missing(resource_history_repo, sample_resource):
+    resource_history_repo.container.read_item = AsyncMock(side_effect=CosmosResourceNotFoundError)
+    resource_history_repo.container.upsert_item = AsyncMock()
+
+    resource_history = await resource_history_repo.create_resource_history_item(sample_resource, HISTORY_ID)
+
+    resource_history_repo.container.upsert_item.assert_called_once_with(body=resource_history.model_dump())
+
+
+@patch('core.config.RESOURCE_HISTORY_SNAPSHOT_INTERVAL', 2)
+def test_advance_history_chain_starts_a_new_chain_when_the_chain_is_full(sample_resource):
+    snapshot_ids = []
+    for version in range(5):
+        sample_resource.resourceVersion = version
+        snapshot_ids.append(ResourceHistoryRepository.advance_history_chain(sample_resource))
+
+    assert snapshot_ids == [None, f"{RESOURCE_ID}-0", None, f"{RESOURCE_ID}-2", None]
+    assert sample_resource.historySnapshotId == f"{RESOURCE_ID}-4"
+    assert sample_resource.historyChainLength == 1
+
+
 @pytest.mark.asyncio
 @patch('db.repositories.resources_history.ResourceHistoryRepository.save_item', side_effect=Exception)
 async def test_create_resource_history_item_throws_error_when_saving(mock_save, resource_history_repo, sample_resource):
@@ -97,10 +162,10 @@ async def test_create_resource_history_item_throws_error_when_saving(mock_save,
 @pytest.mark.asyncio
 @patch('db.repositories.resources_history.ResourceHistoryRepository.query')
 async def test_get_resource_history_by_resource_id_if_found(mock_query, resource_history_repo, sample_resource_history):
-    mock_query.return_value = [sample_resource_history]
+    mock_query.return_value = [sample_resource_history.model_dump()]
     result = await resource_history_repo.get_resource_history_by_resource_id(RESOURCE_ID)
 
-    assert result == mock_query.return_value
+    assert result == [sample_resource_history]
 
 
 @pytest.mark.asyncio
@@ -110,3 +175,46 @@ async def test_get_resource_history_by_resource_id_if_not_found(mock_query, reso
     result = await resource_history_repo.get_resource_history_by_resource_id(RESOURCE_ID)
 
     assert result == mock_query.return_value
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("in_memory_database")
+@patch('core.config.RESOURCE_HISTORY_SNAPSHOT_INTERVAL', 3)
+async def test_resource_history_is_reconstructed_from_patches(sample_resource):
+    resource_history_repo = await ResourceHistoryRepository.create()
+    versions = []
+    for version in range(7):
+        sample_resource.resourceVersion = version
+        sample_resource.properties = {**sample_resource.properties, 'display_name': f'name {version}', 'outputs': {'count': version}}
+        snapshot_id = ResourceHistoryRepository.advance_history_chain(sample_resource)
+        versions.append(await resource_history_repo.create_resource_history_item(sample_resource, snapshot_id))
+
+    stored = await resource_history_repo.query('SELECT * FROM c ORDER BY c.resourceVersion')
+    first_page, continuation_token = await resource_history_repo.get_resource_history_page(RESOURCE_ID, page_size=4)
+    second_page, _ = await resource_history_repo.get_resource_history_page(RESOURCE_ID, page_size=4, continuation_token=continuation_token)
+
+    assert ["properties" in item for item in stored] == [True, False, False, True, False, False, True]
+    assert await resource_history_repo.get_resource_history_by_resource_id(RESOURCE_ID) == versions
+    assert first_page + second_page == versions
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("in_memory_database")
+@patch('core.config.RESOURCE_HISTORY_SNAPSHOT_INTERVAL', 3)
+async def test_resource_history_is_filtered_ordered_and_projected(sample_resource):
+    resource_history_repo = await ResourceHistoryRepository.create()
+    for version in range(6):
+        sample_resource.resourceVersion = version
+        sample_resource.updatedWhen = 100 + version
+        sample_resource.properties = {**sample_resource.properties, 'display_name': f'name {version}'}
+        await resource_history_repo.create_resource_history_item(sample_resource, ResourceHistoryRepository.advance_history_chain(sample_resource))
+
+    newest_first = await resource_history_repo.get_resource_history_by_resource_id(RESOURCE_ID, from_when=101, to_when=104, order_ascending=False)
+    page, continuation_token = await resource_history_repo.get_resource_history_page(RESOURCE_ID, page_size=2, from_when=102, fields=["resourceVersion", "updatedWhen"])
+
+    assert [item.resourceVersion for item in newest_first] == [4, 3, 2, 1]
+    assert newest_first[0].properties["display_name"] == "name 4"
+    assert [item.resourceVersion for item in page] == [2, 3] and continuation_token is not None
+    assert page[0].model_fields_set == {"id", "resourceId", "resourceVersion", "updatedWhen"}
+    with pytest.raises(InvalidInput):
+        await resource_history_repo.get_resource_history_by_resource_id(RESOURCE_ID, fields=["secrets"])
@@ -12,8 +12,8 @@ from tests_ma.test_api.test_routes.test_resource_helpers import FAKE_CREATE_TIME
 from tests_ma.test_api.conftest import create_test_user
 
 from db.errors import EntityDoesNotExist, UserNotAuthorizedToUseTemplate
-from db.repositories.resources import ResourceRepository
-from azure.cosmos.exceptions import CosmosResourceNotFoundError
+from db.repositories.resources import ResourceRepository, TemplateValidatorRegistry
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceNotFoundError
 from models.domain.resource import Resource
 from models.domain.resource_template import ResourceTemplate
 from models.domain.user_resource_template import UserResourceTemplate
@@ -322,6 +322,17 @@ async def test_get_enriched_template_returns_the_enriched_template_for_user_reso
     assert "display_name" in template["properties"]
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_resource_dict_by_id_point_reads_within_the_workspace_partition_given(resource_repo, partitioned_by_workspace):
+    resource_repo.partitioned_by_workspace = partitioned_by_workspace
+    resource_repo.read_item_by_id = AsyncMock(return_value={"id": "123"})
+
+    await resource_repo.get_resource_dict_by_id("123", workspace_partition="workspace-id")
+
+    resource_repo.read_item_by_id.assert_called_once_with("123", ["workspace-id", "123"] if partitioned_by_workspace else "123")
+
+
 @pytest.mark.asyncio
 async def test_get_resource_dict_by_id_raises_entity_does_not_exist_if_no_resources_come_back(resource_repo):
     item_id = "123"
@@ -350,6 +361,8 @@ async def test_patch_resource_preserves_property_history(_, __, ___, resource_re
     expected_resource = sample_resource()
     expected_resource.properties['display_name'] = 'updated name'
     expected_resource.resourceVersion = 1
+    expected_resource.historySnapshotId = f"{expected_resource.id}-0"
+    expected_resource.historyChainLength = 1
     expected_resource.user = user.model_dump()
     expected_resource.updatedWhen = FAKE_UPDATE_TIMESTAMP
 
@@ -360,6 +373,7 @@ async def test_patch_resource_preserves_property_history(_, __, ___, resource_re
     new_resource = copy.deepcopy(expected_resource)  # new_resource is after the first patch
     new_patch = ResourcePatch(isEnabled=False, properties={'display_name': 'updated name 2'})
     expected_resource.resourceVersion = 2
+    expected_resource.historyChainLength = 2
     expected_resource.properties['display_name'] = "updated name 2"
     expected_resource.isEnabled = False
     expected_resource.user = user.model_dump()
@@ -368,6 +382,25 @@ async def test_patch_resource_preserves_property_history(_, __, ___, resource_re
     resource_repo.update_item_with_etag.assert_called_with(expected_resource, etag)
 
 
+@pytest.mark.asyncio
+@patch("db.repositories.resources_history.ResourceHistoryRepository.save_item")
+@patch('db.repositories.resources.ResourceRepository.validate_patch')
+async def test_patch_resource_saves_history_of_the_patched_version_only_once_patched(_, mock_save, resource_repo, resource_history_repo):
+    resource_repo.update_item_with_etag = AsyncMock(side_effect=[CosmosAccessConditionFailedError, None])
+    resource_patch = ResourcePatch(properties={'display_name': 'updated name'})
+
+    with pytest.raises(CosmosAccessConditionFailedError):
+        await resource_repo.patch_resource(sample_resource(), resource_patch, None, "stale-etag", None, resource_history_repo, create_test_user(), strings.RESOURCE_ACTION_UPDATE)
+    mock_save.assert_not_called()
+
+    await resource_repo.patch_resource(sample_resource(), resource_patch, None, "etag", None, resource_history_repo, create_test_user(), strings.RESOURCE_ACTION_UPDATE)
+    history_item, snapshot_id = mock_save.call_args.args
+    assert history_item.id == f"{history_item.resourceId}-0"
+    assert snapshot_id is None
+    assert history_item.resourceVersion == 0
+    assert history_item.properties["display_name"] != 'updated name'
+
+
 @patch('db.repositories.resources.ResourceTemplateRepository.enrich_template')
 def test_validate_patch_with_good_fields_passes(template_repo, resource_repo):
     """
@@ -407,6 +440,47 @@ def test_validate_patch_with_bad_fields_fails(template_repo, resource_repo):
         resource_repo.validate_patch(patch, template_repo, template, strings.RESOURCE_ACTION_INSTALL)
 
 
+@patch('db.repositories.resources.ResourceTemplateRepository.enrich_template')
+def test_validate_patch_compiles_update_schema_once_per_template_and_action(template_repo, resource_repo):
+    template_repo.enrich_template = MagicMock(return_value=sample_resource_template())
+    template = sample_resource_template()
+
+    patch = ResourcePatch(isEnabled=True, properties={'vm_size': 'large'})
+    resource_repo.validate_patch(patch, template_repo, template, strings.RESOURCE_ACTION_UPDATE)
+    resource_repo.validate_patch(patch, template_repo, template, strings.RESOURCE_ACTION_UPDATE)
+    assert template_repo.enrich_template.call_count == 1
+
+    resource_repo.validate_patch(patch, template_repo, template, strings.RESOURCE_ACTION_INSTALL)
+    assert template_repo.enrich_template.call_count == 2
+
+
+def test_validate_resource_parameters_reuses_compiled_validator_for_template_id(resource_repo):
+    template = sample_resource_template()
+    resource_input = {"properties": {"title": "my vm", "os_image": "Windows 11"}}
+
+    with patch("db.repositories.resources.ResourceRepository._normalize_template_schema", wraps=ResourceRepository._normalize_template_schema) as normalize_mock:
+        resource_repo._validate_resource_parameters(resource_input, template)
+        resource_repo._validate_resource_parameters(resource_input, template)
+
+    normalize_mock.assert_called_once()
+    with pytest.raises(ValidationError):
+        resource_repo._validate_resource_parameters({"properties": {"title": "my vm"}}, template)
+
+
+def test_template_validator_registry_evicts_least_recently_used_validator():
+    registry = TemplateValidatorRegistry(max_size=2)
+    schema = {"type": "object"}
+
+    first = registry.get_validator(("1", False, "install"), lambda: schema)
+    second = registry.get_validator(("2", False, "install"), lambda: schema)
+    assert registry.get_validator(("1", False, "install"), lambda: schema) is first
+
+    # "2" is now the least recently used entry
+    registry.get_validator(("3", False, "install"), lambda: schema)
+    assert registry.get_validator(("1", False, "install"), lambda: schema) is first
+    assert registry.get_validator(("2", False, "install"), lambda: schema) is not second
+
+
 @pytest.mark.parametrize("nested_schema_id", [
     "#/properties/guac_disable_paste",
     "#properties/network_rule_collections",
@@ -492,3 +566,87 @@ def test_validate_resource_parameters_keeps_nullable_const_null(resource_repo):
 
     normalized_template = resource_repo._normalize_template_schema(template)
     assert normalized_template["properties"]["nullable_const"]["const"] is None
+
+
+def dependency_dict(resource_id: str, resource_path: str, deployment_status: str = "deployed") -> dict:
+    return {"id": resource_id, "resourcePath": resource_path, "deploymentStatus": deployment_status}
+
+
+@pytest.mark.asyncio
+async def test_get_resource_dependency_list_point_reads_indexed_dependencies(resource_repo):
+    workspace = dependency_dict("ws", "/workspaces/ws")
+    service = dependency_dict("svc", "/workspaces/ws/workspace-services/svc")
+    deleted_user_resource = dependency_dict("ur", "/workspaces/ws/workspace-services/svc/user-resources/ur", "deleted")
+    items = {item["id"]: item for item in [workspace, service, deleted_user_resource]}
+    resource_repo.hierarchy_repo = AsyncMock()
+    resource_repo.hierarchy_repo.get_dependency_ids.return_value = ["ur", "gone", "svc", "ws"]
+
+    async def read_item_by_id(item_id, partition_key=None):
+        if item_id not in items:
+            raise CosmosResourceNotFoundError
+        return items[item_id]
+    resource_repo.read_item_by_id = read_item_by_id
+    resource_repo.query = AsyncMock()
+
+    dependencies = await resource_repo.get_resource_dependency_list(sample_resource())
+
+    assert dependencies == [service, workspace]
+    resource_repo.query.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_resource_dependency_list_queries_resource_paths_if_workspace_is_not_indexed(resource_repo):
+    workspace = dependency_dict("ws", "/workspaces/ws")
+    service = dependency_dict("svc", "/workspaces/ws/workspace-services/svc")
+    resource_repo.hierarchy_repo = AsyncMock()
+    resource_repo.hierarchy_repo.get_dependency_ids.return_value = None
+    resource_repo.query = AsyncMock(return_value=[workspace, service])
+
+    dependencies = await resource_repo.get_resource_dependency_list(sample_resource())
+
+    assert dependencies == [service, workspace]
+    assert "CONTAINS(c.resourcePath, @resourcePath)" in resource_repo.query.call_args.kwargs["query"]
+
+
+@pytest.mark.asyncio
+async def test_save_item_indexes_resource_before_saving(resource_repo):
+    calls = []
+    resource = sample_resource()
+    resource_repo.hierarchy_repo = AsyncMock()
+    resource_repo.hierarchy_repo.add_resource.side_effect = lambda r: calls.append("index")
+    resource_repo._container = MagicMock()
+    resource_repo.container.create_item = AsyncMock(side_effect=lambda body: calls.append("save"))
+
+    await resource_repo.save_item(resource)
+
+    resource_repo.hierarchy_repo.add_resource.assert_called_once_with(resource)
+    assert calls == ["index", "save"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_delete_resource_removes_resource_from_index(resource_repo, partitioned_by_workspace):
+    resource_repo.partitioned_by_workspace = partitioned_by_workspace
+    resource = sample_resource()
+    resource_repo.hierarchy_repo = AsyncMock()
+    resource_repo.delete_item = AsyncMock()
+
+    await resource_repo.delete_resource(resource)
+
+    # a workspace is in its own workspace's partition
+    resource_repo.delete_item.assert_called_once_with(resource.id, [resource.id, resource.id] if partitioned_by_workspace else resource.id)
+    resource_repo.hierarchy_repo.remove_resource.assert_called_once_with(resource)
+
+
+def test_resource_hierarchy_migrations_index_workspaces_last(resource_repo):
+    resource_repo.hierarchy_repo = MagicMock()
+
+    children, workspaces = resource_repo.resource_hierarchy_migrations()
+
+    assert children.target == workspaces.target == resource_repo.hierarchy_repo.container
+    assert children.parameters[1]["value"] == [ResourceType.WorkspaceService, ResourceType.UserResource]
+    assert workspaces.parameters[1]["value"] == [ResourceType.Workspace]
+    user_resource = {"id": "ur", "resourceType": ResourceType.UserResource, "resourcePath": "/workspaces/ws/workspace-services/svc/user-resources/ur", "workspaceId": "ws"}
+    workspace = {"id": "ws", "resourceType": ResourceType.Workspace, "resourcePath": "/workspaces/ws"}
+    assert children.transform(user_resource) == {"id": "ur", "workspaceId": "ws", "resourceType": ResourceType.UserResource, "resourcePath": user_resource["resourcePath"], "depth": 6}
+    assert workspaces.transform(workspace) == {"id": "ws", "workspaceId": "ws", "resourceType": ResourceType.Workspace, "resourcePath": "/workspaces/ws", "depth": 2}
@@ -3,7 +3,7 @@ import pytest_asyncio
 from mock import patch
 from models.domain.user_resource_template import UserResourceTemplate
 
-from db.repositories.resource_templates import ResourceTemplateRepository
+from db.repositories.resource_templates import ResourceTemplateRepository, template_cache
 from db.errors import EntityDoesNotExist, InvalidInput
 from models.domain.resource import ResourceType
 from models.domain.resource_template import ResourceTemplate
@@ -111,6 +111,62 @@ async def test_get_by_name_and_version_raises_entity_does_not_exist_if_no_templa
         await resource_template_repo.get_template_by_name_and_version(name=template_name, version=template_version, resource_type=ResourceType.Workspace)
 
 
+@patch('db.repositories.resource_templates.ResourceTemplateRepository.query')
+async def test_get_by_name_and_version_is_served_from_cache_on_repeated_lookups(query_mock, resource_template_repo):
+    query_mock.return_value = [sample_resource_template_as_dict(name="test", version="1.0")]
+
+    first = await resource_template_repo.get_template_by_name_and_version(name="test", version="1.0", resource_type=ResourceType.Workspace)
+    second = await resource_template_repo.get_template_by_name_and_version(name="test", version="1.0", resource_type=ResourceType.Workspace)
+
+    query_mock.assert_called_once()
+    assert first == second
+    assert first is not second
+    assert template_cache.hits == 1
+    assert template_cache.misses == 1
+
+
+@patch('db.repositories.resource_templates.ResourceTemplateRepository.query')
+async def test_get_by_name_and_version_takes_current_from_the_cached_current_template(query_mock, resource_template_repo):
+    old_template = sample_resource_template_as_dict(name="test", version="1.0")
+    old_template["current"] = True
+    new_template = sample_resource_template_as_dict(name="test", version="2.0")
+    new_template["current"] = True
+    query_mock.return_value = [old_template]
+    await resource_template_repo.get_template_by_name_and_version(name="test", version="1.0", resource_type=ResourceType.Workspace)
+
+    # another API instance registers 2.0, which this one picks up once the current template expires
+    query_mock.return_value = [new_template]
+    with patch.object(template_cache, "current_ttl", -1):
+        await resource_template_repo.get_current_template(template_name="test", resource_type=ResourceType.Workspace)
+    template = await resource_template_repo.get_template_by_name_and_version(name="test", version="1.0", resource_type=ResourceType.Workspace)
+
+    assert query_mock.call_count == 2
+    assert not template.current
+
+
+@patch('db.repositories.resource_templates.ResourceTemplateRepository.query')
+async def test_get_by_name_and_version_is_read_again_once_its_current_flag_expires(query_mock, resource_template_repo):
+    template = sample_resource_template_as_dict(name="test", version="1.0")
+    template["current"] = True
+    query_mock.return_value = [template]
+    await resource_template_repo.get_template_by_name_and_version(name="test", version="1.0", resource_type=ResourceType.Workspace)
+
+    with patch.object(template_cache, "current_ttl", -1):
+        await resource_template_repo.get_template_by_name_and_version(name="test", version="1.0", resource_type=ResourceType.Workspace)
+
+    assert query_mock.call_count == 2
+
+
+@patch('db.repositories.resource_templates.ResourceTemplateRepository.query')
+async def test_get_by_name_and_version_caches_user_resource_templates_per_parent_service(query_mock, resource_template_repo):
+    query_mock.return_value = [sample_resource_template_as_dict(name="test", version="1.0", resource_type=ResourceType.UserResource)]
+
+    await resource_template_repo.get_template_by_name_and_version(name="test", version="1.0", resource_type=ResourceType.UserResource, parent_service_name="parent1")
+    await resource_template_repo.get_template_by_name_and_version(name="test", version="1.0", resource_type=ResourceType.UserResource, parent_service_name="parent2")
+
+    assert query_mock.call_count == 2
+
+
 @patch('db.repositories.resource_templates.ResourceTemplateRepository.query')
 async def test_get_current_by_name_queries_db(query_mock, resource_template_repo):
     template_name = "template1"
@@ -293,3 +349,38 @@ async def test_create_template_with_null_pipeline_creates_template_without_pipel
     input_user_resource_template.json_schema["pipeline"] = None
     created = await resource_template_repo.create_template(input_user_resource_template, ResourceType.UserResource)
     assert created.pipeline is None
+
+
+@patch('db.repositories.resource_templates.ResourceTemplateRepository.query')
+async def test_get_current_template_is_served_from_cache_until_ttl_expires(query_mock, resource_template_repo):
+    current_template = sample_resource_template_as_dict(name="template1")
+    current_template["current"] = True
+    query_mock.return_value = [current_template]
+
+    await resource_template_repo.get_current_template(template_name="template1", resource_type=ResourceType.Workspace)
+    await resource_template_repo.get_current_template(template_name="template1", resource_type=ResourceType.Workspace)
+    query_mock.assert_called_once()
+
+    with patch.object(template_cache, "current_ttl", -1):
+        await resource_template_repo.get_current_template(template_name="template1", resource_type=ResourceType.Workspace)
+    assert query_mock.call_count == 2
+
+
+@patch('db.repositories.resource_templates.ResourceTemplateRepository.create_template')
+@patch('db.repositories.resource_templates.ResourceTemplateRepository.update_item')
+@patch('db.repositories.resource_templates.ResourceTemplateRepository.query')
+async def test_create_and_validate_template_invalidates_cached_current_template(query_mock, _, create_template_mock, resource_template_repo, input_workspace_template):
+    current_template = sample_resource_template_as_dict(name=input_workspace_template.name, version="0.0.0")
+    current_template["current"] = True
+    query_mock.return_value = [current_template]
+    await resource_template_repo.get_current_template(template_name=input_workspace_template.name, resource_type=ResourceType.Workspace)
+
+    new_template = ResourceTemplate(**{**current_template, "version": input_workspace_template.version})
+    create_template_mock.return_value = new_template
+    query_mock.side_effect = [[], [current_template]]
+    await resource_template_repo.create_and_validate_template(input_workspace_template, ResourceType.Workspace)
+
+    query_mock.side_effect = None
+    query_mock.return_value = [new_template.model_dump()]
+    template = await resource_template_repo.get_current_template(template_name=input_workspace_template.name, resource_type=ResourceType.Workspace)
+    assert template.version == input_workspace_template.version
@@ -1,11 +1,14 @@
 from unittest.mock import AsyncMock
 import pytest
 import pytest_asyncio
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
 from mock import patch
 
 from db.errors import DuplicateEntity, EntityDoesNotExist
+from db.partitioning import SHARED_PARTITION
 from db.repositories.shared_services import SharedServiceRepository
 from db.repositories.operations import OperationRepository
+from models.domain.operation import Status
 from models.domain.shared_service import SharedService
 from models.domain.resource import ResourceType
 from models.schemas.shared_service import SharedServiceInCreate
@@ -54,26 +57,41 @@ def basic_shared_service_request():
 
 
 async def test_get_shared_service_by_id_raises_if_does_not_exist(shared_service_repo):
-    shared_service_repo.query = AsyncMock(return_value=[])
+    shared_service_repo.read_item_by_id = AsyncMock(side_effect=CosmosResourceNotFoundError)
 
     with pytest.raises(EntityDoesNotExist):
         await shared_service_repo.get_shared_service_by_id(SHARED_SERVICE_ID)
 
 
-async def test_get_shared_service_by_id_raises_if_deleted(shared_service_repo):
-    shared_service_repo.query = AsyncMock(return_value=[])
+async def test_get_shared_service_by_id_raises_if_deleted(shared_service_repo, shared_service):
+    shared_service.deploymentStatus = Status.Deleted
+    shared_service_repo.read_item_by_id = AsyncMock(return_value=shared_service.model_dump())
 
     with pytest.raises(EntityDoesNotExist):
         await shared_service_repo.get_shared_service_by_id(SHARED_SERVICE_ID)
 
 
-async def test_get_active_shared_services_for_shared_queries_db(shared_service_repo):
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_shared_service_by_id_point_reads_db(shared_service_repo, shared_service, partitioned_by_workspace):
+    shared_service_repo.partitioned_by_workspace = partitioned_by_workspace
+    shared_service_repo.read_item_by_id = AsyncMock(return_value=shared_service.model_dump())
+
+    actual_service = await shared_service_repo.get_shared_service_by_id(SHARED_SERVICE_ID)
+
+    shared_service_repo.read_item_by_id.assert_called_once_with(SHARED_SERVICE_ID, [SHARED_PARTITION, SHARED_SERVICE_ID] if partitioned_by_workspace else SHARED_SERVICE_ID)
+    assert actual_service == shared_service
+
+
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_active_shared_services_for_shared_queries_db(shared_service_repo, partitioned_by_workspace):
+    shared_service_repo.partitioned_by_workspace = partitioned_by_workspace
     shared_service_repo.query = AsyncMock(return_value=[])
     query, parameters = SharedServiceRepository.active_shared_services_query()
 
     await shared_service_repo.get_active_shared_services()
 
-    shared_service_repo.query.assert_called_once_with(query=query, parameters=parameters)
+    expected_options = {"partition_key": [SHARED_PARTITION]} if partitioned_by_workspace else {}
+    shared_service_repo.query.assert_called_once_with(query=query, parameters=parameters, **expected_options)
 
 
 @patch('db.repositories.shared_services.SharedServiceRepository.validate_input_against_template')
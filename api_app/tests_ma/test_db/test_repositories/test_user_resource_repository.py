@@ -1,3 +1,5 @@
+from unittest.mock import AsyncMock
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
 from mock import patch
 import pytest
 import pytest_asyncio
@@ -69,7 +71,9 @@ async def test_create_user_resource_item_raises_value_error_if_template_is_inval
 
 
 @patch('db.repositories.user_resources.UserResourceRepository.query', return_value=[])
-async def test_get_user_resources_for_workspace_queries_db(query_mock, user_resource_repo):
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_user_resources_for_workspace_queries_db(query_mock, user_resource_repo, partitioned_by_workspace):
+    user_resource_repo.partitioned_by_workspace = partitioned_by_workspace
     expected_query = 'SELECT * FROM c WHERE c.deploymentStatus != @deletedStatus AND c.resourceType = @resourceType AND c.parentWorkspaceServiceId = @serviceId AND c.workspaceId = @workspaceId'
     expected_parameters = [
         {'name': '@deletedStatus', 'value': Status.Deleted},
@@ -80,42 +84,53 @@ async def test_get_user_resources_for_workspace_queries_db(query_mock, user_reso
 
     await user_resource_repo.get_user_resources_for_workspace_service(WORKSPACE_ID, SERVICE_ID)
 
-    query_mock.assert_called_once_with(query=expected_query, parameters=expected_parameters)
+    expected_options = {"partition_key": [WORKSPACE_ID]} if partitioned_by_workspace else {}
+    query_mock.assert_called_once_with(query=expected_query, parameters=expected_parameters, **expected_options)
 
 
-@patch('db.repositories.user_resources.UserResourceRepository.query')
-async def test_get_user_resource_returns_resource_if_found(query_mock, user_resource_repo, user_resource):
-    query_mock.return_value = [user_resource.model_dump()]
+async def test_get_user_resource_returns_resource_if_found(user_resource_repo, user_resource):
+    user_resource.workspaceId = WORKSPACE_ID
+    user_resource.parentWorkspaceServiceId = SERVICE_ID
+    user_resource_repo.read_item_by_id = AsyncMock(return_value=user_resource.model_dump())
 
     actual_resource = await user_resource_repo.get_user_resource_by_id(WORKSPACE_ID, SERVICE_ID, RESOURCE_ID)
 
     assert actual_resource == user_resource
 
 
-@patch('db.repositories.user_resources.UserResourceRepository.query')
-async def test_get_user_resource_by_id_queries_db(query_mock, user_resource_repo, user_resource):
-    query_mock.return_value = [user_resource.model_dump()]
-    expected_query = 'SELECT * FROM c WHERE c.resourceType = @resourceType AND c.parentWorkspaceServiceId = @serviceId AND c.workspaceId = @workspaceId AND c.id = @resourceId AND c.deploymentStatus != @deletedStatus'
-    expected_parameters = [
-        {'name': '@resourceType', 'value': ResourceType.UserResource},
-        {'name': '@serviceId', 'value': SERVICE_ID},
-        {'name': '@workspaceId', 'value': WORKSPACE_ID},
-        {'name': '@resourceId', 'value': RESOURCE_ID},
-        {'name': '@deletedStatus', 'value': Status.Deleted}
-    ]
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_user_resource_by_id_point_reads_db(user_resource_repo, user_resource, partitioned_by_workspace):
+    user_resource_repo.partitioned_by_workspace = partitioned_by_workspace
+    user_resource.workspaceId = WORKSPACE_ID
+    user_resource.parentWorkspaceServiceId = SERVICE_ID
+    user_resource_repo.read_item_by_id = AsyncMock(return_value=user_resource.model_dump())
 
     await user_resource_repo.get_user_resource_by_id(WORKSPACE_ID, SERVICE_ID, RESOURCE_ID)
 
-    query_mock.assert_called_once_with(query=expected_query, parameters=expected_parameters)
+    user_resource_repo.read_item_by_id.assert_called_once_with(RESOURCE_ID, [WORKSPACE_ID, RESOURCE_ID] if partitioned_by_workspace else RESOURCE_ID)
 
 
-@patch('db.repositories.user_resources.UserResourceRepository.query', return_value=[])
-async def test_get_user_resource_by_id_raises_entity_does_not_exist_if_not_found(_, user_resource_repo):
+async def test_get_user_resource_by_id_raises_entity_does_not_exist_if_not_found(user_resource_repo):
+    user_resource_repo.read_item_by_id = AsyncMock(side_effect=CosmosResourceNotFoundError)
+
     with pytest.raises(EntityDoesNotExist):
         await user_resource_repo.get_user_resource_by_id(WORKSPACE_ID, SERVICE_ID, RESOURCE_ID)
 
 
-@patch('db.repositories.user_resources.UserResourceRepository.query', return_value=[])
-async def test_get_user_resource_by_id_raises_entity_does_not_exist_if_resource_is_deleted(_, user_resource_repo):
+async def test_get_user_resource_by_id_raises_entity_does_not_exist_if_resource_is_deleted(user_resource_repo, user_resource):
+    user_resource.workspaceId = WORKSPACE_ID
+    user_resource.parentWorkspaceServiceId = SERVICE_ID
+    user_resource.deploymentStatus = Status.Deleted
+    user_resource_repo.read_item_by_id = AsyncMock(return_value=user_resource.model_dump())
+
+    with pytest.raises(EntityDoesNotExist):
+        await user_resource_repo.get_user_resource_by_id(WORKSPACE_ID, SERVICE_ID, RESOURCE_ID)
+
+
+async def test_get_user_resource_by_id_raises_entity_does_not_exist_if_resource_is_in_another_service(user_resource_repo, user_resource):
+    user_resource.workspaceId = WORKSPACE_ID
+    user_resource.parentWorkspaceServiceId = "another-service"
+    user_resource_repo.read_item_by_id = AsyncMock(return_value=user_resource.model_dump())
+
     with pytest.raises(EntityDoesNotExist):
         await user_resource_repo.get_user_resource_by_id(WORKSPACE_ID, SERVICE_ID, RESOURCE_ID)
@@ -1,19 +1,22 @@
-import copy
 from unittest.mock import AsyncMock
 import pytest
 import pytest_asyncio
 from mock import patch, MagicMock
 import uuid
 import asyncio
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
 
 from db.errors import EntityDoesNotExist, InvalidInput, ResourceIsNotDeployed, StorageAccountNameGenerationTimeout
 from db.repositories.operations import OperationRepository
 from db.repositories.workspaces import WorkspaceRepository
 from models.domain.operation import Status
 from models.domain.resource import ResourceType
-from models.domain.workspace import Workspace
+from models.domain.workspace import Workspace, WorkspaceAddressSpaces, WorkspaceAirlockManagerRole
+from models.schemas.resource import ResourcePatch
 from models.schemas.workspace import WorkspaceInCreate
 
+WORKSPACE_ID = "000000d3-82da-4bfc-b6e9-9a7853ef753e"
+
 
 @pytest.fixture
 def basic_workspace_request():
@@ -24,6 +27,10 @@ def basic_workspace_request():
 async def workspace_repo():
     with patch('api.dependencies.database.Database.get_container_proxy', return_value=MagicMock()):
         workspace_repo = await WorkspaceRepository().create()
+        # no allocations recorded yet, so they're seeded from the active workspaces
+        workspace_repo.address_space_repo._container = MagicMock()
+        workspace_repo.address_space_repo.container.read_item = AsyncMock(side_effect=CosmosResourceNotFoundError)
+        workspace_repo.address_space_repo.container.create_item = AsyncMock(return_value={"_etag": "etag"})
         yield workspace_repo
 
 
@@ -50,10 +57,13 @@ def workspace():
 @pytest.mark.asyncio
 async def test_get_workspaces_queries_db(workspace_repo):
     workspace_repo.container.query_items = MagicMock()
+    workspace_repo.deleted_repo = AsyncMock()
+    workspace_repo.deleted_repo.get_workspaces.return_value = []
     expected_query, expected_parameters = workspace_repo.workspaces_query_string()
 
     await workspace_repo.get_workspaces()
     workspace_repo.container.query_items.assert_called_once_with(query=expected_query, parameters=expected_parameters)
+    workspace_repo.deleted_repo.get_workspaces.assert_called_once()
 
 
 @pytest.mark.asyncio
@@ -80,7 +90,7 @@ async def test_get_deployed_workspace_by_id_raises_resource_is_not_deployed_if_n
 @pytest.mark.asyncio
 async def test_get_workspace_by_id_raises_entity_does_not_exist_if_item_does_not_exist(workspace_repo):
     workspace_id = uuid.uuid4()
-    workspace_repo.container.query_items = MagicMock()
+    workspace_repo.container.read_item = AsyncMock(side_effect=CosmosResourceNotFoundError)
 
     with pytest.raises(EntityDoesNotExist):
         await workspace_repo.get_workspace_by_id(workspace_id)
@@ -89,32 +99,27 @@ async def test_get_workspace_by_id_raises_entity_does_not_exist_if_item_does_not
 @pytest.mark.asyncio
 async def test_get_workspace_by_id_raises_entity_does_not_exist_if_workspace_is_deleted(workspace_repo, workspace):
     workspace_id = workspace.id
-    workspace_repo.container.query_items = MagicMock()
-    workspace_repo.container.query_items.return_value = AsyncMock()
-    workspace_repo.container.query_items.return_value.__aiter__.return_value = []
+    workspace.deploymentStatus = Status.Deleted
+    workspace_repo.container.read_item = AsyncMock(return_value=workspace.model_dump())
 
     with pytest.raises(EntityDoesNotExist):
         await workspace_repo.get_workspace_by_id(workspace_id)
 
 
 @pytest.mark.asyncio
-async def test_get_workspace_by_id_queries_db(workspace_repo, workspace):
-    workspace_query_item_result = AsyncMock()
-    workspace_query_item_result.__aiter__.return_value = [workspace.model_dump()]
-    workspace_repo.container.query_items = MagicMock(return_value=workspace_query_item_result)
-    expected_query = 'SELECT * FROM c WHERE c.resourceType = @resourceType AND c.id = @workspaceId AND c.deploymentStatus != @deletedStatus'
-    expected_parameters = [
-        {'name': '@resourceType', 'value': ResourceType.Workspace},
-        {'name': '@workspaceId', 'value': workspace.id},
-        {'name': '@deletedStatus', 'value': Status.Deleted}
-    ]
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_workspace_by_id_point_reads_db(workspace_repo, workspace, partitioned_by_workspace):
+    workspace_repo.partitioned_by_workspace = partitioned_by_workspace
+    workspace_repo.container.read_item = AsyncMock(return_value=workspace.model_dump())
 
-    await workspace_repo.get_workspace_by_id(workspace.id)
-    workspace_repo.container.query_items.assert_called_once_with(query=expected_query, parameters=expected_parameters)
+    actual_workspace = await workspace_repo.get_workspace_by_id(workspace.id)
+
+    workspace_repo.container.read_item.assert_called_once_with(item=workspace.id, partition_key=[workspace.id, workspace.id] if partitioned_by_workspace else workspace.id)
+    assert actual_workspace == workspace
 
 
 @pytest.mark.asyncio
-@patch('db.repositories.workspaces.generate_new_cidr')
+@patch('db.repositories.workspaces.AddressSpaceRepository.allocate_address_space')
 @patch('db.repositories.workspaces.WorkspaceRepository.validate_input_against_template')
 @patch('db.repositories.workspaces.WorkspaceRepository.is_workspace_storage_account_available')
 @patch('core.config.RESOURCE_LOCATION', "useast2")
@@ -145,6 +150,7 @@ async def test_create_workspace_item_creates_a_workspace_with_the_right_values(m
     # a new CIDR was allocated
     assert workspace.properties["address_space"] == "1.2.3.4/24"
     assert workspace.properties["address_spaces"] == ["1.2.3.4/24"]
+    new_cidr_mock.assert_called_once_with(workspace.id, 24, workspace_repo.get_active_workspace_address_spaces)
     assert workspace.properties["workspace_owner_object_id"] == "test_object_id"
 
 
@@ -156,7 +162,7 @@ async def test_create_workspace_item_creates_a_workspace_with_the_right_values(m
 async def test_get_address_space_based_on_size_with_small_address_space(workspace_repo, basic_workspace_request):
     workspace_to_create = basic_workspace_request
     workspace_to_create.properties["address_space_size"] = "small"
-    assert "10.1.4.0/24" == await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties)
+    assert "10.1.4.0/24" == await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties, WORKSPACE_ID)
 
 
 @pytest.mark.asyncio
@@ -167,7 +173,7 @@ async def test_get_address_space_based_on_size_with_small_address_space(workspac
 async def test_get_address_space_based_on_size_with_medium_address_space(workspace_repo, basic_workspace_request):
     workspace_to_create = basic_workspace_request
     workspace_to_create.properties["address_space_size"] = "medium"
-    address_space = await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties)
+    address_space = await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties, WORKSPACE_ID)
     assert "10.1.4.0/22" == address_space
 
 
@@ -179,7 +185,7 @@ async def test_get_address_space_based_on_size_with_medium_address_space(workspa
 async def test_get_address_space_based_on_size_with_large_address_space(workspace_repo, basic_workspace_request):
     workspace_to_create = basic_workspace_request
     workspace_to_create.properties["address_space_size"] = "large"
-    address_space = workspace_repo.get_address_space_based_on_size(workspace_to_create.properties)
+    address_space = workspace_repo.get_address_space_based_on_size(workspace_to_create.properties, WORKSPACE_ID)
     assert "10.0.0.0/16" == await address_space
 
 
@@ -231,48 +237,139 @@ async def test_get_address_space_based_on_size_with_custom_address_space_and_mis
     workspace_to_create.properties.pop("address_space", None)
 
     with pytest.raises(InvalidInput):
-        await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties)
+        await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties, WORKSPACE_ID)
 
 
 @pytest.mark.asyncio
-@patch('db.repositories.workspaces.WorkspaceRepository.get_active_workspaces')
+@patch('db.repositories.workspaces.WorkspaceRepository.query')
 @patch('core.config.RESOURCE_LOCATION', "useast2")
 @patch('core.config.TRE_ID', "9876")
 @patch('core.config.CORE_ADDRESS_SPACE', "10.1.0.0/22")
 @patch('core.config.TRE_ADDRESS_SPACE', "10.0.0.0/12")
-async def test_get_address_space_based_on_size_with_address_space_only(get_active_workspaces_mock, workspace_repo, basic_workspace_request, workspace):
-    workspace_with_address_space = copy.deepcopy(workspace)
-    workspace_with_address_space.properties["address_space"] = "10.1.4.0/24"
-
-    get_active_workspaces_mock.return_value = [workspace_with_address_space]
+async def test_get_address_space_based_on_size_with_address_space_only(query_mock, workspace_repo, basic_workspace_request):
+    query_mock.return_value = [{"id": "ws1", "address_space": "10.1.4.0/24"}]
     workspace_to_create = basic_workspace_request
-    address_space = await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties)
+    address_space = await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties, WORKSPACE_ID)
 
     assert "10.1.5.0/24" == address_space
 
 
 @pytest.mark.asyncio
-@patch('db.repositories.workspaces.WorkspaceRepository.get_active_workspaces')
+@patch('db.repositories.workspaces.WorkspaceRepository.query')
 @patch('core.config.RESOURCE_LOCATION', "useast2")
 @patch('core.config.TRE_ID', "9876")
 @patch('core.config.CORE_ADDRESS_SPACE', "10.1.0.0/22")
 @patch('core.config.TRE_ADDRESS_SPACE', "10.0.0.0/12")
-async def test_get_address_space_based_on_size_with_address_space_and_address_spaces(get_active_workspaces_mock, workspace_repo, basic_workspace_request, workspace):
-    workspace_with_address_space = copy.deepcopy(workspace)
-    workspace_with_address_space.properties["address_space"] = "10.1.4.0/24"
+async def test_get_address_space_based_on_size_with_address_space_and_address_spaces(query_mock, workspace_repo, basic_workspace_request):
+    # Projection queries omit properties a workspace doesn't have
+    query_mock.return_value = [
+        {"id": "ws1", "address_space": "10.1.4.0/24"},
+        {"id": "ws2", "address_spaces": ["10.1.5.0/24", "10.1.6.0/24"]},
+        {"id": "ws3", "address_space": "10.1.7.0/24", "address_spaces": ["10.1.7.0/24", "10.1.8.0/24"]}
+    ]
+    workspace_to_create = basic_workspace_request
+    address_space = await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties, WORKSPACE_ID)
 
-    workspace_with_address_spaces = copy.deepcopy(workspace)
-    workspace_with_address_spaces.properties["address_spaces"] = ["10.1.5.0/24", "10.1.6.0/24"]
+    assert "10.1.9.0/24" == address_space
 
-    workspace_with_both = copy.deepcopy(workspace)
-    workspace_with_both.properties["address_spaces"] = ["10.1.7.0/24", "10.1.8.0/24"]
-    workspace_with_both.properties["address_space"] = "10.1.7.0/24"
 
-    get_active_workspaces_mock.return_value = [workspace_with_address_space, workspace_with_address_spaces, workspace_with_both]
-    workspace_to_create = basic_workspace_request
-    address_space = await workspace_repo.get_address_space_based_on_size(workspace_to_create.properties)
+@pytest.mark.asyncio
+@patch('core.config.CORE_ADDRESS_SPACE', "10.1.0.0/22")
+@patch('core.config.TRE_ADDRESS_SPACE', "10.0.0.0/12")
+async def test_get_address_space_based_on_size_skips_address_spaces_reserved_for_workspaces_being_created(workspace_repo, basic_workspace_request):
+    workspace_repo.address_space_repo.container.read_item = AsyncMock(return_value={
+        "id": "workspace-address-spaces",
+        "allocations": [{"addressSpace": "10.1.4.0/24", "workspaceId": "ws1", "reservedWhen": workspace_repo.get_timestamp()}],
+        "_etag": "etag"
+    })
+    workspace_repo.address_space_repo.container.replace_item = AsyncMock(return_value={"_etag": "new-etag"})
 
-    assert "10.1.9.0/24" == address_space
+    address_space = await workspace_repo.get_address_space_based_on_size(basic_workspace_request.properties, WORKSPACE_ID)
+
+    # ws1 isn't saved yet, so only its reservation keeps its address space from being handed out again
+    assert "10.1.5.0/24" == address_space
+    saved_allocations = workspace_repo.address_space_repo.container.replace_item.call_args.kwargs["body"]["allocations"]
+    assert [a["addressSpace"] for a in saved_allocations] == ["10.1.4.0/24", "10.1.5.0/24"]
+
+
+@pytest.mark.asyncio
+@patch('core.config.CORE_ADDRESS_SPACE', "10.1.0.0/22")
+@patch('core.config.TRE_ADDRESS_SPACE', "10.0.0.0/12")
+async def test_get_address_space_based_on_size_with_custom_address_space_reserved_by_another_workspace_raises_invalid_input(workspace_repo, basic_workspace_request):
+    workspace_repo.address_space_repo.container.read_item = AsyncMock(return_value={
+        "id": "workspace-address-spaces",
+        "allocations": [{"addressSpace": "10.2.4.0/24", "workspaceId": "ws1", "reservedWhen": workspace_repo.get_timestamp()}],
+        "_etag": "etag"
+    })
+    basic_workspace_request.properties["address_space_size"] = "custom"
+    basic_workspace_request.properties["address_space"] = "10.2.4.0/24"
+
+    with pytest.raises(InvalidInput):
+        await workspace_repo.get_address_space_based_on_size(basic_workspace_request.properties, WORKSPACE_ID)
+
+
+@pytest.mark.asyncio
+@patch('db.repositories.workspaces.AddressSpaceRepository.claim_address_spaces')
+@patch('db.repositories.workspaces.WorkspaceRepository.patch_resource')
+async def test_patch_workspace_claims_patched_address_spaces(patch_resource_mock, claim_address_spaces_mock, workspace_repo, workspace):
+    patch_resource_mock.return_value = (workspace, MagicMock())
+    workspace_patch = ResourcePatch(properties={"address_spaces": ["10.1.4.0/24", "10.1.5.0/24"]})
+
+    await workspace_repo.patch_workspace(workspace, workspace_patch, "etag", AsyncMock(), AsyncMock(), MagicMock(), False)
+
+    claim_address_spaces_mock.assert_called_once_with(workspace.id, ["10.1.4.0/24", "10.1.5.0/24"], workspace_repo.get_active_workspace_address_spaces)
+
+
+@pytest.mark.asyncio
+@patch('db.repositories.workspaces.AddressSpaceRepository.claim_address_spaces')
+@patch('db.repositories.workspaces.WorkspaceRepository.patch_resource')
+async def test_patch_workspace_without_address_spaces_does_not_claim_any(patch_resource_mock, claim_address_spaces_mock, workspace_repo, workspace):
+    patch_resource_mock.return_value = (workspace, MagicMock())
+
+    await workspace_repo.patch_workspace(workspace, ResourcePatch(isEnabled=False), "etag", AsyncMock(), AsyncMock(), MagicMock(), False)
+
+    claim_address_spaces_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_active_workspace_address_spaces_projects_address_spaces(workspace_repo):
+    workspace_repo.query = AsyncMock(return_value=[{"id": "ws1", "address_space": "10.1.4.0/24"}, {"id": "ws2"}])
+    expected_query = 'SELECT c.id, c.properties.address_space, c.properties.address_spaces FROM c WHERE c.resourceType = @resourceType AND c.deploymentStatus != @deletedStatus'
+    expected_parameters = [
+        {'name': '@resourceType', 'value': ResourceType.Workspace},
+        {'name': '@deletedStatus', 'value': Status.Deleted}
+    ]
+
+    address_spaces = await workspace_repo.get_active_workspace_address_spaces()
+
+    workspace_repo.query.assert_called_once_with(query=expected_query, parameters=expected_parameters)
+    assert address_spaces == [WorkspaceAddressSpaces(id="ws1", address_space="10.1.4.0/24"), WorkspaceAddressSpaces(id="ws2")]
+
+
+@pytest.mark.asyncio
+async def test_get_active_workspace_airlock_manager_roles_projects_role_id(workspace_repo):
+    workspace_repo.query = AsyncMock(return_value=[{"id": "ws1", "app_role_id_workspace_airlock_manager": "role-1"}, {"id": "ws2"}])
+
+    roles = await workspace_repo.get_active_workspace_airlock_manager_roles()
+
+    assert workspace_repo.query.call_args.kwargs["query"].startswith('SELECT c.id, c.properties.app_role_id_workspace_airlock_manager FROM c WHERE')
+    assert roles == [WorkspaceAirlockManagerRole(id="ws1", app_role_id_workspace_airlock_manager="role-1"), WorkspaceAirlockManagerRole(id="ws2")]
+
+
+@pytest.mark.asyncio
+async def test_get_active_workspace_subscription_ids_skips_missing_and_duplicate_ids(workspace_repo):
+    workspace_repo.query = AsyncMock(return_value=[
+        {"id": "ws1"},
+        {"id": "ws2", "workspace_subscription_id": "sub-2"},
+        {"id": "ws3", "workspace_subscription_id": ""},
+        {"id": "ws4", "workspace_subscription_id": "sub-2"},
+        {"id": "ws5", "workspace_subscription_id": "sub-5"}
+    ])
+
+    subscription_ids = await workspace_repo.get_active_workspace_subscription_ids()
+
+    assert workspace_repo.query.call_args.kwargs["query"].startswith('SELECT c.id, c.properties.workspace_subscription_id FROM c WHERE')
+    assert subscription_ids == ["sub-2", "sub-5"]
 
 
 @pytest.mark.asyncio
@@ -378,7 +475,7 @@ async def test_is_workspace_storage_account_available_when_check_raises_exceptio
 
 @pytest.mark.asyncio
 @patch('db.repositories.workspaces.asyncio.wait_for')
-@patch('db.repositories.workspaces.generate_new_cidr')
+@patch('db.repositories.workspaces.AddressSpaceRepository.allocate_address_space')
 @patch('db.repositories.workspaces.WorkspaceRepository.validate_input_against_template')
 @patch('db.repositories.workspaces.WorkspaceRepository.is_workspace_storage_account_available')
 async def test_create_workspace_item_raises_timeout_error_after_timeout(mock_is_workspace_storage_account_available, validate_input_mock, new_cidr_mock, mock_wait_for, workspace_repo, basic_workspace_request, basic_resource_template):
@@ -1,4 +1,5 @@
 from unittest.mock import AsyncMock
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
 from mock import patch, MagicMock
 import pytest
 import pytest_asyncio
@@ -49,13 +50,16 @@ def workspace_service():
     return workspace_service
 
 
-async def test_get_active_workspace_services_for_workspace_queries_db(workspace_service_repo):
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_active_workspace_services_for_workspace_queries_db(workspace_service_repo, partitioned_by_workspace):
+    workspace_service_repo.partitioned_by_workspace = partitioned_by_workspace
     workspace_service_repo.query = AsyncMock(return_value=[])
     query, parameters = WorkspaceServiceRepository.active_workspace_services_query(WORKSPACE_ID)
 
     await workspace_service_repo.get_active_workspace_services_for_workspace(WORKSPACE_ID)
 
-    workspace_service_repo.query.assert_called_once_with(query=query, parameters=parameters)
+    expected_options = {"partition_key": [WORKSPACE_ID]} if partitioned_by_workspace else {}
+    workspace_service_repo.query.assert_called_once_with(query=query, parameters=parameters, **expected_options)
 
 
 async def test_get_deployed_workspace_service_by_id_raises_resource_is_not_deployed_if_not_deployed(workspace_service_repo, workspace_service, operations_repo):
@@ -80,32 +84,39 @@ async def test_get_deployed_workspace_service_by_id_return_workspace_service_if_
 
 
 async def test_get_workspace_service_by_id_raises_entity_does_not_exist_if_no_available_services(workspace_service_repo):
-    workspace_service_repo.query = AsyncMock(return_value=[])
+    workspace_service_repo.read_item_by_id = AsyncMock(side_effect=CosmosResourceNotFoundError)
 
     with pytest.raises(EntityDoesNotExist):
         await workspace_service_repo.get_workspace_service_by_id(WORKSPACE_ID, SERVICE_ID)
 
 
-async def test_get_workspace_service_by_id_raises_entity_does_not_exist_if_service_is_deleted(workspace_service_repo):
-    workspace_service_repo.query = AsyncMock(return_value=[])
+async def test_get_workspace_service_by_id_raises_entity_does_not_exist_if_service_is_deleted(workspace_service_repo, workspace_service):
+    workspace_service.workspaceId = WORKSPACE_ID
+    workspace_service.deploymentStatus = Status.Deleted
+    workspace_service_repo.read_item_by_id = AsyncMock(return_value=workspace_service.model_dump())
+
+    with pytest.raises(EntityDoesNotExist):
+        await workspace_service_repo.get_workspace_service_by_id(WORKSPACE_ID, SERVICE_ID)
+
+
+async def test_get_workspace_service_by_id_raises_entity_does_not_exist_if_service_is_in_another_workspace(workspace_service_repo, workspace_service):
+    workspace_service.workspaceId = "another-workspace"
+    workspace_service_repo.read_item_by_id = AsyncMock(return_value=workspace_service.model_dump())
 
     with pytest.raises(EntityDoesNotExist):
         await workspace_service_repo.get_workspace_service_by_id(WORKSPACE_ID, SERVICE_ID)
 
 
-async def test_get_workspace_service_by_id_queries_db(workspace_service_repo, workspace_service):
-    workspace_service_repo.query = AsyncMock(return_value=[workspace_service])
-    expected_query = 'SELECT * FROM c WHERE c.resourceType = @resourceType AND c.workspaceId = @workspaceId AND c.id = @serviceId AND c.deploymentStatus != @deletedStatus'
-    expected_parameters = [
-        {'name': '@resourceType', 'value': ResourceType.WorkspaceService},
-        {'name': '@workspaceId', 'value': WORKSPACE_ID},
-        {'name': '@serviceId', 'value': SERVICE_ID},
-        {'name': '@deletedStatus', 'value': Status.Deleted}
-    ]
+@pytest.mark.parametrize("partitioned_by_workspace", [False, True])
+async def test_get_workspace_service_by_id_point_reads_db(workspace_service_repo, workspace_service, partitioned_by_workspace):
+    workspace_service_repo.partitioned_by_workspace = partitioned_by_workspace
+    workspace_service.workspaceId = WORKSPACE_ID
+    workspace_service_repo.read_item_by_id = AsyncMock(return_value=workspace_service.model_dump())
 
-    await workspace_service_repo.get_workspace_service_by_id(WORKSPACE_ID, SERVICE_ID)
+    actual_service = await workspace_service_repo.get_workspace_service_by_id(WORKSPACE_ID, SERVICE_ID)
 
-    workspace_service_repo.query.assert_called_once_with(query=expected_query, parameters=expected_parameters)
+    workspace_service_repo.read_item_by_id.assert_called_once_with(SERVICE_ID, [WORKSPACE_ID, SERVICE_ID] if partitioned_by_workspace else SERVICE_ID)
+    assert actual_service == workspace_service
 
 
 @patch('db.repositories.workspace_services.WorkspaceServiceRepository.validate_input_against_template')
@@ -122,7 +122,7 @@ async def test_receiving_good_message(_, logging_mock, workspace_repo, airlock_r
     complete_message = await airlockStatusUpdater.process_message(ServiceBusReceivedMessageMock(test_sb_step_result_message))
 
     assert complete_message is True
-    airlock_request_repo.return_value.get_airlock_request_by_id.assert_called_once_with(test_sb_step_result_message["data"]["request_id"])
+    airlock_request_repo.return_value.get_airlock_request_by_id.assert_called_once_with(test_sb_step_result_message["data"]["request_id"], None)
     airlock_request_repo.return_value.update_airlock_request.assert_called_once_with(
         original_request=expected_airlock_request,
         updated_by=expected_airlock_request.updatedBy,
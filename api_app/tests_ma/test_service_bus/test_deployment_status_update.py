@@ -1,16 +1,19 @@
 import copy
 import json
-from unittest.mock import MagicMock, ANY
+from functools import partial
+from unittest.mock import ANY
 from pydantic import TypeAdapter
 import pytest
 import uuid
 
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError
 from mock import AsyncMock, patch
 from tests_ma.test_api.test_routes.test_resource_helpers import FAKE_CREATE_TIMESTAMP, FAKE_UPDATE_TIMESTAMP
 from models.domain.request_action import RequestAction
 from models.domain.resource import ResourceType
 
 from db.errors import EntityDoesNotExist
+from db.repositories.base import BaseRepository
 from models.domain.workspace import Workspace
 from models.domain.operation import DeploymentStatusUpdateMessage, Operation, OperationStep, Status
 from resources import strings
@@ -116,6 +119,15 @@ def create_sample_operation(resource_id, request_action):
     )
 
 
+async def create_status_updater() -> DeploymentStatusUpdater:
+    status_updater = DeploymentStatusUpdater()
+    await status_updater.init_repos()
+    # the repository is mocked, but not the read-modify-write it runs the operation update in
+    status_updater.operations_repo.update_with_retries = partial(BaseRepository.update_with_retries, status_updater.operations_repo)
+    status_updater.operations_repo.colocated_with_resources = False
+    return status_updater
+
+
 @pytest.mark.parametrize("payload", test_data)
 @patch('services.logging.logger.exception')
 async def test_receiving_bad_json_logs_error(logging_mock, payload):
@@ -139,18 +151,17 @@ async def test_receiving_bad_json_logs_error(logging_mock, payload):
 @patch('services.logging.logger.exception')
 async def test_receiving_good_message(logging_mock, resource_repo, operation_repo, _, __):
     expected_workspace = create_sample_workspace_object(test_sb_message["id"])
-    resource_repo.return_value.get_resource_dict_by_id.return_value = expected_workspace.model_dump()
+    resource_repo.return_value.update_deployment_status.return_value = expected_workspace
 
     operation = create_sample_operation(test_sb_message["id"], RequestAction.Install)
-    operation_repo.return_value.get_operation_by_id.return_value = operation
+    operation_repo.return_value.get_operation_and_etag_by_id.return_value = (operation, "operation-etag")
 
-    status_updater = DeploymentStatusUpdater()
-    await status_updater.init_repos()
+    status_updater = await create_status_updater()
     complete_message = await status_updater.process_message(ServiceBusReceivedMessageMock(test_sb_message))
 
     assert complete_message is True
-    resource_repo.return_value.get_resource_dict_by_id.assert_called_once_with(uuid.UUID(test_sb_message["id"]))
-    resource_repo.return_value.update_item_dict.assert_called_once_with(expected_workspace.model_dump())
+    resource_repo.return_value.update_deployment_status.assert_called_once_with(uuid.UUID(test_sb_message["id"]), Status.Deployed, test_sb_message["id"])
+    resource_repo.return_value.update_outputs.assert_called_once_with(uuid.UUID(test_sb_message["id"]), {}, test_sb_message["id"])
     logging_mock.assert_not_called()
 
 
@@ -160,13 +171,12 @@ async def test_receiving_good_message(logging_mock, resource_repo, operation_rep
 @patch('service_bus.deployment_status_updater.ResourceRepository.create')
 @patch('services.logging.logger.exception')
 async def test_when_updating_non_existent_workspace_error_is_logged(logging_mock, resource_repo, operation_repo, _, __):
-    resource_repo.return_value.get_resource_dict_by_id.side_effect = EntityDoesNotExist
+    resource_repo.return_value.update_deployment_status.side_effect = EntityDoesNotExist
 
     operation = create_sample_operation(test_sb_message["id"], RequestAction.Install)
-    operation_repo.return_value.get_operation_by_id.return_value = operation
+    operation_repo.return_value.get_operation_and_etag_by_id.return_value = (operation, "operation-etag")
 
-    status_updater = DeploymentStatusUpdater()
-    await status_updater.init_repos()
+    status_updater = await create_status_updater()
     complete_message = await status_updater.process_message(ServiceBusReceivedMessageMock(test_sb_message))
 
     assert complete_message is True
@@ -180,13 +190,12 @@ async def test_when_updating_non_existent_workspace_error_is_logged(logging_mock
 @patch('service_bus.deployment_status_updater.ResourceRepository.create')
 @patch('services.logging.logger.exception')
 async def test_when_updating_and_state_store_exception(logging_mock, resource_repo, operation_repo, _, __):
-    resource_repo.return_value.get_resource_dict_by_id.side_effect = Exception
+    resource_repo.return_value.update_deployment_status.side_effect = Exception
 
     operation = create_sample_operation(test_sb_message["id"], RequestAction.Install)
-    operation_repo.return_value.get_operation_by_id.return_value = operation
+    operation_repo.return_value.get_operation_and_etag_by_id.return_value = (operation, "operation-etag")
 
-    status_updater = DeploymentStatusUpdater()
-    await status_updater.init_repos()
+    status_updater = await create_status_updater()
     complete_message = await status_updater.process_message(ServiceBusReceivedMessageMock(test_sb_message))
 
     logging_mock.assert_called_once_with("Failed to update status")
@@ -205,11 +214,11 @@ async def test_state_transitions_from_deployed_to_deleted(resource_repo, operati
     service_bus_received_message_mock = ServiceBusReceivedMessageMock(updated_message)
 
     workspace = create_sample_workspace_object(test_sb_message["id"])
-    resource_repo.return_value.get_resource_dict_by_id.return_value = workspace.model_dump()
+    resource_repo.return_value.update_deployment_status.return_value = workspace
 
     operation = create_sample_operation(workspace.id, RequestAction.UnInstall)
     operation.steps[0].status = Status.Deployed
-    operations_repo_mock.return_value.get_operation_by_id.return_value = operation
+    operations_repo_mock.return_value.get_operation_and_etag_by_id.return_value = (operation, "operation-etag")
 
     expected_operation = create_sample_operation(workspace.id, RequestAction.UnInstall)
     expected_operation.steps[0].status = Status.Deleted
@@ -217,12 +226,109 @@ async def test_state_transitions_from_deployed_to_deleted(resource_repo, operati
     expected_operation.status = Status.Deleted
     expected_operation.message = updated_message["message"]
 
-    status_updater = DeploymentStatusUpdater()
-    await status_updater.init_repos()
+    status_updater = await create_status_updater()
     complete_message = await status_updater.process_message(service_bus_received_message_mock)
 
     assert complete_message is True
-    operations_repo_mock.return_value.update_item.assert_called_once_with(expected_operation)
+    operations_repo_mock.return_value.update_operation_step_status.assert_called_once_with(expected_operation, 0, "operation-etag")
+
+
+@patch("db.repositories.base.asyncio.sleep")
+@patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceTemplateRepository.create')
+@patch('service_bus.deployment_status_updater.OperationRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceRepository.create')
+async def test_operation_modified_concurrently_is_reread_and_patched_again(resource_repo, operations_repo_mock, _, __, ___):
+    workspace = create_sample_workspace_object(test_sb_message["id"])
+    resource_repo.return_value.update_deployment_status.return_value = workspace
+    operations_repo_mock.return_value.get_operation_and_etag_by_id.side_effect = [
+        (create_sample_operation(workspace.id, RequestAction.Install), "stale-etag"),
+        (create_sample_operation(workspace.id, RequestAction.Install), "latest-etag")
+    ]
+    operations_repo_mock.return_value.update_operation_step_status.side_effect = [CosmosAccessConditionFailedError, "new-etag"]
+
+    status_updater = await create_status_updater()
+    complete_message = await status_updater.process_message(ServiceBusReceivedMessageMock({**test_sb_message, "status": Status.Deployed}))
+
+    assert complete_message is True
+    assert [c.args[2] for c in operations_repo_mock.return_value.update_operation_step_status.call_args_list] == ["stale-etag", "latest-etag"]
+    resource_repo.return_value.update_deployment_status.assert_called_once()
+
+
+@patch('service_bus.deployment_status_updater.WorkspaceRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceTemplateRepository.create')
+@patch("service_bus.deployment_status_updater.get_timestamp", return_value=FAKE_UPDATE_TIMESTAMP)
+@patch('service_bus.deployment_status_updater.OperationRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceRepository.create')
+async def test_deleted_workspace_releases_its_address_spaces_and_index_entry(resource_repo, operations_repo_mock, _, __, ___, workspace_repo_mock):
+    deleted_message = {**test_sb_message, "status": Status.Deleted, "message": "Has been deleted"}
+    workspace = create_sample_workspace_object(deleted_message["id"])
+    workspace.deploymentStatus = Status.Deleted
+    resource_repo.return_value.update_deployment_status.return_value = workspace
+    operations_repo_mock.return_value.get_operation_and_etag_by_id.return_value = (create_sample_operation(workspace.id, RequestAction.UnInstall), "operation-etag")
+
+    status_updater = await create_status_updater()
+    complete_message = await status_updater.process_message(ServiceBusReceivedMessageMock(deleted_message))
+
+    assert complete_message is True
+    workspace_repo_mock.return_value.release_address_spaces.assert_called_once_with(workspace.id)
+    resource_repo.return_value.hierarchy_repo.remove_resource.assert_called_once_with(workspace)
+    # the uninstall has completed, so the workspace is moved out of the resources container
+    resource_repo.return_value.get_resource_dict_by_id.assert_called_once_with(workspace.id, workspace_partition=workspace.id)
+    resource_repo.return_value.move_to_deleted.assert_called_once_with(resource_repo.return_value.get_resource_dict_by_id.return_value)
+    resource_repo.return_value.mark_deployed.assert_not_called()
+
+
+@patch('service_bus.deployment_status_updater.WorkspaceRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceTemplateRepository.create')
+@patch('service_bus.deployment_status_updater.OperationRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceRepository.create')
+async def test_deployed_workspace_keeps_its_address_spaces(resource_repo, operations_repo_mock, _, __, workspace_repo_mock):
+    workspace = create_sample_workspace_object(test_sb_message["id"])
+    workspace.deploymentStatus = Status.Deployed
+    resource_repo.return_value.update_deployment_status.return_value = workspace
+    operations_repo_mock.return_value.get_operation_and_etag_by_id.return_value = (create_sample_operation(workspace.id, RequestAction.Install), "operation-etag")
+
+    status_updater = await create_status_updater()
+    await status_updater.process_message(ServiceBusReceivedMessageMock({**test_sb_message, "status": Status.Deployed}))
+
+    workspace_repo_mock.return_value.release_address_spaces.assert_not_called()
+    resource_repo.return_value.hierarchy_repo.remove_resource.assert_not_called()
+
+
+@patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceTemplateRepository.create')
+@patch("service_bus.deployment_status_updater.get_timestamp", return_value=FAKE_UPDATE_TIMESTAMP)
+@patch('service_bus.deployment_status_updater.OperationRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceRepository.create')
+async def test_completed_install_marks_the_resource_deployed(resource_repo, operations_repo_mock, _, __, ___):
+    workspace = create_sample_workspace_object(test_sb_message["id"])
+    workspace.deploymentStatus = Status.Deployed
+    resource_repo.return_value.update_deployment_status.return_value = workspace
+    operations_repo_mock.return_value.get_operation_and_etag_by_id.return_value = (create_sample_operation(workspace.id, RequestAction.Install), "operation-etag")
+
+    status_updater = await create_status_updater()
+    complete_message = await status_updater.process_message(ServiceBusReceivedMessageMock({**test_sb_message, "status": Status.Deployed}))
+
+    assert complete_message is True
+    resource_repo.return_value.mark_deployed.assert_called_once_with(workspace, FAKE_UPDATE_TIMESTAMP, workspace.id)
+
+
+@patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceTemplateRepository.create')
+@patch('service_bus.deployment_status_updater.OperationRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceRepository.create')
+async def test_failed_install_doesnt_mark_the_resource_deployed(resource_repo, operations_repo_mock, _, __):
+    workspace = create_sample_workspace_object(test_sb_message["id"])
+    resource_repo.return_value.update_deployment_status.return_value = workspace
+    operations_repo_mock.return_value.get_operation_and_etag_by_id.return_value = (create_sample_operation(workspace.id, RequestAction.Install), "operation-etag")
+
+    status_updater = await create_status_updater()
+    await status_updater.process_message(ServiceBusReceivedMessageMock({**test_sb_message, "status": Status.DeploymentFailed}))
+
+    resource_repo.return_value.mark_deployed.assert_not_called()
 
 
 @patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
@@ -235,8 +341,7 @@ async def test_outputs_are_added_to_resource_item(resource_repo, operations_repo
     service_bus_received_message_mock = ServiceBusReceivedMessageMock(received_message)
 
     resource = create_sample_workspace_object(received_message["id"])
-    resource.properties = {"exitingName": "exitingValue"}
-    resource_repo.return_value.get_resource_dict_by_id.return_value = resource.model_dump()
+    resource_repo.return_value.update_deployment_status.return_value = resource
 
     new_params = {
         "string1": "value1",
@@ -248,18 +353,42 @@ async def test_outputs_are_added_to_resource_item(resource_repo, operations_repo
         "list2": ["one", "two"],
     }
 
-    expected_resource = resource
-    expected_resource.properties = {**resource.properties, **new_params}
-
     operation = create_sample_operation(resource.id, RequestAction.UnInstall)
-    operations_repo.return_value.get_operation_by_id.return_value = operation
+    operations_repo.return_value.get_operation_and_etag_by_id.return_value = (operation, "operation-etag")
 
-    status_updater = DeploymentStatusUpdater()
-    await status_updater.init_repos()
+    status_updater = await create_status_updater()
     complete_message = await status_updater.process_message(service_bus_received_message_mock)
 
     assert complete_message is True
-    resource_repo.return_value.update_item_dict.assert_called_once_with(expected_resource.model_dump())
+    # only the outputs are written, so properties set since the resource was read are kept
+    resource_repo.return_value.update_outputs.assert_called_once_with(uuid.UUID(resource.id), new_params, resource.id)
+
+
+@patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceTemplateRepository.create')
+@patch('service_bus.deployment_status_updater.OperationRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceRepository.create')
+async def test_colocated_operation_and_resource_are_updated_in_one_batch(resource_repo, operations_repo, _, __):
+    received_message = {**test_sb_message_with_outputs, "status": Status.Deployed}
+    resource = create_sample_workspace_object(received_message["id"])
+    resource.deploymentStatus = Status.Deployed
+    operation = create_sample_operation(resource.id, RequestAction.Install)
+    operations_repo.return_value.get_operation_and_etag_by_id.return_value = (operation, "operation-etag")
+    operations_repo.return_value.update_operation_step_and_resource_status.return_value = ("new-etag", resource.model_dump())
+
+    status_updater = await create_status_updater()
+    status_updater.operations_repo.colocated_with_resources = True
+    complete_message = await status_updater.process_message(ServiceBusReceivedMessageMock(received_message))
+
+    assert complete_message is True
+    operation_arg, step_index, etag, resource_patch = operations_repo.return_value.update_operation_step_and_resource_status.call_args.args
+    assert (operation_arg.status, step_index, etag) == (Status.Deployed, 0, "operation-etag")
+    assert resource_patch[0] == {"op": "set", "path": "/deploymentStatus", "value": Status.Deployed}
+    assert {"op": "set", "path": "/properties/string1", "value": "value1"} in resource_patch
+    operations_repo.return_value.get_operation_and_etag_by_id.assert_called_once_with(str(operation.id), resource_id=resource.id)
+    operations_repo.return_value.update_operation_step_status.assert_not_called()
+    resource_repo.return_value.update_deployment_status.assert_not_called()
+    resource_repo.return_value.update_outputs.assert_not_called()
 
 
 @patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
@@ -272,20 +401,16 @@ async def test_properties_dont_change_with_no_outputs(resource_repo, operations_
     service_bus_received_message_mock = ServiceBusReceivedMessageMock(received_message)
 
     resource = create_sample_workspace_object(received_message["id"])
-    resource.properties = {"exitingName": "exitingValue"}
-    resource_repo.return_value.get_resource_dict_by_id.return_value = resource.model_dump()
+    resource_repo.return_value.update_deployment_status.return_value = resource
 
     operation = create_sample_operation(resource.id, RequestAction.UnInstall)
-    operations_repo.return_value.get_operation_by_id.return_value = operation
+    operations_repo.return_value.get_operation_and_etag_by_id.return_value = (operation, "operation-etag")
 
-    expected_resource = resource
-
-    status_updater = DeploymentStatusUpdater()
-    await status_updater.init_repos()
+    status_updater = await create_status_updater()
     complete_message = await status_updater.process_message(service_bus_received_message_mock)
 
     assert complete_message is True
-    resource_repo.return_value.update_item_dict.assert_called_once_with(expected_resource.model_dump())
+    resource_repo.return_value.update_outputs.assert_called_once_with(uuid.UUID(resource.id), {}, resource.id)
 
 
 @patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
@@ -301,19 +426,16 @@ async def test_multi_step_operation_sends_next_step(sb_sender_client, resource_r
     sb_sender_client().get_queue_sender().send_messages = AsyncMock()
 
     # step 1 resource
-    resource_repo.return_value.get_resource_dict_by_id.return_value = basic_shared_service.model_dump()
+    resource_repo.return_value.update_deployment_status.return_value = basic_shared_service
 
     # step 2 resource
     resource_repo.return_value.get_resource_by_id.return_value = user_resource_multi
 
-    operations_repo.return_value.update_item.return_value = MagicMock(return_value=basic_shared_service)
-
     # get the multi-step operation and process it
-    operations_repo.return_value.get_operation_by_id.return_value = multi_step_operation
+    operations_repo.return_value.get_operation_and_etag_by_id.return_value = (multi_step_operation, "operation-etag")
     update_resource_for_step.return_value = user_resource_multi
 
-    status_updater = DeploymentStatusUpdater()
-    await status_updater.init_repos()
+    status_updater = await create_status_updater()
     complete_message = await status_updater.process_message(service_bus_received_message_mock)
 
     assert complete_message is True
@@ -329,7 +451,7 @@ async def test_multi_step_operation_sends_next_step(sb_sender_client, resource_r
         resource_to_update_id=multi_step_operation.steps[1].resourceId,
         primary_action=ANY,
         user=ANY)
-    resource_repo.return_value.get_resource_by_id.assert_called_with(multi_step_operation.resourceId)
+    resource_repo.return_value.get_resource_by_id.assert_called_with(multi_step_operation.resourceId, include_deleted=True)
 
     # check the operation is updated as expected
     expected_operation = copy.deepcopy(multi_step_operation)
@@ -337,12 +459,39 @@ async def test_multi_step_operation_sends_next_step(sb_sender_client, resource_r
     expected_operation.message = "Multi step pipeline running. See steps for details."
     expected_operation.steps[0].status = Status.Updated
     expected_operation.steps[0].message = "upgrade succeeded"
-    operations_repo.return_value.update_item.assert_called_once_with(expected_operation)
+    operations_repo.return_value.update_operation_step_status.assert_called_once_with(expected_operation, 0, "operation-etag")
 
     # check it sent a message on for the next step
     sb_sender_client().get_queue_sender().send_messages.assert_called_once()
 
 
+@patch("db.repositories.base.asyncio.sleep")
+@patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceTemplateRepository.create')
+@patch('service_bus.deployment_status_updater.update_resource_for_step', side_effect=Exception("template not found"))
+@patch('service_bus.deployment_status_updater.OperationRepository.create')
+@patch('service_bus.deployment_status_updater.ResourceRepository.create')
+async def test_next_step_failure_is_written_after_rereading_an_operation_modified_concurrently(resource_repo, operations_repo, _, __, ___, ____, multi_step_operation, basic_shared_service):
+    resource_repo.return_value.update_deployment_status.return_value = basic_shared_service
+    operations_repo.return_value.get_operation_and_etag_by_id.side_effect = [
+        (copy.deepcopy(multi_step_operation), "operation-etag"),
+        (copy.deepcopy(multi_step_operation), "latest-etag")
+    ]
+    # the step's status is written, then the operation is modified before its next step's failure is
+    operations_repo.return_value.update_operation_step_status.side_effect = ["step-etag", CosmosAccessConditionFailedError, "failed-etag"]
+
+    status_updater = await create_status_updater()
+    complete_message = await status_updater.process_message(ServiceBusReceivedMessageMock({**test_sb_message_multi_step_1_complete, "status": Status.Updated}))
+
+    assert complete_message is True
+    calls = operations_repo.return_value.update_operation_step_status.call_args_list
+    assert [(c.args[1], c.args[2]) for c in calls] == [(0, "operation-etag"), (1, "step-etag"), (1, "latest-etag")]
+    failed_operation = calls[2].args[0]
+    assert failed_operation.steps[1].status == Status.UpdatingFailed
+    assert failed_operation.steps[1].message == repr(Exception("template not found"))
+    operations_repo.return_value.get_operation_and_etag_by_id.assert_called_with(multi_step_operation.id, resource_id=multi_step_operation.resourceId)
+
+
 @patch('service_bus.deployment_status_updater.ResourceHistoryRepository.create')
 @patch('service_bus.deployment_status_updater.ResourceTemplateRepository.create')
 @patch('service_bus.deployment_status_updater.OperationRepository.create')
@@ -354,13 +503,8 @@ async def test_multi_step_operation_ends_at_last_step(sb_sender_client, resource
     service_bus_received_message_mock = ServiceBusReceivedMessageMock(received_message)
     sb_sender_client().get_queue_sender().send_messages = AsyncMock()
 
-    # step 2 resource
-    resource_repo.return_value.get_resource_dict_by_id.return_value = user_resource_multi.model_dump()
-
     # step 3 resource
-    resource_repo.return_value.get_resource_by_id.return_value = basic_shared_service
-
-    operations_repo.return_value.update_item.return_value = MagicMock(return_value=user_resource_multi)
+    resource_repo.return_value.update_deployment_status.return_value = basic_shared_service
 
     # get the multi-step operation and process it
     # simulate what the op would look like after step 2
@@ -373,10 +517,9 @@ async def test_multi_step_operation_ends_at_last_step(sb_sender_client, resource
     in_flight_op.steps[1].message = "install succeeded"
     in_flight_op.steps[2].status = Status.Updating
 
-    operations_repo.return_value.get_operation_by_id.return_value = in_flight_op
+    operations_repo.return_value.get_operation_and_etag_by_id.return_value = (in_flight_op, "operation-etag")
 
-    status_updater = DeploymentStatusUpdater()
-    await status_updater.init_repos()
+    status_updater = await create_status_updater()
     complete_message = await status_updater.process_message(service_bus_received_message_mock)
     assert complete_message is True
 
@@ -386,7 +529,7 @@ async def test_multi_step_operation_ends_at_last_step(sb_sender_client, resource
     expected_operation.message = "Multi step pipeline completed successfully"
     expected_operation.steps[2].status = Status.Updated
     expected_operation.steps[2].message = "upgrade succeeded"
-    operations_repo.return_value.update_item.assert_called_once_with(expected_operation)
+    operations_repo.return_value.update_operation_step_status.assert_called_once_with(expected_operation, 2, "operation-etag")
 
     # check it did _not_ enqueue another message
     sb_sender_client().get_queue_sender().send_messages.assert_not_called()
@@ -2,6 +2,7 @@
 import json
 import pytest
 import uuid
+from functools import partial
 
 from azure.servicebus import ServiceBusMessage
 from mock import AsyncMock, patch
@@ -22,10 +23,16 @@ from service_bus.resource_request_sender import (
     RequestAction,
 )
 from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+from db.repositories.base import BaseRepository
 
 pytestmark = pytest.mark.asyncio
 
 
+def use_update_with_retries(resource_repo):
+    # the repository is mocked, but not the read-modify-write it runs the patch in
+    resource_repo.update_with_retries = partial(BaseRepository.update_with_retries, resource_repo)
+
+
 def create_test_resource():
     return Resource(
         id=str(uuid.uuid4()),
@@ -61,6 +68,7 @@ async def test_resource_request_message_generated_correctly(
     operations_repo_mock.create_operation_item.return_value = operation
     resource_repo.get_resource_by_id.return_value = resource
     resource_template_repo.get_template_by_name_and_version.return_value = multi_step_resource_template
+    use_update_with_retries(resource_repo)
 
     resource_repo.patch_resource.return_value = (resource, multi_step_resource_template)
 
@@ -118,6 +126,7 @@ async def test_multi_step_document_sends_first_step(
     ]
 
     resource_repo.patch_resource.return_value = (basic_shared_service, basic_shared_service_template)
+    use_update_with_retries(resource_repo)
 
     resource_repo.get_resource_by_id.return_value = basic_shared_service
 
@@ -169,25 +178,24 @@ async def test_multi_step_document_retries(
 
     # simulate an etag mismatch
     resource_repo.patch_resource.side_effect = CosmosAccessConditionFailedError
+    use_update_with_retries(resource_repo)
 
     num_retries = 5
-    try:
-        await try_update_with_retries(
-            num_retries=num_retries,
-            attempt_count=0,
-            resource_repo=resource_repo,
-            resource_template_repo=resource_template_repo,
-            user=test_user,
-            resource_to_update_id="resource-id",
-            template_step=multi_step_resource_template.pipeline.install[0],
-            resource_history_repo=resource_history_repo,
-            primary_resource=primary_resource,
-            primary_parent_workspace=None,
-            primary_parent_workspace_svc=None
-        )
-    except CosmosAccessConditionFailedError:
-        pass
-
-    # check it tried to patch and re-get the item the first time + all the retries
+    with patch("core.config.ETAG_CONFLICT_MAX_RETRIES", num_retries), patch("db.repositories.base.asyncio.sleep") as sleep:
+        with pytest.raises(CosmosAccessConditionFailedError):
+            await try_update_with_retries(
+                resource_repo=resource_repo,
+                resource_template_repo=resource_template_repo,
+                user=test_user,
+                resource_to_update_id="resource-id",
+                template_step=multi_step_resource_template.pipeline.install[0],
+                resource_history_repo=resource_history_repo,
+                primary_resource=primary_resource,
+                primary_parent_workspace=None,
+                primary_parent_workspace_svc=None
+            )
+
+    # check it tried to patch and re-get the item the first time + all the retries, backing off between them
     assert len(resource_repo.patch_resource.mock_calls) == (num_retries + 1)
     assert len(resource_repo.get_resource_by_id.mock_calls) == (num_retries + 1)
+    assert sleep.await_count == num_retries
@@ -0,0 +1,30 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from mock import patch
+
+from services.airlock_review_inbox_reconciler import AirlockReviewInboxReconciler
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_reconcile_returns_how_many_copies_were_corrected():
+    reconciler = AirlockReviewInboxReconciler()
+    reconciler.airlock_request_repo = AsyncMock()
+    reconciler.airlock_request_repo.reconcile_review_inbox.return_value = 2
+
+    assert await reconciler.reconcile() == 2
+
+
+@patch("services.airlock_review_inbox_reconciler.asyncio.sleep", side_effect=[None, StopAsyncIteration])
+@patch("services.airlock_review_inbox_reconciler.logger.exception")
+async def test_reconcile_periodically_keeps_running_after_a_failure(logger_mock, _):
+    reconciler = AirlockReviewInboxReconciler()
+    reconciler.airlock_request_repo = AsyncMock()
+    reconciler.airlock_request_repo.reconcile_review_inbox.side_effect = [Exception("throttled"), 0]
+
+    with pytest.raises(StopAsyncIteration):
+        await reconciler.reconcile_periodically()
+
+    assert reconciler.airlock_request_repo.reconcile_review_inbox.call_count == 2
+    logger_mock.assert_called_once()
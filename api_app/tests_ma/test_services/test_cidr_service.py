@@ -45,3 +45,51 @@ def test_is_network_available__returns_false():
 @patch('core.config.TRE_ADDRESS_SPACE', "10.0.0.0/12")
 def test_is_network_available__returns_true():
     assert True is services.cidr_service.is_network_available(["10.2.4.0/24", "10.1.0.0/16", "10.2.1.0/24", "10.2.3.0/24", "10.2.0.0/24", "10.2.2.0/24"], "10.2.5.0/24")
+
+
+def test_cidr_allocation_index__allocates_smallest_free_block_first():
+    index = services.cidr_service.CidrAllocationIndex(ipaddress.IPv4Network("10.0.0.0/16"), [ipaddress.IPv4Network("10.0.0.0/24")])
+
+    assert index.allocate(24) == ipaddress.IPv4Network("10.0.1.0/24")
+    assert index.allocate(23) == ipaddress.IPv4Network("10.0.2.0/23")
+    assert index.allocate(24) == ipaddress.IPv4Network("10.0.4.0/24")
+
+
+def test_cidr_allocation_index__reserve_overlapping_free_blocks_removes_them():
+    index = services.cidr_service.CidrAllocationIndex(ipaddress.IPv4Network("10.0.0.0/16"), [ipaddress.IPv4Network("10.0.1.0/24")])
+
+    assert index.reserve(ipaddress.IPv4Network("10.0.0.0/22"))
+    assert not index.is_available(ipaddress.IPv4Network("10.0.0.0/24"))
+    assert index.free_subnets()[0] == ipaddress.IPv4Network("10.0.4.0/22")
+    assert not index.reserve(ipaddress.IPv4Network("10.0.2.0/24"))
+
+
+def test_cidr_allocation_index__raises_when_network_is_full():
+    index = services.cidr_service.CidrAllocationIndex(ipaddress.IPv4Network("10.0.0.0/23"), [ipaddress.IPv4Network("10.0.0.0/24")])
+    index.allocate(24)
+
+    assert not index.can_allocate(24)
+    with pytest.raises(Exception, match="Not enough space in network."):
+        index.allocate(24)
+
+
+def test_cidr_allocation_index__work_per_allocation_doesnt_grow_with_allocated_subnets():
+    allocation_network = ipaddress.IPv4Network("10.0.0.0/8")
+    # every other /24, so no two allocated subnets merge into a larger free block
+    allocated = [ipaddress.IPv4Network((int(allocation_network.network_address) + (i << 9), 24)) for i in range(5000)]
+    index_class = services.cidr_service.CidrAllocationIndex
+
+    with patch.object(index_class, "_is_free_block", autospec=True, side_effect=index_class._is_free_block) as is_free_block, \
+            patch("services.cidr_service.insort", side_effect=services.cidr_service.insort) as insort:
+        index = index_class(allocation_network, allocated)
+        # reserving a network only looks at the free blocks of the prefix lengths above it
+        assert is_free_block.call_count <= len(allocated) * 33
+        insort.reset_mock()
+        new_subnets = [index.allocate(24) for _ in range(5000)]
+        # and allocating one only splits the block it's taken from
+        assert insort.call_count <= len(new_subnets) * 32
+
+    # the gaps between the allocated subnets are handed out first, lowest address first
+    assert new_subnets == [ipaddress.IPv4Network((int(s.network_address) + 256, 24)) for s in allocated]
+    assert not index.is_available(allocated[-1])
+    assert index.allocate(24) == ipaddress.IPv4Network("10.39.16.0/24")
@@ -366,6 +366,7 @@ async def test_query_tre_costs_with_dates_set_as_none_calls_client_with_custom_d
 
 
 def __set_workspace_repo_mock_get_active_workspaces_return_value(workspace_repo_mock):
+    workspace_repo_mock.get_active_workspace_subscription_ids = AsyncMock(return_value=[])
     workspace_repo_mock.get_active_workspaces = AsyncMock(return_value=[
         Workspace(id='19b7ce24-aa35-438c-adf6-37e6762911a6', templateName='tre-workspace-base',
                   resourceType=ResourceType.Workspace, templateVersion="1", _etag="x",
@@ -377,6 +378,7 @@ def __set_workspace_repo_mock_get_active_workspaces_return_value(workspace_repo_
 
 
 def __set_workspace_repo_mock_get_active_workspaces_return_value_without_display_name(workspace_repo_mock):
+    workspace_repo_mock.get_active_workspace_subscription_ids = AsyncMock(return_value=[])
     workspace_repo_mock.get_active_workspaces = AsyncMock(return_value=[
         Workspace(id='19b7ce24-aa35-438c-adf6-37e6762911a6', templateName='tre-workspace-base',
                   resourceType=ResourceType.Workspace, templateVersion="1", _etag="x"),
@@ -664,12 +666,8 @@ async def test_subscription_id_includes_default_and_workspace_ids(get_resource_g
     cs.config.SUBSCRIPTION_ID = "default-sub-id"
 
     # Workspace with and without subscription id
-    workspace_repo_mock.get_active_workspaces = AsyncMock(return_value=[
-        Workspace(id='ws1', templateName='t1', resourceType=ResourceType.Workspace, templateVersion="1", _etag="x", properties={}),
-        Workspace(id='ws2', templateName='t2', resourceType=ResourceType.Workspace, templateVersion="1", _etag="x", properties={"workspace_subscription_id": "sub-2"}),
-        Workspace(id='ws3', templateName='t3', resourceType=ResourceType.Workspace, templateVersion="1", _etag="x", properties={"workspace_subscription_id": "sub-3"}),
-        Workspace(id='ws4', templateName='t4', resourceType=ResourceType.Workspace, templateVersion="1", _etag="x", properties={"workspace_subscription_id": "sub-2"}),  # duplicate
-    ])
+    workspace_repo_mock.get_active_workspaces = AsyncMock(return_value=[])
+    workspace_repo_mock.get_active_workspace_subscription_ids = AsyncMock(return_value=["sub-2", "sub-3"])
     __set_shared_service_repo_mock_return_value(shared_service_repo_mock)
     get_resource_groups_by_tag_mock.return_value = {}
     client_mock.return_value.query.usage.return_value = QueryResult(rows=[], columns=[])
@@ -689,14 +687,12 @@ async def test_subscription_id_includes_default_and_workspace_ids(get_resource_g
 @patch('db.repositories.shared_services.SharedServiceRepository')
 @patch('services.cost_service.CostManagementClient')
 @patch('services.cost_service.CostService.__wrapped__.get_resource_groups_by_tag')
-async def test_subscription_id_skips_workspaces_without_id(get_resource_groups_by_tag_mock, client_mock, shared_service_repo_mock, workspace_repo_mock):
+async def test_subscription_id_is_default_when_no_workspace_has_one(get_resource_groups_by_tag_mock, client_mock, shared_service_repo_mock, workspace_repo_mock):
     from services import cost_service as cs
     cs.config.SUBSCRIPTION_ID = "default-sub-id"
 
-    workspace_repo_mock.get_active_workspaces = AsyncMock(return_value=[
-        Workspace(id='ws1', templateName='t1', resourceType=ResourceType.Workspace, templateVersion="1", _etag="x", properties={}),
-        Workspace(id='ws2', templateName='t2', resourceType=ResourceType.Workspace, templateVersion="1", _etag="x", properties={}),
-    ])
+    workspace_repo_mock.get_active_workspaces = AsyncMock(return_value=[])
+    workspace_repo_mock.get_active_workspace_subscription_ids = AsyncMock(return_value=[])
     __set_shared_service_repo_mock_return_value(shared_service_repo_mock)
     get_resource_groups_by_tag_mock.return_value = {}
     client_mock.return_value.query.usage.return_value = QueryResult(rows=[], columns=[])
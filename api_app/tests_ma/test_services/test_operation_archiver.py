@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, UTC
+from unittest.mock import AsyncMock
+
+import pytest
+from mock import patch
+
+from services.operation_archiver import OperationArchiver
+
+pytestmark = pytest.mark.asyncio
+
+
+@patch("core.config.OPERATIONS_RETENTION_DAYS", 30)
+async def test_archive_operations_archives_those_finished_before_the_retention_period():
+    archiver = OperationArchiver()
+    archiver.operations_repo = AsyncMock()
+    archiver.operations_repo.archive_operations.return_value = 3
+
+    assert await archiver.archive_operations() == 3
+
+    [finished_before] = archiver.operations_repo.archive_operations.call_args.args
+    expected = (datetime.now(UTC) - timedelta(days=30)).timestamp()
+    assert expected - 60 < finished_before <= expected
+
+
+@patch("services.operation_archiver.asyncio.sleep", side_effect=[None, StopAsyncIteration])
+@patch("services.operation_archiver.logger.exception")
+async def test_archive_periodically_keeps_running_after_a_failure(logger_mock, _):
+    archiver = OperationArchiver()
+    archiver.operations_repo = AsyncMock()
+    archiver.operations_repo.archive_operations.side_effect = [Exception("throttled"), 0]
+
+    with pytest.raises(StopAsyncIteration):
+        await archiver.archive_periodically()
+
+    assert archiver.operations_repo.archive_operations.call_count == 2
+    logger_mock.assert_called_once()
@@ -234,3 +234,36 @@ def test_enrich_template_adds_read_only_on_update(basic_resource_template):
 
     assert "readOnly" not in template["properties"]["updateable_property"].keys()
     assert template["properties"]["fixed_property"]["readOnly"] is True
+
+
+def test_read_schema_returns_copy_of_preloaded_system_schema():
+    required, properties = services.schema_service.read_schema('workspace.json')
+    properties["display_name"]["readOnly"] = True
+
+    _, reloaded_properties = services.schema_service.read_schema('workspace.json')
+
+    assert "display_name" in required
+    assert "readOnly" not in reloaded_properties["display_name"]
+
+
+def test_enriched_template_cache_enriches_once_per_template_and_update_flag(basic_resource_template):
+    cache = services.schema_service.EnrichedTemplateCache()
+    enrich = services.schema_service.enrich_workspace_template
+
+    with patch('services.schema_service.enrich_template', wraps=services.schema_service.enrich_template) as enrich_template_mock:
+        first = cache.get(basic_resource_template, False, enrich)
+        second = cache.get(basic_resource_template, False, enrich)
+        update_template = cache.get(basic_resource_template, True, enrich)
+
+    assert first is second
+    assert update_template["properties"]["fixed_property"]["readOnly"] is True
+    assert enrich_template_mock.call_count == 2
+
+
+def test_enriched_template_cache_re_enriches_template_when_current_flag_changes(basic_resource_template):
+    cache = services.schema_service.EnrichedTemplateCache()
+    enrich = services.schema_service.enrich_workspace_template
+
+    assert cache.get(basic_resource_template, False, enrich)["current"] is True
+    basic_resource_template.current = False
+    assert cache.get(basic_resource_template, False, enrich)["current"] is False